@@ -3,10 +3,10 @@ from dataclasses import dataclass, field
 import time, importlib, inspect, os, json
 from typing import Any, Optional, Dict, TypedDict
 import uuid
-from python.helpers import extract_tools, rate_limiter, files, errors
+from python.helpers import extract_tools, rate_limiter, files, errors, class_registry, tokens, messages
 from python.helpers.print_style import PrintStyle
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, AIMessage
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.language_models.llms import BaseLLM
 from langchain_core.embeddings import Embeddings
@@ -90,16 +90,31 @@ class AgentConfig:
     embeddings_model: Embeddings
     prompts_subdir: str = ""
     memory_subdir: str = ""
+    memory_index: str = "flat"  # "flat", "ivf", "hnsw", "ivf_sq8" or "ivf_pq", used above 10k memories
+    memory_index_areas: dict[str, str] = field(default_factory=dict)  # per area overrides, e.g. {"fragments": "hnsw"}
     knowledge_subdirs: list[str] = field(default_factory=lambda: ["default", "custom"])
+    knowledge_watch: bool = True  # re-index knowledge and instruments files changed while running
+    vector_memory_storage: str = "float32"  # "float32", "float16" or "int8" embeddings, existing databases are converted
+    vector_memory_warm_up: bool = False  # load the vector memory embedding model in the background at startup
     auto_memory_count: int = 3
     auto_memory_skip: int = 2
+    recall_speculative: bool = False  # recall memories and solutions for the next iteration during generation
+    recall_query_mode: str = "llm"  # memory search query by "llm", "embedding" or "keywords"
+    recall_query_record: str = ""  # append recalls to this jsonl corpus for scripts/benchmark_recall_query.py
     rate_limit_seconds: int = 60
     rate_limit_requests: int = 15
     rate_limit_input_tokens: int = 0
     rate_limit_output_tokens: int = 0
+    utility_rate_limit_requests: int | None = None  # None = same as the chat limit, shared if the models are the same
+    utility_rate_limit_input_tokens: int | None = None
+    utility_rate_limit_output_tokens: int | None = None
+    embeddings_rate_limit_requests: int = 0
+    embeddings_rate_limit_input_tokens: int = 0
     msgs_keep_max: int = 25
     msgs_keep_start: int = 5
     msgs_keep_end: int = 10
+    history_max_tokens: int | None = None  # compact history above this many tokens, None = half the context window (at most 32k), 0 = above msgs_keep_max messages
+    extension_timings_print_ms: int = 1000  # print timings of extension folders slower than this, 0 = every call
     response_timeout_seconds: int = 60
     max_tool_response_length: int = 3000
     code_exec_docker_enabled: bool = True
@@ -160,6 +175,7 @@ class LoopData:
         self.message = ""
         self.history_from = 0
         self.history = []
+        self.extension_timings: dict[str, dict[str, float]] = {}  # folder -> module -> ms, this iteration
 
 
 # intervention exception class - skips rest of message loop iteration
@@ -174,6 +190,9 @@ class RepairableException(Exception):
 
 class Agent:
 
+    HISTORY_BUDGET_MAX = 32_000  # tokens of history by default, even if the context window is larger
+    HISTORY_TRUNCATE_MIN_CHARS = 1000  # a message is never truncated shorter than this
+
     def __init__(
         self, number: int, config: AgentConfig, context: AgentContext | None = None
     ):
@@ -189,6 +208,8 @@ class Agent:
         self.agent_name = f"Agent {self.number}"
 
         self.history = []
+        self.history_compaction: tuple[asyncio.Task, list] | None = None  # (summary task, messages it replaces)
+        self.history_summaries: list[BaseMessage] = []  # summary messages swapped into history
         self.last_message = ""
         self.intervention_message = ""
         self.rate_limiter = rate_limiter.RateLimiter(
@@ -197,7 +218,35 @@ class Agent:
             max_input_tokens=self.config.rate_limit_input_tokens,
             max_output_tokens=self.config.rate_limit_output_tokens,
             window_seconds=self.config.rate_limit_seconds,
+            name="chat",
+        )
+        # utility limits not set are those of the chat model, 0 = unlimited
+        def utility_limit(value: int | None, chat: int) -> int:
+            return chat if value is None else value
+
+        utility_limits = (
+            self.config.utility_rate_limit_requests,
+            self.config.utility_rate_limit_input_tokens,
+            self.config.utility_rate_limit_output_tokens,
         )
+        if self.config.utility_model is self.config.chat_model and all(limit is None for limit in utility_limits):
+            self.utility_rate_limiter = self.rate_limiter  # same model, one quota
+        else:
+            self.utility_rate_limiter = rate_limiter.RateLimiter(
+                self.context.log,
+                max_calls=utility_limit(utility_limits[0], self.config.rate_limit_requests),
+                max_input_tokens=utility_limit(utility_limits[1], self.config.rate_limit_input_tokens),
+                max_output_tokens=utility_limit(utility_limits[2], self.config.rate_limit_output_tokens),
+                window_seconds=self.config.rate_limit_seconds,
+                name="utility",
+            )
+        self.chat_tokens = tokens.MessageTokenCounter(tokens.get_counter(self.config.chat_model))
+        context_window = tokens.get_context_window(self.config.chat_model)
+        self.history_budget = self.config.history_max_tokens
+        if self.history_budget is None:
+            self.history_budget = min(context_window // 2, Agent.HISTORY_BUDGET_MAX)
+        self.history_limit = context_window * 3 // 4  # the rest is for the system prompt and the response
+        self.utility_tokens = tokens.get_counter(self.config.utility_model)
         self.data = {}  # free data object all the tools can use
 
     async def monologue(self, msg: str):
@@ -222,6 +271,11 @@ class Agent:
                 self.context.streaming_agent = self  # mark self as current streamer
                 agent_response = ""
                 loop_data.iteration += 1
+                loop_data.extension_timings = {}
+
+                # swap in history summary finished in background, never wait for it
+                self.apply_history_compaction()
+                self.truncate_history()
 
                 try:
 
@@ -243,10 +297,10 @@ class Agent:
                     )
                     chain = prompt | self.config.chat_model
 
-                    # rate limiter TODO - move to extension, make per-model
-                    formatted_inputs = prompt.format(messages=self.history)
-                    tokens = int(len(formatted_inputs) / 4)
-                    self.rate_limiter.limit_call_and_input(tokens)
+                    # rate limiter TODO - move to extension
+                    # counts are cached per message, only new history is tokenized
+                    input_tokens = self.chat_tokens.count_prompt(loop_data.system, loop_data.history)
+                    call = await self.rate_limiter.limit_call_and_input(input_tokens)
 
                     # output that the agent is starting
                     PrintStyle(
@@ -259,6 +313,9 @@ class Agent:
                         type="agent", heading=f"{self.agent_name}: Generating"
                     )
 
+                    # one incremental parser per generation, fed only with new chunks
+                    stream_parser = DirtyJson()
+
                     async for chunk in chain.astream({"messages": loop_data.history}):
                         await self.handle_intervention(
                             agent_response
@@ -276,11 +333,13 @@ class Agent:
                             agent_response += (
                                 content  # concatenate stream into the response
                             )
-                            self.log_from_stream(agent_response, log)
+                            self.log_from_stream(
+                                agent_response, content, stream_parser, log
+                            )
 
                     self.rate_limiter.set_output_tokens(
-                        int(len(agent_response) / 4)
-                    )  # rough estimation
+                        self.chat_tokens.counter.count(agent_response), call
+                    )
 
                     await self.handle_intervention(agent_response)
 
@@ -361,11 +420,7 @@ class Agent:
         else:
             new_message = HumanMessage(content=msg) if human else AIMessage(content=msg)
             self.history.append(new_message)
-            await self.cleanup_history(
-                self.config.msgs_keep_max,
-                self.config.msgs_keep_start,
-                self.config.msgs_keep_end,
-            )
+            self.schedule_history_compaction()
         if message_type == "ai":
             self.last_message = msg
 
@@ -373,7 +428,11 @@ class Agent:
         return "\n".join([f"{msg.type}: {msg.content}" for msg in messages])
 
     async def call_utility_llm(
-        self, system: str, msg: str, callback: Callable[[str], None] | None = None
+        self,
+        system: str,
+        msg: str,
+        callback: Callable[[str], None] | None = None,
+        interruptible: bool = True,
     ):
         prompt = ChatPromptTemplate.from_messages(
             [SystemMessage(content=system), HumanMessage(content=msg)]
@@ -382,12 +441,15 @@ class Agent:
         chain = prompt | self.config.utility_model
         response = ""
 
-        formatted_inputs = prompt.format()
-        tokens = int(len(formatted_inputs) / 4)
-        self.rate_limiter.limit_call_and_input(tokens)
+        input_tokens = (
+            self.utility_tokens.count(system) + self.utility_tokens.count(msg)
+            + 2 * self.utility_tokens.tokens_per_message
+        )
+        call = await self.utility_rate_limiter.limit_call_and_input(input_tokens)
 
         async for chunk in chain.astream({}):
-            await self.handle_intervention()  # wait for intervention and handle it, if paused
+            if interruptible:
+                await self.handle_intervention()  # wait for intervention and handle it, if paused
 
             if isinstance(chunk, str):
                 content = chunk
@@ -401,7 +463,7 @@ class Agent:
 
             response += content
 
-        self.rate_limiter.set_output_tokens(int(len(response) / 4))
+        self.utility_rate_limiter.set_output_tokens(self.utility_tokens.count(response), call)
 
         return response
 
@@ -409,7 +471,7 @@ class Agent:
         if self.history:
             return self.history[-1]
 
-    async def replace_middle_messages(self, middle_messages):
+    async def replace_middle_messages(self, middle_messages, interruptible: bool = True):
         cleanup_prompt = self.read_prompt("fw.msg_cleanup.md")
         log_item = self.context.log.log(
             type="util", heading="Mid messages cleanup summary"
@@ -428,35 +490,108 @@ class Agent:
             system=cleanup_prompt,
             msg=self.concat_messages(middle_messages),
             callback=log_callback,
+            interruptible=interruptible,
         )
         new_human_message = HumanMessage(content=summary)
         return [new_human_message]
 
-    async def cleanup_history(self, max: int, keep_start: int, keep_end: int):
-        if len(self.history) <= max:
-            return self.history
-
-        first_x = self.history[:keep_start]
-        last_y = self.history[-keep_end:]
-
-        # Identify the middle part
-        middle_part = self.history[keep_start:-keep_end]
+    def _middle_range(self, keep_start: int, keep_end: int) -> tuple[int, int]:
+        start = keep_start
+        end = len(self.history) - keep_end
 
         # Ensure the first message in the middle is "human", if not, move one message back
-        if middle_part and middle_part[0].type != "human":
-            if len(first_x) > 0:
-                middle_part.insert(0, first_x.pop())
+        if start < end and self.history[start].type != "human" and start > 0:
+            start -= 1
 
         # Ensure the middle part has an odd number of messages
-        if len(middle_part) % 2 == 0:
-            middle_part = middle_part[:-1]
-
-        # Replace the middle part using the replacement function
-        new_middle_part = await self.replace_middle_messages(middle_part)
-
-        self.history = first_x + new_middle_part + last_y
-
-        return self.history
+        if end > start and (end - start) % 2 == 0:
+            end -= 1
+
+        return start, end
+
+    def _history_keep_end(self) -> int:
+        keep_end = self.config.msgs_keep_end
+        budget = self.history_budget
+        if budget:
+            # recent messages may use half of the budget, the rest is for the start and summaries
+            while keep_end > 1 and sum(
+                self.chat_tokens.count_message(msg) for msg in self.history[-keep_end:]
+            ) > budget // 2:
+                keep_end -= 1
+        return keep_end
+
+    def history_over_budget(self) -> bool:
+        if not self.history_budget:
+            return len(self.history) > self.config.msgs_keep_max
+        return self.chat_tokens.count_messages(self.history) > self.history_budget
+
+    def truncate_history(self) -> bool:
+        """Cut the longest messages while history is over the context limit, returns True if history changed"""
+        # a long tool output can exceed the context window before its summary is ready
+        truncated = False
+        for _ in range(len(self.history)):
+            excess = self.chat_tokens.count_messages(self.history) - self.history_limit
+            if excess <= 0:
+                break
+            longest = max(self.history, key=self.chat_tokens.count_message)
+            count = self.chat_tokens.count_message(longest)
+            content = longest.content if isinstance(longest.content, str) else str(longest.content)
+            keep = max(int(len(content) * (count - excess) / count), Agent.HISTORY_TRUNCATE_MIN_CHARS)
+            if keep >= len(content):
+                break
+            longest.content = messages.truncate_text(self, content, keep)
+            truncated = True
+        if truncated:
+            self.context.log.log(
+                type="warning", heading="History truncated to fit the context window",
+                content=f"{self.chat_tokens.count_messages(self.history)} of {self.history_limit} tokens",
+            )
+        return truncated
+
+    def schedule_history_compaction(self):
+        """Start summarizing the middle of the history in background if it is over budget"""
+        if self.history_compaction or not self.history_over_budget():
+            return
+        start, end = self._middle_range(self.config.msgs_keep_start, self._history_keep_end())
+        if end - start < 1:
+            return
+        middle_part = self.history[start:end]
+        # summarizing nothing but summaries again costs a utility call each loop and gains nothing
+        if all(any(msg is summary for summary in self.history_summaries) for msg in middle_part):
+            return
+        task = asyncio.create_task(
+            self.replace_middle_messages(middle_part, interruptible=False)
+        )
+        self.history_compaction = (task, middle_part)
+
+    def apply_history_compaction(self) -> bool:
+        """Replace summarized messages with a finished summary, returns True if history changed"""
+        if not self.history_compaction:
+            return False
+        task, middle_part = self.history_compaction
+        if not task.done():
+            return False
+        self.history_compaction = None
+
+        if task.cancelled() or task.exception():
+            error = "cancelled" if task.cancelled() else errors.format_error(task.exception())  # type: ignore
+            self.context.log.log(type="warning", heading="History compaction failed", content=error)
+            return False
+
+        # summarized messages are still in place unless history was reset or compacted meanwhile
+        start = next((i for i, msg in enumerate(self.history) if msg is middle_part[0]), -1)
+        end = start + len(middle_part)
+        if start < 0 or any(a is not b for a, b in zip(self.history[start:end], middle_part)):
+            return False
+        self.history = self.history[:start] + task.result() + self.history[end:]
+        self.history_summaries = [
+            summary for summary in self.history_summaries
+            if any(msg is summary for msg in self.history)
+        ] + task.result()
+
+        # history may still be over budget after a long tool output, continue with next chunk
+        self.schedule_history_compaction()
+        return True
 
     async def handle_intervention(self, progress: str = ""):
         while self.context.paused:
@@ -483,19 +618,24 @@ class Agent:
         tool_request = extract_tools.json_parse_dirty(msg)
 
         if tool_request is not None:
-            tool_name = tool_request.get("tool_name", "")
-            tool_args = tool_request.get("tool_args", {})
-            tool = self.get_tool(tool_name, tool_args, msg)
-
-            await self.handle_intervention()  # wait if paused and handle intervention message if needed
-            await tool.before_execution(**tool_args)
-            await self.handle_intervention()  # wait if paused and handle intervention message if needed
-            response = await tool.execute(**tool_args)
-            await self.handle_intervention()  # wait if paused and handle intervention message if needed
-            await tool.after_execution(response)
-            await self.handle_intervention()  # wait if paused and handle intervention message if needed
-            if response.break_loop:
-                return response.message
+            calls = []
+            for request in extract_tools.get_tool_requests(tool_request):
+                tool_name = request.get("tool_name", "")
+                tool_args = request.get("tool_args", {})
+                calls.append((self.get_tool(tool_name, tool_args, msg), tool_args))
+
+            # consecutive concurrency safe tools run together, the others one by one
+            batches = []
+            for call in calls:
+                if batches and call[0].concurrency_safe and batches[-1][-1][0].concurrency_safe:
+                    batches[-1].append(call)
+                else:
+                    batches.append([call])
+
+            for batch in batches:
+                result = await self.run_tools(batch)
+                if result is not None:
+                    return result
         else:
             msg = self.read_prompt("fw.msg_misformat.md")
             await self.append_message(msg, human=True)
@@ -504,11 +644,39 @@ class Agent:
                 type="error", content=f"{self.agent_name}: Message misformat"
             )
 
-    def log_from_stream(self, stream: str, logItem: Log.LogItem):
+    async def run_tools(self, calls: list[tuple[Any, dict]]) -> str | None:
+        """Execute tools concurrently, results are added to history in the order of calls"""
+        for tool, tool_args in calls:
+            await self.handle_intervention()  # wait if paused and handle intervention message if needed
+            await tool.before_execution(**tool_args)
+        await self.handle_intervention()  # wait if paused and handle intervention message if needed
+
+        if len(calls) == 1:
+            tool, tool_args = calls[0]
+            responses = [await tool.execute(**tool_args)]
+        else:
+            responses = await asyncio.gather(
+                *(tool.execute(**tool_args) for tool, tool_args in calls),
+                return_exceptions=True,
+            )
+        await self.handle_intervention()  # wait if paused and handle intervention message if needed
+
+        for (tool, _), response in zip(calls, responses):
+            if isinstance(response, BaseException):
+                raise response  # results before the failed tool are already in history
+            await tool.after_execution(response)
+            await self.handle_intervention()  # wait if paused and handle intervention message if needed
+            if response.break_loop:
+                return response.message
+        return None
+
+    def log_from_stream(
+        self, stream: str, chunk: str, parser: DirtyJson, logItem: Log.LogItem
+    ):
         try:
+            response = parser.feed(chunk)  # only parses the new chunk
             if len(stream) < 25:
-                return  # no reason to try
-            response = DirtyJson.parse_string(stream)
+                return  # no reason to log yet
             if isinstance(response, dict):
                 logItem.update(
                     content=stream, kvps=response
@@ -520,17 +688,33 @@ class Agent:
         from python.tools.unknown import Unknown
         from python.helpers.tool import Tool
 
-        classes = extract_tools.load_classes_from_folder(
-            "python/tools", name + ".py", Tool
+        classes = class_registry.get_registry().get_classes(
+            class_registry.TOOLS_FOLDER, name + ".py", Tool
         )
         tool_class = classes[0] if classes else Unknown
         return tool_class(agent=self, name=name, args=args, message=message, **kwargs)
 
     async def call_extensions(self, folder: str, **kwargs) -> Any:
+        from python.helpers import extension
         from python.helpers.extension import Extension
 
-        classes = extract_tools.load_classes_from_folder(
-            "python/extensions/" + folder, "*", Extension
+        classes = class_registry.get_registry().get_classes(
+            class_registry.EXTENSIONS_FOLDER + "/" + folder, "*", Extension
         )
-        for cls in classes:
-            await cls(agent=self).execute(**kwargs)
+        loop_data = kwargs.get("loop_data")
+        if isinstance(loop_data, LoopData):
+            # concurrent extensions keep their system prompt parts in file order
+            loop_data.system = extension.OrderedList(loop_data.system)
+
+        start = time.perf_counter()
+        timings = await extension.run_extensions(self, classes, **kwargs)
+        total = (time.perf_counter() - start) * 1000
+
+        if isinstance(loop_data, LoopData):
+            loop_data.extension_timings[folder] = {**timings, "total": total}
+        # timings are kept in loop_data, only slow folders are printed
+        if timings and total >= self.config.extension_timings_print_ms:
+            details = ", ".join(f"{name} {ms:.0f}ms" for name, ms in timings.items())
+            PrintStyle(font_color="gray", padding=False).print(
+                f"{self.agent_name}: {folder} extensions {total:.0f}ms ({details})"
+            )
@@ -1,6 +1,6 @@
 import models
 from agent import AgentConfig
-from python.helpers import files
+from python.helpers import files, class_registry, vector_memory
 import os
 from dotenv import load_dotenv
 
@@ -44,16 +44,31 @@ def initialize():
         embeddings_model = embedding_llm,
         # prompts_subdir = "default",
         # memory_subdir = "",
+        # memory_index = "flat",
+        # memory_index_areas = {"fragments": "hnsw"},
         knowledge_subdirs = ["default","custom"],
+        # knowledge_watch = True,
+        # vector_memory_storage = "float32",
+        # vector_memory_warm_up = False,
         auto_memory_count = 0,
         # auto_memory_skip = 2,
+        recall_speculative = True,
+        # recall_query_mode = "llm",
+        # recall_query_record = "",
         # rate_limit_seconds = 60,
         rate_limit_requests = 30,
         # rate_limit_input_tokens = 0,
         # rate_limit_output_tokens = 0,
+        # utility_rate_limit_requests = None,  # None = as the chat limits, one shared quota when utility_llm is chat_llm
+        # utility_rate_limit_input_tokens = None,
+        # utility_rate_limit_output_tokens = None,
+        # embeddings_rate_limit_requests = 0,
+        # embeddings_rate_limit_input_tokens = 0,
         # msgs_keep_max = 25,
         # msgs_keep_start = 5,
         # msgs_keep_end = 10,
+        # history_max_tokens = None,  # None = from the chat model context window, 0 = by message count
+        # extension_timings_print_ms = 1000,
         max_tool_response_length = 3000,
         # response_timeout_seconds = 60,
         code_exec_docker_enabled = False,  # Docker not available on Android/Termux
@@ -72,5 +87,12 @@ def initialize():
         # additional = {},
     )
 
+    # register tool and extension classes once, lookups then only check mtimes
+    class_registry.preload_agent_classes()
+
+    # load the vector memory model while the rest starts, the first search doesn't wait for it
+    if config.vector_memory_warm_up:
+        vector_memory.get_memory(config.vector_memory_storage, warm_up=True)
+
     # return config object
     return config
@@ -8,6 +8,9 @@ class LoadSpecializedRole(Extension):
     This allows users to start Agent Zero with a specific role
     """
 
+    # independent of other prompt extensions, runs concurrently
+    depends_on = []
+
     async def execute(self, loop_data: LoopData = LoopData(), **kwargs):
         # Only load role once at the beginning for Agent 0
         if self.agent.number != 0 or loop_data.iteration != 0:
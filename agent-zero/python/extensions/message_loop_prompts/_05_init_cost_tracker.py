@@ -7,6 +7,9 @@ class InitCostTracker(Extension):
     Runs once at the beginning of the first message loop
     """
 
+    # independent of other prompt extensions, runs concurrently
+    depends_on = []
+
     async def execute(self, loop_data: LoopData = LoopData(), **kwargs):
         # Only initialize for Agent 0 and only on first iteration
         if self.agent.number != 0 or loop_data.iteration != 0:
@@ -29,29 +32,34 @@ class InitCostTracker(Extension):
         Add cost tracking to agent's LLM calls
         Non-invasive monkey-patching approach
         """
-        original_rate_limiter_set_output = self.agent.rate_limiter.set_output_tokens
+        self._patch_limiter(self.agent.rate_limiter, self.agent.config.chat_model, "chat")
+        self._patch_limiter(self.agent.utility_rate_limiter, self.agent.config.utility_model, "utility")
+
+    def _patch_limiter(self, limiter, model, model_type: str):
+        """Log usage of one model whenever its rate limiter records output tokens"""
+        original_rate_limiter_set_output = limiter.set_output_tokens
 
-        def tracked_set_output_tokens(tokens: int):
+        def tracked_set_output_tokens(tokens: int, record=None):
             # Call original method
-            original_rate_limiter_set_output(tokens)
+            original_rate_limiter_set_output(tokens, record)
 
             # Log to cost tracker
             if hasattr(self.agent.context, 'cost_tracker'):
                 try:
-                    # Estimate input tokens from last call
-                    input_tokens = getattr(self.agent.rate_limiter, '_last_input_tokens', 0)
+                    # Input tokens of the same call, estimated from the last call without one
+                    input_tokens = record.input_tokens if record is not None else getattr(limiter, '_last_input_tokens', 0)
 
                     # Determine model name (fallback to "unknown")
                     model_name = "unknown"
-                    if hasattr(self.agent.config.chat_model, 'model_name'):
-                        model_name = self.agent.config.chat_model.model_name
-                    elif hasattr(self.agent.config.chat_model, 'model'):
-                        model_name = self.agent.config.chat_model.model
+                    if hasattr(model, 'model_name'):
+                        model_name = model.model_name
+                    elif hasattr(model, 'model'):
+                        model_name = model.model
 
                     self.agent.context.cost_tracker.log_usage(
                         agent_name=self.agent.agent_name,
                         model_name=model_name,
-                        model_type="chat",
+                        model_type=model_type,
                         input_tokens=input_tokens,
                         output_tokens=tokens,
                         task_description=f"Iteration {getattr(self.agent, '_current_iteration', 0)}"
@@ -61,14 +69,14 @@ class InitCostTracker(Extension):
                     pass
 
         # Also track input tokens
-        original_rate_limiter_limit_call = self.agent.rate_limiter.limit_call_and_input
+        original_rate_limiter_limit_call = limiter.limit_call_and_input
 
-        def tracked_limit_call_and_input(input_tokens: int):
+        async def tracked_limit_call_and_input(input_tokens: int):
             # Store for later use
-            self.agent.rate_limiter._last_input_tokens = input_tokens
+            limiter._last_input_tokens = input_tokens
             # Call original
-            return original_rate_limiter_limit_call(input_tokens)
+            return await original_rate_limiter_limit_call(input_tokens)
 
         # Apply patches
-        self.agent.rate_limiter.set_output_tokens = tracked_set_output_tokens
-        self.agent.rate_limiter.limit_call_and_input = tracked_limit_call_and_input
+        limiter.set_output_tokens = tracked_set_output_tokens
+        limiter.limit_call_and_input = tracked_limit_call_and_input
@@ -6,6 +6,9 @@ from copy import deepcopy
 
 class SystemPrompt(Extension):
 
+    # independent of other prompt extensions, runs concurrently
+    depends_on = []
+
     async def execute(self, loop_data: LoopData = LoopData(), **kwargs):
         # append main system prompt and tools
         main = get_main_prompt(self.agent)
@@ -18,6 +18,9 @@ class ReasoningEngine(Extension):
     - Error correction
     """
 
+    # independent of other prompt extensions, runs concurrently
+    depends_on = []
+
     async def execute(self, loop_data: LoopData = LoopData(), **kwargs):
         """
         Inject reasoning instructions into system prompt
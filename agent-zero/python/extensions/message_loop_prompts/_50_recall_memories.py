@@ -1,21 +1,41 @@
 from python.helpers.extension import Extension
 from python.helpers.memory import Memory
+from python.helpers import memory_query, speculative_recall
+from python.helpers.log import LogItem
 from agent import LoopData
 
 
 class RecallMemories(Extension):
 
+    # LLM calls must be tracked, so wait for the cost tracker;
+    # the system prompt extension rewrites loop_data.history, let it finish first
+    depends_on = ["_05_init_cost_tracker", "_10_system_prompt"]
+
     INTERVAL = 3
     HISTORY = 5
     RESULTS = 3
     THRESHOLD = 0.6
+    SPECULATIVE_NAME = "memories"
 
     async def execute(self, loop_data: LoopData = LoopData(), **kwargs):
 
         if (
             loop_data.iteration % RecallMemories.INTERVAL == 0
         ):  # every 3 iterations (or the first one) recall memories
-            await self.search_memories(loop_data=loop_data, **kwargs)
+            # never wait for a recall prepared ahead, a late or stale one is replaced by a regular search
+            ready, memories_text = speculative_recall.take_result(
+                self.agent, RecallMemories.SPECULATIVE_NAME, loop_data.message
+            )
+            if ready:
+                self.add_to_prompt(loop_data, memories_text)
+            else:
+                await self.search_memories(loop_data=loop_data, **kwargs)
+
+        if (
+            self.agent.config.recall_speculative
+            and (loop_data.iteration + 1) % RecallMemories.INTERVAL == 0
+        ):  # prepare recall of the next iteration while this one is generating
+            self.start_speculative(loop_data)
 
     async def search_memories(self, loop_data: LoopData, **kwargs):
         # try:
@@ -30,39 +50,43 @@ class RecallMemories(Extension):
             heading="Searching memories...",
         )
 
-        # get system message and chat history for util llm
-        msgs_text = self.agent.concat_messages(
-            self.agent.history[-RecallMemories.HISTORY :]
-        )  # only last X messages
-        system = self.agent.read_prompt(
-            "memory.memories_query.sys.md", history=msgs_text
-        )
-
-        # log query streamed by LLM
-        def log_callback(content):
-            log_item.stream(query=content)
+        memories_text = await self.recall(loop_data.message, log_item)
+        self.add_to_prompt(loop_data, memories_text)
 
-        # call util llm to summarize conversation
-        query = await self.agent.call_utility_llm(
-            system=system, msg=loop_data.message, callback=log_callback
-        )
+    async def recall(self, message: str, log_item: LogItem, interruptible: bool = True) -> str:
+        config = self.agent.config
+        history = self.agent.history[-RecallMemories.HISTORY :]  # only last X messages
+        prompt = "memory.memories_query.sys.md"
+        filter = f"area == '{Memory.Area.MAIN.value}' or area == '{Memory.Area.FRAGMENTS.value}'"  # exclude solutions
 
         # get solutions database
         db = await Memory.get(self.agent)
 
-        memories = await db.search_similarity_threshold(
-            query=query,
+        # search query from recent conversation, by utility llm or without it
+        query = await memory_query.get_builder(config.recall_query_mode).build(
+            self.agent, db, message, history, prompt, log_item, interruptible
+        )
+
+        memories = await memory_query.search(
+            db,
+            query,
             limit=RecallMemories.RESULTS,
             threshold=RecallMemories.THRESHOLD,
-            filter=f"area == '{Memory.Area.MAIN.value}' or area == '{Memory.Area.FRAGMENTS.value}'",  # exclude solutions
+            filter=filter,
         )
 
+        if config.recall_query_record:
+            memory_query.record_case(
+                config.recall_query_record, prompt, message, history, memories, filter,
+                config.recall_query_mode or "llm",
+            )
+
         # log the short result
         if not isinstance(memories, list) or len(memories) == 0:
             log_item.update(
                 heading="No useful memories found",
             )
-            return
+            return ""
         else:
             log_item.update(
                 heading=f"{len(memories)} memories found",
@@ -76,6 +100,11 @@ class RecallMemories(Extension):
 
         # log the full results
         log_item.update(memories=memories_text)
+        return memories_text
+
+    def add_to_prompt(self, loop_data: LoopData, memories_text: str):
+        if not memories_text:
+            return
 
         # place to prompt
         memories_prompt = self.agent.read_prompt(
@@ -85,6 +114,18 @@ class RecallMemories(Extension):
         # append to system message
         loop_data.system.append(memories_prompt)
 
+    def start_speculative(self, loop_data: LoopData):
+        log_item = self.agent.context.log.log(
+            type="util",
+            heading="Searching memories for next step...",
+        )
+        speculative_recall.start(
+            self.agent,
+            RecallMemories.SPECULATIVE_NAME,
+            loop_data.message,
+            self.recall(loop_data.message, log_item, interruptible=False),
+        )
+
     # except Exception as e:
     #     err = errors.format_error(e)
     #     self.agent.context.log.log(
@@ -1,22 +1,43 @@
+import asyncio
 from python.helpers.extension import Extension
 from python.helpers.memory import Memory
+from python.helpers import memory_query, speculative_recall
+from python.helpers.log import LogItem
 from agent import LoopData
 
 
 class RecallSolutions(Extension):
 
+    # LLM calls must be tracked, so wait for the cost tracker;
+    # the system prompt extension rewrites loop_data.history, let it finish first
+    depends_on = ["_05_init_cost_tracker", "_10_system_prompt"]
+
     INTERVAL = 3
     HISTORY = 5
     SOLUTIONS_COUNT = 2
     INSTRUMENTS_COUNT = 2
     THRESHOLD = 0.6
+    SPECULATIVE_NAME = "solutions"
 
     async def execute(self, loop_data: LoopData = LoopData(), **kwargs):
 
         if (
             loop_data.iteration % RecallSolutions.INTERVAL == 0
         ):  # every 3 iterations (or the first one) recall solution memories
-            await self.search_solutions(loop_data=loop_data, **kwargs)
+            # never wait for a recall prepared ahead, a late or stale one is replaced by a regular search
+            ready, found = speculative_recall.take_result(
+                self.agent, RecallSolutions.SPECULATIVE_NAME, loop_data.message
+            )
+            if ready:
+                self.add_to_prompt(loop_data, *found)
+            else:
+                await self.search_solutions(loop_data=loop_data, **kwargs)
+
+        if (
+            self.agent.config.recall_speculative
+            and (loop_data.iteration + 1) % RecallSolutions.INTERVAL == 0
+        ):  # prepare recall of the next iteration while this one is generating
+            self.start_speculative(loop_data)
 
     async def search_solutions(self, loop_data: LoopData, **kwargs):
         # try:
@@ -31,65 +52,92 @@ class RecallSolutions(Extension):
             heading="Searching memory for solutions...",
         )
 
-        # get system message and chat history for util llm
-        msgs_text = self.agent.concat_messages(
-            self.agent.history[-RecallSolutions.HISTORY :]
-        )  # only last X messages
-        system = self.agent.read_prompt(
-            "memory.solutions_query.sys.md", history=msgs_text
-        )
-
-        # log query streamed by LLM
-        def log_callback(content):
-            log_item.stream(query=content)
+        instruments_text, solutions_text = await self.recall(loop_data.message, log_item)
+        self.add_to_prompt(loop_data, instruments_text, solutions_text)
 
-        # call util llm to summarize conversation
-        query = await self.agent.call_utility_llm(
-            system=system, msg=loop_data.message, callback=log_callback
-        )
+    async def recall(self, message: str, log_item: LogItem, interruptible: bool = True) -> tuple[str, str]:
+        config = self.agent.config
+        history = self.agent.history[-RecallSolutions.HISTORY :]  # only last X messages
+        prompt = "memory.solutions_query.sys.md"
 
         # get solutions database
         db = await Memory.get(self.agent)
 
-        solutions = await db.search_similarity_threshold(
-            query=query,
-            limit=RecallSolutions.SOLUTIONS_COUNT,
-            threshold=RecallSolutions.THRESHOLD,
-            filter=f"area == '{Memory.Area.SOLUTIONS.value}'",
+        # search query from recent conversation, by utility llm or without it
+        query = await memory_query.get_builder(config.recall_query_mode).build(
+            self.agent, db, message, history, prompt, log_item, interruptible
         )
-        instruments = await db.search_similarity_threshold(
-            query=query,
-            limit=RecallSolutions.INSTRUMENTS_COUNT,
-            threshold=RecallSolutions.THRESHOLD,
-            filter=f"area == '{Memory.Area.INSTRUMENTS.value}'",
+
+        # each area has its own database, both are searched concurrently
+        solutions, instruments = await asyncio.gather(
+            memory_query.search(
+                db,
+                query,
+                limit=RecallSolutions.SOLUTIONS_COUNT,
+                threshold=RecallSolutions.THRESHOLD,
+                filter=f"area == '{Memory.Area.SOLUTIONS.value}'",
+            ),
+            memory_query.search(
+                db,
+                query,
+                limit=RecallSolutions.INSTRUMENTS_COUNT,
+                threshold=RecallSolutions.THRESHOLD,
+                filter=f"area == '{Memory.Area.INSTRUMENTS.value}'",
+            ),
         )
 
+        if config.recall_query_record:
+            memory_query.record_case(
+                config.recall_query_record, prompt, message, history,
+                solutions, f"area == '{Memory.Area.SOLUTIONS.value}'",
+                config.recall_query_mode or "llm",
+            )
+
         log_item.update(
             heading=f"{len(instruments)} instruments, {len(solutions)} solutions found",
         )
 
-        if instruments:
-            instruments_text = ""
-            for instrument in instruments:
-                instruments_text += instrument.page_content + "\n\n"
-            instruments_text = instruments_text.strip()
+        instruments_text = ""
+        for instrument in instruments:
+            instruments_text += instrument.page_content + "\n\n"
+        instruments_text = instruments_text.strip()
+        if instruments_text:
             log_item.update(instruments=instruments_text)
+
+        solutions_text = ""
+        for solution in solutions:
+            solutions_text += solution.page_content + "\n\n"
+        solutions_text = solutions_text.strip()
+        if solutions_text:
+            log_item.update(solutions=solutions_text)
+
+        return instruments_text, solutions_text
+
+    def add_to_prompt(self, loop_data: LoopData, instruments_text: str, solutions_text: str):
+        if instruments_text:
             instruments_prompt = self.agent.read_prompt(
                 "agent.system.instruments.md", instruments=instruments_text
             )
             loop_data.system.append(instruments_prompt)
 
-        if solutions:
-            solutions_text = ""
-            for solution in solutions:
-                solutions_text += solution.page_content + "\n\n"
-            solutions_text = solutions_text.strip()
-            log_item.update(solutions=solutions_text)
+        if solutions_text:
             solutions_prompt = self.agent.read_prompt(
                 "agent.system.solutions.md", solutions=solutions_text
             )
             loop_data.system.append(solutions_prompt)
 
+    def start_speculative(self, loop_data: LoopData):
+        log_item = self.agent.context.log.log(
+            type="util",
+            heading="Searching memory for solutions for next step...",
+        )
+        speculative_recall.start(
+            self.agent,
+            RecallSolutions.SPECULATIVE_NAME,
+            loop_data.message,
+            self.recall(loop_data.message, log_item, interruptible=False),
+        )
+
     # except Exception as e:
     #     err = errors.format_error(e)
     #     self.agent.context.log.log(
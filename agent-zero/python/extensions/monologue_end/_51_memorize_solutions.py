@@ -56,29 +56,24 @@ class MemorizeSolutions(Extension):
         # save chat history
         db = await Memory.get(self.agent)
 
-        solutions_txt = ""
-        rem = []
-        for solution in solutions:
-            # solution to plain text:
-            txt = f"# Problem\n {solution['problem']}\n# Solution\n {solution['solution']}"
-            solutions_txt += txt + "\n\n"
-
-            # remove previous solutions too similiar to this one
-            if self.REPLACE_THRESHOLD > 0:
-                rem += await db.delete_documents_by_query(
-                    query=txt,
-                    threshold=self.REPLACE_THRESHOLD,
-                    filter=f"area=='{Memory.Area.SOLUTIONS.value}'",
-                )
-                if rem:
-                    rem_txt = "\n\n".join(Memory.format_docs_plain(rem))
-                    log_item.update(replaced=rem_txt)
-
-            # insert new solution
-            db.insert_text(text=txt, metadata={"area": Memory.Area.SOLUTIONS.value})
-
-        solutions_txt = solutions_txt.strip()
-        log_item.update(solutions=solutions_txt)
+        # solutions to plain text
+        texts = [
+            f"# Problem\n {solution['problem']}\n# Solution\n {solution['solution']}"
+            for solution in solutions
+        ]
+        log_item.update(solutions="\n\n".join(texts))
+
+        # insert all at once, removing previous solutions too similar to any of them
+        _, rem = await db.insert_texts_replacing(
+            texts,
+            threshold=self.REPLACE_THRESHOLD,
+            filter=f"area=='{Memory.Area.SOLUTIONS.value}'",
+            metadata={"area": Memory.Area.SOLUTIONS.value},
+        )
+        if rem:
+            rem_txt = "\n\n".join(Memory.format_docs_plain(rem))
+            log_item.update(replaced=rem_txt)
+
         log_item.update(
             result=f"{len(solutions)} solutions memorized.",
             heading=f"{len(solutions)} solutions memorized.",
@@ -0,0 +1,9 @@
+from python.helpers.extension import Extension
+from python.helpers import speculative_recall
+from agent import LoopData
+
+class DropSpeculativeRecall(Extension):
+
+    async def execute(self, loop_data: LoopData = LoopData(), **kwargs):
+        # recalls prepared late in the previous monologue are about its message, not the new one
+        speculative_recall.drop_all(self.agent)
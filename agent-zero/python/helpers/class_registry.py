@@ -0,0 +1,188 @@
+"""
+Class Registry - process-wide cache of Tool and Extension classes per folder
+Replaces per-call directory scans and imports with a stat-based freshness check
+"""
+
+import importlib
+import inspect
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from types import ModuleType
+from typing import Dict, List, Optional, Type, TypeVar
+from python.helpers.print_style import PrintStyle
+
+T = TypeVar("T")
+
+TOOLS_FOLDER = "python/tools"
+EXTENSIONS_FOLDER = "python/extensions"
+
+
+@dataclass
+class ModuleEntry:
+    """Imported module of a single .py file"""
+    module: ModuleType
+    mtime: int
+    classes: Dict[type, list] = field(default_factory=dict)  # base class -> subclasses
+
+
+@dataclass
+class FolderEntry:
+    """Cached listing of a single folder"""
+    mtime: int
+    file_names: List[str]  # sorted .py files
+    modules: Dict[str, ModuleEntry] = field(default_factory=dict)
+
+
+class ClassRegistry:
+    """
+    Registry of classes loaded from python folders (tools, extensions)
+
+    Folders are listed and modules imported once. Every lookup only stats the
+    folder and the matching files: a changed folder mtime triggers a new listing
+    (added or removed files), a changed file mtime reloads the module, so hot
+    reload keeps working without rescanning and re-importing on every call.
+    """
+
+    def __init__(self):
+        self.folders: Dict[str, FolderEntry] = {}
+        self._lock = threading.RLock()
+        self.stats = {
+            "lookups": 0,
+            "total_lookup_ms": 0.0,
+            "max_lookup_ms": 0.0,
+            "folder_scans": 0,
+            "module_loads": 0,
+            "module_reloads": 0,
+        }
+
+    def get_classes(self, folder: str, name_pattern: str, base_class: Type[T]) -> List[Type[T]]:
+        """Get subclasses of base_class from .py files in folder matching name_pattern"""
+        start = time.perf_counter()
+        classes = []
+        with self._lock:
+            entry = self._get_folder(folder)
+            if entry:
+                for file_name in entry.file_names:
+                    if fnmatch(file_name, name_pattern):
+                        module = self._get_module(folder, entry, file_name)
+                        if module:
+                            classes += self._get_module_classes(module, base_class)
+        self._record_lookup((time.perf_counter() - start) * 1000)
+        return classes
+
+    def preload(self, folders: Dict[str, type]):
+        """Build the registry for given folders (folder -> base class) upfront"""
+        for folder, base_class in folders.items():
+            with self._lock:
+                entry = self._get_folder(folder)
+                for file_name in entry.file_names if entry else []:
+                    try:
+                        module = self._get_module(folder, entry, file_name)  # type: ignore
+                        if module:
+                            self._get_module_classes(module, base_class)
+                    except Exception as e:
+                        # broken modules are reported again on lookup, don't stop startup
+                        PrintStyle(font_color="orange", padding=False).print(
+                            f"Could not preload {folder}/{file_name}: {e}"
+                        )
+
+    def clear(self):
+        with self._lock:
+            self.folders.clear()
+
+    def get_stats(self) -> Dict:
+        lookups = self.stats["lookups"]
+        return {
+            **self.stats,
+            "avg_lookup_ms": round(self.stats["total_lookup_ms"] / lookups, 4) if lookups else 0.0,
+            "folders": len(self.folders),
+            "modules": sum(len(f.modules) for f in self.folders.values()),
+        }
+
+    def _get_folder(self, folder: str) -> Optional[FolderEntry]:
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+        except FileNotFoundError:
+            self.folders.pop(folder, None)
+            return None
+
+        entry = self.folders.get(folder)
+        if entry is None or entry.mtime != mtime:
+            file_names = sorted(
+                name for name in os.listdir(folder) if name.endswith(".py")
+            )
+            modules = entry.modules if entry else {}
+            entry = FolderEntry(
+                mtime=mtime,
+                file_names=file_names,
+                modules={k: v for k, v in modules.items() if k in file_names},
+            )
+            self.folders[folder] = entry
+            self.stats["folder_scans"] += 1
+        return entry
+
+    def _get_module(self, folder: str, entry: FolderEntry, file_name: str) -> Optional[ModuleEntry]:
+        try:
+            mtime = os.stat(os.path.join(folder, file_name)).st_mtime_ns
+        except FileNotFoundError:
+            entry.modules.pop(file_name, None)
+            return None
+
+        cached = entry.modules.get(file_name)
+        if cached and cached.mtime == mtime:
+            return cached
+
+        if cached:
+            module = importlib.reload(cached.module)
+            self.stats["module_reloads"] += 1
+        else:
+            module_path = folder.replace("/", ".") + "." + file_name[:-3]
+            module = importlib.import_module(module_path)
+            self.stats["module_loads"] += 1
+        entry.modules[file_name] = ModuleEntry(module=module, mtime=mtime)
+        return entry.modules[file_name]
+
+    def _get_module_classes(self, entry: ModuleEntry, base_class: type) -> list:
+        if base_class not in entry.classes:
+            entry.classes[base_class] = [
+                cls
+                for _, cls in inspect.getmembers(entry.module, inspect.isclass)
+                if cls is not base_class and issubclass(cls, base_class)
+            ]
+        return entry.classes[base_class]
+
+    def _record_lookup(self, duration_ms: float):
+        self.stats["lookups"] += 1
+        self.stats["total_lookup_ms"] += duration_ms
+        if duration_ms > self.stats["max_lookup_ms"]:
+            self.stats["max_lookup_ms"] = duration_ms
+
+
+def preload_agent_classes():
+    """Register all tools and extensions, called once at startup"""
+    from python.helpers.tool import Tool
+    from python.helpers.extension import Extension
+
+    registry = get_registry()
+    if registry.folders:
+        return
+    folders: Dict[str, type] = {TOOLS_FOLDER: Tool}
+    if os.path.isdir(EXTENSIONS_FOLDER):
+        for name in sorted(os.listdir(EXTENSIONS_FOLDER)):
+            if os.path.isdir(os.path.join(EXTENSIONS_FOLDER, name)):
+                folders[EXTENSIONS_FOLDER + "/" + name] = Extension
+    registry.preload(folders)
+
+
+# Global instance for easy access
+_global_registry: Optional[ClassRegistry] = None
+
+def get_registry() -> ClassRegistry:
+    """Get or create global class registry"""
+    global _global_registry
+    if _global_registry is None:
+        _global_registry = ClassRegistry()
+    return _global_registry
@@ -1,4 +1,22 @@
+import re
+
+# characters that end a plain run of string content, per quote character
+_STRING_STOPS = {
+    quote: re.compile("[\\\\" + re.escape(quote) + "]") for quote in ['"', "'", "`"]
+}
+_START_CHARS = re.compile(r'[{\["]')
+
+
 class DirtyJson:
+    """
+    Lenient JSON parser for LLM output.
+
+    The parser is resumable: parse() handles a complete string in one go, while
+    feed() accepts the input chunk by chunk (e.g. from a streamed LLM response)
+    and only processes the newly received characters. The partial result is
+    available in `result` after every feed() and is completed by finish().
+    """
+
     def __init__(self):
         self._reset()
 
@@ -8,27 +26,63 @@ class DirtyJson:
         self.current_char = None
         self.result = None
         self.stack = []
+        self.completed = False  # no more input will be fed
+        self._parser = None
+        self._finished = False
+        self._started = False
+        self._scan = 0
+        self._slot = None  # (container, key) the value being parsed belongs to
 
     @staticmethod
     def parse_string(json_string):
         parser = DirtyJson()
         return parser.parse(json_string)
-    
+
     def parse(self, json_string):
         self._reset()
-        self.json_string = json_string
-        self.index = self.get_start_pos(self.json_string) #skip any text up to the first brace
-        self.current_char = self.json_string[self.index]
-        self._parse()
-        return self.result
-        
+        self.feed(json_string)
+        return self.finish()
+
     def feed(self, chunk):
+        if self._finished:
+            return self.result
+        if self._parser is None:
+            self._parser = self._parse()
+        if self._started and self.index:
+            # drop the consumed input, the buffer only keeps what is still unparsed
+            consumed = min(self.index, len(self.json_string))
+            self.json_string = self.json_string[consumed:]
+            self.index -= consumed
         self.json_string += chunk
-        if not self.current_char and self.json_string:
-            self.current_char = self.json_string[0]
-        self._parse()
+        self._resume()
         return self.result
 
+    def finish(self):
+        if not self._finished:
+            self.completed = True
+            if self._parser is None:
+                self._parser = self._parse()
+            self._resume()
+        return self.result
+
+    def _resume(self):
+        if self.index < len(self.json_string):
+            self.current_char = self.json_string[self.index]
+        else:
+            self.current_char = None
+        try:
+            next(self._parser)  # type: ignore
+        except StopIteration:
+            self._finished = True
+        except Exception:
+            self._finished = True
+            raise
+
+    def _wait(self, count=1):
+        # suspend until `count` characters are available from the current position
+        while not self.completed and self.index + count > len(self.json_string):
+            yield
+
     def _advance(self, count=1):
         self.index += count
         if self.index < len(self.json_string):
@@ -37,48 +91,71 @@ class DirtyJson:
             self.current_char = None
 
     def _skip_whitespace(self):
-        while self.current_char is not None and self.current_char.isspace():
-            self._advance()
+        while True:
+            while self.current_char is not None and self.current_char.isspace():
+                self._advance()
+            if self.current_char is not None or self.completed:
+                return
+            yield
 
     def _parse(self):
-        if self.result is None:
-            self.result = self._parse_value()
-        else:
-            self._continue_parsing()
-
-    def _continue_parsing(self):
-        while self.current_char is not None:
-            if isinstance(self.result, dict):
-                self._parse_object_content()
-            elif isinstance(self.result, list):
-                self._parse_array_content()
-            elif isinstance(self.result, str):
-                self.result = self._parse_string()
-            else:
+        # skip any text up to the first brace
+        while True:
+            match = _START_CHARS.search(self.json_string, self._scan)
+            if match or self.completed:
                 break
+            self._scan = len(self.json_string)
+            yield
+        self._started = True
+        self._advance((match.start() if match else 0) - self.index)
+        self.result = yield from self._parse_value()
+
+    def _publish(self, value):
+        # expose a partially parsed value in its parent container
+        if self._slot is None:
+            return
+        container, key = self._slot
+        if isinstance(container, list) and key >= len(container):
+            container.append(value)
+        else:
+            container[key] = value
+
+    def _open(self, container):
+        if not self.stack and self.result is None:
+            self.result = container
+        else:
+            self._publish(container)
+        self.stack.append(container)
 
     def _parse_value(self):
-        self._skip_whitespace()
-        if self.current_char == '{':
-            if self._peek(1) == '{':  # Handle {{
-                self._advance(2)
-            return self._parse_object()
-        elif self.current_char == '[':
-            return self._parse_array()
+        yield from self._skip_whitespace()
+        if self.current_char == "{":
+            yield from self._wait(2)
+            doubled = self._peek(1) == "{"
+            if doubled:  # Handle {{
+                self._advance(1)
+            return (yield from self._parse_object(doubled))
+        elif self.current_char == "[":
+            return (yield from self._parse_array())
         elif self.current_char in ['"', "'", "`"]:
+            yield from self._wait(3)
             if self._peek(2) == self.current_char * 2:  # type: ignore
-                return self._parse_multiline_string()
-            return self._parse_string()
-        elif self.current_char and (self.current_char.isdigit() or self.current_char in ['-', '+']):
-            return self._parse_number()
-        elif self._match("true"):
+                return (yield from self._parse_multiline_string())
+            return (yield from self._parse_string())
+        elif self.current_char and (
+            self.current_char.isdigit() or self.current_char in ["-", "+"]
+        ):
+            return (yield from self._parse_number())
+
+        yield from self._wait(len("undefined") + 1)
+        if self._match("true"):
             return True
-        elif self._match('false'):
+        elif self._match("false"):
             return False
-        elif self._match('null') or self._match("undefined"):
+        elif self._match("null") or self._match("undefined"):
             return None
         elif self.current_char:
-            return self._parse_unquoted_string()
+            return (yield from self._parse_unquoted_string())
         return None
 
     def _match(self, text: str) -> bool:
@@ -87,19 +164,24 @@ class DirtyJson:
             self._advance(cnt)
             return True
         return False
-    
-    def _parse_object(self):
+
+    def _parse_object(self, doubled=False):
         obj = {}
         self._advance()  # Skip opening brace
-        self.stack.append(obj)
-        self._parse_object_content()
+        self._open(obj)
+        yield from self._parse_object_content(doubled)
         return obj
 
-    def _parse_object_content(self):
-        while self.current_char is not None:
-            self._skip_whitespace()
-            if self.current_char == '}':
-                if self._peek(1) == '}':  # Handle }}
+    def _parse_object_content(self, doubled=False):
+        while True:
+            yield from self._wait()
+            if self.current_char is None:
+                self.stack.pop()
+                return  # End of input reached right after the opening bracket
+            yield from self._skip_whitespace()
+            if self.current_char == "}":
+                yield from self._wait(2)
+                if doubled and self._peek(1) == "}":  # Handle }} closing {{
                     self._advance(2)
                 else:
                     self._advance()
@@ -108,78 +190,111 @@ class DirtyJson:
             if self.current_char is None:
                 self.stack.pop()
                 return  # End of input reached while parsing object
-            
-            key = self._parse_key()
+
+            self._slot = None
+            key = yield from self._parse_key()
             value = None
-            self._skip_whitespace()
-            
-            if self.current_char == ':':
+            yield from self._skip_whitespace()
+
+            self._slot = (self.stack[-1], key)
+            if self.current_char == ":":
                 self._advance()
-                value = self._parse_value()
+                value = yield from self._parse_value()
             elif self.current_char is None:
                 value = None  # End of input reached after key
             else:
-                value = self._parse_value()
-                
+                value = yield from self._parse_value()
+
             self.stack[-1][key] = value
-            
-            self._skip_whitespace()
-            if self.current_char == ',':
+
+            yield from self._skip_whitespace()
+            if self.current_char == ",":
                 self._advance()
                 continue
-            elif self.current_char != '}':
+            elif self.current_char != "}":
                 if self.current_char is None:
                     self.stack.pop()
                     return  # End of input reached after value
                 continue
 
     def _parse_key(self):
-        self._skip_whitespace()
+        yield from self._skip_whitespace()
         if self.current_char in ['"', "'"]:
-            return self._parse_string()
+            return (yield from self._parse_string())
         else:
-            return self._parse_unquoted_key()
+            return (yield from self._parse_unquoted_key())
 
     def _parse_unquoted_key(self):
         result = ""
-        while self.current_char is not None and not self.current_char.isspace() and self.current_char not in [':', ',', '}', ']']:
-            result += self.current_char
-            self._advance()
-        return result
+        while True:
+            while (
+                self.current_char is not None
+                and not self.current_char.isspace()
+                and self.current_char not in [":", ",", "}", "]"]
+            ):
+                result += self.current_char
+                self._advance()
+            if self.current_char is not None or self.completed:
+                return result
+            yield
 
     def _parse_array(self):
         arr = []
         self._advance()  # Skip opening bracket
-        self.stack.append(arr)
-        self._parse_array_content()
+        self._open(arr)
+        yield from self._parse_array_content()
         return arr
 
     def _parse_array_content(self):
-        while self.current_char is not None:
-            self._skip_whitespace()
-            if self.current_char == ']':
+        while True:
+            yield from self._wait()
+            if self.current_char is None:
+                self.stack.pop()
+                return  # End of input reached right after the opening bracket
+            yield from self._skip_whitespace()
+            if self.current_char == "]":
                 self._advance()
                 self.stack.pop()
                 return
-            value = self._parse_value()
-            self.stack[-1].append(value)
-            self._skip_whitespace()
-            if self.current_char == ',':
+            arr = self.stack[-1]
+            key = len(arr)
+            self._slot = (arr, key)
+            value = yield from self._parse_value()
+            if self.stack[-1] is arr and key < len(arr):
+                arr[key] = value  # replace the published partial value
+            else:
+                self.stack[-1].append(value)
+            yield from self._skip_whitespace()
+            if self.current_char == ",":
                 self._advance()
-            elif self.current_char != ']':
+            elif self.current_char != "]":
                 self.stack.pop()
                 return
 
     def _parse_string(self):
         result = ""
         quote_char = self.current_char
+        stops = _STRING_STOPS[quote_char]  # type: ignore
         self._advance()  # Skip opening quote
-        while self.current_char is not None and self.current_char != quote_char:
-            if self.current_char == '\\':
+        while True:
+            if self.current_char is None:
+                if self.completed:
+                    break
+                self._publish(result)
+                yield
+                # withdraw the partial value while appending, a string referenced only here
+                # is extended in place instead of copied for every chunk
+                self._publish(None)
+                continue
+            if self.current_char == quote_char:
+                self._advance()  # Skip closing quote
+                break
+            if self.current_char == "\\":
+                yield from self._wait(len("\\uXXXX"))
                 self._advance()
-                if self.current_char in ['"', "'", '\\', '/', 'b', 'f', 'n', 'r', 't']:
-                    result += {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}.get(self.current_char, self.current_char)
-                elif self.current_char == 'u':
+                if self.current_char in ["\"", "'", "\\", "/", "b", "f", "n", "r", "t"]:
+                    result += {"b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}.get(self.current_char, self.current_char)  # type: ignore
+                elif self.current_char == "u":
                     unicode_char = ""
                     for _ in range(4):
                         if self.current_char is None:
@@ -188,80 +303,76 @@ class DirtyJson:
                         self._advance()
                     result += chr(int(unicode_char, 16))
                     continue
-            else:
-                result += self.current_char
-            self._advance()
-        if self.current_char == quote_char:
-            self._advance()  # Skip closing quote
+                self._advance()
+                continue
+            # copy the plain run up to the next quote or escape at once
+            match = stops.search(self.json_string, self.index)
+            end = match.start() if match else len(self.json_string)
+            result += self.json_string[self.index : end]
+            self._advance(end - self.index)
         return result
 
     def _parse_multiline_string(self):
         result = ""
         quote_char = self.current_char
         self._advance(3)  # Skip first quote
-        while self.current_char is not None:
-            if self.current_char == quote_char and self._peek(2) == quote_char * 2: # type: ignore
-                self._advance(3)  # Skip first quote
-                break
-            result += self.current_char
-            self._advance()
+        while True:
+            if self.current_char is None:
+                if self.completed:
+                    break
+                self._publish(result.strip())
+                yield
+                self._publish(None)  # as in _parse_string
+                continue
+            if self.current_char == quote_char:
+                yield from self._wait(3)
+                if self._peek(2) == quote_char * 2:  # type: ignore
+                    self._advance(3)  # Skip first quote
+                    break
+                result += self.current_char  # type: ignore
+                self._advance()
+                continue
+            end = self.json_string.find(quote_char, self.index)  # type: ignore
+            if end == -1:
+                end = len(self.json_string)
+            result += self.json_string[self.index : end]
+            self._advance(end - self.index)
         return result.strip()
 
     def _parse_number(self):
         number_str = ""
-        while self.current_char is not None and (self.current_char.isdigit() or self.current_char in ['-', '+', '.', 'e', 'E']):
-            number_str += self.current_char
-            self._advance()
+        while True:
+            while self.current_char is not None and (
+                self.current_char.isdigit() or self.current_char in ["-", "+", ".", "e", "E"]
+            ):
+                number_str += self.current_char
+                self._advance()
+            if self.current_char is not None or self.completed:
+                break
+            yield
         try:
             return int(number_str)
         except ValueError:
             return float(number_str)
 
-    def _parse_true(self):
-        self._advance()
-        for char in 'rue':
-            if self.current_char != char:
-                return None
-            self._advance()
-        return True
-
-    def _parse_false(self):
-        self._advance()
-        for char in 'alse':
-            if self.current_char != char:
-                return None
-            self._advance()
-        return False
-
-    def _parse_null(self):
-        self._advance()
-        for char in 'ull':
-            if self.current_char != char:
-                return None
-            self._advance()
-        return None
-
     def _parse_unquoted_string(self):
         result = ""
-        while self.current_char is not None and self.current_char not in [':', ',', '}', ']']:
-            result += self.current_char
-            self._advance()
+        while True:
+            while self.current_char is not None and self.current_char not in [
+                ":",
+                ",",
+                "}",
+                "]",
+            ]:
+                result += self.current_char
+                self._advance()
+            if self.current_char is not None or self.completed:
+                break
+            yield
         self._advance()
         return result.strip()
 
     def _peek(self, n):
         peek_index = self.index + 1
-        result = ''
-        for _ in range(n):
-            if peek_index < len(self.json_string):
-                result += self.json_string[peek_index]
-                peek_index += 1
-            else:
-                break
-        return result
-
-    def get_start_pos(self, input_str: str) -> int:
-        chars = ["{", "[", '"']
-        indices = [input_str.find(char) for char in chars if input_str.find(char) != -1]
-        return min(indices) if indices else 0
+        return self.json_string[peek_index : peek_index + n]
 
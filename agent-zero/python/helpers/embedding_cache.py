@@ -0,0 +1,212 @@
+"""
+Embedding Cache - persistent embedding store and a scheduler batching embedding calls
+
+Cached embeddings live in one SQLite file instead of one file per embedding, lookups
+and writes of a whole batch are one query and one transaction. In front of the model,
+the scheduler gathers concurrent calls from all contexts and threads into batches of
+the size the provider accepts.
+"""
+
+import asyncio
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Iterator, List, Optional, Sequence
+from langchain_core.embeddings import Embeddings
+from langchain_core.stores import BaseStore
+from .print_style import PrintStyle
+
+MAX_VARIABLES = 500  # keys per query, below the SQLite limit of bound parameters
+MIGRATE_BATCH = 1000
+
+_stores: dict[str, "SQLiteByteStore"] = {}
+_stores_lock = threading.Lock()
+
+
+class SQLiteByteStore(BaseStore[str, bytes]):
+    """
+    Byte store in a single SQLite file, keys are the primary key of the table.
+    One connection is shared by all threads, use open_store to share it per file.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # a crash can lose the last writes, never corrupt
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        found: dict[str, bytes] = {}
+        with self._lock:
+            for start in range(0, len(keys), MAX_VARIABLES):
+                part = list(keys[start : start + MAX_VARIABLES])
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM cache WHERE key IN ({','.join('?' * len(part))})", part
+                )
+                found.update(rows)
+        return [found.get(key) for key in keys]
+
+    def mset(self, key_value_pairs: Sequence[tuple[str, bytes]]) -> None:
+        with self._lock, self._conn:  # one transaction
+            self._conn.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?)", list(key_value_pairs))
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in keys])
+
+    def yield_keys(self, *, prefix: str | None = None) -> Iterator[str]:
+        with self._lock:
+            if prefix:
+                rows = self._conn.execute(
+                    "SELECT key FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+                ).fetchall()
+            else:
+                rows = self._conn.execute("SELECT key FROM cache").fetchall()
+        for (key,) in rows:
+            yield key
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_store(path: str) -> SQLiteByteStore:
+    """Store of the file, opened once per process"""
+    path = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = SQLiteByteStore(path)
+        return store
+
+
+def migrate_file_store(directory: str, store: BaseStore[str, bytes]) -> int:
+    """Move embeddings cached one file per key (LocalFileStore) into the store, returns their count"""
+    if not os.path.isdir(directory):
+        return 0
+    count = 0
+    batch: list[tuple[str, bytes]] = []
+    for dir_path, _, file_names in os.walk(directory):
+        for name in file_names:
+            path = os.path.join(dir_path, name)
+            with open(path, "rb") as f:
+                batch.append((os.path.relpath(path, directory).replace(os.sep, "/"), f.read()))
+            if len(batch) >= MIGRATE_BATCH:
+                store.mset(batch)
+                count += len(batch)
+                batch.clear()
+    store.mset(batch)
+    count += len(batch)
+    shutil.rmtree(directory)  # removed only once everything is in the store
+    if count:
+        PrintStyle(font_color="gray").print(f"Moved {count} cached embeddings into {getattr(store, 'path', 'the store')}")
+    return count
+
+
+@dataclass
+class _Request:
+    kind: str  # "documents" or "query"
+    texts: list[str]
+    future: Future = field(default_factory=Future)
+
+
+class EmbeddingScheduler(Embeddings):
+    """
+    Embeddings model wrapper coalescing concurrent calls into batches.
+    Calls from any thread or event loop are queued to one worker, which waits up to
+    max_wait seconds for more calls and embeds documents batch_size texts per call.
+    Identical texts of a batch are embedded once, queries keep using embed_query.
+    Other attributes (model, model_name...) are passed to the wrapped model.
+    """
+
+    BATCH_SIZE = 256
+    MAX_WAIT = 0.01
+
+    def __init__(self, embeddings: Embeddings, batch_size: int = BATCH_SIZE, max_wait: float = MAX_WAIT):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.calls = 0  # calls made to the wrapped model
+        self._queue: queue.SimpleQueue[_Request] = queue.SimpleQueue()
+        self._worker: threading.Thread | None = None
+        self._worker_lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.__dict__["embeddings"], name)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._submit("documents", texts).result()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit("query", [text]).result()[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.wrap_future(self._submit("documents", texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await asyncio.wrap_future(self._submit("query", [text])))[0]
+
+    def _submit(self, kind: str, texts: List[str]) -> Future:
+        request = _Request(kind, list(texts))
+        if not request.texts:
+            request.future.set_result([])
+            return request.future
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-scheduler", daemon=True)
+                self._worker.start()
+        self._queue.put(request)
+        return request.future
+
+    def _run(self):
+        # a loop of its own, async models and rate limiters wait without blocking any context
+        loop = asyncio.new_event_loop()
+        while True:
+            requests = [self._queue.get()]
+            size = len(requests[0].texts)
+            deadline = time.monotonic() + self.max_wait
+            while size < self.batch_size:
+                try:
+                    request = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                requests.append(request)
+                size += len(request.texts)
+            loop.run_until_complete(self._embed(requests))
+
+    async def _embed(self, requests: list[_Request]):
+        for kind in ("documents", "query"):
+            group = [
+                request
+                for request in requests  # requests cancelled by their caller are skipped
+                if request.kind == kind and request.future.set_running_or_notify_cancel()
+            ]
+            if not group:
+                continue
+            unique = list(dict.fromkeys(text for request in group for text in request.texts))
+            try:
+                if kind == "documents":
+                    batches = [unique[i : i + self.batch_size] for i in range(0, len(unique), self.batch_size)]
+                    self.calls += len(batches)
+                    results = await asyncio.gather(*(self.embeddings.aembed_documents(b) for b in batches))
+                    vectors = [vector for result in results for vector in result]
+                else:
+                    self.calls += len(unique)
+                    vectors = await asyncio.gather(*(self.embeddings.aembed_query(text) for text in unique))
+                by_text = dict(zip(unique, vectors))
+                for request in group:
+                    request.future.set_result([by_text[text] for text in request.texts])
+            except Exception as e:
+                for request in group:
+                    request.future.set_exception(e)
@@ -1,13 +1,92 @@
+import asyncio
+import bisect
+import math
+import time
 from abc import abstractmethod
+from contextvars import ContextVar
 from typing import Any
 from agent import Agent
-    
+
+# position of the extension running in the current task, orders its output
+_writer: ContextVar[float] = ContextVar("extension_writer", default=math.inf)
+
+
 class Extension:
 
+    # modules (file names without .py) of the same folder this extension needs to finish first,
+    # None = all previous extensions in the folder (sequential), [] = independent, runs concurrently
+    depends_on: list[str] | None = None
+
     def __init__(self, agent: Agent, *args, **kwargs):
         self.agent = agent
         self.kwargs = kwargs
 
     @abstractmethod
     async def execute(self, **kwargs) -> Any:
-        pass
\ No newline at end of file
+        pass
+
+
+class OrderedList(list):
+    """
+    List shared by concurrent extensions (loop_data.system). Items appended by an
+    extension are kept in extension order, no matter which extension finished first.
+    """
+
+    def __init__(self, items=()):
+        super().__init__(items)
+        self._keys = [-math.inf] * len(self)
+
+    def append(self, item):
+        if len(self._keys) != len(self):  # changed by other list methods, keep existing order
+            self._keys = [-math.inf] * len(self)
+        key = _writer.get()
+        pos = bisect.bisect_right(self._keys, key)
+        self._keys.insert(pos, key)
+        super().insert(pos, item)
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+
+def get_name(cls: type) -> str:
+    return cls.__module__.rsplit(".", 1)[-1]
+
+
+async def run_extensions(agent: Agent, classes: list[type[Extension]], **kwargs) -> dict[str, float]:
+    """Run extensions as soon as their dependencies are done, returns durations in ms by module"""
+    timings: dict[str, float] = {}
+    by_module: dict[str, list[asyncio.Task]] = {}
+    tasks: list[asyncio.Task] = []
+
+    async def run(index: int, cls: type[Extension], deps: list[asyncio.Task]):
+        if deps:
+            await asyncio.gather(*deps)
+        _writer.set(index)
+        start = time.perf_counter()
+        try:
+            await cls(agent=agent).execute(**kwargs)
+        finally:
+            name = get_name(cls)
+            timings[name] = timings.get(name, 0) + (time.perf_counter() - start) * 1000
+
+    for index, cls in enumerate(classes):
+        if cls.depends_on is None:
+            deps = list(tasks)
+        else:
+            deps = [task for name in cls.depends_on for task in by_module.get(name, [])]
+        task = asyncio.create_task(run(index, cls, deps))
+        tasks.append(task)
+        by_module.setdefault(get_name(cls), []).append(task)
+
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    return timings
@@ -11,6 +11,14 @@ def json_parse_dirty(json:str) -> dict[str,Any] | None:
         if isinstance(data,dict): return data
     return None
 
+def get_tool_requests(data: dict[str,Any]) -> list[dict[str,Any]]:
+    # multiple tool requests can be listed in "tool_calls", otherwise the object is a single request
+    calls = data.get("tool_calls")
+    if isinstance(calls, list):
+        requests = [call for call in calls if isinstance(call, dict)]
+        if requests: return requests
+    return [data]
+
 def extract_json_object_string(content):
     start = content.find('{')
     if start == -1:
@@ -3,42 +3,9 @@ import os, re
 import re
 
 def read_file(relative_path, backup_dirs=None, **kwargs):
-    if backup_dirs is None:
-        backup_dirs = []
-
-    # Try to get the absolute path for the file from the original directory or backup directories
-    absolute_path = find_file_in_dirs(relative_path, backup_dirs)
-
-    # Read the file content
-    with open(absolute_path) as f:
-        content = remove_code_fences(f.read())
-
-    # Replace placeholders with values from kwargs
-    for key, value in kwargs.items():
-        placeholder = "{{" + key + "}}"
-        strval = str(value)
-        content = content.replace(placeholder, strval)
-
-    # Process include statements
-    content = process_includes(content, os.path.dirname(relative_path), backup_dirs, **kwargs)
-
-    return content
-
-def process_includes(content, base_path, backup_dirs, **kwargs):
-    # Regex to find {{ include 'path' }} or {{include'path'}}
-    include_pattern = re.compile(r"{{\s*include\s*['\"](.*?)['\"]\s*}}")
-
-    def replace_include(match):
-        include_path = match.group(1)
-        # First attempt to resolve the include relative to the base path
-        full_include_path = find_file_in_dirs(os.path.join(base_path, include_path), backup_dirs)
-        
-        # Recursively read the included file content, keeping the original base path
-        included_content = read_file(full_include_path, backup_dirs, **kwargs)
-        return included_content
-
-    # Replace all includes with the file content
-    return re.sub(include_pattern, replace_include, content)
+    # Prompts are compiled once (code fences removed, includes resolved) and cached until a file changes
+    from python.helpers import templates
+    return templates.get_cache().render(relative_path, backup_dirs, **kwargs)
 
 def find_file_in_dirs(file_path, backup_dirs):
     """
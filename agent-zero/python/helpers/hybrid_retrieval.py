@@ -0,0 +1,150 @@
+"""
+Hybrid Retrieval - keyword (BM25) and vector search of the vector memory, fused by rank
+
+Keyword search runs first on the FTS5 index of the memory database. When BM25 is
+confident, the top hit contains every query word and clearly outscores the next one,
+its ranking is returned and the query is never embedded. Otherwise the vector search
+runs and both rankings are combined by reciprocal rank fusion, so memories found by
+both come first. Results are cached per query until the memory changes.
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+from .vector_memory import VectorMemory, get_memory, query_terms
+
+RRF_K = 60  # rank offset of reciprocal rank fusion, damps the weight of the first ranks
+CANDIDATES = 20  # results taken from each search for the fusion, at least top_k
+CONFIDENT_MARGIN = 1.5  # BM25 score of the top hit over the second one to skip vector search
+CACHE_SIZE = 256
+
+_global_retriever: Optional["HybridRetriever"] = None
+_global_lock = threading.Lock()
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[tuple[int, float]]:
+    """IDs of all rankings by the sum of 1 / (k + rank) over the rankings they appear in"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, id in enumerate(ranking, 1):
+            scores[id] = scores.get(id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def bm25_confident(query: str, hits: List[Dict], margin: float = CONFIDENT_MARGIN) -> bool:
+    """Whether the top keyword hit contains every query word and clearly leads"""
+    if not hits:
+        return False
+    if not set(query_terms(query)) <= set(query_terms(hits[0]["content"])):
+        return False
+    return len(hits) == 1 or hits[0]["bm25"] >= margin * hits[1]["bm25"]
+
+
+class HybridRetriever:
+    """
+    Keyword and vector search of a vector memory combined by reciprocal rank fusion.
+    The vector search runs only when BM25 is not confident. With concurrent on, it starts
+    together with the keyword search on a worker thread instead, which saves the keyword
+    search time on fused queries but embeds every query, also those BM25 answers alone.
+    """
+
+    def __init__(
+        self,
+        memory: VectorMemory,
+        candidates: int = CANDIDATES,
+        rrf_k: int = RRF_K,
+        confident_margin: float = CONFIDENT_MARGIN,
+        cache_size: int = CACHE_SIZE,
+        concurrent: bool = False,
+    ):
+        self.memory = memory
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.confident_margin = confident_margin
+        self.cache_size = cache_size
+        self.concurrent = concurrent
+        self.dense_skipped = 0  # searches answered by BM25 alone without running the vector search
+        self._cache: OrderedDict[tuple, tuple[int, List[Dict]]] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hybrid-dense")
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        memory_type: Optional[str] = None,
+        similarity_threshold: float = 0.3,
+    ) -> List[Dict]:
+        """
+        Memories for a query, each with its fused "score", the "sources" that found it
+        and its "bm25" and "similarity" scores when found by that search
+        """
+        if top_k <= 0:
+            return []
+        key = (query, top_k, memory_type or None, similarity_threshold)
+        version = self.memory.version
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == version:
+                self._cache.move_to_end(key)
+                return [dict(result) for result in cached[1]]
+
+        results = self._search(query, top_k, memory_type, similarity_threshold)
+
+        with self._cache_lock:
+            self._cache[key] = (version, results)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return [dict(result) for result in results]
+
+    def _search(self, query: str, top_k: int, memory_type: Optional[str], similarity_threshold: float) -> List[Dict]:
+        count = max(top_k, self.candidates)
+        dense: Optional[Future] = None
+        if self.concurrent:
+            dense = self._executor.submit(self.memory.search, query, count, memory_type, similarity_threshold)
+
+        keyword = self.memory.keyword_search(query, count, memory_type)
+        if bm25_confident(query, keyword, self.confident_margin):
+            # a vector search already running can't be cancelled, it finishes on the worker unused
+            if dense is None or dense.cancel():
+                self.dense_skipped += 1
+            return [self._result(hit, 1.0 / (self.rrf_k + rank), keyword=hit) for rank, hit in enumerate(keyword[:top_k], 1)]
+
+        if dense is None:
+            vector = self.memory.search(query, count, memory_type, similarity_threshold)
+        else:
+            vector = dense.result()
+        by_id_keyword = {hit["id"]: hit for hit in keyword}
+        by_id_vector = {hit["id"]: hit for hit in vector}
+        fused = reciprocal_rank_fusion([list(by_id_keyword), list(by_id_vector)], self.rrf_k)
+        return [
+            self._result(
+                by_id_keyword.get(id) or by_id_vector[id], score,
+                keyword=by_id_keyword.get(id), vector=by_id_vector.get(id)
+            )
+            for id, score in fused[:top_k]
+        ]
+
+    @staticmethod
+    def _result(hit: Dict, score: float, keyword: Optional[Dict] = None, vector: Optional[Dict] = None) -> Dict:
+        result = {key: value for key, value in hit.items() if key not in ("bm25", "similarity")}
+        result["score"] = score
+        result["sources"] = [name for name, found in (("keyword", keyword), ("vector", vector)) if found]
+        result["bm25"] = keyword["bm25"] if keyword else None
+        result["similarity"] = vector["similarity"] if vector else None
+        return result
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_retriever(memory: Optional[VectorMemory] = None) -> HybridRetriever:
+    """Get or create the global retriever of the global vector memory, its cache is kept between calls"""
+    global _global_retriever
+    memory = memory or get_memory()
+    with _global_lock:
+        if _global_retriever is None or _global_retriever.memory is not memory:
+            _global_retriever = HybridRetriever(memory)
+        return _global_retriever
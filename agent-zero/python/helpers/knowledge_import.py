@@ -1,8 +1,14 @@
+import asyncio
+import fnmatch
 import glob
 import os
 import hashlib
 import json
-from typing import Any, Dict, Literal, TypedDict
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterable, Literal, TypedDict
 from langchain_community.document_loaders import (
     CSVLoader,
     JSONLoader,
@@ -11,11 +17,33 @@ from langchain_community.document_loaders import (
     UnstructuredHTMLLoader,
     UnstructuredMarkdownLoader,
 )
+from langchain_core.documents import Document
 from python.helpers import files
 from python.helpers.log import LogItem
+from python.helpers.print_style import PrintStyle
 
 text_loader_kwargs = {"autodetect_encoding": True}
 
+# Mapping file extensions to corresponding loader classes
+file_types_loaders = {
+    "txt": TextLoader,
+    "pdf": PyPDFLoader,
+    "csv": CSVLoader,
+    "html": UnstructuredHTMLLoader,
+    "json": JSONLoader,
+    # "md": UnstructuredMarkdownLoader,
+    "md": TextLoader,
+}
+
+CHECKSUM_CHUNK = 1 << 20  # files are hashed in 1 MB blocks, never read whole
+HASH_THREADS = 8
+PARSE_WORKERS = max(1, min(8, (os.cpu_count() or 2) - 1))
+PROCESS_MIN_FILES = 8  # fewer changed files are parsed in a thread, a process pool costs ~1s to start
+# the agent runs threads (web UI, watchers), forking it could copy a held lock into a worker
+PROCESS_START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
 
 class KnowledgeImport(TypedDict):
     file: str
@@ -25,14 +53,106 @@ class KnowledgeImport(TypedDict):
     documents: list[Any]
 
 
+@dataclass
+class KnowledgeRoot:
+    """A folder of knowledge files, with the metadata its documents get"""
+
+    dir: str
+    metadata: dict[str, Any]
+    filename_pattern: str = "**/*"
+
+    def contains(self, file: str) -> bool:
+        return file.startswith(self.dir + os.sep) and fnmatch.fnmatch(
+            os.path.basename(file), os.path.basename(self.filename_pattern)
+        )
+
+
+@dataclass
+class ImportJob:
+    """A changed knowledge file to parse, with the metadata of its folder"""
+
+    file: str
+    ext: str
+    size: int
+    metadata: dict[str, Any]
+
+
+@dataclass
+class ImportProgress:
+    """Counts and throughput of a knowledge import, reported at most every INTERVAL seconds"""
+
+    INTERVAL = 2.0
+
+    log_item: LogItem | None
+    files_total: int
+    files: int = 0
+    chunks: int = 0
+    bytes: int = 0
+    embedded: int = 0
+    reused: int = 0  # chunks already stored, not embedded again
+    started: float = field(default_factory=time.perf_counter)
+    _reported: float = field(default_factory=time.perf_counter)
+
+    def parsed(self, job: ImportJob, chunks: int):
+        self.files += 1
+        self.chunks += chunks
+        self.bytes += job.size
+        self._report()
+
+    def inserted(self, chunks: int):
+        self.embedded += chunks
+        self._report()
+
+    def summary(self) -> str:
+        seconds = max(time.perf_counter() - self.started, 1e-9)
+        return (
+            f"Imported {self.embedded} new chunks ({self.reused} unchanged)"
+            f" from {self.files}/{self.files_total} files"
+            f" in {seconds:.1f}s ({self.files / seconds:.1f} files/s,"
+            f" {self.embedded / seconds:.1f} chunks/s, {self.bytes / seconds / 2**20:.1f} MB/s)"
+        )
+
+    def finish(self):
+        self._report(force=True)
+
+    def _report(self, force=False):
+        now = time.perf_counter()
+        if not force and now - self._reported < self.INTERVAL:
+            return
+        self._reported = now
+        summary = self.summary()
+        PrintStyle(font_color="gray").print(summary)
+        if self.log_item:
+            self.log_item.stream(progress=f"\n{summary}")
+
+
 def calculate_checksum(file_path: str) -> str:
     hasher = hashlib.md5()
     with open(file_path, "rb") as f:
-        buf = f.read()
-        hasher.update(buf)
+        for buf in iter(lambda: f.read(CHECKSUM_CHUNK), b""):
+            hasher.update(buf)
     return hasher.hexdigest()
 
 
+def chunk_id(doc: Document) -> str:
+    """Content address of a chunk, identical chunks of one area are stored once"""
+    area = str(doc.metadata.get("area", ""))
+    return hashlib.sha256(f"{area}\0{doc.page_content}".encode("utf-8")).hexdigest()[:32]
+
+
+def load_file(job: ImportJob) -> list[Document]:
+    """Load and split one file, runs in a worker process"""
+    loader_cls = file_types_loaders[job.ext]
+    loader = loader_cls(
+        job.file,
+        **(text_loader_kwargs if job.ext in ["txt", "csv", "html", "md"] else {}),
+    )
+    documents = loader.load_and_split()
+    for doc in documents:
+        doc.metadata = {**doc.metadata, **job.metadata}
+    return documents
+
+
 def load_knowledge(
     log_item: LogItem | None,
     knowledge_dir: str,
@@ -40,22 +160,29 @@ def load_knowledge(
     metadata: dict[str, Any] = {},
     filename_pattern: str = "**/*",
 ) -> Dict[str, KnowledgeImport]:
+    """Scan and parse changed files in this process, their documents are set in the index"""
+    index, jobs = scan_knowledge(log_item, knowledge_dir, index, metadata, filename_pattern)
+    cnt_docs = 0
+    for job in jobs:
+        index[job.file]["documents"] = load_file(job)
+        cnt_docs += len(index[job.file]["documents"])
 
-    # from python.helpers.memory import Memory
+    print(f"Processed {cnt_docs} documents from {len(jobs)} files.")
+    if log_item:
+        log_item.stream(
+            progress=f"\nProcessed {cnt_docs} documents from {len(jobs)} files."
+        )
+    return index
 
-    # Mapping file extensions to corresponding loader classes
-    file_types_loaders = {
-        "txt": TextLoader,
-        "pdf": PyPDFLoader,
-        "csv": CSVLoader,
-        "html": UnstructuredHTMLLoader,
-        "json": JSONLoader,
-        # "md": UnstructuredMarkdownLoader,
-        "md": TextLoader,
-    }
 
-    cnt_files = 0
-    cnt_docs = 0
+def scan_knowledge(
+    log_item: LogItem | None,
+    knowledge_dir: str,
+    index: Dict[str, KnowledgeImport],
+    metadata: dict[str, Any] = {},
+    filename_pattern: str = "**/*",
+) -> tuple[Dict[str, KnowledgeImport], list[ImportJob]]:
+    """Mark files of the index original, changed or removed by checksum, changed files are returned as jobs"""
 
     # for area in Memory.Area:
     #     subdir = files.get_abs_path(knowledge_dir, area.value)
@@ -77,49 +204,114 @@ def load_knowledge(
                 progress=f"\nFound {len(kn_files)} knowledge files in {knowledge_dir}, processing...",
             )
 
-    for file_path in kn_files:
-        ext = file_path.split(".")[-1].lower()
-        if ext in file_types_loaders:
-            checksum = calculate_checksum(file_path)
-            file_key = file_path  # os.path.relpath(file_path, knowledge_dir)
-
-            # Load existing data from the index or create a new entry
-            file_data = index.get(file_key, {})
-
-            if file_data.get("checksum") == checksum:
-                file_data["state"] = "original"
-            else:
-                file_data["state"] = "changed"
-
-            if file_data["state"] == "changed":
-                file_data["checksum"] = checksum
-                loader_cls = file_types_loaders[ext]
-                loader = loader_cls(
-                    file_path,
-                    **(
-                        text_loader_kwargs
-                        if ext in ["txt", "csv", "html", "md"]
-                        else {}
-                    ),
-                )
-                file_data["documents"] = loader.load_and_split()
-                for doc in file_data["documents"]:
-                    doc.metadata = {**doc.metadata, **metadata}
-                cnt_files += 1
-                cnt_docs += len(file_data["documents"])
-                # print(f"Imported {len(file_data['documents'])} documents from {file_path}")
-
-            # Update the index
-            index[file_key] = file_data  # type: ignore
+    kn_files = [f for f in kn_files if f.split(".")[-1].lower() in file_types_loaders]
+    jobs = _check_files(index, [(f, metadata) for f in kn_files])
 
     # loop index where state is not set and mark it as removed
     for file_key, file_data in index.items():
         if not file_data.get("state", ""):
             index[file_key]["state"] = "removed"
 
-    print(f"Processed {cnt_docs} documents from {cnt_files} files.")
-    if log_item:
-        log_item.stream(
-            progress=f"\nProcessed {cnt_docs} documents from {cnt_files} files."
+    return index, jobs
+
+
+def rescan_files(
+    paths: Iterable[str],
+    index: Dict[str, KnowledgeImport],
+    roots: list[KnowledgeRoot],
+) -> tuple[Dict[str, KnowledgeImport], list[ImportJob]]:
+    """Like scan_knowledge, limited to the given paths, all other files of the index stay original.
+    A folder stands for every file under it, also files of the index that are gone with it."""
+    for file_data in index.values():
+        file_data["state"] = "original"
+
+    candidates: set[str] = set()
+    for path in paths:
+        if os.path.isdir(path):
+            candidates.update(glob.glob(path + "/**/*", recursive=True))
+        else:
+            candidates.add(path)
+        candidates.update(key for key in index if key.startswith(path + os.sep))
+
+    found = []
+    for file_path in sorted(candidates):
+        root = next((root for root in roots if root.contains(file_path)), None)
+        if (
+            root is not None
+            and os.path.isfile(file_path)
+            and file_path.split(".")[-1].lower() in file_types_loaders
+        ):
+            found.append((file_path, root.metadata))
+        elif file_path in index:
+            index[file_path]["state"] = "removed"
+
+    return index, _check_files(index, found)
+
+
+def _check_files(
+    index: Dict[str, KnowledgeImport], found: list[tuple[str, dict[str, Any]]]
+) -> list[ImportJob]:
+    """Mark files original or changed by checksum, changed files are returned as jobs"""
+    # hashing is I/O bound and hashlib releases the GIL, files are hashed concurrently
+    with ThreadPoolExecutor(HASH_THREADS) as pool:
+        checksums = list(pool.map(calculate_checksum, [file_path for file_path, _ in found]))
+
+    jobs = []
+    for (file_path, metadata), checksum in zip(found, checksums):
+        ext = file_path.split(".")[-1].lower()
+        file_key = file_path  # os.path.relpath(file_path, knowledge_dir)
+
+        # Load existing data from the index or create a new entry
+        file_data = index.get(file_key, {})
+
+        if file_data.get("checksum") == checksum:
+            file_data["state"] = "original"
+        else:
+            file_data["state"] = "changed"
+
+        if file_data["state"] == "changed":
+            file_data["checksum"] = checksum
+            jobs.append(ImportJob(file_path, ext, os.path.getsize(file_path), metadata))
+
+        # Update the index
+        index[file_key] = file_data  # type: ignore
+
+    return jobs
+
+
+async def parse_files(
+    jobs: list[ImportJob], workers: int = PARSE_WORKERS
+) -> AsyncIterator[tuple[ImportJob, list[Document] | None]]:
+    """Load and split files in a process pool, yielded as they finish, None for files that failed.
+    At most 2 * workers files are in flight, so a slow consumer holds back parsing."""
+    if not jobs:
+        return
+    loop = asyncio.get_running_loop()
+    if len(jobs) >= PROCESS_MIN_FILES and workers > 1:
+        executor = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context(PROCESS_START_METHOD)
         )
-    return index
+    else:
+        executor = ThreadPoolExecutor(1)
+
+    try:
+        queued = iter(jobs)
+        pending: dict[asyncio.Future, ImportJob] = {}
+        while True:
+            for job in queued:
+                pending[loop.run_in_executor(executor, load_file, job)] = job
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                break
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                job = pending.pop(future)
+                try:
+                    documents = future.result()
+                except Exception as e:
+                    PrintStyle.error(f"Failed to load knowledge file {job.file}: {e}")
+                    documents = None
+                yield job, documents
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,150 @@
+"""
+Knowledge Watcher - live incremental re-indexing of knowledge folders
+
+Changed paths are collected from inotify (through watchdog, when it is installed) or by
+polling modification times, and handed to a callback as one batch once the folders have
+been quiet for DEBOUNCE_SECONDS, so a copied folder or an editor saving in several steps
+triggers one update. A batch is never held back longer than MAX_DELAY_SECONDS, and changes
+made while the callback runs are collected for the next batch.
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Iterable
+from python.helpers.print_style import PrintStyle
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # polling fallback
+    FileSystemEventHandler = object
+    Observer = None
+
+DEBOUNCE_SECONDS = 1.0  # quiet time before a batch is handed over
+MAX_DELAY_SECONDS = 10.0  # continuous changes still go out this often
+POLL_SECONDS = 2.0  # scan interval without inotify
+
+
+class KnowledgeWatcher:
+    """Watches folders recursively, calls on_change with the changed paths from a background thread"""
+
+    def __init__(
+        self,
+        folders: list[str],
+        on_change: Callable[[set[str]], None],
+        debounce: float = DEBOUNCE_SECONDS,
+        max_delay: float = MAX_DELAY_SECONDS,
+        poll: float = POLL_SECONDS,
+        inotify: bool = True,
+    ):
+        self.folders = [os.path.normpath(folder) for folder in folders]
+        self.on_change = on_change
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll = poll
+        self.mode = "inotify" if inotify and Observer is not None else "polling"
+        self._changed: set[str] = set()
+        self._first = self._last = 0.0
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._observer = None
+
+    def start(self):
+        if self.mode == "inotify":
+            self._observer = Observer()  # type: ignore
+            handler = _EventHandler(self.notify)
+            for folder in self.folders:
+                if os.path.isdir(folder):
+                    self._observer.schedule(handler, folder, recursive=True)
+            self._observer.start()
+        else:
+            snapshot = _snapshot(self.folders)  # taken now, changes from here on are reported
+            self._start_thread(lambda: self._poll(snapshot), "poll")
+        self._start_thread(self._debounce, "debounce")
+
+    def stop(self):
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._observer is not None:
+            self._observer.stop()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=5)
+
+    def notify(self, paths: Iterable[str]):
+        """Record changed paths, safe to call from any thread"""
+        with self._cond:
+            now = time.monotonic()
+            if not self._changed:
+                self._first = now
+            self._changed.update(os.path.normpath(path) for path in paths)
+            self._last = now
+            self._cond.notify_all()
+
+    def _start_thread(self, target: Callable[[], None], name: str):
+        thread = threading.Thread(target=target, name=f"knowledge-watcher-{name}", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _debounce(self):
+        while not self._stopped.is_set():
+            with self._cond:
+                while not self._changed and not self._stopped.is_set():
+                    self._cond.wait()
+                while not self._stopped.is_set():
+                    now = time.monotonic()
+                    wait = min(self._last + self.debounce, self._first + self.max_delay) - now
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                paths, self._changed = self._changed, set()
+            if paths and not self._stopped.is_set():
+                try:
+                    self.on_change(paths)
+                except Exception as e:
+                    PrintStyle.error(f"Knowledge update failed: {e}")
+
+    def _poll(self, snapshot: dict[str, tuple[int, int]]):
+        while not self._stopped.wait(self.poll):
+            current = _snapshot(self.folders)
+            changed = {
+                path
+                for path in snapshot.keys() | current.keys()
+                if snapshot.get(path) != current.get(path)
+            }
+            snapshot = current
+            if changed:
+                self.notify(changed)
+
+
+class _EventHandler(FileSystemEventHandler):  # type: ignore
+
+    def __init__(self, notify: Callable[[Iterable[str]], None]):
+        super().__init__()
+        self._notify = notify
+
+    def on_any_event(self, event):
+        if event.event_type in ("opened", "closed_no_write") or (
+            event.is_directory and event.event_type == "modified"
+        ):
+            return  # reads and directory timestamps change no content
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        self._notify(os.fsdecode(path) for path in paths if path)
+
+
+def _snapshot(folders: list[str]) -> dict[str, tuple[int, int]]:
+    """Modification time and size of every file under the folders"""
+    snapshot = {}
+    for folder in folders:
+        for dir_path, _, file_names in os.walk(folder):
+            for name in file_names:
+                path = os.path.join(dir_path, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # removed while scanning
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
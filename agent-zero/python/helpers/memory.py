@@ -1,10 +1,6 @@
 from datetime import datetime
 from typing import Any, List, Sequence
 from langchain_core.stores import InMemoryByteStore
-try:
-    from langchain.storage import LocalFileStore
-except ImportError:
-    from langchain_community.storage import LocalFileStore
 from langchain.embeddings import CacheBackedEmbeddings
 
 # from langchain_chroma import Chroma
@@ -14,19 +10,68 @@ from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores.utils import (
     DistanceStrategy,
 )
-import os, json
+import os, json, asyncio, contextlib, threading
 
 import numpy as np
 from . import files
 from langchain_core.documents import Document
 import uuid
-from python.helpers import knowledge_import
+from python.helpers import embedding_cache, knowledge_import, knowledge_watcher, rate_limiter, memory_wal, memory_index, memory_filter, memory_docstore
 from python.helpers.log import Log, LogItem
 from enum import Enum
 from agent import Agent
 
 
 class MyFaiss(FAISS):
+    # vectors are stored under explicit labels (keys of index_to_docstore_id), see memory_index
+
+    EXACT_SUBSET_MAX = 10_000  # filtered searches over fewer candidates are scored exactly
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index = memory_index.with_labels(self.index, self.index_to_docstore_id)
+        self.index_kind = "flat"  # configured kind, the index itself stays flat while small
+        self.rebuilding = False
+        # FAISS add and remove_ids are not safe next to a search, writers (the write-ahead log,
+        # index rebuilds, knowledge refreshes) and searches all hold this lock
+        self.lock = threading.RLock()
+        self._metadata: memory_filter.MetadataIndex | None = None
+        # reverse of index_to_docstore_id, kept in step by _add_vectors and delete
+        self._labels_by_id = {id: label for label, id in self.index_to_docstore_id.items()}
+        self.index_changed()
+
+    @classmethod
+    def load_local(
+        cls,
+        folder_path: str,
+        embeddings,
+        index_name: str = "index",
+        *,
+        allow_dangerous_deserialization: bool = False,
+        **kwargs,
+    ):
+        """Like FAISS.load_local, with the index memory mapped and documents of a segment left on disk"""
+        if not allow_dangerous_deserialization:
+            raise ValueError("Loading a pickled memory database requires allow_dangerous_deserialization=True")
+        index = memory_index.read(os.path.join(folder_path, f"{index_name}.faiss"))
+        docstore, index_to_docstore_id = memory_docstore.load(folder_path, index_name)
+        db = cls(embeddings, index, docstore, index_to_docstore_id, **kwargs)
+        db.index_mapped = bool(memory_index.MMAP_FLAG) and db.index is index  # legacy ones are copied when wrapped
+        return db
+
+    def _own_index(self):
+        # a memory mapped index is read only, the first write copies it into RAM
+        if self.index_mapped:
+            self.index = memory_index.copy(self.index)
+            self.index_changed()
+
+    def index_changed(self):
+        self.index_mapped = False
+        self._next_label: int | None = None
+        self._deleted: np.ndarray | None = None  # labels deleted but still in the index
+        self._deleted_params = None
+        self._deleted_selectors = None
+
     # override aget_by_ids
     def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
         # return all self.docstore._dict[id] in ids
@@ -35,6 +80,211 @@ class MyFaiss(FAISS):
     async def aget_by_ids(self, ids: Sequence[str], /) -> List[Document]:
         return self.get_by_ids(ids)
 
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs) -> List[str]:
+        texts = list(texts)
+        return self._add_vectors(texts, self._embed_documents(texts), metadatas, ids)
+
+    def add_embeddings(self, text_embeddings, metadatas=None, ids=None, **kwargs) -> List[str]:
+        texts, embeddings = zip(*text_embeddings) if text_embeddings else ((), ())
+        return self._add_vectors(list(texts), list(embeddings), metadatas, ids)
+
+    def _add_vectors(self, texts, embeddings, metadatas=None, ids=None) -> List[str]:
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        if len(ids) != len(set(ids)):
+            raise ValueError("Duplicate ids found in the ids list.")
+        if not texts:
+            return []
+        vectors = np.array(embeddings, dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+
+        if self._next_label is None:
+            stored = memory_index.labels_of(self.index)
+            self._next_label = int(stored.max()) + 1 if len(stored) else 0
+        labels = np.arange(self._next_label, self._next_label + len(ids), dtype=np.int64)
+        self._next_label += len(ids)
+        self._own_index()
+
+        # mapping first, a concurrent search must never see an unknown label
+        self.docstore.add(  # type: ignore
+            {id: Document(id=id, page_content=t, metadata=m) for id, t, m in zip(ids, texts, metadatas)}
+        )
+        self.index_to_docstore_id.update(zip(labels.tolist(), ids))
+        self._labels_by_id.update(zip(ids, labels.tolist()))
+        self.index.add_with_ids(vectors, labels)
+        if self._metadata is not None:
+            for label, metadata in zip(labels.tolist(), metadatas):
+                self._metadata.add(label, metadata)
+        return ids
+
+    def delete(self, ids: list[str] | None = None, **kwargs) -> bool | None:
+        if ids is None:
+            raise ValueError("No ids provided to delete.")
+        missing = set(ids).difference(self._labels_by_id)
+        if missing:
+            raise ValueError(f"Some specified ids do not exist in the current store. Ids not found: {missing}")
+
+        labels = np.array([self._labels_by_id[id] for id in ids], dtype=np.int64)
+        self._own_index()
+        if not memory_index.remove(self.index, labels):
+            self._deleted = None  # stay in the index until the next rebuild, skipped by search
+        if self._metadata is not None:
+            for label, id in zip(labels.tolist(), ids):
+                self._metadata.remove(label, self._doc_metadata(id))
+        self.docstore.delete(ids)  # type: ignore
+        for label, id in zip(labels.tolist(), ids):
+            del self.index_to_docstore_id[label]
+            del self._labels_by_id[id]
+        return True
+
+    def update_metadata(self, ids: list[str], metadatas: list[dict]):
+        """Replace the metadata of stored documents, vectors and labels are kept"""
+        for id, metadata in zip(ids, metadatas):
+            old = self.docstore.search(id)
+            if not isinstance(old, Document):
+                raise ValueError(f"Could not find document for id {id}, got {old}")
+            if self._metadata is not None:
+                self._metadata.remove(self._labels_by_id[id], old.metadata)
+                self._metadata.add(self._labels_by_id[id], metadata)
+            self.docstore.delete([id])  # type: ignore
+            self.docstore.add({id: Document(id=id, page_content=old.page_content, metadata=metadata)})  # type: ignore
+
+    def similarity_search_with_score_by_vector(
+        self, embedding, k: int = 4, filter=None, fetch_k: int = 20, **kwargs
+    ):
+        with self.lock:
+            return self._search_by_vector(embedding, k, filter, fetch_k, **kwargs)
+
+    def _search_by_vector(self, embedding, k: int, filter, fetch_k: int, **kwargs):
+        vector = np.array([embedding], dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vector)
+        index = self.index
+
+        candidates, exact, filter = self._plan_filter(filter)
+        if candidates is not None:
+            # only vectors matching the indexed part of the filter are scored
+            if not candidates:
+                return []
+            scores, labels = self._search_subset(index, vector, candidates, k if exact else fetch_k)
+        else:
+            scores, labels = index.search(
+                vector, k if filter is None else fetch_k, params=self._search_params(index)
+            )
+        filter_func = self._create_filter_func(filter) if filter is not None and not exact else None
+
+        docs = []
+        for score, label in zip(scores[0], labels[0]):
+            id = self.index_to_docstore_id.get(int(label))
+            if id is None:
+                continue  # not enough results, or deleted meanwhile
+            doc = self.docstore.search(id)
+            if not isinstance(doc, Document):
+                raise ValueError(f"Could not find document for id {id}, got {doc}")
+            if filter_func is None or filter_func(doc.metadata):
+                docs.append((doc, float(score)))
+
+        score_threshold = kwargs.get("score_threshold")
+        if score_threshold is not None:
+            higher_is_better = self.distance_strategy in (
+                DistanceStrategy.MAX_INNER_PRODUCT,
+                DistanceStrategy.JACCARD,
+            )
+            docs = [
+                (doc, score) for doc, score in docs
+                if (score >= score_threshold if higher_is_better else score <= score_threshold)
+            ]
+        return docs[:k]
+
+    def range_search_with_score_by_vectors(
+        self, embeddings: list[list[float]], radius: float, filter=None
+    ) -> list[list[tuple[Document, float]]]:
+        """Documents scoring above radius for each embedding, by one range search over the batch"""
+        with self.lock:
+            return self._range_search(embeddings, radius, filter)
+
+    def _range_search(self, embeddings: list[list[float]], radius: float, filter) -> list[list[tuple[Document, float]]]:
+        vectors = np.array(embeddings, dtype=np.float32).reshape(-1, self.index.d)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+        index = self.index
+
+        candidates, exact, filter = self._plan_filter(filter)
+        if candidates is not None:
+            if not candidates:
+                return [[] for _ in vectors]
+            selector = faiss.IDSelectorBatch(
+                np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            )
+            params = memory_index.search_params(index, selector)
+        else:
+            params = self._search_params(index)
+        lims, scores, labels = index.range_search(vectors, radius, params=params)
+        filter_func = self._create_filter_func(filter) if filter is not None and not exact else None
+
+        results = []
+        for row in range(len(vectors)):
+            docs = []
+            for score, label in zip(scores[lims[row] : lims[row + 1]], labels[lims[row] : lims[row + 1]]):
+                id = self.index_to_docstore_id.get(int(label))
+                doc = self.docstore.search(id) if id is not None else None
+                if isinstance(doc, Document) and (filter_func is None or filter_func(doc.metadata)):
+                    docs.append((doc, float(score)))
+            docs.sort(key=lambda result: result[1], reverse=True)
+            results.append(docs)
+        return results
+
+    def _plan_filter(self, filter):
+        """Candidate labels of a compiled filter, whether they all match, and the filter left to apply"""
+        if not isinstance(filter, memory_filter.Filter):
+            return None, False, filter
+        candidates, exact = filter.candidates(self.metadata_index)
+        if exact and len(candidates) >= len(self.index_to_docstore_id):  # type: ignore
+            return None, True, None  # everything matches, e.g. the area of an area database
+        return candidates, exact, filter
+
+    @property
+    def metadata_index(self) -> memory_filter.MetadataIndex:
+        if self._metadata is None:
+            metadata = memory_filter.MetadataIndex()
+            for label, id in list(self.index_to_docstore_id.items()):
+                doc_metadata = self._doc_metadata(id)
+                if doc_metadata is not None:
+                    metadata.add(label, doc_metadata)
+            self._metadata = metadata
+        return self._metadata
+
+    def _doc_metadata(self, id: str) -> dict | None:
+        if isinstance(self.docstore, memory_docstore.DiskDocstore):
+            return self.docstore.metadata(id)  # without loading the text
+        doc = self.docstore._dict.get(id)  # type: ignore
+        return doc.metadata if doc is not None else None
+
+    def _search_subset(self, index, vector: np.ndarray, candidates: set[int], k: int):
+        labels = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        if memory_index.kind_of(index) != "flat" and len(labels) <= self.EXACT_SUBSET_MAX:
+            # an ANN index would probe too few cells/nodes to find a small subset
+            scores = memory_index.reconstruct(index, labels) @ vector[0]
+            top = np.argsort(-scores)[:k] if len(scores) <= k else np.argpartition(-scores, k)[:k]
+            top = top[np.argsort(-scores[top])]
+            return scores[top][None, :], labels[top][None, :]
+        selector = faiss.IDSelectorBatch(labels)
+        return index.search(vector, k, params=memory_index.search_params(index, selector))
+
+    def _search_params(self, index):
+        # exclude vectors that were deleted but could not be removed (HNSW)
+        if self._deleted is None:
+            if index.ntotal <= len(self.index_to_docstore_id):
+                return None
+            stored = memory_index.labels_of(index)
+            self._deleted = np.setdiff1d(stored, np.fromiter(self.index_to_docstore_id, dtype=np.int64))
+            batch = faiss.IDSelectorBatch(self._deleted)
+            selector = faiss.IDSelectorNot(batch)
+            self._deleted_params = memory_index.search_params(index, selector)
+            self._deleted_selectors = (batch, selector)  # referenced by the params in C++
+        return self._deleted_params
+
 
 class Memory:
 
@@ -44,7 +294,15 @@ class Memory:
         SOLUTIONS = "solutions"
         INSTRUMENTS = "instruments"
 
-    index: dict[str, "MyFaiss"] = {}
+    _AREAS = frozenset(area.value for area in Area)
+
+    EMBED_BATCH = 256  # knowledge chunks embedded per call
+    IMPORT_QUEUE = 16  # parsed knowledge files waiting to be embedded
+
+    # one database per area, in memory/<subdir>/<area>, searches only touch the areas they filter on
+    index: dict[str, dict[str, "MyFaiss"]] = {}
+    wal: dict[str, memory_wal.MemoryWal] = {}  # write-behind persistence per database
+    watchers: dict[str, knowledge_watcher.KnowledgeWatcher] = {}  # live knowledge updates per subdir
 
     @staticmethod
     async def get(agent: Agent):
@@ -54,18 +312,33 @@ class Memory:
                 type="util",
                 heading=f"Initializing VectorDB in '/{memory_subdir}'",
             )
-            db = Memory.initialize(
-                log_item,
-                agent.config.embeddings_model,
-                memory_subdir,
-                False,
-            )
-            Memory.index[memory_subdir] = db
-            wrap = Memory(agent, db, memory_subdir=memory_subdir)
+            print("Initializing VectorDB...")
+            log_item.stream(progress="\nInitializing VectorDB")
+            embedder = Memory._embedder(Memory._rate_limited_embeddings(agent), False)
+            Memory._split_shared_db(log_item, embedder, memory_subdir)
+
+            dbs: dict[str, MyFaiss] = {}
+            dim = None
+            for area in Memory.Area:
+                db_dir = Memory._abs_db_dir(memory_subdir, area.value)
+                db = Memory._load_db(log_item, embedder, db_dir, dim)
+                db.index_kind = agent.config.memory_index_areas.get(
+                    area.value, agent.config.memory_index
+                )
+                Memory.wal[Memory._wal_key(memory_subdir, area.value)] = memory_wal.MemoryWal(db_dir, db)
+                dbs[area.value] = db
+                dim = db.index.d
+            Memory.index[memory_subdir] = dbs
+
+            wrap = Memory(agent, dbs, memory_subdir=memory_subdir)
+            for area in dbs:
+                wrap._maintain_index(area)  # migrates an existing index to the configured kind
             if agent.config.knowledge_subdirs:
                 await wrap.preload_knowledge(
                     log_item, agent.config.knowledge_subdirs, memory_subdir
                 )
+                if agent.config.knowledge_watch:
+                    wrap.watch_knowledge(agent.config.knowledge_subdirs, memory_subdir)
             return wrap
         else:
             return Memory(
@@ -74,12 +347,29 @@ class Memory:
                 memory_subdir=memory_subdir,
             )
 
+    @staticmethod
+    def _rate_limited_embeddings(agent: Agent):
+        config = agent.config
+        if not (config.embeddings_rate_limit_requests or config.embeddings_rate_limit_input_tokens):
+            return config.embeddings_model
+        # the database outlives the agent, so the limiter does not log into its context
+        limiter = rate_limiter.RateLimiter(
+            None,
+            max_calls=config.embeddings_rate_limit_requests,
+            max_input_tokens=config.embeddings_rate_limit_input_tokens,
+            max_output_tokens=0,
+            window_seconds=config.rate_limit_seconds,
+            name="embeddings",
+        )
+        return rate_limiter.RateLimitedEmbeddings(config.embeddings_model, limiter)
+
     @staticmethod
     def initialize(
         log_item: LogItem | None,
         embeddings_model,
         memory_subdir: str,
         in_memory=False,
+        area: str = "",
     ) -> MyFaiss:
 
         print("Initializing VectorDB...")
@@ -87,23 +377,26 @@ class Memory:
         if log_item:
             log_item.stream(progress="\nInitializing VectorDB")
 
+        embedder = Memory._embedder(embeddings_model, in_memory)
+        return Memory._load_db(log_item, embedder, Memory._abs_db_dir(memory_subdir, area))
+
+    @staticmethod
+    def _embedder(embeddings_model, in_memory=False) -> CacheBackedEmbeddings:
         em_dir = files.get_abs_path(
             "memory/embeddings"
         )  # just caching, no need to parameterize
-        db_dir = Memory._abs_db_dir(memory_subdir)
-
-        # make sure embeddings and database directories exist
-        os.makedirs(db_dir, exist_ok=True)
 
         if in_memory:
             store = InMemoryByteStore()
         else:
-            os.makedirs(em_dir, exist_ok=True)
-            store = LocalFileStore(em_dir)
-
-        # here we setup the embeddings model with the chosen cache storage
-        embedder = CacheBackedEmbeddings.from_bytes_store(
-            embeddings_model,
+            # one indexed file, embeddings cached one file each by older versions are moved in
+            store = embedding_cache.open_store(em_dir + ".db")
+            embedding_cache.migrate_file_store(em_dir, store)
+
+        # here we setup the embeddings model with the chosen cache storage,
+        # cache misses of concurrent calls are sent to the model together
+        return CacheBackedEmbeddings.from_bytes_store(
+            embedding_cache.EmbeddingScheduler(embeddings_model),
             store,
             namespace=getattr(
                 embeddings_model,
@@ -112,12 +405,22 @@ class Memory:
             ),
         )
 
+    @staticmethod
+    def _load_db(
+        log_item: LogItem | None, embedder, db_dir: str, dim: int | None = None
+    ) -> MyFaiss:
+        # make sure the database directory exists
+        os.makedirs(db_dir, exist_ok=True)
+
         # self.db = Chroma(
         #     embedding_function=self.embedder,
         #     persist_directory=db_dir)
 
+        # finish a checkpoint interrupted by a crash before loading it
+        memory_wal.recover_checkpoint(db_dir)
+
         # if db folder exists and is not empty:
-        if os.path.exists(db_dir) and files.exists(db_dir, "index.faiss"):
+        if os.path.exists(os.path.join(db_dir, "index.faiss")):
             db = MyFaiss.load_local(
                 folder_path=db_dir,
                 embeddings=embedder,
@@ -127,32 +430,138 @@ class Memory:
                 relevance_score_fn=Memory._cosine_normalizer,
             )
         else:
-            index = faiss.IndexFlatIP(len(embedder.embed_query("example")))
+            db = Memory._new_db(embedder, dim or len(embedder.embed_query("example")))
 
-            db = MyFaiss(
-                embedding_function=embedder,
-                index=index,
-                docstore=InMemoryDocstore(),
-                index_to_docstore_id={},
-                distance_strategy=DistanceStrategy.COSINE,
-                # normalize_L2=True,
-                relevance_score_fn=Memory._cosine_normalizer,
-            )
+        # apply writes made after the last checkpoint
+        replayed = memory_wal.replay(db_dir, db)
+        if replayed and log_item:
+            log_item.stream(progress=f"\nRecovered {replayed} memory writes")
         return db  # type: ignore
 
+    @staticmethod
+    def _new_db(embedder, dim: int) -> MyFaiss:
+        return MyFaiss(
+            embedding_function=embedder,
+            index=memory_index.create("flat", dim),
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={},
+            distance_strategy=DistanceStrategy.COSINE,
+            # normalize_L2=True,
+            relevance_score_fn=Memory._cosine_normalizer,
+        )
+
+    @staticmethod
+    def _split_shared_db(log_item: LogItem | None, embedder, memory_subdir: str):
+        """Move a database shared by all areas (older versions) into one database per area"""
+        db_dir = Memory._abs_db_dir(memory_subdir)
+        files_to_move = [
+            os.path.join(db_dir, name)
+            for name in (*memory_wal.INDEX_FILES, memory_wal.WAL_FILE)
+            if os.path.exists(os.path.join(db_dir, name))
+        ]
+        if not files_to_move:
+            return
+
+        shared = Memory._load_db(log_item, embedder, db_dir)
+        labels_by_area: dict[str, list[int]] = {area.value: [] for area in Memory.Area}
+        for label, id in shared.index_to_docstore_id.items():
+            area = shared.docstore._dict[id].metadata.get("area", "")  # type: ignore
+            labels_by_area[Memory._area_of(area)].append(label)
+
+        for area, labels in labels_by_area.items():
+            db = Memory._new_db(embedder, shared.index.d)
+            if labels:
+                ids = [shared.index_to_docstore_id[label] for label in labels]
+                docs = [shared.docstore._dict[id] for id in ids]  # type: ignore
+                vectors = memory_index.reconstruct(shared.index, np.array(labels, dtype=np.int64))
+                db.add_embeddings(
+                    list(zip([doc.page_content for doc in docs], vectors.tolist())),
+                    metadatas=[doc.metadata for doc in docs],
+                    ids=ids,
+                )
+            db.save_local(Memory._abs_db_dir(memory_subdir, area))
+
+        # the shared files go only after every area is written, an interrupted split is redone
+        for path in files_to_move:
+            os.remove(path)
+        if log_item:
+            log_item.stream(progress=f"\nSplit {len(shared.index_to_docstore_id)} memories by area")
+
     def __init__(
         self,
         agent: Agent,
-        db: MyFaiss,
+        db: "MyFaiss | dict[str, MyFaiss]",
         memory_subdir: str,
     ):
         self.agent = agent
-        self.db = db
+        # databases by area, or a single database holding all areas under the key ""
+        self.dbs: dict[str, MyFaiss] = db if isinstance(db, dict) else {"": db}
         self.memory_subdir = memory_subdir
 
+    @property
+    def db(self) -> MyFaiss:
+        return self.dbs[self._area_key(Memory.Area.MAIN.value)]
+
+    @staticmethod
+    def _area_of(area: Any) -> str:
+        # memories of unknown areas are kept with the main area
+        if isinstance(area, str) and area in Memory._AREAS:
+            return area
+        return Memory.Area.MAIN.value
+
+    def _area_key(self, area: Any) -> str:
+        area = Memory._area_of(area)
+        return area if area in self.dbs else next(iter(self.dbs))
+
+    def _areas_for(self, filter: str) -> list[str]:
+        """Databases that can hold matches of the filter"""
+        areas = Memory._get_comparator(filter).values("area") if filter else None
+        if areas is None:
+            return list(self.dbs)
+        keys = {self._area_key(area) for area in areas}
+        return [key for key in self.dbs if key in keys]
+
     async def preload_knowledge(
         self, log_item: LogItem | None, kn_dirs: list[str], memory_subdir: str
     ):
+        index = Memory._load_knowledge_index(memory_subdir)
+
+        # find changed and removed knowledge files by checksum
+        index, jobs = self._preload_knowledge_folders(log_item, kn_dirs, index)
+
+        index = await self._update_knowledge(log_item, index, jobs)
+        Memory._save_knowledge_index(memory_subdir, index)
+
+    async def refresh_knowledge(self, paths: set[str], kn_dirs: list[str], memory_subdir: str):
+        """Re-index changed knowledge paths only, the update is embedded first and applied at once"""
+        index = Memory._load_knowledge_index(memory_subdir)
+        index, jobs = knowledge_import.rescan_files(paths, index, Memory._knowledge_roots(kn_dirs))
+        if jobs or any(file["state"] == "removed" for file in index.values()):
+            index = await self._update_knowledge(None, index, jobs, atomic=True)
+            Memory._save_knowledge_index(memory_subdir, index)
+
+    def watch_knowledge(self, kn_dirs: list[str], memory_subdir: str) -> knowledge_watcher.KnowledgeWatcher:
+        """Refresh knowledge whenever files change, from a background thread, until stopped"""
+        Memory.stop_watching(memory_subdir)
+
+        def refresh(paths: set[str]):
+            asyncio.run(self.refresh_knowledge(paths, kn_dirs, memory_subdir))
+
+        watcher = knowledge_watcher.KnowledgeWatcher(
+            [files.get_abs_path("knowledge"), files.get_abs_path("instruments")], refresh
+        )
+        watcher.start()
+        Memory.watchers[memory_subdir] = watcher
+        return watcher
+
+    @staticmethod
+    def stop_watching(memory_subdir: str):
+        watcher = Memory.watchers.pop(memory_subdir, None)
+        if watcher:
+            watcher.stop()
+
+    @staticmethod
+    def _load_knowledge_index(memory_subdir: str) -> dict[str, knowledge_import.KnowledgeImport]:
         # db abs path
         db_dir = Memory._abs_db_dir(memory_subdir)
 
@@ -167,133 +576,336 @@ class Memory:
         if os.path.exists(index_path):
             with open(index_path, "r") as f:
                 index = json.load(f)
+        return index
 
-        # preload knowledge folders
-        index = self._preload_knowledge_folders(log_item, kn_dirs, index)
-
-        for file in index:
-            if index[file]["state"] in ["changed", "removed"] and index[file].get(
-                "ids", []
-            ):  # for knowledge files that have been changed or removed and have IDs
-                await self.delete_documents_by_ids(
-                    index[file]["ids"]
-                )  # remove original version
-            if index[file]["state"] == "changed":
-                index[file]["ids"] = self.insert_documents(
-                    index[file]["documents"]
-                )  # insert new version
-
-        # remove index where state="removed"
-        index = {k: v for k, v in index.items() if v["state"] != "removed"}
-
+    @staticmethod
+    def _save_knowledge_index(memory_subdir: str, index: dict[str, knowledge_import.KnowledgeImport]):
         # strip state and documents from index and save it
         for file in index:
             if "documents" in index[file]:
                 del index[file]["documents"]  # type: ignore
             if "state" in index[file]:
                 del index[file]["state"]  # type: ignore
+        index_path = files.get_abs_path(Memory._abs_db_dir(memory_subdir), "knowledge_import.json")
         with open(index_path, "w") as f:
             json.dump(index, f)
 
+    async def _update_knowledge(
+        self,
+        log_item: LogItem | None,
+        index: dict[str, knowledge_import.KnowledgeImport],
+        jobs: list[knowledge_import.ImportJob],
+        atomic: bool = False,
+    ) -> dict[str, knowledge_import.KnowledgeImport]:
+        """Import changed files and drop chunks no file refers to anymore, returns the index
+        without removed files. An atomic update is applied in one step under the write locks,
+        so writers and checkpoints never see a file half updated."""
+        # chunks of the original versions of changed and removed files
+        old_ids = {
+            id
+            for file in index.values()
+            if file["state"] in ["changed", "removed"]
+            for id in file.get("ids", [])
+        }
+
+        # insert new versions, parsed in a process pool while earlier files are embedded,
+        # chunks are content addressed, only new ones are embedded
+        staged: list[tuple[list[Document], list[list[float]]]] = []
+        await self._import_knowledge(log_item, index, jobs, staged if atomic else None)
+
+        # remove chunks no file refers to anymore, chunks shared with other files stay
+        referenced = {
+            id
+            for file in index.values()
+            if file["state"] != "removed"
+            for id in file.get("ids", [])
+        }
+        unreferenced = list(old_ids - referenced)
+
+        # every file containing a chunk is one of its sources, changed and removed files drop out
+        touched = (old_ids & referenced) | {
+            id for file in index.values() if file["state"] == "changed" for id in file.get("ids", [])
+        }
+        sources = Memory._chunk_sources(index, touched)
+        for docs, _ in staged:
+            for doc in docs:
+                doc.metadata = Memory._with_sources(doc.metadata, sources[doc.metadata["id"]])
+
+        with contextlib.ExitStack() as locks:
+            if atomic:
+                for area in self.dbs:  # always in the same order
+                    locks.enter_context(self._wal(area).lock)
+            for docs, embeddings in staged:
+                self._add_embedded(docs, [doc.metadata["id"] for doc in docs], embeddings)
+            self._update_sources(sources)
+            if unreferenced:
+                self._delete(unreferenced)
+
+        # remove index where state="removed"
+        return {k: v for k, v in index.items() if v["state"] != "removed"}
+
+    @staticmethod
+    def _chunk_sources(index: dict[str, knowledge_import.KnowledgeImport], ids: set[str]) -> dict[str, list[str]]:
+        """Files of the index (not removed) containing each of the chunks"""
+        sources: dict[str, list[str]] = {id: [] for id in ids}
+        for file, data in sorted(index.items()):
+            if data["state"] != "removed":
+                for id in data.get("ids", []):
+                    if id in sources:
+                        sources[id].append(file)
+        return {id: files for id, files in sources.items() if files}
+
+    @staticmethod
+    def _with_sources(metadata: dict, sources: list[str]) -> dict:
+        return {**metadata, "source": sources[0], "sources": sources}
+
+    def _update_sources(self, sources: dict[str, list[str]]):
+        """Store the current source files of stored chunks where they changed"""
+        for area, db in self.dbs.items():
+            ids, metadatas = [], []
+            for id, files in sources.items():
+                metadata = db._doc_metadata(id)
+                if metadata is not None and metadata.get("sources") != files:
+                    ids.append(id)
+                    metadatas.append(Memory._with_sources(metadata, files))
+            if ids:
+                self._wal(area).update(ids, metadatas)
+
     def _preload_knowledge_folders(
         self,
         log_item: LogItem | None,
         kn_dirs: list[str],
         index: dict[str, knowledge_import.KnowledgeImport],
     ):
-        # load knowledge folders, subfolders by area
-        for kn_dir in kn_dirs:
-            for area in Memory.Area:
-                index = knowledge_import.load_knowledge(
-                    log_item,
-                    files.get_abs_path("knowledge", kn_dir, area.value),
-                    index,
-                    {"area": area.value},
-                )
+        jobs: list[knowledge_import.ImportJob] = []
+        for root in Memory._knowledge_roots(kn_dirs):
+            index, found = knowledge_import.scan_knowledge(
+                log_item, root.dir, index, root.metadata, root.filename_pattern
+            )
+            jobs += found
+        return index, jobs
 
-        # load instruments descriptions
-        index = knowledge_import.load_knowledge(
-            log_item,
-            files.get_abs_path("instruments"),
-            index,
-            {"area": Memory.Area.INSTRUMENTS.value},
-            filename_pattern="**/*.md",
+    @staticmethod
+    def _knowledge_roots(kn_dirs: list[str]) -> list[knowledge_import.KnowledgeRoot]:
+        # knowledge folders, subfolders by area
+        roots = [
+            knowledge_import.KnowledgeRoot(
+                files.get_abs_path("knowledge", kn_dir, area.value), {"area": area.value}
+            )
+            for kn_dir in kn_dirs
+            for area in Memory.Area
+        ]
+        # instruments descriptions
+        roots.append(
+            knowledge_import.KnowledgeRoot(
+                files.get_abs_path("instruments"),
+                {"area": Memory.Area.INSTRUMENTS.value},
+                filename_pattern="**/*.md",
+            )
         )
+        return roots
 
-        return index
+    async def _import_knowledge(
+        self,
+        log_item: LogItem | None,
+        index: dict[str, knowledge_import.KnowledgeImport],
+        jobs: list[knowledge_import.ImportJob],
+        staged: list[tuple[list[Document], list[list[float]]]] | None = None,
+    ):
+        """Parse and embed changed files, chunks are inserted in batches or, given a staged
+        list, collected there for the caller to insert"""
+        if not jobs:
+            return
+        progress = knowledge_import.ImportProgress(log_item, len(jobs))
+        queue: asyncio.Queue = asyncio.Queue(Memory.IMPORT_QUEUE)
+
+        async def parse():
+            try:
+                async for job, documents in knowledge_import.parse_files(jobs):
+                    if documents is None:
+                        index[job.file]["checksum"] = ""  # failed, retried on the next start
+                        documents = []
+                    progress.parsed(job, len(documents))
+                    await queue.put((job.file, documents))  # waits while embedding is behind
+            except Exception:
+                await queue.put(None)  # stop the consumer, the error is raised by await producer
+                raise
+            await queue.put(None)
+
+        stored: set[str] = set()  # chunks inserted by this import
+        pending: list[Document] = []
+
+        async def insert():
+            if pending:
+                timestamp = self.get_timestamp()
+                for doc in pending:
+                    doc.metadata["timestamp"] = timestamp
+                embeddings = await self.db.embedding_function.aembed_documents(  # type: ignore
+                    [doc.page_content for doc in pending]
+                )
+                if staged is None:
+                    self._add_embedded(pending, [doc.metadata["id"] for doc in pending], embeddings)
+                else:
+                    staged.append((list(pending), embeddings))
+            progress.inserted(len(pending))
+            pending.clear()
+
+        producer = asyncio.create_task(parse())
+        try:
+            while (item := await queue.get()) is not None:
+                file, documents = item
+                ids = []
+                for doc in documents:
+                    id = knowledge_import.chunk_id(doc)
+                    ids.append(id)
+                    if id in stored or self._contains(id):
+                        progress.reused += 1  # same chunk in another file or the previous version
+                        continue
+                    stored.add(id)
+                    doc.metadata = Memory._with_sources({**doc.metadata, "id": id}, [file])
+                    pending.append(doc)
+                index[file]["ids"] = list(dict.fromkeys(ids))
+                if len(pending) >= Memory.EMBED_BATCH:
+                    await insert()
+            await insert()
+        finally:
+            if not producer.done():
+                producer.cancel()
+        await producer
+        progress.finish()
 
     async def search_similarity_threshold(
         self, query: str, limit: int, threshold: float, filter: str = ""
     ):
+        vector = await self.db.embedding_function.aembed_query(query)  # type: ignore
+        return await self.search_by_vector_threshold(vector, limit, threshold, filter)
+
+    async def search_by_vector_threshold(
+        self, vector: list[float], limit: int, threshold: float, filter: str = ""
+    ):
+        results = await self.search_federated(
+            vector, self._areas_for(filter), limit, threshold, filter
+        )
+        return [doc for doc, _ in results]
+
+    async def search_federated(
+        self,
+        vector: list[float],
+        areas: list[str],
+        limit: int,
+        threshold: float = 0.0,
+        filter: str = "",
+    ) -> list[tuple[Document, float]]:
+        """Search the databases of several areas concurrently, results merged by relevance"""
         comparator = Memory._get_comparator(filter) if filter else None
-        return await self.db.asearch(
-            query,
-            search_type="similarity_score_threshold",
-            k=limit,
-            score_threshold=threshold,
-            filter=comparator,
+        keys = list(dict.fromkeys(self._area_key(area) for area in areas))
+        found = await asyncio.gather(
+            *(
+                self.dbs[key].asimilarity_search_with_score_by_vector(
+                    vector, k=limit, filter=comparator
+                )
+                for key in keys
+            )
         )
+        results = []
+        for key, docs in zip(keys, found):
+            relevance = self.dbs[key]._select_relevance_score_fn()
+            results += [(doc, relevance(score)) for doc, score in docs]
+        results = [(doc, score) for doc, score in results if score >= threshold]
+        results.sort(key=lambda result: result[1], reverse=True)
+        return results[:limit]
 
     async def delete_documents_by_query(
         self, query: str, threshold: float, filter: str = ""
     ):
-        k = 100
-        tot = 0
-        removed = []
+        # all documents over the threshold in one range search, no batches
+        vector = await self.db.embedding_function.aembed_query(query)  # type: ignore
+        removed = await self.search_similar_documents([vector], threshold, filter)
+        if removed:
+            self._delete([doc.metadata["id"] for doc in removed])
+        return removed
 
-        while True:
-            # Perform similarity search with score
-            docs = await self.search_similarity_threshold(
-                query, limit=k, threshold=threshold, filter=filter
+    async def search_similar_documents(
+        self, vectors: list[list[float]], threshold: float, filter: str = ""
+    ) -> list[Document]:
+        """Documents similar to any of the vectors over the threshold, one range search per area"""
+        comparator = Memory._get_comparator(filter) if filter else None
+        radius = Memory._cosine_denormalizer(threshold) - 1e-6  # range search is strict, allow rounding
+        areas = self._areas_for(filter)
+        found = await asyncio.gather(
+            *(
+                asyncio.to_thread(
+                    self.dbs[area].range_search_with_score_by_vectors, vectors, radius, comparator
+                )
+                for area in areas
             )
-            removed += docs
-
-            # Extract document IDs and filter based on score
-            # document_ids = [result[0].metadata["id"] for result in docs if result[1] < score_limit]
-            document_ids = [result.metadata["id"] for result in docs]
-
-            # Delete documents with IDs over the threshold score
-            if document_ids:
-                # fnd = self.db.get(where={"id": {"$in": document_ids}})
-                # if fnd["ids"]: self.db.delete(ids=fnd["ids"])
-                # tot += len(fnd["ids"])
-                self.db.delete(ids=document_ids)
-                tot += len(document_ids)
-
-            # If fewer than K document IDs, break the loop
-            if len(document_ids) < k:
-                break
-
-        if tot:
-            self._save_db()  # persist
-        return removed
+        )
+        docs: dict[str, Document] = {}
+        for area, results in zip(areas, found):
+            relevance = self.dbs[area]._select_relevance_score_fn()
+            for doc, score in (result for per_vector in results for result in per_vector):
+                if relevance(score) >= threshold:
+                    docs.setdefault(doc.metadata["id"], doc)
+        return list(docs.values())
+
+    async def insert_texts_replacing(
+        self, texts: list[str], threshold: float, filter: str = "", metadata: dict = {}
+    ) -> tuple[list[str], list[Document]]:
+        """Insert texts and delete previous documents too similar to any of them (threshold > 0),
+        with one embedding batch, one range search, one delete and one insert"""
+        if not texts:
+            return [], []
+        embeddings = await self.db.embedding_function.aembed_documents(texts)  # type: ignore
+        removed = []
+        if threshold > 0:
+            removed = await self.search_similar_documents(embeddings, threshold, filter)
+            if removed:
+                self._delete([doc.metadata["id"] for doc in removed])
+
+        ids = [str(uuid.uuid4()) for _ in texts]
+        timestamp = self.get_timestamp()
+        metadata = {"area": Memory.Area.MAIN.value, **metadata}
+        docs = [
+            Document(text, metadata={"id": id, "timestamp": timestamp, **metadata})
+            for text, id in zip(texts, ids)
+        ]
+        self._add_embedded(docs, ids, embeddings)
+        return ids, removed
 
     async def delete_documents_by_ids(self, ids: list[str]):
         # aget_by_ids is not yet implemented in faiss, need to do a workaround
-        rem_docs = self.db.get_by_ids(ids)  # existing docs to remove (prevents error)
+        rem_docs = [  # existing docs to remove (prevents error)
+            doc for db in self.dbs.values() for doc in db.get_by_ids(ids)
+        ]
         if rem_docs:
             rem_ids = [doc.metadata["id"] for doc in rem_docs]  # ids to remove
-            await self.db.adelete(ids=rem_ids)
-
-        if rem_docs:
-            self._save_db()  # persist
+            self._delete(rem_ids)
         return rem_docs
 
+    def _contains(self, id: str) -> bool:
+        return any(id in db.docstore._dict for db in self.dbs.values())  # type: ignore
+
+    def _delete(self, ids: list[str]):
+        for area, db in self.dbs.items():
+            found = [id for id in ids if id in db.docstore._dict]  # type: ignore
+            if found:
+                self._wal(area).delete(found)
+                self._maintain_index(area)
+
     def insert_text(self, text, metadata: dict = {}):
         id = str(uuid.uuid4())
         if not metadata.get("area", ""):
             metadata["area"] = Memory.Area.MAIN.value
 
-        self.db.add_documents(
-            documents=[
+        self._add_documents(
+            [
                 Document(
                     text,
                     metadata={"id": id, "timestamp": self.get_timestamp(), **metadata},
                 )
             ],
-            ids=[id],
+            [id],
         )
-        self._save_db()  # persist
         return id
 
     def insert_documents(self, docs: list[Document]):
@@ -303,23 +915,64 @@ class Memory:
             for doc, id in zip(docs, ids):
                 doc.metadata["id"] = id  # add ids to documents metadata
                 doc.metadata["timestamp"] = timestamp  # add timestamp
-            self.db.add_documents(documents=docs, ids=ids)
-            self._save_db()  # persist
+            self._add_documents(docs, ids)
         return ids
 
+    def _add_documents(self, docs: list[Document], ids: list[str]):
+        texts = [doc.page_content for doc in docs]
+        embeddings = self.db.embedding_function.embed_documents(texts)  # type: ignore
+        self._add_embedded(docs, ids, embeddings)
+
+    def _add_embedded(self, docs: list[Document], ids: list[str], embeddings: list[list[float]]):
+        texts = [doc.page_content for doc in docs]
+        rows_by_area: dict[str, list[int]] = {}
+        for row, doc in enumerate(docs):
+            rows_by_area.setdefault(self._area_key(doc.metadata.get("area", "")), []).append(row)
+        for area, rows in rows_by_area.items():
+            self._wal(area).add(
+                [texts[row] for row in rows],
+                [embeddings[row] for row in rows],
+                [docs[row].metadata for row in rows],
+                [ids[row] for row in rows],
+            )
+            self._maintain_index(area)
+
+    def _maintain_index(self, area: str = ""):
+        # train or rebuild the ANN index in the background once the corpus outgrows it
+        db = self.dbs[self._area_key(area)]
+        wal = self._wal(area)
+        memory_index.rebuild_in_background(
+            db, db.index_kind, wal.lock, on_done=wal.mark_dirty
+        )
+
+    def _wal(self, area: str = "") -> memory_wal.MemoryWal:
+        # writes are logged (O(1)) and persisted by background checkpoints
+        area = self._area_key(area)
+        db = self.dbs[area]
+        key = Memory._wal_key(self.memory_subdir, area)
+        wal = Memory.wal.get(key)
+        if wal is None or wal.db is not db:
+            wal = memory_wal.MemoryWal(self._abs_db_dir(self.memory_subdir, area), db)
+            Memory.wal[key] = wal
+        return wal
+
+    @staticmethod
+    def _wal_key(memory_subdir: str, area: str) -> str:
+        return f"{memory_subdir}/{area}" if area else memory_subdir
+
     def _save_db(self):
-        self.db.save_local(folder_path=self._abs_db_dir(self.memory_subdir))
+        """Write the full index now instead of waiting for the next checkpoint"""
+        for area in self.dbs:
+            self._wal(area).checkpoint()
 
     @staticmethod
-    def _get_comparator(condition: str):
-        def comparator(data: dict[str, Any]):
-            try:
-                return eval(condition, {}, data)
-            except Exception as e:
-                # print(f"Error evaluating condition: {e}")
-                return False
+    def flush_all():
+        memory_wal.flush_all()
 
-        return comparator
+    @staticmethod
+    def _get_comparator(condition: str):
+        # parsed once, no eval per document, also used to prefilter by the metadata index
+        return memory_filter.compile(condition)
 
     @staticmethod
     def _score_normalizer(val: float) -> float:
@@ -335,8 +988,14 @@ class Memory:
         return res
 
     @staticmethod
-    def _abs_db_dir(memory_subdir: str) -> str:
-        return files.get_abs_path("memory", memory_subdir)
+    def _cosine_denormalizer(relevance: float) -> float:
+        # cosine score of a relevance, inverse of _cosine_normalizer
+        return relevance * 2 - 1
+
+    @staticmethod
+    def _abs_db_dir(memory_subdir: str, area: str = "") -> str:
+        db_dir = files.get_abs_path("memory", memory_subdir)
+        return os.path.join(db_dir, area) if area else db_dir
 
     @staticmethod
     def format_docs_plain(docs: list[Document]) -> list[str]:
@@ -0,0 +1,220 @@
+"""
+Memory Docstore - documents of a memory database kept on disk, loaded when returned
+
+Checkpoints write all documents into one segment file, record after record, each the
+pickled metadata followed by the text. A loaded database reads single records through a
+memory map, so only documents a search returns are loaded, and the metadata index reads
+metadata without the texts. Documents added or deleted after the checkpoint are kept in
+RAM until the next checkpoint writes a new segment and the docstore is rebased on it.
+"""
+
+import mmap
+import os
+import pickle
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any, Iterator
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+DOCS_FILE = "index.docs"
+
+
+@dataclass
+class SegmentIndex:
+    """Ids of a segment and the byte ranges of their records: start, text start, end"""
+
+    ids: list[str]
+    offsets: np.ndarray
+
+
+class Segment:
+    """A written segment file, read through a memory map opened on first access"""
+
+    def __init__(self, path: str, index: SegmentIndex):
+        self.path = path
+        self.ids = index.ids
+        self.offsets = index.offsets
+        self.positions = {id: row for row, id in enumerate(index.ids)}
+        self._map: mmap.mmap | None = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def record(self, row: int) -> bytes:
+        start, _, end = self.offsets[row]
+        return self._mapped()[start:end]
+
+    def document(self, id: str) -> Document | None:
+        row = self.positions.get(id)
+        if row is None:
+            return None
+        start, text_start, end = self.offsets[row]
+        data = self._mapped()
+        metadata = pickle.loads(data[start:text_start])
+        return Document(id=id, page_content=data[text_start:end].decode("utf-8"), metadata=metadata)
+
+    def metadata(self, id: str) -> dict | None:
+        row = self.positions.get(id)
+        if row is None:
+            return None
+        start, text_start, _ = self.offsets[row]
+        return pickle.loads(self._mapped()[start:text_start])
+
+    def _mapped(self) -> mmap.mmap:
+        if self._map is None:
+            with open(self.path, "rb") as f:
+                # the map stays valid when a checkpoint replaces the file
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+
+class DiskDocstore(Docstore, AddableMixin):
+    """Documents of a segment, with the ones added and deleted since it was written"""
+
+    def __init__(
+        self,
+        segment: Segment | None = None,
+        added: dict[str, Document] | None = None,
+        deleted: set[str] | None = None,
+    ):
+        self.segment = segment
+        self.added: dict[str, Document] = added or {}
+        self.deleted: set[str] = deleted or set()  # ids of the segment
+        self._dict = DocumentsView(self)  # used like the dict of InMemoryDocstore
+
+    def get(self, id: str) -> Document | None:
+        doc = self.added.get(id)
+        if doc is not None or self.segment is None or id in self.deleted:
+            return doc
+        return self.segment.document(id)
+
+    def metadata(self, id: str) -> dict | None:
+        doc = self.added.get(id)
+        if doc is not None or self.segment is None or id in self.deleted:
+            return doc.metadata if doc is not None else None
+        return self.segment.metadata(id)
+
+    def contains(self, id: str) -> bool:
+        return id in self.added or (
+            self.segment is not None and id in self.segment.positions and id not in self.deleted
+        )
+
+    def ids(self) -> Iterator[str]:
+        if self.segment is not None:
+            for id in self.segment.ids:
+                if id not in self.deleted:
+                    yield id
+        yield from list(self.added)
+
+    def __len__(self) -> int:
+        return len(self.added) + (len(self.segment) - len(self.deleted) if self.segment else 0)
+
+    def search(self, search: str) -> Document | str:
+        doc = self.get(search)
+        return doc if doc is not None else f"ID {search} not found."
+
+    def add(self, texts: dict[str, Document]) -> None:
+        overlapping = [id for id in texts if self.contains(id)]
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self.added.update(texts)
+
+    def delete(self, ids: list) -> None:
+        missing = [id for id in ids if not self.contains(id)]
+        if missing:
+            raise ValueError(f"Tried to delete ids that does not  exist: {missing}")
+        for id in ids:
+            if self.added.pop(id, None) is None:
+                self.deleted.add(id)
+
+
+class DocumentsView(Mapping):
+    """Read only mapping of ids to documents, documents are loaded on access"""
+
+    def __init__(self, docstore: DiskDocstore):
+        self._docstore = docstore
+
+    def __getitem__(self, id: str) -> Document:
+        doc = self._docstore.get(id)
+        if doc is None:
+            raise KeyError(id)
+        return doc
+
+    def __contains__(self, id: object) -> bool:
+        return isinstance(id, str) and self._docstore.contains(id)
+
+    def __iter__(self) -> Iterator[str]:
+        return self._docstore.ids()
+
+    def __len__(self) -> int:
+        return len(self._docstore)
+
+
+@dataclass
+class Snapshot:
+    """Documents of a docstore at a checkpoint, taken under the write lock"""
+
+    segment: Segment | None
+    deleted: frozenset[str]
+    added: dict[str, Document]
+
+
+def snapshot(docstore: Any) -> Snapshot:
+    if isinstance(docstore, DiskDocstore):
+        return Snapshot(docstore.segment, frozenset(docstore.deleted), dict(docstore.added))
+    return Snapshot(None, frozenset(), dict(docstore._dict))  # InMemoryDocstore of older versions
+
+
+def write(path: str, snapshot: Snapshot) -> SegmentIndex:
+    """Write the documents of a snapshot as a segment, records of the old segment are copied as they are"""
+    ids: list[str] = []
+    offsets: list[tuple[int, int, int]] = []
+    position = 0
+    with open(path, "wb") as f:
+        segment = snapshot.segment
+        if segment is not None:
+            for row, id in enumerate(segment.ids):
+                if id in snapshot.deleted:
+                    continue
+                start, text_start, end = segment.offsets[row]
+                f.write(segment.record(row))
+                ids.append(id)
+                offsets.append((position, position + int(text_start - start), position + int(end - start)))
+                position += int(end - start)
+        for id, doc in snapshot.added.items():
+            metadata = pickle.dumps(doc.metadata, protocol=pickle.HIGHEST_PROTOCOL)
+            text = doc.page_content.encode("utf-8")
+            f.write(metadata)
+            f.write(text)
+            ids.append(id)
+            offsets.append((position, position + len(metadata), position + len(metadata) + len(text)))
+            position += len(metadata) + len(text)
+        f.flush()
+        os.fsync(f.fileno())
+    return SegmentIndex(ids, np.array(offsets, dtype=np.int64).reshape(-1, 3))
+
+
+def rebase(docstore: Any, snapshot: Snapshot, segment: Segment) -> DiskDocstore:
+    """The live docstore on a segment written from the snapshot, with the changes made since"""
+    if isinstance(docstore, DiskDocstore):
+        added, deleted = docstore.added, docstore.deleted - snapshot.deleted
+    else:
+        added, deleted = docstore._dict, set()
+    # deleted since the snapshot, also deleted and added again
+    deleted |= {id for id, doc in snapshot.added.items() if added.get(id) is not doc}
+    return DiskDocstore(
+        segment,
+        added={id: doc for id, doc in added.items() if snapshot.added.get(id) is not doc},
+        deleted={id for id in deleted if id in segment.positions},
+    )
+
+
+def load(db_dir: str, index_name: str = "index") -> tuple[Any, dict[int, str]]:
+    """Docstore and label mapping of a database folder, documents of a segment stay on disk"""
+    with open(os.path.join(db_dir, f"{index_name}.pkl"), "rb") as f:
+        docs, index_to_docstore_id = pickle.load(f)
+    if isinstance(docs, SegmentIndex):
+        docs = DiskDocstore(Segment(os.path.join(db_dir, f"{index_name}.docs"), docs))
+    return docs, index_to_docstore_id
@@ -0,0 +1,326 @@
+"""
+Memory Filter - compiled metadata filter expressions and an inverted metadata index
+
+Filters keep the Python syntax of the memory tools ("area == 'main' and timestamp < '2024'"),
+but are parsed once into closures over a small safe subset instead of eval per document:
+comparisons (==, !=, <, <=, >, >=, in, not in, chained), and/or/not, constants, lists,
+metadata keys as names, len() and the str methods startswith, endswith, lower, upper, strip.
+
+Filters also plan a candidate set from the MetadataIndex (equality, membership, ranges and
+prefixes on metadata values), so a search can be restricted to matching vectors before
+scoring instead of over-fetching and post-filtering.
+"""
+
+import ast
+import bisect
+import operator
+import threading
+from functools import lru_cache
+from typing import Any, Callable
+
+Predicate = Callable[[dict[str, Any]], Any]
+
+_COMPARE = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+_METHODS = {"startswith", "endswith", "lower", "upper", "strip"}
+_FUNCTIONS = {"len": len}
+
+
+class MetadataIndex:
+    """Labels by metadata value, with sorted values for range and prefix lookups"""
+
+    def __init__(self):
+        self.values: dict[str, dict[Any, set[int]]] = {}
+        self._sorted: dict[tuple[str, type], list] = {}  # (key, str|float) -> sorted distinct values
+        self._lock = threading.Lock()
+
+    def add(self, label: int, metadata: dict[str, Any]):
+        with self._lock:
+            for key, value in metadata.items():
+                if not _indexable(value):
+                    continue
+                labels = self.values.setdefault(key, {}).setdefault(value, set())
+                if not labels:
+                    family = _family(value)
+                    if family and (key, family) in self._sorted:
+                        bisect.insort(self._sorted[(key, family)], value)
+                labels.add(label)
+
+    def remove(self, label: int, metadata: dict[str, Any]):
+        with self._lock:
+            for key, value in metadata.items():
+                if not _indexable(value):
+                    continue
+                labels = self.values.get(key, {}).get(value)
+                if labels is None:
+                    continue
+                labels.discard(label)
+                if not labels:
+                    del self.values[key][value]
+                    family = _family(value)
+                    values = self._sorted.get((key, family)) if family else None
+                    if values is not None:
+                        pos = bisect.bisect_left(values, value)
+                        if pos < len(values) and values[pos] == value:
+                            del values[pos]
+
+    def equal(self, key: str, value: Any) -> set[int]:
+        if not _indexable(value):
+            return set()
+        with self._lock:
+            return set(self.values.get(key, {}).get(value, ()))
+
+    def range(self, key: str, low=None, high=None, low_inclusive=True, high_inclusive=True) -> set[int]:
+        family = _family(low if low is not None else high)
+        with self._lock:
+            values = self._sorted_values(key, family)
+            start = 0 if low is None else (
+                bisect.bisect_left(values, low) if low_inclusive else bisect.bisect_right(values, low)
+            )
+            end = len(values) if high is None else (
+                bisect.bisect_right(values, high) if high_inclusive else bisect.bisect_left(values, high)
+            )
+            by_value = self.values.get(key, {})
+            return set().union(*(by_value[value] for value in values[start:end]))
+
+    def prefix(self, key: str, prefix: str) -> set[int]:
+        with self._lock:
+            values = self._sorted_values(key, str)
+            start = bisect.bisect_left(values, prefix)
+            by_value = self.values.get(key, {})
+            labels: set[int] = set()
+            for value in values[start:]:
+                if not value.startswith(prefix):
+                    break
+                labels |= by_value[value]
+            return labels
+
+    def _sorted_values(self, key: str, family) -> list:
+        values = self._sorted.get((key, family))
+        if values is None:
+            values = sorted(v for v in self.values.get(key, {}) if _family(v) is family)
+            self._sorted[(key, family)] = values
+        return values
+
+
+def _indexable(value: Any) -> bool:
+    return isinstance(value, (str, int, float, bool))
+
+
+def _family(value: Any):
+    # values comparable with each other by <
+    if isinstance(value, str):
+        return str
+    if isinstance(value, (int, float)):
+        return float
+    return None
+
+
+class Filter:
+    """Compiled filter expression, callable on a metadata dict"""
+
+    def __init__(self, condition: str):
+        self.condition = condition
+        self.error = ""
+        try:
+            self.tree = ast.parse(condition.strip(), mode="eval").body
+            self.predicate = _compile(self.tree)
+        except (SyntaxError, ValueError) as e:
+            self.tree = None
+            self.predicate = lambda metadata: False
+            self.error = str(e)
+
+    def __call__(self, metadata: dict[str, Any]) -> bool:
+        try:
+            return bool(self.predicate(metadata))
+        except Exception:
+            return False  # missing keys or incompatible types, as eval did
+
+    def candidates(self, index: MetadataIndex) -> tuple[set[int] | None, bool]:
+        """Labels that can match (None = unknown), and whether all of them do match"""
+        if self.tree is None:
+            return set(), True
+        return _plan(self.tree, index)
+
+    def values(self, key: str) -> set | None:
+        """Values of a metadata key that every match has one of (None = any value)"""
+        if self.tree is None:
+            return set()
+        return _values(self.tree, key)
+
+
+@lru_cache(maxsize=256)
+def compile(condition: str) -> Filter:
+    # an invalid filter matches nothing, callers report Filter.error to the agent
+    return Filter(condition)
+
+
+def _compile(node: ast.AST) -> Predicate:
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile(value) for value in node.values]
+        if isinstance(node.op, ast.And):
+            return lambda m: _all(parts, m)
+        return lambda m: _any(parts, m)
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        operand = _compile(node.operand)
+        return lambda m: not operand(m)
+
+    if isinstance(node, ast.Compare):
+        ops = [_COMPARE[type(op)] for op in node.ops if type(op) in _COMPARE]
+        if len(ops) != len(node.ops):
+            raise ValueError("unsupported comparison")
+        operands = [_compile(node.left)] + [_compile(c) for c in node.comparators]
+
+        def compare(m):
+            left = operands[0](m)
+            for op, right_fn in zip(ops, operands[1:]):
+                right = right_fn(m)
+                if not op(left, right):
+                    return False
+                left = right
+            return True
+
+        return compare
+
+    if isinstance(node, ast.Name):
+        key = node.id
+        return lambda m: m[key]  # KeyError for a missing key, the filter does not match
+
+    if isinstance(node, ast.Constant):
+        value = node.value
+        return lambda m: value
+
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        items = [_compile(item) for item in node.elts]
+        return lambda m: [item(m) for item in items]
+
+    if isinstance(node, ast.Call) and not node.keywords:
+        args = [_compile(arg) for arg in node.args]
+        if isinstance(node.func, ast.Attribute) and node.func.attr in _METHODS:
+            target = _compile(node.func.value)
+            method = node.func.attr
+            return lambda m: getattr(_str(target(m)), method)(*(arg(m) for arg in args))
+        if isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS:
+            function = _FUNCTIONS[node.func.id]
+            return lambda m: function(*(arg(m) for arg in args))
+
+    raise ValueError(f"unsupported expression: {ast.dump(node)[:80]}")
+
+
+def _all(parts: list[Predicate], metadata) -> bool:
+    return all(part(metadata) for part in parts)
+
+
+def _any(parts: list[Predicate], metadata) -> bool:
+    return any(part(metadata) for part in parts)
+
+
+def _str(value: Any) -> str:
+    if not isinstance(value, str):
+        raise TypeError("string method on a non-string value")
+    return value
+
+
+_FLIPPED = {ast.Lt: ast.Gt, ast.LtE: ast.GtE, ast.Gt: ast.Lt, ast.GtE: ast.LtE, ast.Eq: ast.Eq, ast.NotEq: ast.NotEq}
+
+
+def _plan(node: ast.AST, index: MetadataIndex) -> tuple[set[int] | None, bool]:
+    if isinstance(node, ast.BoolOp):
+        plans = [_plan(value, index) for value in node.values]
+        if isinstance(node.op, ast.And):
+            known = [labels for labels, _ in plans if labels is not None]
+            if not known:
+                return None, False
+            return set.intersection(*known), all(exact for _, exact in plans)
+        if any(labels is None for labels, _ in plans):
+            return None, False
+        return set().union(*(labels for labels, _ in plans)), all(exact for _, exact in plans)  # type: ignore
+
+    if isinstance(node, ast.Compare):
+        if len(node.ops) > 1:  # a < x < b  ==  a < x and x < b
+            operands = [node.left] + node.comparators
+            pairs = [
+                ast.Compare(left=operands[i], ops=[op], comparators=[operands[i + 1]])
+                for i, op in enumerate(node.ops)
+            ]
+            return _plan(ast.BoolOp(op=ast.And(), values=pairs), index)
+        return _plan_compare(node.left, node.ops[0], node.comparators[0], index)
+
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and node.func.attr == "startswith"
+        and isinstance(node.func.value, ast.Name)
+        and len(node.args) == 1
+        and isinstance(node.args[0], ast.Constant)
+        and isinstance(node.args[0].value, str)
+    ):
+        return index.prefix(node.func.value.id, node.args[0].value), True
+
+    return None, False
+
+
+def _plan_compare(left: ast.AST, op: ast.cmpop, right: ast.AST, index: MetadataIndex):
+    if isinstance(left, ast.Constant) and isinstance(right, ast.Name):
+        if type(op) not in _FLIPPED:
+            return None, False
+        left, right, op = right, left, _FLIPPED[type(op)]()
+    if not isinstance(left, ast.Name):
+        return None, False
+    key = left.id
+
+    if isinstance(right, ast.Constant):
+        value = right.value
+        if isinstance(op, ast.Eq):
+            if not _indexable(value):
+                return None, False  # e.g. None or a list, not in the index, scan instead
+            return index.equal(key, value), True
+        if _family(value) is not None:
+            if isinstance(op, (ast.Lt, ast.LtE)):
+                return index.range(key, high=value, high_inclusive=isinstance(op, ast.LtE)), True
+            if isinstance(op, (ast.Gt, ast.GtE)):
+                return index.range(key, low=value, low_inclusive=isinstance(op, ast.GtE)), True
+        return None, False
+
+    if isinstance(right, (ast.List, ast.Tuple, ast.Set)) and isinstance(op, ast.In):
+        if all(isinstance(item, ast.Constant) and _indexable(item.value) for item in right.elts):
+            values = [item.value for item in right.elts]  # type: ignore
+            return set().union(*(index.equal(key, value) for value in values)), True
+
+    return None, False
+
+
+def _values(node: ast.AST, key: str) -> set | None:
+    if isinstance(node, ast.BoolOp):
+        parts = [_values(value, key) for value in node.values]
+        if isinstance(node.op, ast.And):
+            known = [values for values in parts if values is not None]
+            return set.intersection(*known) if known else None
+        if any(values is None for values in parts):
+            return None
+        return set().union(*parts)  # type: ignore
+
+    if isinstance(node, ast.Compare) and len(node.ops) == 1:
+        left, op, right = node.left, node.ops[0], node.comparators[0]
+        if isinstance(op, ast.Eq) and isinstance(left, ast.Constant):
+            left, right = right, left
+        if isinstance(left, ast.Name) and left.id == key:
+            if isinstance(op, ast.Eq) and isinstance(right, ast.Constant) and _indexable(right.value):
+                return {right.value}
+            if (
+                isinstance(op, ast.In)
+                and isinstance(right, (ast.List, ast.Tuple, ast.Set))
+                and all(isinstance(item, ast.Constant) and _indexable(item.value) for item in right.elts)
+            ):
+                return {item.value for item in right.elts}  # type: ignore
+
+    return None
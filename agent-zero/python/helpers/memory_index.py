@@ -0,0 +1,244 @@
+"""
+Memory Index - FAISS index backends for the memory database
+
+Kinds (AgentConfig.memory_index):
+- flat: exact brute-force scan
+- ivf: inverted lists over k-means cells, exact vectors
+- hnsw: navigable small-world graph, no training
+- ivf_sq8: IVF with 8-bit scalar quantized vectors (4x smaller)
+- ivf_pq: IVF with product quantized vectors (16x+ smaller)
+
+All indexes store explicit vector labels (index_to_docstore_id keys), so deletes never
+renumber other vectors. Small databases stay flat; once the corpus crosses
+ANN_MIN_VECTORS the index is trained and rebuilt in the background, and retrained when
+it outgrows its IVF cells or collects too many deleted vectors. Existing flat index
+files are wrapped on load and migrated by the same rebuild. Index files are memory
+mapped on load, a mapped index is read only and copied into RAM by its first write.
+"""
+
+import math
+import threading
+from typing import Any, Callable
+import faiss
+import numpy as np
+from python.helpers.print_style import PrintStyle
+
+KINDS = ("flat", "ivf", "hnsw", "ivf_sq8", "ivf_pq")
+
+ANN_MIN_VECTORS = 10_000  # below this a flat scan is as fast as any ANN index
+IVF_TRAIN_PER_CELL = 64  # training sample size per IVF cell
+IVF_NPROBE_RATIO = 16  # cells searched = nlist / ratio (at least IVF_MIN_NPROBE)
+IVF_MIN_NPROBE = 8
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+REBUILD_DELETED_RATIO = 0.2  # rebuild when this share of vectors is deleted but still indexed
+MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)  # older faiss versions read the whole file
+
+
+def kind_of(index: faiss.Index) -> str:
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap2):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVFScalarQuantizer):
+        return "ivf_sq8"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def target_kind(configured: str, count: int) -> str:
+    if configured not in KINDS:
+        raise ValueError(f"Unknown memory index '{configured}', use one of: {', '.join(KINDS)}")
+    return configured if count >= ANN_MIN_VECTORS else "flat"
+
+
+def ivf_cells(count: int) -> int:
+    # ~4*sqrt(n) cells, with enough training points per cell
+    return max(1, min(int(4 * math.sqrt(count)), count // 39))
+
+
+def create(kind: str, dim: int, vectors: np.ndarray | None = None, labels: np.ndarray | None = None) -> faiss.Index:
+    """New index of the given kind, trained on and filled with the vectors"""
+    count = 0 if vectors is None else len(vectors)
+    metric = faiss.METRIC_INNER_PRODUCT
+
+    if kind == "flat":
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    elif kind == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, HNSW_M, metric)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        hnsw.hnsw.efSearch = HNSW_EF_SEARCH
+        index = faiss.IndexIDMap2(hnsw)
+    elif kind in ("ivf", "ivf_sq8", "ivf_pq"):
+        if vectors is None or count < ANN_MIN_VECTORS:
+            raise ValueError(f"{kind} index needs at least {ANN_MIN_VECTORS} training vectors")
+        nlist = ivf_cells(count)
+        quantizer = faiss.IndexFlatIP(dim)
+        if kind == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        elif kind == "ivf_sq8":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, faiss.ScalarQuantizer.QT_8bit, metric)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_subquantizers(dim), 8, metric)
+        sample = vectors
+        if count > nlist * IVF_TRAIN_PER_CELL:
+            rows = np.random.default_rng(0).choice(count, nlist * IVF_TRAIN_PER_CELL, replace=False)
+            sample = vectors[rows]
+        index.train(sample)
+        index.nprobe = min(nlist, max(IVF_MIN_NPROBE, nlist // IVF_NPROBE_RATIO))
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)  # reconstruct and remove by label
+    else:
+        raise ValueError(f"Unknown memory index '{kind}', use one of: {', '.join(KINDS)}")
+
+    if count:
+        index.add_with_ids(vectors, labels if labels is not None else np.arange(count, dtype=np.int64))
+    return index
+
+
+def _pq_subquantizers(dim: int) -> int:
+    # largest sub-quantizer count that divides the dimension, with >= 4 dims each
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2):
+        if dim % m == 0 and dim // m >= 4:
+            return m
+    return 1
+
+
+def with_labels(index: faiss.Index, index_to_docstore_id: dict[int, str]) -> faiss.Index:
+    """Wrap a legacy positional flat index, its positions become labels"""
+    # a downcast proxy does not own the index, only use it for type checks
+    typed = faiss.downcast_index(index)
+    if isinstance(typed, (faiss.IndexIDMap2, faiss.IndexIVF)):
+        return index
+    if not isinstance(typed, faiss.IndexFlat):
+        raise ValueError(f"Unsupported memory index type {type(typed).__name__}")
+    labels = np.array(sorted(index_to_docstore_id), dtype=np.int64)
+    if len(labels) != index.ntotal:
+        labels = np.arange(index.ntotal, dtype=np.int64)
+    wrapped = create("flat", index.d)
+    if index.ntotal:
+        wrapped.add_with_ids(index.reconstruct_n(0, index.ntotal), labels)
+    return wrapped
+
+
+def read(path: str) -> faiss.Index:
+    """Index file, memory mapped where faiss supports it"""
+    return faiss.read_index(path, MMAP_FLAG)
+
+
+def copy(index: faiss.Index) -> faiss.Index:
+    """Writable copy of an index in RAM, also of a memory mapped one"""
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+def labels_of(index: faiss.Index) -> np.ndarray:
+    """All labels stored in the index, including deleted but not removed ones"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap2):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    invlists = index.invlists  # type: ignore
+    ids = [
+        faiss.rev_swig_ptr(invlists.get_ids(cell), invlists.list_size(cell)).copy()
+        for cell in range(index.nlist)  # type: ignore
+        if invlists.list_size(cell)
+    ]
+    return np.concatenate(ids).astype(np.int64) if ids else np.zeros(0, dtype=np.int64)
+
+
+def reconstruct(index: faiss.Index, labels: np.ndarray) -> np.ndarray:
+    """Vectors by label, approximate for quantized indexes"""
+    if not len(labels):
+        return np.zeros((0, index.d), dtype=np.float32)
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap2):
+        if len(labels) < index.ntotal // 4:
+            return np.vstack([index.reconstruct(int(label)) for label in labels])
+        rows = {label: row for row, label in enumerate(faiss.vector_to_array(index.id_map))}
+        stored = index.index.reconstruct_n(0, index.ntotal)
+        return stored[[rows[int(label)] for label in labels]]
+    return index.reconstruct_batch(np.asarray(labels, dtype=np.int64))
+
+
+def remove(index: faiss.Index, labels: np.ndarray) -> bool:
+    """Remove vectors, False if the index cannot remove (HNSW), they stay as deleted"""
+    try:
+        index.remove_ids(np.asarray(labels, dtype=np.int64))
+        return True
+    except RuntimeError:
+        return False
+
+
+def search_params(index: faiss.Index, selector: Any) -> Any:
+    """Search parameters restricted by an ID selector, keeping the index's own settings"""
+    index = faiss.downcast_index(index)
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=inner.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def needs_rebuild(index: faiss.Index, configured: str, live: int) -> bool:
+    current = kind_of(index)
+    if current != target_kind(configured, live):
+        # stay on a configured ANN index until well below the threshold, no flapping
+        if not (current == configured and live >= ANN_MIN_VECTORS // 2):
+            return True
+    if index.ntotal and (index.ntotal - live) / index.ntotal > REBUILD_DELETED_RATIO:
+        return True  # deleted vectors slow down and crowd out search results
+    if current.startswith("ivf"):
+        ivf = faiss.extract_index_ivf(index)
+        return ivf_cells(live) >= 2 * ivf.nlist  # corpus grew ~4x since training
+    return False
+
+
+def rebuild(db, kind: str, lock: threading.RLock, on_done: Callable[[], None] | None = None):
+    """Build a new index from the live vectors of db and swap it in, writes continue meanwhile"""
+    with lock:
+        old = db.index
+        labels = np.array(list(db.index_to_docstore_id), dtype=np.int64)
+        vectors = reconstruct(old, labels)
+    target = target_kind(kind, len(labels))
+    new = create(target, old.d, vectors, labels)  # slow part, without the lock
+
+    with lock:
+        # apply writes made during the build
+        current = np.array(list(db.index_to_docstore_id), dtype=np.int64)
+        added = np.setdiff1d(current, labels)
+        removed = np.setdiff1d(labels, current)
+        if len(added):
+            new.add_with_ids(reconstruct(db.index, added), added)
+        if len(removed):
+            remove(new, removed)
+        db.index = new
+        db.index_changed()
+    PrintStyle(font_color="gray").print(
+        f"Memory index rebuilt: {kind_of(old)} -> {target}, {len(current)} vectors"
+    )
+    if on_done:
+        on_done()
+
+
+def rebuild_in_background(db, kind: str, lock: threading.RLock, on_done: Callable[[], None] | None = None):
+    """Start a rebuild if the index needs one and none is running"""
+    with lock:
+        if getattr(db, "rebuilding", False) or not needs_rebuild(db.index, kind, len(db.index_to_docstore_id)):
+            return None
+        db.rebuilding = True
+
+    def run():
+        try:
+            rebuild(db, kind, lock, on_done)
+        except Exception as e:
+            PrintStyle.error(f"Memory index rebuild failed: {e}")
+        finally:
+            db.rebuilding = False
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
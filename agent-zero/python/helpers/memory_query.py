@@ -0,0 +1,290 @@
+"""
+Memory Query Builders - turn recent conversation into a memory search query
+
+Strategies (AgentConfig.recall_query_mode):
+- llm: the utility model writes the query (original behaviour)
+- embedding: weighted average of embeddings of recent messages, no LLM call
+- keywords: most frequent recent keywords as a text query, no LLM call
+
+Also contains a small A/B harness comparing the strategies on a recorded corpus
+(see AgentConfig.recall_query_record and scripts/benchmark_recall_query.py). Only
+cases with labelled relevant memories give a fair hit rate; agreement with the
+recorded results favours the mode the corpus was recorded with.
+"""
+
+import json
+import os
+import re
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Sequence
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from python.helpers.log import LogItem
+from python.helpers.memory import Memory
+
+
+@dataclass
+class MemoryQuery:
+    """Search query, by text or by an already computed embedding vector"""
+    text: str
+    vector: list[float] | None = None
+
+
+class QueryBuilder(ABC):
+
+    HISTORY = 5  # messages considered
+    DECAY = 0.5  # weight of a message relative to the next (newer) one
+
+    @abstractmethod
+    async def build(
+        self,
+        agent,
+        db: Memory,
+        message: str,
+        history: Sequence[BaseMessage],
+        prompt: str,
+        log_item: LogItem | None = None,
+        interruptible: bool = True,
+    ) -> MemoryQuery:
+        pass
+
+    def window(self, message: str, history: Sequence[BaseMessage]) -> list[tuple[str, float]]:
+        """Message and recent history (newest first) with their weights"""
+        texts = [message] + [
+            str(msg.content) for msg in reversed(list(history)[-self.HISTORY :])
+        ]
+        return [
+            (text, self.DECAY**i) for i, text in enumerate(texts) if text.strip()
+        ]
+
+
+class LlmQueryBuilder(QueryBuilder):
+
+    async def build(self, agent, db, message, history, prompt, log_item=None, interruptible=True):
+        system = agent.read_prompt(prompt, history=agent.concat_messages(history))
+
+        # log query streamed by LLM
+        def log_callback(content):
+            if log_item:
+                log_item.stream(query=content)
+
+        query = await agent.call_utility_llm(
+            system=system, msg=message, callback=log_callback, interruptible=interruptible
+        )
+        return MemoryQuery(text=query)
+
+
+class EmbeddingQueryBuilder(QueryBuilder):
+
+    MAX_CHARS = 2000  # per message, long tool outputs would dominate the average
+
+    async def build(self, agent, db, message, history, prompt, log_item=None, interruptible=True):
+        window = [(text[: self.MAX_CHARS], weight) for text, weight in self.window(message, history)]
+        if log_item:
+            log_item.update(query=f"embedding of {len(window)} recent messages")
+        if not window:
+            return MemoryQuery(text=message)
+
+        # cached embedder of the database, older messages are usually cached already
+        embedder = db.db.embedding_function
+        vectors = np.array(
+            await embedder.aembed_documents([text for text, _ in window]),  # type: ignore
+            dtype=np.float32,
+        )
+        weights = np.array([weight for _, weight in window], dtype=np.float32)
+        weights /= weights.sum()
+
+        # keep the norm of a single message embedding, scores stay comparable to text queries
+        vector = weights @ vectors
+        norm = float(np.linalg.norm(vector))
+        if norm > 0:
+            vector *= float(weights @ np.linalg.norm(vectors, axis=1)) / norm
+        return MemoryQuery(text=message, vector=vector.tolist())
+
+
+class KeywordQueryBuilder(QueryBuilder):
+
+    KEYWORDS = 12
+    STOPWORDS = frozenset(
+        """
+        the and for are but not you your with this that these those from have has had was were will
+        would can could should about into over what when where which who whom why how all any both each
+        few more most other some such only own same than too very just also then there here they them
+        their our its it's i'm let lets please need want make does did doing done been being get got use
+        using used like file files text data true false null none yes
+        thoughts tool_name tool_args tool_calls response_from_tool response message
+        """.split()
+    )
+
+    async def build(self, agent, db, message, history, prompt, log_item=None, interruptible=True):
+        query = " ".join(self.keywords(self.window(message, history)))
+        if log_item:
+            log_item.update(query=query)
+        return MemoryQuery(text=query or message)
+
+    def keywords(self, window: list[tuple[str, float]]) -> list[str]:
+        scores: Counter[str] = Counter()
+        for text, weight in window:
+            for word in re.findall(r"[^\W_][\w\-.]*[^\W_]", text.lower()):
+                if len(word) > 2 and word not in self.STOPWORDS and not word.isdigit():
+                    scores[word] += weight
+        return [word for word, _ in scores.most_common(self.KEYWORDS)]
+
+
+_builders: dict[str, QueryBuilder] = {
+    "llm": LlmQueryBuilder(),
+    "embedding": EmbeddingQueryBuilder(),
+    "keywords": KeywordQueryBuilder(),
+}
+
+
+def get_builder(mode: str) -> QueryBuilder:
+    builder = _builders.get(mode or "llm")
+    if builder is None:
+        raise ValueError(
+            f"Unknown recall query mode '{mode}', use one of: {', '.join(_builders)}"
+        )
+    return builder
+
+
+async def search(
+    db: Memory, query: MemoryQuery, limit: int, threshold: float, filter: str = ""
+) -> list[Document]:
+    if query.vector is not None:
+        return await db.search_by_vector_threshold(query.vector, limit, threshold, filter)
+    return await db.search_similarity_threshold(query.text, limit, threshold, filter)
+
+
+# --- recorded corpus and A/B harness ---
+
+
+@dataclass
+class RecallCase:
+    prompt: str
+    message: str
+    history: list[BaseMessage]
+    retrieved: list[str]  # ids found by the recorded recall
+    relevant: list[str] | None = None  # ids labelled relevant, None = not labelled
+    filter: str = ""
+    mode: str = ""  # query mode of the recorded recall
+
+
+@dataclass
+class RecallStats:
+    mode: str
+    cases: int = 0
+    scored: int = 0  # cases with labelled relevant memories
+    hits: int = 0
+    recorded: int = 0  # unlabelled cases where the recorded recall found memories
+    agreements: int = 0
+    latencies: list[float] = field(default_factory=list)  # ms
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of labelled cases where a relevant memory was found"""
+        return self.hits / self.scored if self.scored else 0.0
+
+    @property
+    def agreement(self) -> float:
+        """Share of unlabelled cases where a memory of the recorded recall was found again,
+        biased toward the mode the corpus was recorded with, which agrees with itself"""
+        return self.agreements / self.recorded if self.recorded else 0.0
+
+    @property
+    def mean_ms(self) -> float:
+        return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+    @property
+    def p95_ms(self) -> float:
+        return float(np.percentile(self.latencies, 95)) if self.latencies else 0.0
+
+
+def record_case(
+    path: str,
+    prompt: str,
+    message: str,
+    history: Sequence[BaseMessage],
+    docs: list[Document],
+    filter: str = "",
+    mode: str = "",
+):
+    """Append a recall to a JSONL corpus. Found memories are stored as "retrieved",
+    "relevant" is left to be labelled by hand or by an independent judge."""
+    case = {
+        "prompt": prompt,
+        "message": message,
+        "history": [{"type": msg.type, "content": str(msg.content)} for msg in history],
+        "retrieved": [doc.metadata.get("id") for doc in docs],
+        "relevant": None,
+        "filter": filter,
+        "mode": mode,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(case, ensure_ascii=False) + "\n")
+
+
+def load_corpus(path: str) -> list[RecallCase]:
+    cases = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data: dict[str, Any] = json.loads(line)
+            history: list[BaseMessage] = [
+                HumanMessage(content=msg["content"]) if msg["type"] == "human"
+                else AIMessage(content=msg["content"])
+                for msg in data.get("history", [])
+            ]
+            relevant = data.get("relevant")
+            cases.append(
+                RecallCase(
+                    prompt=data.get("prompt", "memory.memories_query.sys.md"),
+                    message=data.get("message", ""),
+                    history=history,
+                    # corpora recorded before labelling kept the found ids as "expected"
+                    retrieved=[id for id in data.get("retrieved", data.get("expected", [])) if id],
+                    relevant=None if relevant is None else [id for id in relevant if id],
+                    filter=data.get("filter", ""),
+                    mode=data.get("mode", "llm" if "expected" in data else ""),
+                )
+            )
+    return cases
+
+
+async def compare_modes(
+    agent,
+    db: Memory,
+    cases: list[RecallCase],
+    modes: Sequence[str] = ("llm", "embedding", "keywords"),
+    limit: int = 3,
+    threshold: float = 0.6,
+) -> dict[str, RecallStats]:
+    """
+    Per mode: hit rate on labelled cases (any relevant memory found), agreement with the
+    recorded recall on unlabelled ones, and latency (query + search). Agreement favours
+    the recording mode by construction, only the hit rate compares modes fairly.
+    """
+    results = {}
+    for mode in modes:
+        builder = get_builder(mode)
+        stats = RecallStats(mode=mode)
+        for case in cases:
+            start = time.perf_counter()
+            query = await builder.build(agent, db, case.message, case.history, case.prompt)
+            docs = await search(db, query, limit, threshold, case.filter)
+            stats.latencies.append((time.perf_counter() - start) * 1000)
+            stats.cases += 1
+            found = {doc.metadata.get("id") for doc in docs}
+            if case.relevant is not None:
+                stats.scored += 1
+                stats.hits += bool(found & set(case.relevant))
+            elif case.retrieved:
+                stats.recorded += 1
+                stats.agreements += bool(found & set(case.retrieved))
+        results[mode] = stats
+    return results
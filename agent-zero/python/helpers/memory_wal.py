@@ -0,0 +1,269 @@
+"""
+Memory Write-Ahead Log - write-behind persistence for the FAISS memory database
+
+Every mutation is appended to an append-only log (one JSON line, fsynced) before it is
+applied in RAM, so a write costs the same no matter how large the index is. The full
+index is written by checkpoints in a background thread, after enough records or time,
+and on shutdown. After a crash the last checkpoint is loaded and the log replayed;
+replay is idempotent, so records already contained in the checkpoint are skipped.
+
+Checkpoint files are written next to the live ones and swapped in only after a marker
+says they are complete, an interrupted swap is finished on the next load. Documents are
+written as a segment (see memory_docstore) the database then reads from disk.
+"""
+
+import atexit
+import base64
+import json
+import os
+import pickle
+import threading
+import time
+import weakref
+from typing import Any
+import faiss
+import numpy as np
+from python.helpers import memory_docstore
+from python.helpers.print_style import PrintStyle
+
+WAL_FILE = "memory.wal"
+INDEX_FILES = ("index.faiss", "index.pkl", memory_docstore.DOCS_FILE)
+TMP_SUFFIX = ".tmp"
+READY_MARKER = "checkpoint.ready"
+
+_open: "weakref.WeakSet[MemoryWal]" = weakref.WeakSet()
+
+
+class MemoryWal:
+
+    CHECKPOINT_RECORDS = 200  # checkpoint after this many logged mutations
+    CHECKPOINT_SECONDS = 60.0  # or this long after the first unsaved mutation
+    FSYNC = True  # durable appends, a crash loses no acknowledged write
+
+    def __init__(self, db_dir: str, db):
+        self.db_dir = db_dir
+        self.db = db
+        os.makedirs(db_dir, exist_ok=True)
+        self.path = os.path.join(db_dir, WAL_FILE)
+        self.lock = db.lock  # guards the log and the in-RAM index, searches hold it too
+        self._checkpoint_lock = threading.Lock()
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._seq = _last_seq(self.path)
+        self._pending = len(_read_lines(self.path))  # records since the last checkpoint snapshot
+        self._timer: threading.Timer | None = None
+        _open.add(self)
+        if self._pending:
+            self._schedule()  # absorb records replayed after a crash
+
+    # --- mutations, logged first then applied ---
+
+    def add(self, texts: list[str], embeddings: list[list[float]], metadatas: list[dict], ids: list[str]):
+        with self.lock:
+            self._append({
+                "op": "add",
+                "ids": ids,
+                "texts": texts,
+                "metadatas": metadatas,
+                "embeddings": _encode(embeddings),
+            })
+            apply_add(self.db, texts, embeddings, metadatas, ids)
+        self._schedule()
+
+    def delete(self, ids: list[str]):
+        with self.lock:
+            self._append({"op": "delete", "ids": ids})
+            apply_delete(self.db, ids)
+        self._schedule()
+
+    def update(self, ids: list[str], metadatas: list[dict]):
+        """Replace the metadata of stored documents, their vectors stay as they are"""
+        with self.lock:
+            self._append({"op": "update", "ids": ids, "metadatas": metadatas})
+            apply_update(self.db, ids, metadatas)
+        self._schedule()
+
+    def _append(self, record: dict[str, Any]):
+        self._seq += 1
+        self._file.write(json.dumps({"seq": self._seq, **record}, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if self.FSYNC:
+            os.fsync(self._file.fileno())
+        self._pending += 1
+
+    # --- checkpoints ---
+
+    def mark_dirty(self):
+        """The index changed without a logged mutation (rebuild), save it with the next checkpoint"""
+        with self.lock:
+            self._pending += 1
+        self._schedule()
+
+    def _schedule(self):
+        if self._pending >= self.CHECKPOINT_RECORDS:
+            if not self._checkpoint_lock.locked():
+                self.checkpoint_in_background()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.CHECKPOINT_SECONDS, self.checkpoint)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def checkpoint_in_background(self):
+        threading.Thread(target=self.checkpoint, daemon=True).start()
+
+    def checkpoint(self):
+        """Write the full index and drop log records it contains, safe to call from any thread"""
+        with self._checkpoint_lock:
+            with self.lock:
+                if self._timer:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._pending:
+                    return
+                # copy in RAM while writes wait, the slow disk part runs without the lock
+                seq = self._seq
+                index = faiss.serialize_index(self.db.index)
+                docs = memory_docstore.snapshot(self.db.docstore)
+                index_to_docstore_id = dict(self.db.index_to_docstore_id)
+                self._pending = 0
+            try:
+                segment = _write_checkpoint(self.db_dir, index, docs, index_to_docstore_id)
+                with self.lock:
+                    self._truncate(seq)
+                    # documents of the checkpoint are read from its segment from now on
+                    self.db.docstore = memory_docstore.rebase(self.db.docstore, docs, segment)
+            except Exception as e:
+                with self.lock:
+                    self._pending += 1  # retried by the next checkpoint
+                PrintStyle.error(f"Memory checkpoint failed, log kept for recovery: {e}")
+
+    def _truncate(self, seq: int):
+        """Keep only records newer than the checkpoint"""
+        self._file.close()
+        keep = [line for line in _read_lines(self.path) if _record_seq(line) > seq]
+        tmp = self.path + TMP_SUFFIX
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(keep)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        self.checkpoint()
+        with self.lock:
+            self._file.close()
+        _open.discard(self)
+
+
+def apply_add(db, texts: list[str], embeddings: list[list[float]], metadatas: list[dict], ids: list[str]):
+    new = [i for i, id in enumerate(ids) if id not in db.docstore._dict]  # type: ignore
+    if new:
+        db.add_embeddings(
+            [(texts[i], embeddings[i]) for i in new],
+            metadatas=[metadatas[i] for i in new],
+            ids=[ids[i] for i in new],
+        )
+
+
+def apply_delete(db, ids: list[str]):
+    existing = [id for id in ids if id in db.docstore._dict]  # type: ignore
+    if existing:
+        db.delete(ids=existing)
+
+
+def apply_update(db, ids: list[str], metadatas: list[dict]):
+    existing = [i for i, id in enumerate(ids) if id in db.docstore._dict]  # type: ignore
+    if existing:
+        db.update_metadata([ids[i] for i in existing], [metadatas[i] for i in existing])
+
+
+def recover_checkpoint(db_dir: str):
+    """Finish a checkpoint swap interrupted by a crash, or discard an incomplete checkpoint"""
+    marker = os.path.join(db_dir, READY_MARKER)
+    for name in INDEX_FILES:
+        tmp = os.path.join(db_dir, name + TMP_SUFFIX)
+        if os.path.exists(tmp):
+            if os.path.exists(marker):
+                os.replace(tmp, os.path.join(db_dir, name))
+            else:
+                os.remove(tmp)
+    if os.path.exists(marker):
+        os.remove(marker)
+
+
+def replay(db_dir: str, db) -> int:
+    """Apply logged mutations to a freshly loaded index, returns number of records"""
+    count = 0
+    for line in _read_lines(os.path.join(db_dir, WAL_FILE)):
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            break  # torn write of the last record
+        if record["op"] == "add":
+            apply_add(db, record["texts"], _decode(record["embeddings"]), record["metadatas"], record["ids"])
+        elif record["op"] == "delete":
+            apply_delete(db, record["ids"])
+        elif record["op"] == "update":
+            apply_update(db, record["ids"], record["metadatas"])
+        count += 1
+    return count
+
+
+def flush_all():
+    """Checkpoint every open log, registered to run on interpreter shutdown"""
+    for wal in list(_open):
+        try:
+            wal.checkpoint()
+        except Exception as e:
+            PrintStyle.error(f"Memory flush failed: {e}")
+
+
+atexit.register(flush_all)
+
+
+def _write_checkpoint(
+    db_dir: str, index, docs: memory_docstore.Snapshot, index_to_docstore_id: dict[int, str]
+) -> memory_docstore.Segment:
+    marker = os.path.join(db_dir, READY_MARKER)
+    index_file, pkl_file, docs_file = (os.path.join(db_dir, name) for name in INDEX_FILES)
+    segment = memory_docstore.write(docs_file + TMP_SUFFIX, docs)
+    for path, data in (
+        (index_file, index.tobytes()),
+        (pkl_file, pickle.dumps((segment, index_to_docstore_id))),
+    ):
+        with open(path + TMP_SUFFIX, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+    with open(marker, "w") as f:
+        f.write(str(time.time()))
+    recover_checkpoint(db_dir)  # swap in the complete files
+    return memory_docstore.Segment(docs_file, segment)
+
+
+def _encode(embeddings: list[list[float]]) -> dict[str, Any]:
+    array = np.asarray(embeddings, dtype=np.float32)
+    return {"dim": int(array.shape[1]) if array.ndim == 2 else 0, "data": base64.b64encode(array.tobytes()).decode()}
+
+
+def _decode(encoded: dict[str, Any]) -> list[list[float]]:
+    array = np.frombuffer(base64.b64decode(encoded["data"]), dtype=np.float32)
+    return array.reshape(-1, encoded["dim"]).tolist() if encoded["dim"] else []
+
+
+def _read_lines(path: str) -> list[str]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [line for line in f if line.strip()]
+
+
+def _record_seq(line: str) -> int:
+    try:
+        return json.loads(line)["seq"]
+    except (json.JSONDecodeError, KeyError):
+        return 0  # torn record, dropped
+
+
+def _last_seq(path: str) -> int:
+    return max((_record_seq(line) for line in _read_lines(path)), default=0)
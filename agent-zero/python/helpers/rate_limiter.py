@@ -1,67 +1,142 @@
+import asyncio
+import threading
 import time
 from collections import deque
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import Any, List, Tuple
+from langchain_core.embeddings import Embeddings
 from .print_style import PrintStyle
 from .log import Log
+from . import tokens
 
 @dataclass
 class CallRecord:
     timestamp: float
     input_tokens: int
     output_tokens: int = 0  # Default to 0, will be set separately
+    expired: bool = False  # dropped from the window, its tokens no longer count
 
 class RateLimiter:
-    def __init__(self, logger: Log, max_calls: int, max_input_tokens: int, max_output_tokens: int, window_seconds: int = 60):
+    """
+    Sliding window limiter for calls, input and output tokens of one model.
+    Waiting is done with asyncio.sleep, so a throttled agent never blocks the
+    event loop shared with other contexts. Token totals of the window are kept
+    as running sums, updated when records are added or expire.
+    """
+
+    def __init__(self, logger: Log | None, max_calls: int, max_input_tokens: int, max_output_tokens: int, window_seconds: int = 60, name: str = ""):
         self.logger = logger
+        self.name = name
         self.max_calls = max_calls
         self.max_input_tokens = max_input_tokens
         self.max_output_tokens = max_output_tokens
         self.window_seconds = window_seconds
         self.call_records: deque = deque()
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._lock = threading.Lock()  # limiters can be shared by event loops in different threads
 
     def _clean_old_records(self, current_time: float):
         while self.call_records and current_time - self.call_records[0].timestamp > self.window_seconds:
-            self.call_records.popleft()
+            record = self.call_records.popleft()
+            record.expired = True
+            self.input_tokens -= record.input_tokens
+            self.output_tokens -= record.output_tokens
 
     def _get_counts(self) -> Tuple[int, int, int]:
-        calls = len(self.call_records)
-        input_tokens = sum(record.input_tokens for record in self.call_records)
-        output_tokens = sum(record.output_tokens for record in self.call_records)
-        return calls, input_tokens, output_tokens
+        return len(self.call_records), self.input_tokens, self.output_tokens
 
-    def _wait_if_needed(self, current_time: float, new_input_tokens: int):
-        while True:
-            self._clean_old_records(current_time)
-            calls, input_tokens, output_tokens = self._get_counts()
-            
-            wait_reasons = []
-            if self.max_calls > 0 and calls >= self.max_calls:
-                wait_reasons.append("max calls")
-            if self.max_input_tokens > 0 and input_tokens + new_input_tokens > self.max_input_tokens:
-                wait_reasons.append("max input tokens")
-            if self.max_output_tokens > 0 and output_tokens >= self.max_output_tokens:
-                wait_reasons.append("max output tokens")
-            
-            if not wait_reasons:
-                break
-            
-            oldest_record = self.call_records[0]
-            wait_time = oldest_record.timestamp + self.window_seconds - current_time
-            if wait_time > 0:
-                PrintStyle(font_color="yellow", padding=True).print(f"Rate limit exceeded. Waiting for {wait_time:.2f} seconds due to: {', '.join(wait_reasons)}")
-                self.logger.log("rate_limit","Rate limit exceeded",f"Rate limit exceeded. Waiting for {wait_time:.2f} seconds due to: {', '.join(wait_reasons)}")
-                time.sleep(wait_time)
-            current_time = time.time()
+    def _get_wait(self, current_time: float, new_input_tokens: int) -> Tuple[float, List[str]]:
+        self._clean_old_records(current_time)
+        calls, input_tokens, output_tokens = self._get_counts()
+
+        wait_reasons = []
+        if self.max_calls > 0 and calls >= self.max_calls:
+            wait_reasons.append("max calls")
+        if self.max_input_tokens > 0 and input_tokens + new_input_tokens > self.max_input_tokens:
+            wait_reasons.append("max input tokens")
+        if self.max_output_tokens > 0 and output_tokens >= self.max_output_tokens:
+            wait_reasons.append("max output tokens")
 
-    def limit_call_and_input(self, input_token_count: int) -> CallRecord:
-        current_time = time.time()
-        self._wait_if_needed(current_time, input_token_count)
+        if not wait_reasons or not self.call_records:
+            return 0, []  # an empty window can not free more room, let the call through
+        oldest_record = self.call_records[0]
+        return oldest_record.timestamp + self.window_seconds - current_time, wait_reasons
+
+    def _add_record(self, current_time: float, input_token_count: int) -> CallRecord:
         new_record = CallRecord(current_time, input_token_count)
         self.call_records.append(new_record)
+        self.input_tokens += input_token_count
         return new_record
 
-    def set_output_tokens(self, output_token_count: int):
-        if self.call_records:
-            self.call_records[-1].output_tokens += output_token_count
+    def _log_wait(self, wait_time: float, wait_reasons: List[str]):
+        name = f" ({self.name})" if self.name else ""
+        message = f"Rate limit exceeded{name}. Waiting for {wait_time:.2f} seconds due to: {', '.join(wait_reasons)}"
+        PrintStyle(font_color="yellow", padding=True).print(message)
+        if self.logger:
+            self.logger.log("rate_limit", "Rate limit exceeded", message)
+
+    async def limit_call_and_input(self, input_token_count: int) -> CallRecord:
+        while True:
+            with self._lock:
+                current_time = time.time()
+                wait_time, wait_reasons = self._get_wait(current_time, input_token_count)
+                if not wait_reasons:
+                    return self._add_record(current_time, input_token_count)
+            if wait_time > 0:
+                self._log_wait(wait_time, wait_reasons)
+            await asyncio.sleep(max(wait_time, 0.01))
+
+    def record_call(self, input_token_count: int) -> CallRecord:
+        """Count a call made from synchronous code without waiting for the window"""
+        with self._lock:
+            current_time = time.time()
+            self._clean_old_records(current_time)
+            return self._add_record(current_time, input_token_count)
+
+    def set_output_tokens(self, output_token_count: int, record: CallRecord | None = None):
+        """Add output tokens to the call returned by limit_call_and_input (or record_call),
+        without a record to the latest call, which is another one when calls overlap"""
+        with self._lock:
+            if record is None and self.call_records:
+                record = self.call_records[-1]
+            if record is not None:
+                record.output_tokens += output_token_count
+                if not record.expired:
+                    self.output_tokens += output_token_count
         return self
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """
+    Embeddings model wrapper counting embedding calls in a RateLimiter.
+    Async calls wait for the window, sync calls are only counted.
+    Other attributes (model, model_name...) are passed to the wrapped model.
+    """
+
+    def __init__(self, embeddings: Embeddings, limiter: RateLimiter):
+        self.embeddings = embeddings
+        self.limiter = limiter
+        self.counter = tokens.get_counter(embeddings)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.__dict__["embeddings"], name)
+
+    def _tokens(self, texts: List[str]) -> int:
+        return sum(self.counter.count(text) for text in texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.limiter.record_call(self._tokens(texts))
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        self.limiter.record_call(self._tokens([text]))
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await self.limiter.limit_call_and_input(self._tokens(texts))
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await self.limiter.limit_call_and_input(self._tokens([text]))
+        return await self.embeddings.aembed_query(text)
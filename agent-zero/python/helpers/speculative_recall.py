@@ -0,0 +1,88 @@
+"""
+Speculative Recall - memory recalls started one iteration ahead
+
+A recall extension starts its search while the chat model is still generating the
+previous iteration (AgentConfig.recall_speculative) and takes the result when its
+iteration comes. The recall is never waited for: one that has not finished, failed,
+or is based on history that changed too much is dropped, and the extension searches
+as usual.
+"""
+
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Coroutine
+
+DATA_KEY = "_speculative_recalls"  # agent data, recall name -> SpeculativeRecall
+MAX_NEW_MESSAGES = 4  # more new messages since the recall started make it stale
+
+
+@dataclass
+class SpeculativeRecall:
+    """Recall started one iteration ahead, with the history it was based on"""
+    task: asyncio.Task
+    message: str
+    last_message: Any
+    history_length: int
+
+
+def start(agent, name: str, message: str, recall: Coroutine) -> SpeculativeRecall:
+    """Run a recall for the next iteration in the background, replacing an earlier one"""
+    take(agent, name)
+    history = agent.history
+    speculative = SpeculativeRecall(
+        task=asyncio.create_task(recall),
+        message=message,
+        last_message=history[-1] if history else None,
+        history_length=len(history),
+    )
+    _recalls(agent)[name] = speculative
+    return speculative
+
+
+def take(agent, name: str) -> SpeculativeRecall | None:
+    """Remove a prepared recall from the agent, cancelling it if still running"""
+    speculative = _recalls(agent).pop(name, None)
+    if speculative and not speculative.task.done():
+        speculative.task.cancel()
+    return speculative
+
+
+def take_result(agent, name: str, message: str) -> tuple[bool, Any]:
+    """Whether a prepared recall is usable for the current message, and its result"""
+    speculative = take(agent, name)
+    if speculative is None:
+        return False, None
+    task = speculative.task
+    if not task.done() or task.cancelled() or task.exception():
+        return False, None
+    if is_stale(agent, speculative, message):
+        return False, None
+    return True, task.result()
+
+
+def drop_all(agent):
+    """Cancel and remove every prepared recall, e.g. when a new monologue starts"""
+    for name in list(_recalls(agent)):
+        take(agent, name)
+
+
+def is_stale(agent, speculative: SpeculativeRecall, message: str) -> bool:
+    if speculative.message != message:
+        return True  # new user message
+    history = agent.history
+    new_messages = len(history) - speculative.history_length
+    if new_messages > MAX_NEW_MESSAGES:
+        return True
+    # history the recall was based on must still be there (not reset or compacted)
+    return speculative.last_message is not None and not any(
+        msg is speculative.last_message
+        for msg in history[-(max(new_messages, 0) + 1) :]
+    )
+
+
+def _recalls(agent) -> dict[str, SpeculativeRecall]:
+    recalls = agent.get_data(DATA_KEY)
+    if recalls is None:
+        recalls = {}
+        agent.set_data(DATA_KEY, recalls)
+    return recalls
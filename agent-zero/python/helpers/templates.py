@@ -0,0 +1,128 @@
+"""
+Prompt Templates - compiled and cached prompt files
+Each prompt file is parsed once into a template with includes resolved,
+rendered in a single pass and recompiled when any of its files change
+"""
+
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from python.helpers import files
+
+INCLUDE_PATTERN = re.compile(r"{{\s*include\s*['\"](.*?)['\"]\s*}}")
+PLACEHOLDER_PATTERN = re.compile(r"{{(\w+)}}")
+
+
+@dataclass
+class PromptTemplate:
+    """Prompt split into literal text (even indexes) and placeholder names (odd indexes)"""
+    parts: List[str]
+    dependencies: List[Tuple[str, int]] = field(default_factory=list)  # (path, mtime) of all files used
+
+    def render(self, **kwargs) -> str:
+        if len(self.parts) == 1:
+            return self.parts[0]
+        out = []
+        for i, part in enumerate(self.parts):
+            if i % 2 == 0:
+                out.append(part)
+            elif part in kwargs:
+                out.append(str(kwargs[part]))
+            else:
+                out.append("{{" + part + "}}")  # unknown placeholders stay as they are
+        return "".join(out)
+
+    def is_current(self) -> bool:
+        for path, mtime in self.dependencies:
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return False
+            except FileNotFoundError:
+                return False
+        return True
+
+
+class TemplateCache:
+    """Cache of compiled prompt templates keyed by resolved file path and include directory"""
+
+    def __init__(self):
+        self.templates: Dict[Tuple[str, str, Tuple[str, ...]], PromptTemplate] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, relative_path: str, backup_dirs: Optional[List[str]] = None) -> PromptTemplate:
+        backup_dirs = backup_dirs or []
+        path = files.find_file_in_dirs(relative_path, backup_dirs)
+        # includes resolve from the requested directory, a profile overrides files included by defaults
+        base_path = os.path.dirname(relative_path)
+        key = (path, base_path, tuple(backup_dirs))
+        with self._lock:
+            template = self.templates.get(key)
+            if template and template.is_current():
+                self.stats["hits"] += 1
+                return template
+            if template:
+                self.stats["invalidations"] += 1
+            self.stats["misses"] += 1
+
+        template = self.compile(path, base_path, backup_dirs)
+        with self._lock:
+            self.templates[key] = template
+        return template
+
+    def render(self, relative_path: str, backup_dirs: Optional[List[str]] = None, **kwargs) -> str:
+        return self.get(relative_path, backup_dirs).render(**kwargs)
+
+    def compile(self, path: str, base_path: str, backup_dirs: List[str]) -> PromptTemplate:
+        dependencies: List[Tuple[str, int]] = []
+        text = self._expand(path, base_path, backup_dirs, dependencies, [])
+
+        parts = []
+        pos = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            parts.append(text[pos : match.start()])
+            parts.append(match.group(1))
+            pos = match.end()
+        parts.append(text[pos:])
+        return PromptTemplate(parts=parts, dependencies=dependencies)
+
+    def _expand(self, path: str, base_path: str, backup_dirs: List[str], dependencies: list, chain: List[str]) -> str:
+        path = os.path.normpath(path)
+        if path in chain:
+            raise ValueError(f"Circular include of '{path}' in {chain[0]}")
+        # stat before reading, so a write in between invalidates the entry
+        mtime = os.stat(path).st_mtime_ns
+        with open(path) as f:
+            content = files.remove_code_fences(f.read())
+        dependencies.append((path, mtime))
+
+        def replace_include(match):
+            include_path = files.find_file_in_dirs(os.path.join(base_path, match.group(1)), backup_dirs)
+            return self._expand(include_path, os.path.dirname(include_path), backup_dirs, dependencies, chain + [path])
+
+        return INCLUDE_PATTERN.sub(replace_include, content)
+
+    def clear(self):
+        with self._lock:
+            self.templates.clear()
+
+    def get_stats(self) -> Dict:
+        total = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / total, 4) if total else 0.0,
+            "templates": len(self.templates),
+        }
+
+
+# Global instance for easy access
+_global_cache: Optional[TemplateCache] = None
+
+def get_cache() -> TemplateCache:
+    """Get or create global template cache"""
+    global _global_cache
+    if _global_cache is None:
+        _global_cache = TemplateCache()
+    return _global_cache
@@ -0,0 +1,268 @@
+"""
+Token Counting - offline per-model token counters
+Counters are picked by model name and can be extended with register_counter().
+The cl100k_base encoding ships in tiktoken_cache/, so OpenAI models and the calibrated
+counters of other model families (Gemini, Claude, Llama, Mistral) count offline.
+Tokenizers load on a background thread; until then counts are approximated.
+Message counts are cached, so unchanged history is never tokenized again.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from fnmatch import fnmatch
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from python.helpers import files
+from python.helpers.print_style import PrintStyle
+
+BUNDLED_ENCODING = "cl100k_base"  # in tiktoken_cache/, other encodings are downloaded there on first use
+
+
+class TokenCounter:
+    """Approximate counter (~4 characters per token), used when no tokenizer is available"""
+
+    name = "approximate"
+    tokens_per_message = 3  # role and separators added to every chat message
+    generation = 0  # changes when the same text would count differently, e.g. a tokenizer loaded
+
+    def __init__(self, chars_per_token: float = 4, cache_size: int = 256):
+        self.chars_per_token = chars_per_token
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode_count(self, text: str) -> int:
+        return int(len(text) / self.chars_per_token)
+
+    def count(self, text: str) -> int:
+        return self.encode_count(text) if text else 0
+
+    def count_cached(self, text: str) -> int:
+        """Count text that repeats between calls (system prompts), LRU cached by content"""
+        with self._lock:
+            if text in self._cache:
+                self._cache.move_to_end(text)
+                return self._cache[text]
+        generation = self.generation
+        count = self.count(text)
+        with self._lock:
+            if generation != self.generation:
+                return count
+            self._cache[text] = count
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return count
+
+
+class TiktokenCounter(TokenCounter):
+    """
+    OpenAI BPE tokenizer. Encodings other than the bundled cl100k_base are downloaded on
+    first use into the tiktoken cache; offline they are replaced by cl100k_base, which
+    counts within a few percent of o200k_base.
+    """
+
+    name = "tiktoken"
+
+    def __init__(self, model_name: str, **kwargs):
+        import tiktoken
+
+        super().__init__(**kwargs)
+        os.environ.setdefault("TIKTOKEN_CACHE_DIR", files.get_abs_path("tiktoken_cache"))
+        try:
+            self.encoding = tiktoken.encoding_for_model(model_name)
+        except Exception:  # unknown model, or its encoding can't be downloaded
+            self.encoding = tiktoken.get_encoding(BUNDLED_ENCODING)
+
+    def encode_count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+
+class CalibratedCounter(TiktokenCounter):
+    """Bundled cl100k_base counts scaled to the tokenizer of another model family"""
+
+    name = "calibrated"
+
+    def __init__(self, factor: float, **kwargs):
+        super().__init__(BUNDLED_ENCODING, **kwargs)
+        self.factor = factor
+
+    def encode_count(self, text: str) -> int:
+        return round(super().encode_count(text) * self.factor)
+
+
+class LazyCounter(TokenCounter):
+    """Approximate counts until the counter built by factory(model_name) on a background thread is ready"""
+
+    def __init__(self, model_name: str, factory: Callable[[str], TokenCounter], **kwargs):
+        super().__init__(**kwargs)
+        self.model_name = model_name
+        self.tokenizer: Optional[TokenCounter] = None
+        self._thread = threading.Thread(target=self._load, args=(factory,), name="token-counter", daemon=True)
+        self._thread.start()
+
+    @property
+    def name(self) -> str:  # type: ignore[override]
+        return self.tokenizer.name if self.tokenizer else TokenCounter.name
+
+    def _load(self, factory: Callable[[str], TokenCounter]):
+        try:
+            tokenizer = factory(self.model_name)
+        except Exception as e:  # tokenizer not installed or its files can't be found
+            PrintStyle(font_color="orange", padding=False).print(
+                f"Token counter for '{self.model_name}' not available, using approximation: {e}"
+            )
+            return
+        with self._lock:
+            self.tokenizer = tokenizer
+            self._cache.clear()
+            self.generation += 1
+
+    def wait(self, timeout: Optional[float] = None) -> TokenCounter:
+        """The loaded counter, or this one (approximate) while loading or if loading failed"""
+        self._thread.join(timeout)
+        return self.tokenizer or self
+
+    def encode_count(self, text: str) -> int:
+        tokenizer = self.tokenizer
+        return tokenizer.encode_count(text) if tokenizer else super().encode_count(text)
+
+
+def _calibrated(factor: float) -> Callable[[str], TokenCounter]:
+    return lambda model_name: CalibratedCounter(factor)
+
+
+# model name pattern -> factory(model_name), first match wins, later registrations first;
+# factors are tokens per cl100k_base token measured on prompts, code and docs
+_factories: List[Tuple[str, Callable[[str], TokenCounter]]] = [
+    ("gpt-*", TiktokenCounter),
+    ("o1*", TiktokenCounter),
+    ("o3*", TiktokenCounter),
+    ("text-embedding-*", TiktokenCounter),
+    ("openai/*", lambda name: TiktokenCounter(name.split("/", 1)[1])),
+    ("*claude*", _calibrated(1.15)),
+    ("*gemini*", _calibrated(1.0)),
+    ("models/*embedding*", _calibrated(1.0)),  # Google embeddings
+    ("*llama*", _calibrated(1.0)),  # Llama 3 extends cl100k_base
+    ("*mistral*", _calibrated(1.1)),
+    ("*mixtral*", _calibrated(1.1)),
+    ("*codestral*", _calibrated(1.1)),
+]
+_counters: Dict[str, TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+# model name pattern -> context window in tokens, first match wins
+_context_windows: List[Tuple[str, int]] = [
+    ("*gemini-1.5-pro*", 2_097_152),
+    ("*gemini*", 1_048_576),
+    ("*gpt-4.1*", 1_047_576),
+    ("*gpt-4o*", 128_000),
+    ("*gpt-4-turbo*", 128_000),
+    ("*gpt-4*", 8_192),
+    ("*gpt-3.5*", 16_385),
+    ("o1*", 200_000),
+    ("o3*", 200_000),
+    ("*claude*", 200_000),
+    ("*llama-3.[123]*", 128_000),
+    ("*llama3.[123]*", 128_000),
+    ("*llama*", 8_192),
+    ("*mistral*", 32_000),
+    ("*mixtral*", 32_000),
+]
+DEFAULT_CONTEXT_WINDOW = 8_192
+
+
+def register_counter(pattern: str, factory: Callable[[str], TokenCounter]):
+    """Use factory(model_name) for models matching the pattern (fnmatch), e.g. a local tokenizer"""
+    with _counters_lock:
+        _factories.insert(0, (pattern, factory))
+        _counters.clear()
+
+
+def get_model_name(model: Any) -> str:
+    if isinstance(model, str):
+        return model
+    for attr in ("model_name", "model"):
+        name = getattr(model, attr, None)
+        if isinstance(name, str) and name:
+            return name
+    return type(model).__name__
+
+
+def get_counter(model: Any) -> TokenCounter:
+    """Get the token counter for a model object or model name, its tokenizer loads in the background"""
+    name = get_model_name(model)
+    with _counters_lock:
+        counter = _counters.get(name)
+        if counter:
+            return counter
+        factory = _get_factory(name)
+        counter = LazyCounter(name, factory) if factory else TokenCounter()
+        _counters[name] = counter
+        return counter
+
+
+def get_context_window(model: Any) -> int:
+    """Tokens a chat model accepts, its num_ctx if set (Ollama) or known by model name"""
+    num_ctx = getattr(model, "num_ctx", None)
+    if isinstance(num_ctx, int) and num_ctx > 0:
+        return num_ctx
+    name = get_model_name(model).lower()
+    for pattern, window in _context_windows:
+        if fnmatch(name, pattern):
+            return window
+    return DEFAULT_CONTEXT_WINDOW
+
+
+def _get_factory(name: str) -> Optional[Callable[[str], TokenCounter]]:
+    for pattern, factory in _factories:
+        if fnmatch(name.lower(), pattern):
+            return factory
+    return None
+
+
+class MessageTokenCounter:
+    """
+    Counts tokens of chat message lists for one model.
+    Per-message counts are cached; a message extended in place (history merging)
+    only has its new suffix counted.
+    """
+
+    def __init__(self, counter: TokenCounter):
+        self.counter = counter
+        self._cache: Dict[int, Tuple[Any, str, int]] = {}  # id(message) -> (message, content, tokens)
+        self._generation = counter.generation
+
+    def count_message(self, message: Any) -> int:
+        if self.counter.generation != self._generation:  # counted by the approximation so far
+            self._generation = self.counter.generation
+            self._cache = {}
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        cached = self._cache.get(id(message))
+        if cached and cached[0] is message:
+            _, old_content, old_count = cached
+            if content is old_content or content == old_content:
+                return old_count
+            if content.startswith(old_content):
+                count = old_count + self.counter.count(content[len(old_content):])
+            else:
+                count = self.counter.count(content) + self.counter.tokens_per_message
+        else:
+            count = self.counter.count(content) + self.counter.tokens_per_message
+        # keep the message referenced so its id can not be reused while cached
+        self._cache[id(message)] = (message, content, count)
+        return count
+
+    def count_messages(self, messages: Sequence[Any]) -> int:
+        total = sum(self.count_message(message) for message in messages)
+        if len(self._cache) > len(messages):
+            # drop messages no longer in history (summarized or removed)
+            keep = {id(message) for message in messages}
+            self._cache = {k: v for k, v in self._cache.items() if k in keep}
+        return total
+
+    def count_prompt(self, system: Optional[Sequence[str]], messages: Sequence[Any]) -> int:
+        """Count a system prompt made of parts and a message history"""
+        total = self.count_messages(messages)
+        if system:
+            total += self.counter.count_cached("\n\n".join(system)) + self.counter.tokens_per_message
+        return total
@@ -11,6 +11,9 @@ class Response:
     
 class Tool:
 
+    # tool only reads and can run concurrently with other safe tools requested in the same message
+    concurrency_safe: bool = False
+
     def __init__(self, agent: Agent, name: str, args: dict[str,str], message: str, **kwargs) -> None:
         self.agent = agent
         self.name = name
@@ -2,45 +2,210 @@
 Lightweight Vector Memory System for Termux/Android
 Uses sentence-transformers with a small model and SQLite for storage
 No heavy dependencies like ChromaDB
+Search scores an in-memory matrix of normalized embeddings per memory type
+Embeddings are stored as float32, or float16 or int8 to halve or quarter the size
+The model is loaded only to embed, optionally in the background at startup
+An FTS5 index of the contents serves keyword (BM25) search, see hybrid_retrieval
 """
 
 import sqlite3
 import json
+import re
+import threading
 import numpy as np
 from typing import List, Dict, Tuple, Optional
 from datetime import datetime
 import os
 from python.helpers import files
 
+LOAD_BATCH = 10000  # rows read per fetch when the index is loaded
+ENCODE_BATCH = 64  # texts per forward pass of the embedding model
+SCORE_CHUNK = 1024  # quantized rows converted to float32 at a time when scoring
+
+# float32 keeps the embedding as returned by the model, float16 the normalized embedding,
+# int8 the normalized embedding scaled to +-127 with its float32 scale in front
+STORAGE_TYPES = ("float32", "float16", "int8")
+
+# kept as constants, the connection caches the statement compiled for each
+INSERT_MEMORY = """
+    INSERT INTO memories (content, embedding, memory_type, agent_name, timestamp, metadata)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+DELETE_MEMORY = "DELETE FROM memories WHERE id = ?"
+
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    """Rows scaled to unit length, zero rows stay zero"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _to_blobs(embeddings: np.ndarray, storage: str) -> List[bytes]:
+    """Stored form of each row of a float32 matrix"""
+    if storage == "float32":
+        return [row.tobytes() for row in embeddings]
+    vectors = _normalized(embeddings)
+    if storage == "float16":
+        return [row.tobytes() for row in vectors.astype(np.float16)]
+    scales = (np.abs(vectors).max(axis=1) / 127).astype(np.float32)
+    codes = np.rint(vectors / np.where(scales == 0, 1, scales)[:, None]).astype(np.int8)
+    return [scale.tobytes() + row.tobytes() for scale, row in zip(scales, codes)]
+
+
+def _from_blobs(blobs: List[bytes], storage: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Rows as searched, normalized or quantized, and the int8 scales"""
+    data = b"".join(blobs)
+    if storage == "float32":
+        return _normalized(np.frombuffer(data, dtype=np.float32).reshape(len(blobs), -1)), None
+    if storage == "float16":
+        return np.frombuffer(data, dtype=np.float16).reshape(len(blobs), -1), None
+    raw = np.frombuffer(data, dtype=np.uint8).reshape(len(blobs), -1)
+    return raw[:, 4:].copy().view(np.int8), raw[:, :4].copy().view(np.float32).ravel()
+
+
+def _dequantized(vectors: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    vectors = vectors.astype(np.float32)
+    return vectors * scales[:, None] if scales is not None else vectors
+
+
+class _TypeIndex:
+    """
+    Normalized embeddings of one memory type in a contiguous matrix of the storage
+    type, with the memory ID of each row and, for int8, its scale. Rows are appended
+    into spare capacity and a deleted row is replaced by the last one, so the matrix
+    stays dense.
+    """
+
+    def __init__(self, dim: int, storage: str = "float32", capacity: int = 0):
+        self.vectors = np.empty((capacity, dim), dtype=np.dtype(storage))
+        self.scales = np.empty(capacity, dtype=np.float32) if storage == "int8" else None
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.count = 0
+        self.rows: Dict[int, int] = {}  # memory ID -> row
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray, scales: Optional[np.ndarray] = None):
+        end = self.count + len(ids)
+        if end > len(self.ids):
+            self._grow(max(end, 2 * len(self.ids), 64))
+        self.vectors[self.count : end] = vectors
+        if self.scales is not None:
+            self.scales[self.count : end] = scales
+        self.ids[self.count : end] = ids
+        self.rows.update(zip(ids.tolist(), range(self.count, end)))
+        self.count = end
+
+    def _grow(self, capacity: int):
+        grown = np.empty((capacity, self.vectors.shape[1]), dtype=self.vectors.dtype)
+        grown[: self.count] = self.vectors[: self.count]
+        grown_ids = np.empty(capacity, dtype=np.int64)
+        grown_ids[: self.count] = self.ids[: self.count]
+        self.vectors, self.ids = grown, grown_ids
+        if self.scales is not None:
+            grown_scales = np.empty(capacity, dtype=np.float32)
+            grown_scales[: self.count] = self.scales[: self.count]
+            self.scales = grown_scales
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the rows in use"""
+        per_row = self.vectors[:1].nbytes + self.ids.itemsize + (4 if self.scales is not None else 0)
+        return self.count * per_row
+
+    def remove(self, memory_id: int) -> bool:
+        row = self.rows.pop(memory_id, None)
+        if row is None:
+            return False
+        last = self.count - 1
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.ids[row] = self.ids[last]
+            if self.scales is not None:
+                self.scales[row] = self.scales[last]
+            self.rows[int(self.ids[row])] = row
+        self.count = last
+        return True
+
+    def top_k(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """IDs and cosine similarities of the k rows closest to a normalized query, unordered"""
+        scores = self.scores(query)
+        if k < self.count:
+            rows = np.argpartition(scores, self.count - k)[self.count - k :]
+            return self.ids[rows], scores[rows]
+        return self.ids[: self.count].copy(), scores  # read after the lock is released, rows may move
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        if self.vectors.dtype == np.float32:
+            return self.vectors[: self.count] @ query
+        # numpy has no float16 or int8 BLAS, the product runs on float32 copies of
+        # chunks small enough to stay in the CPU cache
+        scores = np.empty(self.count, dtype=np.float32)
+        chunk = np.empty((min(SCORE_CHUNK, self.count), self.vectors.shape[1]), dtype=np.float32)
+        for start in range(0, self.count, SCORE_CHUNK):
+            end = min(start + SCORE_CHUNK, self.count)
+            chunk[: end - start] = self.vectors[start:end]
+            scores[start:end] = chunk[: end - start] @ query
+        if self.scales is not None:
+            scores *= self.scales[: self.count]
+        return scores
+
+
 class VectorMemory:
     """
     Lightweight vector-based memory using sentence transformers and SQLite
     Optimized for Termux/Android with minimal dependencies
     """
 
-    def __init__(self, db_path: str = None, embedding_model: str = "all-MiniLM-L6-v2"):
+    def __init__(
+        self,
+        db_path: str = None,
+        embedding_model: str = "all-MiniLM-L6-v2",
+        storage: str = None,
+        warm_up: bool = False
+    ):
         """
         Initialize vector memory
 
         Args:
             db_path: Path to SQLite database
             embedding_model: Sentence transformer model name (default: small 80MB model)
+            storage: Embedding storage, "float32", "float16" or "int8" (optional,
+                defaults to the database's, a different one converts the database)
+            warm_up: Load the embedding model on a background thread right away
         """
         self.db_path = db_path or files.get_abs_path("memory", "vector_memory.db")
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
 
+        # One connection for all threads, used under the lock
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # a crash can lose the last writes, never corrupt
+
         # Initialize database
         self._init_database()
 
-        # Lazy load embedding model (only when needed)
+        # Lazy load embedding model (only when needed), its dimension is known from the database
         self._embedding_model = None
         self._embedding_model_name = embedding_model
-        self._embedding_dim = None
+        dimension = self._get_meta("dimension")
+        self._embedding_dim = int(dimension) if dimension else None
+        self._model_lock = threading.Lock()
+
+        # Embeddings by memory type, loaded on the first search and kept in sync by this instance
+        self._index: Optional[Dict[Optional[str], _TypeIndex]] = None
+        self.version = 0  # changes made through this instance, for caches of results
+
+        # Databases written before storage types were recorded hold float32
+        self.storage = self._get_meta("storage") or "float32"
+        if storage and storage != self.storage:
+            self.convert_storage(storage)
+
+        if warm_up:
+            self.warm_up()
 
     def _init_database(self):
         """Create database tables if they don't exist"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
 
         # Main memory table
         cursor.execute("""
@@ -66,41 +231,140 @@ class VectorMemory:
             ON memories(timestamp)
         """)
 
-        conn.commit()
-        conn.close()
+        # Settings of the database
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+
+        self._conn.commit()
+        self.fts = self._init_fts()
+
+    def _init_fts(self) -> bool:
+        """Full-text index of the contents, kept in sync by triggers, False if SQLite lacks FTS5"""
+        cursor = self._conn.cursor()
+        created = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'memories_fts'"
+        ).fetchone() is None
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
+                    content,
+                    content='memories',
+                    content_rowid='id'
+                )
+            """)
+        except sqlite3.OperationalError:  # no such module: fts5
+            return False
+
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS memories_ai AFTER INSERT ON memories BEGIN
+                INSERT INTO memories_fts(rowid, content) VALUES (new.id, new.content);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS memories_ad AFTER DELETE ON memories BEGIN
+                INSERT INTO memories_fts(memories_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS memories_au AFTER UPDATE OF content ON memories BEGIN
+                INSERT INTO memories_fts(memories_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                INSERT INTO memories_fts(rowid, content) VALUES (new.id, new.content);
+            END
+        """)
+
+        # Databases of older versions get their memories indexed once
+        if created:
+            cursor.execute("INSERT INTO memories_fts(memories_fts) VALUES ('rebuild')")
+        self._conn.commit()
+        return True
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        """Set a setting, commits with the caller's transaction if one is open"""
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
 
     def _get_embedding_model(self):
-        """Lazy load embedding model"""
-        if self._embedding_model is None:
-            try:
-                from sentence_transformers import SentenceTransformer
+        """Lazy load embedding model, callers wait for a load in progress"""
+        if self._embedding_model is not None:
+            return self._embedding_model
+        with self._model_lock:
+            if self._embedding_model is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError:
+                    raise ImportError(
+                        "sentence-transformers not installed. "
+                        "Install with: pip install sentence-transformers"
+                    )
                 print(f"Loading embedding model: {self._embedding_model_name}...")
-                self._embedding_model = SentenceTransformer(self._embedding_model_name)
-                self._embedding_dim = self._embedding_model.get_sentence_embedding_dimension()
+                model = SentenceTransformer(self._embedding_model_name)
+                dimension = model.get_sentence_embedding_dimension()
+                self._check_model(dimension)
+                self._embedding_dim = dimension
+                self._embedding_model = model
                 print(f"Model loaded (dimension: {self._embedding_dim})")
-            except ImportError:
-                raise ImportError(
-                    "sentence-transformers not installed. "
-                    "Install with: pip install sentence-transformers"
-                )
         return self._embedding_model
 
+    def _check_model(self, dimension: int):
+        """Record the model of the database, or make sure it is the one stored memories were embedded with"""
+        with self._lock:
+            stored_model, stored_dimension = self._get_meta("model"), self._get_meta("dimension")
+            empty = self._conn.execute("SELECT 1 FROM memories LIMIT 1").fetchone() is None
+            if not empty and stored_dimension and int(stored_dimension) != dimension:
+                raise ValueError(
+                    f"Vector memory {self.db_path} holds {stored_dimension} dimensional embeddings of "
+                    f"{stored_model}, {self._embedding_model_name} has {dimension}. "
+                    "Use that model or clear the memory."
+                )
+            if not empty and stored_model and stored_model != self._embedding_model_name:
+                print(f"Warning: vector memory was embedded with {stored_model}, searching with {self._embedding_model_name}")
+            elif empty or not stored_model:
+                with self._conn:
+                    self._set_meta("model", self._embedding_model_name)
+                    self._set_meta("dimension", str(dimension))
+
+    def warm_up(self) -> threading.Thread:
+        """Load the embedding model on a background thread, the first search then finds it loaded"""
+
+        def load():
+            try:
+                self._get_embedding_model()
+            except Exception as e:  # raised again by the first call that needs the model
+                print(f"Embedding model warm-up failed: {e}")
+
+        thread = threading.Thread(target=load, name="vector-memory-warm-up", daemon=True)
+        thread.start()
+        return thread
+
     def _text_to_embedding(self, text: str) -> np.ndarray:
         """Convert text to embedding vector"""
         model = self._get_embedding_model()
         embedding = model.encode(text, convert_to_numpy=True)
         return embedding
 
+    def _texts_to_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Convert texts to embedding vectors, batched through the model"""
+        model = self._get_embedding_model()
+        embeddings = model.encode(texts, batch_size=ENCODE_BATCH, convert_to_numpy=True)
+        return np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+
     def _embedding_to_bytes(self, embedding: np.ndarray) -> bytes:
         """Convert numpy array to bytes for storage"""
-        return embedding.tobytes()
+        return _to_blobs(np.asarray(embedding, dtype=np.float32)[None, :], self.storage)[0]
 
     def _bytes_to_embedding(self, blob: bytes) -> np.ndarray:
-        """Convert bytes back to numpy array"""
-        if self._embedding_dim is None:
-            # Need to initialize model to get dimension
-            self._get_embedding_model()
-        return np.frombuffer(blob, dtype=np.float32).reshape(self._embedding_dim)
+        """Convert bytes back to numpy array, quantized embeddings come back normalized"""
+        if self.storage == "float32":
+            return np.frombuffer(blob, dtype=np.float32)
+        return _dequantized(*_from_blobs([blob], self.storage))[0]
 
     def add_memory(
         self,
@@ -121,38 +385,77 @@ class VectorMemory:
         Returns:
             Memory ID
         """
-        # Generate embedding
-        embedding = self._text_to_embedding(content)
-        embedding_bytes = self._embedding_to_bytes(embedding)
+        return self.add_memories([{
+            "content": content,
+            "memory_type": memory_type,
+            "agent_name": agent_name,
+            "metadata": metadata
+        }])[0]
+
+    def add_memories(self, batch: List[Dict]) -> List[int]:
+        """
+        Add many memories at once, embedded in batches and stored in one transaction
 
-        # Store in database
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        Args:
+            batch: Memory dicts with "content" and optionally "memory_type",
+                "agent_name" and "metadata", defaults as in add_memory
 
-        cursor.execute("""
-            INSERT INTO memories (content, embedding, memory_type, agent_name, timestamp, metadata)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (
-            content,
-            embedding_bytes,
-            memory_type,
-            agent_name,
-            datetime.now().isoformat(),
-            json.dumps(metadata or {})
-        ))
-
-        memory_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-
-        return memory_id
+        Returns:
+            Memory IDs, in the order of the batch
+        """
+        if not batch:
+            return []
+
+        # Generate embeddings
+        embeddings = self._texts_to_embeddings([item["content"] for item in batch])
+        timestamp = datetime.now().isoformat()
+
+        with self._lock:
+            storage = self.storage  # fixed while the lock is held
+            blobs = _to_blobs(embeddings, storage)
+            rows = [
+                (
+                    item["content"],
+                    blob,
+                    item.get("memory_type", "general"),
+                    item.get("agent_name", "Agent 0"),
+                    timestamp,
+                    json.dumps(item.get("metadata") or {})
+                )
+                for item, blob in zip(batch, blobs)
+            ]
+
+            # Store in database
+            with self._conn:  # one transaction
+                self._conn.executemany(INSERT_MEMORY, rows)
+                last_id = self._conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            # the write lock is held for the whole transaction, the IDs are consecutive
+            memory_ids = list(range(last_id - len(rows) + 1, last_id + 1))
+            self.version += 1
+
+            if self._index is not None:
+                # the index holds what a load would read back
+                vectors, scales = _from_blobs(blobs, storage)
+                types = [row[2] for row in rows]
+                for mem_type in dict.fromkeys(types):
+                    rows_of_type = [i for i, t in enumerate(types) if t == mem_type]
+                    if mem_type not in self._index:
+                        self._index[mem_type] = _TypeIndex(vectors.shape[1], storage)
+                    self._index[mem_type].append(
+                        np.array(memory_ids)[rows_of_type],
+                        vectors[rows_of_type],
+                        scales[rows_of_type] if scales is not None else None
+                    )
+
+        return memory_ids
 
     def search(
         self,
         query: str,
         top_k: int = 5,
         memory_type: str = None,
-        similarity_threshold: float = 0.3
+        similarity_threshold: float = 0.3,
+        rerank: int = 0
     ) -> List[Dict]:
         """
         Search for similar memories using cosine similarity
@@ -162,130 +465,254 @@ class VectorMemory:
             top_k: Number of results to return
             memory_type: Filter by memory type (optional)
             similarity_threshold: Minimum similarity score (0-1)
+            rerank: With float16 or int8 storage, re-score this many of the closest
+                memories with exact embeddings of their content (0 to skip)
 
         Returns:
             List of memory dicts with similarity scores
         """
-        # Generate query embedding
-        query_embedding = self._text_to_embedding(query)
+        if top_k <= 0:
+            return []
 
-        # Fetch memories from database
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # Generate query embedding
+        query_embedding = _normalized(np.asarray(self._text_to_embedding(query), dtype=np.float32))
+
+        # Closest rows of each searched type, then the closest of those
+        with self._lock:
+            reranking = rerank > 0 and self.storage != "float32"
+            count = max(top_k, rerank) if reranking else top_k
+            index = self._get_index()
+            if memory_type:
+                parts = [index[memory_type]] if memory_type in index else []
+            else:
+                parts = list(index.values())
+            candidates = [part.top_k(query_embedding, count) for part in parts if part.count]
+
+        if not candidates:
+            return []
+        ids = np.concatenate([c[0] for c in candidates])
+        scores = np.concatenate([c[1] for c in candidates])
+        if not reranking:  # approximate scores are only compared once re-scored
+            keep = scores >= similarity_threshold
+            ids, scores = ids[keep], scores[keep]
+        order = np.lexsort((ids, -scores))[:count]  # most similar first, older memories first on ties
+        ids, scores = ids[order].tolist(), scores[order].tolist()
+        if not ids:
+            return []
 
-        if memory_type:
-            cursor.execute("""
-                SELECT id, content, embedding, memory_type, agent_name, timestamp, metadata
-                FROM memories
-                WHERE memory_type = ?
-            """, (memory_type,))
-        else:
-            cursor.execute("""
-                SELECT id, content, embedding, memory_type, agent_name, timestamp, metadata
+        # Fetch only the rows returned
+        with self._lock:
+            cursor = self._conn.execute(f"""
+                SELECT id, content, memory_type, agent_name, timestamp, metadata
                 FROM memories
-            """)
+                WHERE id IN ({','.join('?' * len(ids))})
+            """, ids)
+            rows = {row[0]: row for row in cursor.fetchall()}
+
+        found = [(memory_id, similarity) for memory_id, similarity in zip(ids, scores) if memory_id in rows]
+        if reranking and found:
+            exact = _normalized(self._texts_to_embeddings([rows[memory_id][1] for memory_id, _ in found])) @ query_embedding
+            found = [(memory_id, float(similarity)) for (memory_id, _), similarity in zip(found, exact)]
+            found = [f for f in found if f[1] >= similarity_threshold]
+            found.sort(key=lambda f: (-f[1], f[0]))
+            found = found[:top_k]
+
+        return [
+            {**self._row_to_memory(rows[memory_id]), "similarity": float(similarity)}
+            for memory_id, similarity in found
+        ]
+
+    def keyword_search(self, query: str, top_k: int = 5, memory_type: str = None) -> List[Dict]:
+        """
+        Search for memories containing the query terms, ranked by BM25
 
-        rows = cursor.fetchall()
-        conn.close()
+        Args:
+            query: Search query text, any of its words may match
+            top_k: Number of results to return
+            memory_type: Filter by memory type (optional)
 
-        if not rows:
+        Returns:
+            List of memory dicts with BM25 scores, higher is better
+        """
+        terms = query_terms(query)
+        if not self.fts or not terms or top_k <= 0:
             return []
+        match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        sql = """
+            SELECT m.id, m.content, m.memory_type, m.agent_name, m.timestamp, m.metadata,
+                   bm25(memories_fts) AS score
+            FROM memories_fts
+            JOIN memories m ON m.id = memories_fts.rowid
+            WHERE memories_fts MATCH ?
+        """
+        params: list = [match]
+        if memory_type:
+            sql += " AND m.memory_type = ?"
+            params.append(memory_type)
+        sql += " ORDER BY score, m.id LIMIT ?"
+        params.append(top_k)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        # SQLite's bm25() is negative, more negative for better matches
+        return [{**self._row_to_memory(row[:6]), "bm25": -row[6]} for row in rows]
+
+    def _row_to_memory(self, row: tuple) -> Dict:
+        memory_id, content, mem_type, agent, timestamp, metadata_str = row
+        return {
+            "id": memory_id,
+            "content": content,
+            "memory_type": mem_type,
+            "agent_name": agent,
+            "timestamp": timestamp,
+            "metadata": json.loads(metadata_str)
+        }
 
-        # Calculate similarities
-        results = []
-        for row in rows:
-            memory_id, content, embedding_bytes, mem_type, agent, timestamp, metadata_str = row
-
-            # Convert embedding
-            memory_embedding = self._bytes_to_embedding(embedding_bytes)
-
-            # Cosine similarity
-            similarity = self._cosine_similarity(query_embedding, memory_embedding)
-
-            if similarity >= similarity_threshold:
-                results.append({
-                    "id": memory_id,
-                    "content": content,
-                    "similarity": float(similarity),
-                    "memory_type": mem_type,
-                    "agent_name": agent,
-                    "timestamp": timestamp,
-                    "metadata": json.loads(metadata_str)
-                })
-
-        # Sort by similarity and return top_k
-        results.sort(key=lambda x: x["similarity"], reverse=True)
-        return results[:top_k]
-
-    def _cosine_similarity(self, vec1: np.ndarray, vec2: np.ndarray) -> float:
-        """Calculate cosine similarity between two vectors"""
-        dot_product = np.dot(vec1, vec2)
-        norm1 = np.linalg.norm(vec1)
-        norm2 = np.linalg.norm(vec2)
+    def _get_index(self) -> Dict[Optional[str], _TypeIndex]:
+        """Embeddings of all memories by type, read from the database once"""
+        with self._lock:
+            if self._index is None:
+                self._index = self._load_index()
+            return self._index
+
+    def _load_index(self) -> Dict[Optional[str], _TypeIndex]:
+        """Read the embeddings of every type into one matrix each, batch by batch"""
+        cursor = self._conn.cursor()
+        cursor.execute("SELECT memory_type, COUNT(*) FROM memories GROUP BY memory_type")
+        counts = cursor.fetchall()
+
+        index: Dict[Optional[str], _TypeIndex] = {}
+        for mem_type, count in counts:
+            cursor.execute("SELECT id, embedding FROM memories WHERE memory_type IS ? ORDER BY id", (mem_type,))
+            while True:
+                rows = cursor.fetchmany(LOAD_BATCH)
+                if not rows:
+                    break
+                # dimension from the stored blobs, the model is not needed to load
+                vectors, scales = _from_blobs([row[1] for row in rows], self.storage)
+                if mem_type not in index:
+                    index[mem_type] = _TypeIndex(vectors.shape[1], self.storage, count)
+                index[mem_type].append(np.array([row[0] for row in rows], dtype=np.int64), vectors, scales)
+        return index
+
+    def convert_storage(self, storage: str) -> int:
+        """
+        Convert all stored embeddings to another storage type, in one transaction
 
-        if norm1 == 0 or norm2 == 0:
-            return 0.0
+        Args:
+            storage: "float32", "float16" or "int8"
 
-        return dot_product / (norm1 * norm2)
+        Returns:
+            Number of memories converted
+        """
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"Unknown embedding storage '{storage}', expected one of {STORAGE_TYPES}")
+        with self._lock:
+            if storage == self.storage:
+                return 0
+            converted = 0
+            last_id = 0
+            with self._conn:
+                while True:
+                    rows = self._conn.execute(
+                        "SELECT id, embedding FROM memories WHERE id > ? ORDER BY id LIMIT ?", (last_id, LOAD_BATCH)
+                    ).fetchall()
+                    if not rows:
+                        break
+                    embeddings = _dequantized(*_from_blobs([row[1] for row in rows], self.storage))
+                    blobs = _to_blobs(embeddings, storage)
+                    self._conn.executemany(
+                        "UPDATE memories SET embedding = ? WHERE id = ?",
+                        [(blob, row[0]) for blob, row in zip(blobs, rows)]
+                    )
+                    converted += len(rows)
+                    last_id = rows[-1][0]
+                self._set_meta("storage", storage)
+            # give the freed pages back to the file system, through the WAL into the file
+            self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.storage = storage
+            self._index = None  # loaded again in the new type
+            self.version += 1
+        return converted
 
     def delete_memory(self, memory_id: int):
         """Delete a specific memory"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM memories WHERE id = ?", (memory_id,))
-        conn.commit()
-        conn.close()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(DELETE_MEMORY, (memory_id,))
+            self.version += 1
+
+            if self._index is not None:
+                for part in self._index.values():
+                    if part.remove(memory_id):
+                        break
 
     def clear_all(self, memory_type: str = None):
         """Clear all memories or specific type"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        if memory_type:
-            cursor.execute("DELETE FROM memories WHERE memory_type = ?", (memory_type,))
-        else:
-            cursor.execute("DELETE FROM memories")
-
-        conn.commit()
-        conn.close()
+        with self._lock:
+            with self._conn:
+                if memory_type:
+                    self._conn.execute("DELETE FROM memories WHERE memory_type = ?", (memory_type,))
+                else:
+                    self._conn.execute("DELETE FROM memories")
+            self.version += 1
+
+            if self._index is not None:
+                if memory_type:
+                    self._index.pop(memory_type, None)
+                else:
+                    self._index.clear()
 
     def get_memory_stats(self) -> Dict:
         """Get statistics about stored memories"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._lock:
+            cursor = self._conn.cursor()
 
-        # Total count
-        cursor.execute("SELECT COUNT(*) FROM memories")
-        total = cursor.fetchone()[0]
-
-        # Count by type
-        cursor.execute("""
-            SELECT memory_type, COUNT(*) as count
-            FROM memories
-            GROUP BY memory_type
-        """)
-        by_type = {row[0]: row[1] for row in cursor.fetchall()}
+            # Total count
+            cursor.execute("SELECT COUNT(*) FROM memories")
+            total = cursor.fetchone()[0]
 
-        # Database size
-        cursor.execute("SELECT page_count * page_size as size FROM pragma_page_count(), pragma_page_size()")
-        db_size = cursor.fetchone()[0]
+            # Count by type
+            cursor.execute("""
+                SELECT memory_type, COUNT(*) as count
+                FROM memories
+                GROUP BY memory_type
+            """)
+            by_type = {row[0]: row[1] for row in cursor.fetchall()}
 
-        conn.close()
+            # Database size
+            cursor.execute("SELECT page_count * page_size as size FROM pragma_page_count(), pragma_page_size()")
+            db_size = cursor.fetchone()[0]
 
         return {
             "total_memories": total,
             "by_type": by_type,
             "database_size_bytes": db_size,
-            "database_size_mb": round(db_size / (1024 * 1024), 2)
+            "database_size_mb": round(db_size / (1024 * 1024), 2),
+            "embedding_model": self._get_meta("model"),
+            "embedding_dimension": self._embedding_dim,
+            "storage": self.storage
         }
 
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+def query_terms(text: str) -> List[str]:
+    """Lowercase words of a text, as the full-text index splits them"""
+    return list(dict.fromkeys(re.findall(r"[^\W_]+", text.lower())))
+
 
 # Global instance for easy access
 _global_memory: Optional[VectorMemory] = None
 
-def get_memory() -> VectorMemory:
-    """Get or create global vector memory instance"""
+def get_memory(storage: str = None, warm_up: bool = False) -> VectorMemory:
+    """Get or create global vector memory instance, converted to the storage type if given"""
     global _global_memory
     if _global_memory is None:
-        _global_memory = VectorMemory()
+        _global_memory = VectorMemory(storage=storage, warm_up=warm_up)
+    elif storage and storage != _global_memory.storage:
+        _global_memory.convert_storage(storage)
     return _global_memory
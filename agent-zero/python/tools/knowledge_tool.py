@@ -6,6 +6,8 @@ from python.helpers.print_style import PrintStyle
 from python.helpers.errors import handle_error
 
 class Knowledge(Tool):
+    concurrency_safe = True
+
     async def execute(self, question="", **kwargs):
         # Create tasks for all three search methods
         tasks = [
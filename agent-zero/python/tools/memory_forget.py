@@ -6,6 +6,11 @@ DEFAULT_THRESHOLD = 0.75
 class MemoryForget(Tool):
 
     async def execute(self, query="", threshold=DEFAULT_THRESHOLD, filter="", **kwargs):
+        error = Memory._get_comparator(filter).error if filter else ""
+        if error:
+            result = self.agent.read_prompt("fw.memory_filter_invalid.md", filter=filter, error=error)
+            return Response(message=result, break_loop=False)
+
         db = await Memory.get(self.agent)
         dels = await db.delete_documents_by_query(query=query, threshold=threshold, filter=filter)
 
@@ -5,8 +5,14 @@ DEFAULT_THRESHOLD = 0.6
 DEFAULT_LIMIT = 10
 
 class MemoryLoad(Tool):
+    concurrency_safe = True
 
     async def execute(self, query="", threshold=DEFAULT_THRESHOLD, limit=DEFAULT_LIMIT, filter="", **kwargs):
+        error = Memory._get_comparator(filter).error if filter else ""
+        if error:
+            result = self.agent.read_prompt("fw.memory_filter_invalid.md", filter=filter, error=error)
+            return Response(message=result, break_loop=False)
+
         db = await Memory.get(self.agent)
         docs = await db.search_similarity_threshold(query=query, limit=limit, threshold=threshold, filter=filter)
 
@@ -38,7 +38,7 @@ class VectorMemory(Tool):
 
         try:
             from python.helpers.vector_memory import get_memory
-            memory = get_memory()
+            memory = get_memory(self.agent.config.vector_memory_storage)
 
             metadata = {
                 "context": kwargs.get("context", ""),
@@ -76,6 +76,7 @@ class VectorMemory(Tool):
         top_k = int(kwargs.get("top_k", 5))
         memory_type = kwargs.get("memory_type", None)
         threshold = float(kwargs.get("threshold", 0.3))
+        mode = kwargs.get("mode", "hybrid")  # "hybrid", "semantic" or "keyword"
 
         if not query:
             return Response(
@@ -85,14 +86,25 @@ class VectorMemory(Tool):
 
         try:
             from python.helpers.vector_memory import get_memory
-            memory = get_memory()
-
-            results = memory.search(
-                query=query,
-                top_k=top_k,
-                memory_type=memory_type,
-                similarity_threshold=threshold
-            )
+            memory = get_memory(self.agent.config.vector_memory_storage)
+
+            if mode == "keyword":
+                results = memory.keyword_search(query=query, top_k=top_k, memory_type=memory_type)
+            elif mode == "semantic":
+                results = memory.search(
+                    query=query,
+                    top_k=top_k,
+                    memory_type=memory_type,
+                    similarity_threshold=threshold
+                )
+            else:
+                from python.helpers.hybrid_retrieval import get_retriever
+                results = get_retriever(memory).search(
+                    query=query,
+                    top_k=top_k,
+                    memory_type=memory_type,
+                    similarity_threshold=threshold
+                )
 
             if not results:
                 message = f"No relevant memories found for query: '{query}'"
@@ -102,7 +114,12 @@ class VectorMemory(Tool):
             # Format results
             message = f"🔍 Found {len(results)} relevant memories:\n\n"
             for i, result in enumerate(results, 1):
-                message += f"{i}. [{result['memory_type']}] (similarity: {result['similarity']:.2f})\n"
+                scores = []
+                if result.get("similarity") is not None:
+                    scores.append(f"similarity: {result['similarity']:.2f}")
+                if result.get("bm25") is not None:
+                    scores.append(f"keyword score: {result['bm25']:.2f}")
+                message += f"{i}. [{result['memory_type']}] ({', '.join(scores)})\n"
                 message += f"   {result['content']}\n"
                 message += f"   Stored by: {result['agent_name']} at {result['timestamp']}\n\n"
 
@@ -124,7 +141,7 @@ class VectorMemory(Tool):
         """Get memory statistics"""
         try:
             from python.helpers.vector_memory import get_memory
-            memory = get_memory()
+            memory = get_memory(self.agent.config.vector_memory_storage)
 
             stats = memory.get_memory_stats()
 
@@ -1,3 +1,4 @@
+import asyncio
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse
@@ -7,10 +8,16 @@ from python.helpers.errors import handle_error
 
 
 class WebpageContentTool(Tool):
+    concurrency_safe = True
+
     async def execute(self, url="", **kwargs):
         if not url:
             return Response(message="Error: No URL provided.", break_loop=False)
 
+        # blocking download in a thread, so concurrent tool calls are not serialized
+        return await asyncio.to_thread(self.fetch, url)
+
+    def fetch(self, url: str) -> Response:
         try:
             # Validate URL
             parsed_url = urlparse(url)
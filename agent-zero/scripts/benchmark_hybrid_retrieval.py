@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Hybrid Retrieval Benchmark
+
+Accuracy and latency of vector, keyword (BM25) and hybrid search of the vector memory.
+Memories are sentences of random words, every tenth with an identifier (error code,
+file name) of its own. Exact-term queries ask for an identifier, descriptive ones for
+half the words of a memory plus unrelated words. The model is a stand-in embedding a
+text as the sum of fixed vectors of its words, sleeping --model-ms per query like a
+small sentence transformer on a phone CPU.
+
+    python scripts/benchmark_hybrid_retrieval.py --memories 20000 --queries 200 --model-ms 30
+"""
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from python.helpers.hybrid_retrieval import HybridRetriever
+from python.helpers.vector_memory import VectorMemory
+
+DIM = 384
+
+
+class WordsModel:
+    """Embeds a text as the sum of fixed random vectors of its words"""
+
+    def __init__(self, query_seconds: float):
+        self.query_seconds = query_seconds
+        self.vectors: dict[str, np.ndarray] = {}
+
+    def _word(self, word: str) -> np.ndarray:
+        vector = self.vectors.get(word)
+        if vector is None:
+            vector = self.vectors[word] = np.random.default_rng(zlib.crc32(word.encode())).normal(size=DIM).astype(np.float32)
+        return vector
+
+    def _text(self, text: str) -> np.ndarray:
+        return np.sum([self._word(w) for w in re.findall(r"\w+", text.lower())] or [np.zeros(DIM, np.float32)], axis=0)
+
+    def encode(self, text, batch_size=32, convert_to_numpy=True):
+        if isinstance(text, list):
+            return np.stack([self._text(t) for t in text])
+        time.sleep(self.query_seconds)  # one forward pass per query
+        return self._text(text)
+
+
+def corpus(count: int, rng: np.random.Generator) -> tuple[list[str], dict[int, str]]:
+    vocabulary = [f"w{i}" for i in range(3000)]
+    texts, identifiers = [], {}
+    for i in range(count):
+        words = list(rng.choice(vocabulary, size=12))
+        if i % 10 == 0:
+            identifier = f"E{i:06d}" if i % 20 else f"config_{i}.yaml"
+            words.insert(int(rng.integers(len(words))), identifier)
+            identifiers[i] = identifier
+        texts.append(" ".join(words))
+    return texts, identifiers
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    texts, identifiers = corpus(args.memories, rng)
+    root = tempfile.mkdtemp(prefix="hybrid_retrieval_")
+    try:
+        memory = VectorMemory(db_path=os.path.join(root, "vector_memory.db"))
+        memory._embedding_model = WordsModel(args.model_ms / 1000)
+        for start in range(0, len(texts), 1000):
+            memory.add_memories([{"content": text} for text in texts[start : start + 1000]])
+        first_id = 1  # new database, IDs follow the corpus
+
+        exact = [(identifiers[i], i) for i in rng.choice(sorted(identifiers), size=args.queries)]
+        descriptive = []
+        for i in rng.choice(len(texts), size=args.queries):
+            words = [w for w in texts[i].split() if w.startswith("w")]
+            kept = list(rng.choice(words, size=len(words) // 2, replace=False))
+            descriptive.append((" ".join(kept + [f"w{int(n)}" for n in rng.integers(3000, size=2)]), i))
+
+        print(f"{args.memories} memories, {args.queries} queries per kind, {args.model_ms} ms per query embedding\n")
+        print(f"{'queries':<13}{'search':<10}{'hit@1':>8}{'hit@5':>8}{'ms':>9}{'vector skipped':>16}")
+        for kind, queries in (("exact-term", exact), ("descriptive", descriptive)):
+            retriever = HybridRetriever(memory, concurrent=args.concurrent)
+            searches = {
+                "vector": lambda q: memory.search(q, top_k=5, similarity_threshold=-1),
+                "keyword": lambda q: memory.keyword_search(q, top_k=5),
+                "hybrid": lambda q: retriever.search(q, top_k=5, similarity_threshold=-1),
+                "cached": lambda q: retriever.search(q, top_k=5, similarity_threshold=-1),
+            }
+            for name, search in searches.items():
+                hits1 = hits5 = 0
+                start = time.perf_counter()
+                for query, target in queries:
+                    ids = [r["id"] - first_id for r in search(query)]
+                    hits1 += bool(ids) and ids[0] == target
+                    hits5 += target in ids
+                ms = (time.perf_counter() - start) * 1000 / len(queries)
+                skipped = f"{retriever.dense_skipped / len(queries):.0%}" if name == "hybrid" else ""
+                print(f"{kind:<13}{name:<10}{hits1 / len(queries):>8.2f}{hits5 / len(queries):>8.2f}{ms:>9.2f}{skipped:>16}")
+            retriever.close()
+        memory.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--memories", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--model-ms", type=float, default=30.0)
+    parser.add_argument("--concurrent", action="store_true", help="start the vector search together with BM25")
+    main(parser.parse_args())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Knowledge Import Benchmark
+
+Cold start of the knowledge preload on a synthetic knowledge tree, serial (hash, parse and
+embed one file after another) versus the pipeline of Memory.preload_knowledge (threaded
+hashing, process pool parsing, batched embedding concurrent with parsing). The embedding
+model is simulated with a fixed latency per call and per text, as a remote API has.
+
+    python scripts/benchmark_knowledge_import.py --files 500 --size-kb 64 --call-ms 200
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from unittest.mock import Mock, patch
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from python.helpers import knowledge_import
+from python.helpers.memory import Memory
+from python.helpers.print_style import PrintStyle
+
+WORDS = "agent memory vector index knowledge tool prompt model chunk search file".split()
+
+
+class RemoteEmbeddings(DeterministicFakeEmbedding):
+    """Fake embeddings with the latency of a remote embedding API"""
+
+    call_ms: float = 200.0
+    text_ms: float = 1.0
+
+    def embed_documents(self, texts):
+        time.sleep((self.call_ms + self.text_ms * len(texts)) / 1000)
+        return super().embed_documents(texts)
+
+
+def make_tree(root: str, count: int, size_kb: int):
+    folder = os.path.join(root, "knowledge", "default", "main")
+    os.makedirs(folder, exist_ok=True)
+    for i in range(count):
+        words = [WORDS[(i * 7 + j) % len(WORDS)] + str(j % 97) for j in range(size_kb * 1024 // 8)]
+        lines = [" ".join(words[j : j + 12]) for j in range(0, len(words), 12)]
+        with open(os.path.join(folder, f"doc{i}.md"), "w") as f:
+            f.write("\n".join(lines))
+
+
+def serial(root: str, embeddings) -> tuple[float, int]:
+    start = time.perf_counter()
+    index = knowledge_import.load_knowledge(
+        None, os.path.join(root, "knowledge", "default", "main"), {}, {"area": "main"}
+    )
+    chunks = 0
+    for file in index.values():  # one embedding call per file, as the import did
+        embeddings.embed_documents([doc.page_content for doc in file["documents"]])
+        chunks += len(file["documents"])
+    return time.perf_counter() - start, chunks
+
+
+async def pipeline(root: str, embeddings) -> tuple[float, int]:
+    def abs_path(*paths):
+        return os.path.join(root, *paths)
+
+    with patch("python.helpers.files.get_abs_path", side_effect=abs_path):
+        start = time.perf_counter()
+        embedder = Memory._embedder(embeddings, in_memory=True)
+        dbs = {area.value: Memory._new_db(embedder, embeddings.size) for area in Memory.Area}
+        memory = Memory(agent=Mock(), db=dbs, memory_subdir="benchmark")
+        await memory.preload_knowledge(None, ["default"], "benchmark")
+        for area in dbs:
+            memory._wal(area).close()
+        seconds = time.perf_counter() - start
+    return seconds, sum(len(db.index_to_docstore_id) for db in dbs.values())
+
+
+def main(args):
+    root = tempfile.mkdtemp(prefix="knowledge_benchmark_")
+    try:
+        make_tree(root, args.files, args.size_kb)
+        embeddings = RemoteEmbeddings(size=args.dim, call_ms=args.call_ms, text_ms=args.text_ms)
+        # PrintStyle opens its log before get_abs_path is redirected to the benchmark tree
+        PrintStyle().print(
+            f"{args.files} files of {args.size_kb} KB, embedding {args.call_ms} ms/call + {args.text_ms} ms/text\n"
+        )
+        print(f"{'mode':<10}{'seconds':>10}{'chunks':>10}{'chunks/s':>10}")
+
+        seconds, chunks = serial(root, embeddings)
+        print(f"{'serial':<10}{seconds:>10.1f}{chunks:>10}{chunks / seconds:>10.1f}")
+        seconds, chunks = asyncio.run(pipeline(root, embeddings))
+        print(f"{'pipeline':<10}{seconds:>10.1f}{chunks:>10}{chunks / seconds:>10.1f}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--size-kb", type=int, default=64)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--call-ms", type=float, default=200.0)
+    parser.add_argument("--text-ms", type=float, default=1.0)
+    main(parser.parse_args())
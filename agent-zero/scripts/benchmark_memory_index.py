@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Memory Index Benchmark
+
+Recall@k against exact search versus query latency, build time and size for each
+memory index kind (python/helpers/memory_index.py) on synthetic clustered corpora.
+
+    python scripts/benchmark_memory_index.py --sizes 100000 1000000 --dim 384
+
+A 1M x 384 corpus needs ~1.5 GB of RAM for the vectors plus the indexes.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+from python.helpers import memory_index
+
+
+def make_corpus(count: int, dim: int, queries: int, seed: int = 0):
+    """Normalized vectors around random topic centers, queries are perturbed corpus vectors"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(16, count // 1000), dim)).astype(np.float32)
+    vectors = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, 100_000):  # chunked, keeps temporaries small
+        end = min(count, start + 100_000)
+        vectors[start:end] = centers[rng.integers(0, len(centers), end - start)]
+        vectors[start:end] += rng.normal(scale=0.5, size=(end - start, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    picks = vectors[rng.integers(0, count, queries)]
+    qs = picks + rng.normal(scale=0.1, size=picks.shape).astype(np.float32)
+    faiss.normalize_L2(qs)
+    return vectors, qs
+
+
+def benchmark(kind: str, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int):
+    start = time.perf_counter()
+    index = memory_index.create(kind, vectors.shape[1], vectors)
+    build = time.perf_counter() - start
+
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, query in enumerate(queries):  # one by one, as memory recall does
+        start = time.perf_counter()
+        _, labels = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found[i] = labels[0]
+
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+    size = len(faiss.serialize_index(index)) / 2**20
+    return build, recall, float(np.mean(latencies)), float(np.percentile(latencies, 95)), size
+
+
+def main(args):
+    memory_index.ANN_MIN_VECTORS = 0  # benchmark every kind at every size
+    for count in args.sizes:
+        vectors, queries = make_corpus(count, args.dim, args.queries)
+        exact = faiss.IndexFlatIP(args.dim)
+        exact.add(vectors)
+        _, truth = exact.search(queries, args.k)
+        del exact
+
+        print(f"\n{count:,} vectors, dim {args.dim}, {args.queries} queries, recall@{args.k}")
+        print(f"{'kind':<10}{'build s':>10}{'recall':>10}{'mean ms':>10}{'p95 ms':>10}{'size MB':>10}")
+        for kind in args.kinds:
+            build, recall, mean, p95, size = benchmark(kind, vectors, queries, truth, args.k)
+            print(f"{kind:<10}{build:>10.1f}{recall:>10.3f}{mean:>10.3f}{p95:>10.3f}{size:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--kinds", nargs="+", default=list(memory_index.KINDS))
+    main(parser.parse_args())
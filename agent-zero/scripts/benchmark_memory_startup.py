@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Memory Startup Benchmark
+
+Load time, time to the first (filtered) query and resident memory of a memory database,
+loaded as before (whole index read and whole docstore unpickled into RAM) and as now
+(index memory mapped, documents read from the segment when a search returns them).
+Each load runs in a fresh process. RssAnon is memory only this process holds, RssFile
+are pages of mapped files the kernel can drop and read again.
+
+    python scripts/benchmark_memory_startup.py --docs 100000 --dim 384 --text-kb 1
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.embeddings import FakeEmbeddings
+from python.helpers import memory_wal
+from python.helpers.memory import Memory, MyFaiss
+
+WORDS = "agent memory vector index knowledge tool prompt model chunk search file".split()
+
+
+def rss() -> dict[str, float]:
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                values[key] = int(value.split()[0]) / 1024
+    return values
+
+
+def build(root: str, docs: int, dim: int, text_kb: float):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(docs, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    text = " ".join(WORDS[i % len(WORDS)] for i in range(int(text_kb * 1024 / 6)))
+    ids = [f"doc{i}" for i in range(docs)]
+    metadatas = [{"id": id, "area": "main" if i % 4 else "fragments", "timestamp": "2024-01-01 00:00:00"}
+                 for i, id in enumerate(ids)]
+
+    db = Memory._new_db(FakeEmbeddings(size=dim), dim)
+    db.add_embeddings([(f"{id} {text}", vector) for id, vector in zip(ids, vectors.tolist())], metadatas, ids)
+    FAISS.save_local(db, os.path.join(root, "before"))  # the format written until now
+    wal = memory_wal.MemoryWal(os.path.join(root, "after"), db)
+    wal.mark_dirty()
+    wal.close()  # checkpoint: index file and document segment
+    np.save(os.path.join(root, "query.npy"), vectors[7])
+
+
+def child(mode: str, root: str, dim: int):
+    embeddings = FakeEmbeddings(size=dim)
+    kwargs = dict(
+        allow_dangerous_deserialization=True,
+        distance_strategy=DistanceStrategy.COSINE,
+        relevance_score_fn=Memory._cosine_normalizer,
+    )
+    base = rss()
+    start = time.perf_counter()
+    if mode == "before":
+        db = FAISS.load_local.__func__(MyFaiss, os.path.join(root, mode), embeddings, **kwargs)  # type: ignore
+    else:
+        db = MyFaiss.load_local(os.path.join(root, mode), embeddings, **kwargs)
+    loaded = time.perf_counter() - start
+    query = np.load(os.path.join(root, "query.npy")).tolist()
+    results = db.similarity_search_with_score_by_vector(query, k=5, filter=Memory._get_comparator("area == 'main'"))
+    first = time.perf_counter() - start
+    assert results and results[0][0].metadata["id"] == "doc7"
+    used = rss()
+    print(
+        f"{mode:<8}{loaded * 1000:>10.0f}{first * 1000:>12.0f}"
+        + "".join(f"{used[key] - base[key]:>10.0f}" for key in ("VmRSS", "RssAnon", "RssFile"))
+    )
+
+
+def main(args):
+    if args.child:
+        child(args.child, args.root, args.dim)
+        return
+    root = tempfile.mkdtemp(prefix="memory_startup_")
+    try:
+        build(root, args.docs, args.dim, args.text_kb)
+        sizes = {
+            mode: sum(os.path.getsize(os.path.join(root, mode, name)) for name in os.listdir(os.path.join(root, mode)))
+            for mode in ("before", "after")
+        }
+        print(f"{args.docs} documents of {args.text_kb} KB, {args.dim} dims, {sizes['after'] / 2**20:.0f} MB on disk\n")
+        print(f"{'format':<8}{'load ms':>10}{'1st query':>12}{'RSS MB':>10}{'anon MB':>10}{'file MB':>10}")
+        for mode in ("before", "after"):
+            subprocess.run(
+                [sys.executable, __file__, "--child", mode, "--root", root, "--dim", str(args.dim)], check=True
+            )
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--text-kb", type=float, default=1.0)
+    parser.add_argument("--child", choices=["before", "after"], help=argparse.SUPPRESS)
+    parser.add_argument("--root", help=argparse.SUPPRESS)
+    main(parser.parse_args())
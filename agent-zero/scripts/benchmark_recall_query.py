@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Recall Query Benchmark
+
+Compares memory query strategies (llm, embedding, keywords) on a recorded corpus by
+hit rate, agreement with the recording and latency.
+
+Record a corpus by running the agent with recall_query_record = "memory/recall_corpus.jsonl".
+Each case stores the memories the recorded recall "retrieved" and an empty "relevant"
+list. Fill "relevant" with the IDs of the memories that really help (by hand or by an
+independent judge): the hit rate is measured on those labelled cases only. Unlabelled
+cases give the agreement, how often a memory of the recorded recall is found again.
+That number is biased toward the recording mode, which agrees with itself by
+construction, and does not show which mode recalls better. Then run:
+
+    python scripts/benchmark_recall_query.py memory/recall_corpus.jsonl
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import AgentContext
+from initialize import initialize
+from python.helpers import memory_query
+from python.helpers.memory import Memory
+
+
+async def main(args):
+    config = initialize()
+    context = AgentContext(config)
+    agent = context.agent0
+    db = await Memory.get(agent)
+
+    cases = memory_query.load_corpus(args.corpus)
+    print(f"{len(cases)} cases from {args.corpus}\n")
+
+    results = await memory_query.compare_modes(
+        agent, db, cases, args.modes, limit=args.limit, threshold=args.threshold
+    )
+
+    print(f"{'mode':<12}{'hit rate':>10}{'labelled':>10}{'agreement':>11}{'recorded':>10}{'mean ms':>10}{'p95 ms':>10}")
+    for stats in results.values():
+        print(
+            f"{stats.mode:<12}{stats.hit_rate:>10.1%}{stats.scored:>10}{stats.agreement:>11.1%}{stats.recorded:>10}"
+            f"{stats.mean_ms:>10.1f}{stats.p95_ms:>10.1f}"
+        )
+    recorded_modes = sorted({case.mode for case in cases if case.relevant is None and case.mode})
+    if any(stats.recorded for stats in results.values()):
+        print(
+            f"\nAgreement is measured against recalls recorded in {', '.join(recorded_modes) or 'an unknown'} mode"
+            " and favours that mode by construction; label \"relevant\" memories for a fair hit rate."
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="JSONL corpus recorded with recall_query_record")
+    parser.add_argument("--modes", nargs="+", default=["llm", "embedding", "keywords"])
+    parser.add_argument("--limit", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=0.6)
+    asyncio.run(main(parser.parse_args()))
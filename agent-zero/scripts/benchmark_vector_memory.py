@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Vector Memory Search Benchmark
+
+Search latency of the SQLite vector memory at several sizes, before (every row read from
+SQLite and compared in a Python loop) and now (one matrix-vector product over the
+normalized embeddings kept in memory, argpartition for the top k). Rows are random
+embeddings written straight into the database, the model is replaced by a stub returning
+the query vector. Each size and mode runs in a fresh process.
+
+--ingest times inserts instead: one connection and commit per row as before, add_memory on
+the shared connection in WAL mode, and add_memories batches in one transaction each. The
+stub model costs nothing, batched encoding with a real model saves more.
+
+--storage compares float32, float16 and int8 storage on one clustered data set: database
+file size, memory held by the search index, recall@k against float32, with and without
+exact re-rank (the stub model returns the original float32 vectors), and query latency.
+
+    python scripts/benchmark_vector_memory.py --rows 10000 100000 1000000 --dim 384
+    python scripts/benchmark_vector_memory.py --ingest 20000 --batch 500
+    python scripts/benchmark_vector_memory.py --storage --rows 100000 --rerank 50
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from python.helpers.vector_memory import VectorMemory
+
+TYPES = ["general", "solution", "fact", "instruction"]
+BATCH = 10000
+
+
+class QueryModel:
+    """Stands in for the sentence transformer, every text embeds to the saved query"""
+
+    def __init__(self, vector: np.ndarray):
+        self.vector = vector
+
+    def encode(self, text, convert_to_numpy=True):
+        return self.vector
+
+
+class RandomModel:
+    """Stands in for the sentence transformer when inserting, returns random vectors"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.rng = np.random.default_rng(0)
+
+    def encode(self, text, batch_size=32, convert_to_numpy=True):
+        if isinstance(text, list):
+            return self.rng.normal(size=(len(text), self.dim)).astype(np.float32)
+        return self.rng.normal(size=self.dim).astype(np.float32)
+
+
+class LookupModel:
+    """Stands in for the sentence transformer when comparing storage types, texts name their vector"""
+
+    def __init__(self, vectors: np.ndarray, queries: np.ndarray):
+        self.vectors = vectors
+        self.queries = queries
+
+    def _vector(self, text: str) -> np.ndarray:
+        kind, number = text.split()
+        return (self.queries if kind == "query" else self.vectors)[int(number)]
+
+    def encode(self, text, batch_size=32, convert_to_numpy=True):
+        if isinstance(text, list):
+            return np.stack([self._vector(t) for t in text])
+        return self._vector(text)
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def build(path: str, rows: int, dim: int):
+    memory = VectorMemory(db_path=path)  # creates the tables
+    rng = np.random.default_rng(0)
+    conn = sqlite3.connect(path)
+    for start in range(0, rows, BATCH):
+        vectors = rng.normal(size=(min(BATCH, rows - start), dim)).astype(np.float32)
+        conn.executemany(
+            "INSERT INTO memories (content, embedding, memory_type, agent_name, timestamp, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (f"memory {start + i}", v.tobytes(), TYPES[(start + i) % len(TYPES)], "Agent 0", "2024-01-01T00:00:00", "{}")
+                for i, v in enumerate(vectors)
+            ],
+        )
+        if start == 0:
+            np.save(path + ".query.npy", vectors[7])
+    conn.commit()
+    conn.close()
+    return memory
+
+
+def search_before(memory: VectorMemory, query: str, top_k: int = 5, memory_type=None, similarity_threshold: float = 0.3):
+    """The search as it was: all rows fetched, cosine similarity computed row by row"""
+    query_embedding = memory._text_to_embedding(query)
+    conn = sqlite3.connect(memory.db_path)
+    cursor = conn.cursor()
+    if memory_type:
+        cursor.execute("SELECT id, content, embedding, memory_type, agent_name, timestamp, metadata FROM memories WHERE memory_type = ?", (memory_type,))
+    else:
+        cursor.execute("SELECT id, content, embedding, memory_type, agent_name, timestamp, metadata FROM memories")
+    rows = cursor.fetchall()
+    conn.close()
+    results = []
+    for memory_id, content, embedding_bytes, mem_type, agent, timestamp, metadata_str in rows:
+        vector = memory._bytes_to_embedding(embedding_bytes)
+        norm1, norm2 = np.linalg.norm(query_embedding), np.linalg.norm(vector)
+        similarity = 0.0 if norm1 == 0 or norm2 == 0 else np.dot(query_embedding, vector) / (norm1 * norm2)
+        if similarity >= similarity_threshold:
+            results.append({"id": memory_id, "content": content, "similarity": float(similarity), "memory_type": mem_type,
+                            "agent_name": agent, "timestamp": timestamp, "metadata": json.loads(metadata_str)})
+    results.sort(key=lambda x: x["similarity"], reverse=True)
+    return results[:top_k]
+
+
+def child(mode: str, path: str, dim: int, repeat: int):
+    memory = VectorMemory(db_path=path)
+    memory._embedding_model = QueryModel(np.load(path + ".query.npy"))
+    memory._embedding_dim = dim
+    search = (lambda **kw: search_before(memory, "query", **kw)) if mode == "before" else (lambda **kw: memory.search("query", **kw))
+
+    base = rss_mb()
+    start = time.perf_counter()
+    first = search()
+    first_ms = (time.perf_counter() - start) * 1000
+    assert first[0]["content"] == "memory 7"
+    held = rss_mb() - base
+    timings = {}
+    for name, kwargs in (("all", {}), ("typed", {"memory_type": "solution", "top_k": 10})):
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            search(**kwargs)
+            runs.append((time.perf_counter() - start) * 1000)
+        timings[name] = float(np.median(runs))
+    print(f"{mode:<8}{first_ms:>12.1f}{timings['all']:>12.2f}{timings['typed']:>12.2f}{held:>10.0f}", flush=True)
+
+
+def add_before(memory: VectorMemory, content: str, memory_type: str):
+    """add_memory as it was: a connection and a commit per row, rollback journal"""
+    embedding_bytes = memory._embedding_to_bytes(memory._text_to_embedding(content))
+    conn = sqlite3.connect(memory.db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO memories (content, embedding, memory_type, agent_name, timestamp, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+        (content, embedding_bytes, memory_type, "Agent 0", "2024-01-01T00:00:00", "{}"),
+    )
+    conn.commit()
+    conn.close()
+
+
+def ingest(root: str, rows: int, dim: int, batch: int):
+    print(f"{rows} rows, {dim} dims")
+    print(f"{'insert':<16}{'seconds':>10}{'rows/s':>12}")
+    for mode in ("before", "add_memory", "add_memories"):
+        path = os.path.join(root, f"ingest_{mode}.db")
+        memory = VectorMemory(db_path=path)
+        if mode == "before":
+            memory._conn.execute("PRAGMA journal_mode=DELETE")
+        memory._embedding_model = RandomModel(dim)
+        start = time.perf_counter()
+        if mode == "before":
+            for i in range(rows):
+                add_before(memory, f"memory {i}", TYPES[i % len(TYPES)])
+        elif mode == "add_memory":
+            for i in range(rows):
+                memory.add_memory(f"memory {i}", memory_type=TYPES[i % len(TYPES)])
+        else:
+            for start_row in range(0, rows, batch):
+                memory.add_memories([
+                    {"content": f"memory {i}", "memory_type": TYPES[i % len(TYPES)]}
+                    for i in range(start_row, min(start_row + batch, rows))
+                ])
+        seconds = time.perf_counter() - start
+        assert memory.get_memory_stats()["total_memories"] == rows
+        memory.close()
+        print(f"{mode:<16}{seconds:>10.2f}{rows / seconds:>12.0f}")
+
+
+def clustered(rows: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    """Vectors around a few hundred topics, closer to real embeddings than uniform noise"""
+    centers = rng.normal(size=(max(rows // 200, 1), dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=rows)] + 0.6 * rng.normal(size=(rows, dim)).astype(np.float32)
+    return vectors.astype(np.float32)
+
+
+def compare_storage(root: str, rows: int, dim: int, queries: int, top_k: int, rerank: int):
+    rng = np.random.default_rng(0)
+    vectors = clustered(rows, dim, rng)
+    query_vectors = vectors[rng.integers(rows, size=queries)] + 0.3 * rng.normal(size=(queries, dim)).astype(np.float32)
+    model = LookupModel(vectors, query_vectors)
+
+    path = os.path.join(root, "source.db")
+    memory = VectorMemory(db_path=path)
+    memory._embedding_model = model
+    for start in range(0, rows, BATCH):
+        memory.add_memories([{"content": f"memory {i}"} for i in range(start, min(start + BATCH, rows))])
+    memory.close()
+
+    print(f"{rows} rows, {dim} dims, {queries} queries, recall@{top_k} against float32, re-rank of {rerank}\n")
+    print(f"{'storage':<10}{'file MB':>10}{'index MB':>10}{'recall':>10}{'ms':>8}{'re-rank':>10}{'ms':>8}")
+    expected = None
+    for storage in ("float32", "float16", "int8"):
+        copy = os.path.join(root, f"{storage}.db")
+        shutil.copy(path, copy)
+        memory = VectorMemory(db_path=copy, storage=storage)
+        memory._embedding_model = model
+        memory.search("query 0")  # load the index
+        index_mb = sum(part.nbytes for part in memory._index.values()) / 2**20  # type: ignore
+
+        def run(**kwargs):
+            found, start = [], time.perf_counter()
+            for q in range(queries):
+                found.append([r["id"] for r in memory.search(f"query {q}", top_k=top_k, similarity_threshold=-1, **kwargs)])
+            return found, (time.perf_counter() - start) * 1000 / queries
+
+        found, ms = run()
+        if expected is None:
+            expected = found
+        recall = np.mean([len(set(f) & set(e)) / top_k for f, e in zip(found, expected)])
+        line = f"{storage:<10}{os.path.getsize(copy) / 2**20:>10.1f}{index_mb:>10.1f}{recall:>10.4f}{ms:>8.2f}"
+        if storage != "float32":
+            reranked, rerank_ms = run(rerank=rerank)
+            rerank_recall = np.mean([len(set(f) & set(e)) / top_k for f, e in zip(reranked, expected)])
+            line += f"{rerank_recall:>10.4f}{rerank_ms:>8.2f}"
+        print(line)
+        memory.close()
+
+
+def main(args):
+    if args.child:
+        child(args.child, args.path, args.dim, args.repeat)
+        return
+    root = tempfile.mkdtemp(prefix="vector_memory_")
+    try:
+        if args.ingest:
+            ingest(root, args.ingest, args.dim, args.batch)
+            return
+        if args.storage:
+            compare_storage(root, args.rows[0], args.dim, args.queries, args.top_k, args.rerank)
+            return
+        for rows in args.rows:
+            path = os.path.join(root, f"memories_{rows}.db")
+            start = time.perf_counter()
+            build(path, rows, args.dim)
+            size = os.path.getsize(path) / 2**20
+            print(f"\n{rows} rows, {args.dim} dims, {size:.0f} MB database, built in {time.perf_counter() - start:.0f}s")
+            print(f"{'search':<8}{'1st ms':>12}{'median ms':>12}{'typed ms':>12}{'held MB':>10}")
+            for mode in ("before", "after"):
+                # the row by row scan takes seconds per query at large sizes, timed fewer times
+                repeat = args.repeat if mode == "after" else max(1, min(args.repeat, 100_000 // rows))
+                subprocess.run(
+                    [sys.executable, __file__, "--child", mode, "--path", path, "--dim", str(args.dim), "--repeat", str(repeat)],
+                    check=True,
+                )
+            os.remove(path)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--ingest", type=int, help="time inserting this many rows instead")
+    parser.add_argument("--batch", type=int, default=500, help="rows per add_memories call")
+    parser.add_argument("--storage", action="store_true", help="compare storage types instead, on the first --rows")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rerank", type=int, default=50)
+    parser.add_argument("--child", choices=["before", "after"], help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    main(parser.parse_args())
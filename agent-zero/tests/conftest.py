@@ -22,10 +22,13 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from agent import Agent, AgentConfig, AgentContext
-from python.helpers.memory import Memory
+from python.helpers import memory_index
+from python.helpers.memory import Memory, MyFaiss
 from python.helpers.tool import Tool, Response
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain_core.embeddings import Embeddings
+from langchain_core.embeddings import Embeddings, FakeEmbeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.utils import DistanceStrategy
 
 
 # ============================================================================
@@ -230,6 +233,41 @@ async def memory_db(agent, temp_memory_dir):
         yield memory
 
 
+MEMORY_DIM = 16  # vector size of the make_db and make_vectors fixtures
+
+
+@pytest.fixture
+def make_vectors():
+    """Fixture providing a factory of clustered unit vectors, as real embeddings are."""
+    import numpy as np
+
+    def make(count: int = 1000, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        centers = rng.normal(size=(20, MEMORY_DIM))
+        vectors = centers[rng.integers(0, 20, count)] + rng.normal(scale=0.3, size=(count, MEMORY_DIM))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors.astype(np.float32)
+
+    return make
+
+
+@pytest.fixture
+def make_db():
+    """Fixture providing a factory of empty cosine databases, on a flat index unless one is given."""
+
+    def make(index=None, embeddings: Embeddings | None = None) -> MyFaiss:
+        return MyFaiss(
+            embedding_function=embeddings or FakeEmbeddings(size=MEMORY_DIM),
+            index=index if index is not None else memory_index.create("flat", MEMORY_DIM),
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={},
+            distance_strategy=DistanceStrategy.COSINE,
+            relevance_score_fn=Memory._cosine_normalizer,
+        )
+
+    return make
+
+
 @pytest.fixture
 def mock_memory():
     """Fixture providing a mock memory object."""
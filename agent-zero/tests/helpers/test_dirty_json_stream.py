@@ -0,0 +1,114 @@
+import time
+import unittest
+import pytest
+from python.helpers.dirty_json import DirtyJson
+
+
+SAMPLES = [
+    '{"key": "value"}',
+    'some text before {"key": "value"} some text after',
+    '{"key": "value"',
+    '{a: hello, b: 1}',
+    '{"a": [1, 2, 3], "b": {"c": "d"}}',
+    '{"a": """multi\nline"""}',
+    '{"a": "q\\"uote\\\\ \\/ \\n"}',
+    "{'a': 'b'}",
+    '{"a": 1.5e3, "b": -2, "c": true}',
+    ('{"thoughts": ["The user wants to save the source code.", "I can use the tool."], '
+     '"tool_name": "code_execution_tool", "tool_args": {"runtime": "terminal", "code": "echo '
+     '\'print(\'Hello, World!\')\' > hello_world.py"}}'),
+]
+
+
+def feed_in_chunks(text: str, size: int):
+    parser = DirtyJson()
+    for i in range(0, len(text), size):
+        parser.feed(text[i : i + size])
+    return parser.finish()
+
+
+class TestDirtyJsonFeed(unittest.TestCase):
+    def test_feed_matches_parse(self):
+        for sample in SAMPLES:
+            expected = DirtyJson.parse_string(sample)
+            for size in (1, 2, 3, 7, len(sample)):
+                with self.subTest(sample=sample, size=size):
+                    self.assertEqual(feed_in_chunks(sample, size), expected)
+
+    def test_partial_result_is_live(self):
+        parser = DirtyJson()
+        parser.feed('{"tool_name": "code_execution_tool", "tool_args": {"code": "print(')
+        self.assertEqual(parser.result["tool_name"], "code_execution_tool")
+        self.assertEqual(parser.result["tool_args"]["code"], "print(")
+        parser.feed('1)"}}')
+        self.assertEqual(parser.finish()["tool_args"]["code"], "print(1)")
+
+    def test_partial_array_item(self):
+        parser = DirtyJson()
+        parser.feed('{"thoughts": ["first", "sec')
+        self.assertEqual(parser.result["thoughts"], ["first", "sec"])
+        parser.feed('ond"]}')
+        self.assertEqual(parser.finish(), {"thoughts": ["first", "second"]})
+
+    def test_preamble_across_chunks(self):
+        parser = DirtyJson()
+        self.assertIsNone(parser.feed("Sure, here is "))
+        self.assertIsNone(parser.feed("the tool call: "))
+        parser.feed('{"a": 1}')
+        self.assertEqual(parser.finish(), {"a": 1})
+
+    def test_feed_after_end_is_ignored(self):
+        parser = DirtyJson()
+        parser.feed('{"a": "x"}')
+        parser.feed(' trailing {"b": 1}')
+        self.assertEqual(parser.finish(), {"a": "x"})
+
+    def test_buffer_only_keeps_unparsed_input(self):
+        parser = DirtyJson()
+        parser.feed('{"code": "')
+        for _ in range(1000):
+            parser.feed("x" * 50)
+        self.assertLess(len(parser.json_string), 100)
+        self.assertEqual(len(parser.result["code"]), 50000)
+
+
+@pytest.mark.slow
+class TestDirtyJsonFeedPerformance(unittest.TestCase):
+    """Per-chunk cost of feed() must not grow with the response length."""
+
+    CHUNK = 8
+
+    def _chunk_times(self, length):
+        body = "".join(f"line {i}: x = {i} * 2\\n" for i in range(length // 20))
+        text = '{"thoughts": ["writing a long file"], "tool_name": "code_execution_tool", ' \
+               '"tool_args": {"runtime": "python", "code": "' + body + '"}}'
+        parser = DirtyJson()
+        times = []
+        for i in range(0, len(text), self.CHUNK):
+            start = time.perf_counter()
+            parser.feed(text[i : i + self.CHUNK])
+            times.append(time.perf_counter() - start)
+        parser.finish()
+        return text, times
+
+    def _assert_flat(self, length):
+        text, times = self._chunk_times(length)
+        self.assertGreater(len(text), length * 5 // 6)
+        window = 1000
+        early = sorted(times[window : 2 * window])[window // 2]
+        late = sorted(times[-window:])[window // 2]
+        print(
+            f"\nDirtyJson.feed: {len(text)} chars, median per chunk "
+            f"early {early * 1e6:.1f}us, late {late * 1e6:.1f}us"
+        )
+        # reparsing the whole response, or copying the value, per chunk grows ~100x over this range
+        self.assertLess(late, early * 4 + 20e-6)
+
+    def test_per_chunk_cost_stays_flat(self):
+        self._assert_flat(60000)
+
+    def test_per_chunk_cost_stays_flat_for_long_values(self):
+        self._assert_flat(1_200_000)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -55,6 +55,22 @@ class TestJsonParseDirty(unittest.TestCase):
         }
         self.assertEqual(json_parse_dirty(json_string), expected_result)
 
+    def test_nested_objects_closing_together(self):
+        json_string = ('{"tool_calls": [{"tool_name": "memory_load", "tool_args": {"query": "a"}}, '
+                       '{"tool_name": "knowledge_tool", "tool_args": {"question": "b"}}]}')
+        expected_result = {
+            "tool_calls": [
+                {"tool_name": "memory_load", "tool_args": {"query": "a"}},
+                {"tool_name": "knowledge_tool", "tool_args": {"question": "b"}},
+            ]
+        }
+        self.assertEqual(json_parse_dirty(json_string), expected_result)
+
+    def test_double_braces(self):
+        json_string = '{{"key": {"inner": "value"}}}'
+        expected_result = {"key": {"inner": "value"}}
+        self.assertEqual(json_parse_dirty(json_string), expected_result)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""
+Unit tests for the Tool/Extension class registry
+
+Tests cover:
+- Cached lookups without re-importing
+- Pickup of added and removed files
+- Reload of modified files
+- Alphabetical order and name patterns
+- Lookup statistics
+"""
+
+import os
+import sys
+import pytest
+from python.helpers.class_registry import ClassRegistry
+
+
+class Base:
+    pass
+
+
+PLUGIN_SOURCE = """
+from tests_registry_base import Base
+
+class {name}(Base):
+    version = {version}
+"""
+
+
+@pytest.fixture
+def plugin_folder(tmp_path, monkeypatch):
+    """Importable folder 'regpkg/plugins' relative to the working directory."""
+    base_module = type(sys)("tests_registry_base")
+    base_module.Base = Base  # type: ignore
+    monkeypatch.setitem(sys.modules, "tests_registry_base", base_module)
+    folder = tmp_path / "regpkg" / "plugins"
+    folder.mkdir(parents=True)
+    (tmp_path / "regpkg" / "__init__.py").write_text("")
+    (folder / "__init__.py").write_text("")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield folder
+    for name in list(sys.modules):
+        if name.startswith("regpkg"):
+            del sys.modules[name]
+
+
+def write_plugin(folder, file_name, class_name, version=1):
+    path = folder / file_name
+    path.write_text(PLUGIN_SOURCE.format(name=class_name, version=version))
+    # make sure the change is visible even on coarse mtime filesystems
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + version * 1_000_000_000))
+
+
+class TestClassRegistryLookup:
+    """Test cached class lookups."""
+
+    def test_classes_in_alphabetical_order(self, plugin_folder):
+        write_plugin(plugin_folder, "_20_second.py", "Second")
+        write_plugin(plugin_folder, "_10_first.py", "First")
+        registry = ClassRegistry()
+
+        classes = registry.get_classes("regpkg/plugins", "*", Base)
+
+        assert [cls.__name__ for cls in classes] == ["First", "Second"]
+
+    def test_name_pattern(self, plugin_folder):
+        write_plugin(plugin_folder, "alpha.py", "Alpha")
+        write_plugin(plugin_folder, "beta.py", "Beta")
+        registry = ClassRegistry()
+
+        classes = registry.get_classes("regpkg/plugins", "beta.py", Base)
+
+        assert [cls.__name__ for cls in classes] == ["Beta"]
+        assert registry.get_classes("regpkg/plugins", "missing.py", Base) == []
+
+    def test_repeated_lookup_uses_cache(self, plugin_folder):
+        write_plugin(plugin_folder, "alpha.py", "Alpha")
+        registry = ClassRegistry()
+
+        first = registry.get_classes("regpkg/plugins", "*", Base)
+        loads = registry.get_stats()["module_loads"]
+        second = registry.get_classes("regpkg/plugins", "*", Base)
+
+        assert first == second
+        stats = registry.get_stats()
+        assert stats["lookups"] == 2
+        assert stats["folder_scans"] == 1
+        assert stats["module_loads"] == loads
+        assert stats["module_reloads"] == 0
+
+    def test_missing_folder(self, plugin_folder):
+        registry = ClassRegistry()
+        assert registry.get_classes("regpkg/missing", "*", Base) == []
+
+
+class TestClassRegistryRefresh:
+    """Test mtime based refresh."""
+
+    def test_added_file_is_picked_up(self, plugin_folder):
+        write_plugin(plugin_folder, "alpha.py", "Alpha")
+        registry = ClassRegistry()
+        registry.get_classes("regpkg/plugins", "*", Base)
+
+        write_plugin(plugin_folder, "beta.py", "Beta")
+        stat = plugin_folder.stat()
+        os.utime(plugin_folder, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        classes = registry.get_classes("regpkg/plugins", "*", Base)
+        assert [cls.__name__ for cls in classes] == ["Alpha", "Beta"]
+
+    def test_removed_file_is_dropped(self, plugin_folder):
+        write_plugin(plugin_folder, "alpha.py", "Alpha")
+        write_plugin(plugin_folder, "beta.py", "Beta")
+        registry = ClassRegistry()
+        registry.get_classes("regpkg/plugins", "*", Base)
+
+        (plugin_folder / "beta.py").unlink()
+
+        classes = registry.get_classes("regpkg/plugins", "*", Base)
+        assert [cls.__name__ for cls in classes] == ["Alpha"]
+
+    def test_modified_file_is_reloaded(self, plugin_folder):
+        write_plugin(plugin_folder, "alpha.py", "Alpha", version=1)
+        registry = ClassRegistry()
+        assert registry.get_classes("regpkg/plugins", "*", Base)[0].version == 1
+
+        write_plugin(plugin_folder, "alpha.py", "Alpha", version=2)
+
+        assert registry.get_classes("regpkg/plugins", "*", Base)[0].version == 2
+        assert registry.get_stats()["module_reloads"] == 1
+
+
+class TestClassRegistryPreload:
+    """Test startup preloading."""
+
+    def test_preload_skips_broken_modules(self, plugin_folder):
+        write_plugin(plugin_folder, "alpha.py", "Alpha")
+        (plugin_folder / "broken.py").write_text("from nowhere import nothing\n")
+        registry = ClassRegistry()
+
+        registry.preload({"regpkg/plugins": Base})
+
+        assert "alpha.py" in registry.folders["regpkg/plugins"].modules
+        assert "broken.py" not in registry.folders["regpkg/plugins"].modules
+        assert [cls.__name__ for cls in registry.get_classes("regpkg/plugins", "alpha.py", Base)] == ["Alpha"]
+        with pytest.raises(ImportError):
+            registry.get_classes("regpkg/plugins", "broken.py", Base)
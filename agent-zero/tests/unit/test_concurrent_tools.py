@@ -0,0 +1,149 @@
+"""
+Unit tests for multiple tool calls per agent message
+
+Tests cover:
+- Parsing tool_calls lists
+- Concurrent execution of concurrency safe tools
+- Sequential execution of other tools
+- Deterministic order of tool responses in history
+- Loop break and error propagation
+"""
+
+import asyncio
+import json
+import time
+import pytest
+from unittest.mock import Mock
+from agent import Agent, AgentConfig, AgentContext
+from python.helpers import extract_tools
+from python.helpers.tool import Tool, Response
+
+
+class SlowLookup(Tool):
+    concurrency_safe = True
+
+    async def execute(self, delay=0.0, text="", **kwargs):
+        self.agent.events.append(("start", text))
+        await asyncio.sleep(delay)
+        self.agent.events.append(("end", text))
+        return Response(message=str(text), break_loop=False)
+
+
+class SlowAction(SlowLookup):
+    concurrency_safe = False
+
+
+class Finish(Tool):
+    async def execute(self, text="", **kwargs):
+        return Response(message=text, break_loop=True)
+
+
+class Broken(Tool):
+    concurrency_safe = True
+
+    async def execute(self, **kwargs):
+        raise ValueError("tool failed")
+
+
+TOOLS = {"lookup": SlowLookup, "action": SlowAction, "finish": Finish, "broken": Broken}
+
+
+def make_agent() -> Agent:
+    config = AgentConfig(
+        chat_model=Mock(model_name="test-chat"),
+        utility_model=Mock(model_name="test-utility"),
+        embeddings_model=Mock(),
+    )
+    context = AgentContext(config)
+    AgentContext.remove(context.id)
+    agent = context.agent0
+    agent.events = []  # type: ignore
+    agent.get_tool = lambda name, args, message, **kwargs: TOOLS[name](  # type: ignore
+        agent=agent, name=name, args=args, message=message
+    )
+    return agent
+
+
+def message(*calls):
+    return json.dumps({
+        "thoughts": ["test"],
+        "tool_calls": [{"tool_name": name, "tool_args": args} for name, args in calls],
+    })
+
+
+def tool_results(agent: Agent):
+    return [
+        json.loads(part)["response_from_tool"] + ":" + str(json.loads(part)["data"])
+        for part in agent.history[-1].content.split("\n\n")
+    ]
+
+
+class TestToolRequests:
+    """Test extracting tool requests."""
+
+    def test_single_request(self):
+        data = {"tool_name": "a", "tool_args": {}}
+        assert extract_tools.get_tool_requests(data) == [data]
+
+    def test_tool_calls_list(self):
+        calls = [{"tool_name": "a"}, "garbage", {"tool_name": "b"}]
+        assert extract_tools.get_tool_requests({"tool_calls": calls}) == [calls[0], calls[2]]
+
+    def test_empty_tool_calls(self):
+        data = {"tool_calls": [], "tool_name": "a"}
+        assert extract_tools.get_tool_requests(data) == [data]
+
+
+class TestConcurrentTools:
+    """Test executing several tools from one message."""
+
+    @pytest.mark.asyncio
+    async def test_safe_tools_run_concurrently(self):
+        agent = make_agent()
+        msg = message(("lookup", {"delay": 0.2, "text": 1}), ("lookup", {"delay": 0.2, "text": 2}),
+                      ("lookup", {"delay": 0.2, "text": 3}))
+
+        start = time.monotonic()
+        assert await agent.process_tools(msg) is None
+
+        assert time.monotonic() - start < 0.5
+        assert [event[0] for event in agent.events[:3]] == ["start"] * 3
+
+    @pytest.mark.asyncio
+    async def test_results_in_request_order(self):
+        agent = make_agent()
+        msg = message(("lookup", {"delay": 0.1, "text": 1}), ("lookup", {"delay": 0.0, "text": 2}))
+
+        await agent.process_tools(msg)
+
+        assert agent.events.index(("end", 2)) < agent.events.index(("end", 1))  # second tool finished first
+        assert tool_results(agent) == ["lookup:1", "lookup:2"]
+
+    @pytest.mark.asyncio
+    async def test_unsafe_tools_run_alone(self):
+        agent = make_agent()
+        msg = message(("lookup", {"delay": 0.05, "text": 1}), ("action", {"delay": 0.05, "text": 2}),
+                      ("lookup", {"delay": 0.05, "text": 3}))
+
+        await agent.process_tools(msg)
+
+        assert agent.events == [("start", 1), ("end", 1), ("start", 2), ("end", 2), ("start", 3), ("end", 3)]
+        assert tool_results(agent) == ["lookup:1", "action:2", "lookup:3"]
+
+    @pytest.mark.asyncio
+    async def test_break_loop_stops_remaining_tools(self):
+        agent = make_agent()
+        msg = message(("lookup", {"text": 1}), ("finish", {"text": "done"}), ("lookup", {"text": 3}))
+
+        assert await agent.process_tools(msg) == "done"
+        assert ("start", 3) not in agent.events
+
+    @pytest.mark.asyncio
+    async def test_failed_tool_raises_after_earlier_results(self):
+        agent = make_agent()
+        msg = message(("lookup", {"text": 1}), ("broken", {}), ("lookup", {"text": 3}))
+
+        with pytest.raises(ValueError):
+            await agent.process_tools(msg)
+
+        assert tool_results(agent) == ["lookup:1"]
@@ -0,0 +1,173 @@
+"""
+Unit tests for the embedding cache
+
+Tests cover:
+- SQLite byte store batched gets, sets, deletes and keys, persisted across opens
+- Moving a one file per embedding cache into the store
+- Scheduler coalescing concurrent calls from event loops and threads into batches
+- Memory embedder caching in one SQLite file
+"""
+
+import asyncio
+import os
+import threading
+from unittest.mock import patch
+import pytest
+from langchain.storage import LocalFileStore
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from python.helpers import embedding_cache
+from python.helpers.memory import Memory
+
+DIM = 8
+
+
+class RecordingEmbeddings(DeterministicFakeEmbedding):
+    batches: list = []
+    queries: list = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return super().embed_query(text)
+
+
+class TestStore:
+    """Test the SQLite byte store."""
+
+    def test_batched_operations(self, tmp_path):
+        store = embedding_cache.SQLiteByteStore(str(tmp_path / "cache.db"))
+        pairs = [(f"ns{i % 2}/{i}", bytes([i % 256]) * 4) for i in range(1200)]
+
+        store.mset(pairs)
+        store.mdelete(["ns0/0", "missing"])
+
+        assert store.mget([key for key, _ in pairs]) == [None] + [value for _, value in pairs[1:]]
+        assert sorted(store.yield_keys(prefix="ns1/")) == sorted(key for key, _ in pairs if key.startswith("ns1/"))
+        store.close()
+        reopened = embedding_cache.SQLiteByteStore(str(tmp_path / "cache.db"))
+        assert reopened.mget(["ns1/1", "nope"]) == [bytes([1]) * 4, None]
+        reopened.close()
+
+    def test_open_store_is_shared(self, tmp_path):
+        assert embedding_cache.open_store(str(tmp_path / "a.db")) is embedding_cache.open_store(
+            os.path.join(str(tmp_path), ".", "a.db")
+        )
+
+    def test_migrate_file_store(self, tmp_path):
+        model = RecordingEmbeddings(size=DIM, batches=[])
+        old = CacheBackedEmbeddings.from_bytes_store(model, LocalFileStore(str(tmp_path / "embeddings")), namespace="m/v1")
+        vectors = old.embed_documents(["one", "two"])
+        store = embedding_cache.SQLiteByteStore(str(tmp_path / "embeddings.db"))
+
+        assert embedding_cache.migrate_file_store(str(tmp_path / "embeddings"), store) == 2
+
+        cached = CacheBackedEmbeddings.from_bytes_store(model, store, namespace="m/v1")
+        assert cached.embed_documents(["one", "two"]) == vectors
+        assert model.batches == [["one", "two"]]  # no model call after the move
+        assert not os.path.exists(tmp_path / "embeddings")
+        assert embedding_cache.migrate_file_store(str(tmp_path / "embeddings"), store) == 0
+
+    def test_migrate_empty_file_store_is_silent(self, tmp_path, capsys):
+        (tmp_path / "embeddings").mkdir()
+        store = embedding_cache.SQLiteByteStore(str(tmp_path / "embeddings.db"))
+
+        assert embedding_cache.migrate_file_store(str(tmp_path / "embeddings"), store) == 0
+        assert "Moved" not in capsys.readouterr().out
+        assert not os.path.exists(tmp_path / "embeddings")
+
+
+class TestScheduler:
+    """Test coalescing of embedding calls."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_are_batched(self):
+        model = RecordingEmbeddings(size=DIM, batches=[], queries=[])
+        scheduler = embedding_cache.EmbeddingScheduler(model, batch_size=16, max_wait=0.2)
+
+        results = await asyncio.gather(
+            scheduler.aembed_documents(["a", "b"]),
+            scheduler.aembed_documents(["b", "c"]),
+            scheduler.aembed_documents(["d", "e", "f"]),
+            scheduler.aembed_query("q"),
+            scheduler.aembed_query("q"),
+        )
+
+        assert results[0] == model.embed_documents(["a", "b"])
+        assert results[1][0] == results[0][1]
+        assert results[3] == results[4] == DeterministicFakeEmbedding(size=DIM).embed_query("q")
+        assert model.batches[0] == ["a", "b", "c", "d", "e", "f"]  # 3 callers, 1 provider call
+        assert model.queries == ["q"]
+
+    @pytest.mark.asyncio
+    async def test_provider_sized_batches(self):
+        model = RecordingEmbeddings(size=DIM, batches=[])
+        scheduler = embedding_cache.EmbeddingScheduler(model, batch_size=4, max_wait=0)
+
+        vectors = await scheduler.aembed_documents([str(i) for i in range(10)])
+
+        # batches run concurrently on executor threads, their order varies
+        assert sorted(len(batch) for batch in model.batches) == [2, 4, 4]
+        assert vectors == DeterministicFakeEmbedding(size=DIM).embed_documents([str(i) for i in range(10)])
+
+    def test_threads_share_batches(self):
+        model = RecordingEmbeddings(size=DIM, batches=[])
+        scheduler = embedding_cache.EmbeddingScheduler(model, batch_size=64, max_wait=0.2)
+        barrier = threading.Barrier(8)
+        results = {}
+
+        def embed(i):
+            barrier.wait()
+            results[i] = scheduler.embed_documents([f"text {i}"])
+
+        threads = [threading.Thread(target=embed, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(model.batches) < 8
+        assert scheduler.calls == len(model.batches)
+        assert results[3] == DeterministicFakeEmbedding(size=DIM).embed_documents(["text 3"])
+
+    @pytest.mark.asyncio
+    async def test_errors_reach_every_caller(self):
+        class Failing(DeterministicFakeEmbedding):
+            def embed_documents(self, texts):
+                raise RuntimeError("provider down")
+
+        scheduler = embedding_cache.EmbeddingScheduler(Failing(size=DIM), max_wait=0.1)
+
+        results = await asyncio.gather(
+            scheduler.aembed_documents(["a"]), scheduler.aembed_documents(["b"]), return_exceptions=True
+        )
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert await scheduler.aembed_documents([]) == []
+
+    def test_attributes_pass_through(self):
+        model = DeterministicFakeEmbedding(size=DIM)
+        model.__dict__["model"] = "fake-model"
+
+        assert embedding_cache.EmbeddingScheduler(model).model == "fake-model"  # type: ignore
+
+
+class TestMemoryEmbedder:
+    """Test the embedder of Memory."""
+
+    def test_sqlite_cache(self, tmp_path):
+        model = RecordingEmbeddings(size=DIM, batches=[])
+        LocalFileStore(str(tmp_path / "memory" / "embeddings")).mset([("old/key", b"[1.0]")])
+
+        with patch("python.helpers.files.get_abs_path", side_effect=lambda *p: os.path.join(str(tmp_path), *p)):
+            embedder = Memory._embedder(model)
+            embedder.embed_documents(["cached"])
+            embedder.embed_documents(["cached"])
+
+        store = embedding_cache.open_store(str(tmp_path / "memory" / "embeddings.db"))
+        assert model.batches == [["cached"]]
+        assert store.mget(["old/key"]) == [b"[1.0]"]
+        assert not os.path.exists(tmp_path / "memory" / "embeddings")
@@ -0,0 +1,154 @@
+"""
+Unit tests for the extension pipeline
+
+Tests cover:
+- Sequential execution of undeclared extensions
+- Concurrent execution of independent extensions
+- Declared dependencies
+- Deterministic order of system prompt parts
+- Timings and error propagation
+- Timings kept in loop data, printed only for slow folders
+"""
+
+import asyncio
+import time
+import types
+import pytest
+from unittest.mock import Mock
+from agent import LoopData
+from python.helpers.extension import Extension, OrderedList, run_extensions
+
+
+def make_extension(module: str, delay: float = 0.0, depends_on=None, text: str = "", fail: bool = False):
+    """Extension class that pretends to come from python/extensions/test/<module>.py"""
+
+    async def execute(self, loop_data: LoopData = LoopData(), **kwargs):
+        loop_data.events.append(("start", module, list(loop_data.system)))
+        await asyncio.sleep(delay)
+        if fail:
+            raise ValueError(module)
+        if text:
+            loop_data.system.append(text)
+        loop_data.events.append(("end", module))
+
+    cls = types.new_class(module.strip("_").title(), (Extension,))
+    cls.execute = execute  # type: ignore
+    cls.depends_on = depends_on
+    cls.__module__ = "python.extensions.test." + module
+    return cls
+
+
+def make_loop_data():
+    loop_data = LoopData()
+    loop_data.system = OrderedList()
+    loop_data.events = []  # type: ignore
+    return loop_data
+
+
+class TestExtensionPipeline:
+    """Test scheduling of extensions."""
+
+    @pytest.mark.asyncio
+    async def test_undeclared_extensions_run_in_sequence(self):
+        loop_data = make_loop_data()
+        classes = [make_extension("_10_a", 0.02), make_extension("_20_b")]
+
+        await run_extensions(Mock(), classes, loop_data=loop_data)
+
+        assert [event[:2] for event in loop_data.events] == [
+            ("start", "_10_a"), ("end", "_10_a"), ("start", "_20_b"), ("end", "_20_b")
+        ]
+
+    @pytest.mark.asyncio
+    async def test_independent_extensions_run_concurrently(self):
+        loop_data = make_loop_data()
+        classes = [make_extension(f"_{i}0_x", 0.2, depends_on=[]) for i in range(1, 4)]
+
+        start = time.monotonic()
+        timings = await run_extensions(Mock(), classes, loop_data=loop_data)
+
+        assert time.monotonic() - start < 0.5
+        assert set(timings) == {"_10_x", "_20_x", "_30_x"}
+        assert all(ms >= 150 for ms in timings.values())
+
+    @pytest.mark.asyncio
+    async def test_dependency_sees_output(self):
+        loop_data = make_loop_data()
+        classes = [
+            make_extension("_10_system", 0.05, depends_on=[], text="main"),
+            make_extension("_20_other", 0.0, depends_on=[], text="other"),
+            make_extension("_50_needs_system", depends_on=["_10_system"]),
+        ]
+
+        await run_extensions(Mock(), classes, loop_data=loop_data)
+
+        start = next(e for e in loop_data.events if e[:2] == ("start", "_50_needs_system"))
+        assert "main" in start[2]
+
+    @pytest.mark.asyncio
+    async def test_system_parts_keep_file_order(self):
+        loop_data = make_loop_data()
+        loop_data.system = OrderedList(["before"])  # as wrapped by Agent.call_extensions
+        classes = [
+            make_extension("_10_slow", 0.05, depends_on=[], text="first"),
+            make_extension("_20_fast", 0.0, depends_on=[], text="second"),
+        ]
+
+        await run_extensions(Mock(), classes, loop_data=loop_data)
+        loop_data.system.append("after")
+
+        assert list(loop_data.system) == ["before", "first", "second", "after"]
+
+    @pytest.mark.asyncio
+    async def test_failure_is_raised_and_others_cancelled(self):
+        loop_data = make_loop_data()
+        classes = [
+            make_extension("_10_broken", depends_on=[], fail=True),
+            make_extension("_20_slow", 1.0, depends_on=[]),
+        ]
+
+        with pytest.raises(ValueError):
+            await run_extensions(Mock(), classes, loop_data=loop_data)
+        await asyncio.sleep(0)
+
+        assert ("end", "_20_slow") not in loop_data.events
+
+
+class TestPromptExtensions:
+    """Test dependencies declared by the bundled prompt extensions."""
+
+    def test_recall_waits_for_cost_tracker_and_system_prompt(self):
+        from python.extensions.message_loop_prompts._50_recall_memories import RecallMemories
+        from python.extensions.message_loop_prompts._51_recall_solutions import RecallSolutions
+
+        assert RecallMemories.depends_on == ["_05_init_cost_tracker", "_10_system_prompt"]
+        assert RecallSolutions.depends_on == ["_05_init_cost_tracker", "_10_system_prompt"]
+
+
+class TestCallExtensions:
+    """Test timings kept by Agent.call_extensions."""
+
+    @staticmethod
+    def make_agent(print_ms: int):
+        from agent import AgentConfig, AgentContext
+
+        config = AgentConfig(
+            chat_model=Mock(model_name="test-chat"),
+            utility_model=Mock(model_name="test-utility"),
+            embeddings_model=Mock(),
+            extension_timings_print_ms=print_ms,
+        )
+        context = AgentContext(config)
+        AgentContext.remove(context.id)
+        return context.agent0
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("print_ms, printed", [(1000, False), (0, True)])
+    async def test_timings_kept_printed_when_slow(self, capsys, print_ms, printed):
+        agent = self.make_agent(print_ms)
+        loop_data = LoopData()
+
+        await agent.call_extensions("monologue_start", loop_data=loop_data)
+
+        assert set(loop_data.extension_timings["monologue_start"]) == {"_10_drop_speculative_recall", "total"}
+        assert ("monologue_start extensions" in capsys.readouterr().out) is printed
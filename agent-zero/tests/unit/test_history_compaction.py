@@ -0,0 +1,174 @@
+"""
+Unit tests for background history compaction
+
+Tests cover:
+- Scheduling by message count and token budget, budget from the context window
+- Swapping in a finished summary
+- Never waiting for a running summary
+- Discarding summaries of replaced history
+- Never summarizing a summary alone
+- Truncating history over the context limit while a summary is pending
+"""
+
+import asyncio
+import pytest
+from unittest.mock import Mock
+from langchain_core.messages import AIMessage, HumanMessage
+from agent import Agent, AgentConfig, AgentContext
+from python.helpers import tokens
+
+
+def make_agent(chat_model="test-chat", **kwargs) -> Agent:
+    params = dict(msgs_keep_max=6, msgs_keep_start=2, msgs_keep_end=2, history_max_tokens=0)
+    params.update(kwargs)
+    config = AgentConfig(
+        chat_model=Mock(model_name=chat_model),
+        utility_model=Mock(model_name="test-utility"),
+        embeddings_model=Mock(),
+        **params,
+    )
+    context = AgentContext(config)
+    AgentContext.remove(context.id)
+    agent = context.agent0
+    agent.summary_requests = []
+    agent.summary_release = asyncio.Event()
+
+    async def replace_middle_messages(middle_messages, interruptible=True):
+        agent.summary_requests.append(list(middle_messages))
+        await agent.summary_release.wait()
+        return [HumanMessage(content=f"summary of {len(middle_messages)}")]
+
+    agent.replace_middle_messages = replace_middle_messages  # type: ignore
+    return agent
+
+
+async def fill(agent: Agent, count: int, text: str = "message"):
+    for i in range(count):
+        await agent.append_message(f"{text} {i}", human=i % 2 == 0)
+
+
+async def finish_summary(agent: Agent):
+    agent.summary_release.set()
+    await asyncio.wait_for(agent.history_compaction[0], timeout=1)  # type: ignore
+
+
+class TestHistoryCompaction:
+    """Test background compaction of agent history."""
+
+    @pytest.mark.asyncio
+    async def test_under_budget_is_not_compacted(self):
+        agent = make_agent()
+        await fill(agent, 6)
+
+        assert agent.history_compaction is None
+
+    @pytest.mark.asyncio
+    async def test_summary_swapped_in_when_ready(self):
+        agent = make_agent()
+        await fill(agent, 7)
+        assert agent.history_compaction is not None
+
+        # loop continues with full history while summary is running
+        assert agent.apply_history_compaction() is False
+        assert len(agent.history) == 7
+
+        await agent.append_message("new", human=False)
+        await finish_summary(agent)
+
+        assert agent.apply_history_compaction() is True
+        assert [msg.content for msg in agent.history] == [
+            "message 0",
+            "message 1",
+            "summary of 3",
+            "message 5",
+            "message 6",
+            "new",
+        ]
+        assert agent.history_compaction is None
+
+    @pytest.mark.asyncio
+    async def test_token_budget_triggers_compaction(self):
+        agent = make_agent(msgs_keep_max=100, history_max_tokens=200)
+        await fill(agent, 5, "x" * 40)
+        assert agent.history_compaction is None
+
+        await fill(agent, 4, "x" * 200)
+
+        assert agent.history_compaction is not None
+        await asyncio.sleep(0)
+        assert agent.summary_requests
+
+    @pytest.mark.asyncio
+    async def test_summary_alone_is_not_summarized_again(self):
+        agent = make_agent(msgs_keep_max=100, history_max_tokens=200)
+        agent.history = [
+            HumanMessage(content="start"),
+            AIMessage(content="reply"),
+            HumanMessage(content="x" * 40),
+            AIMessage(content="x" * 40),
+        ]
+        await agent.append_message("x" * 1000, human=True)  # recent message over half the budget
+        assert agent.history_compaction is not None
+        await finish_summary(agent)
+
+        assert agent.apply_history_compaction() is True
+        assert agent.history[2].content == "summary of 1"
+
+        # still over budget, but the middle holds only the summary
+        assert agent.history_over_budget()
+        assert agent.history_compaction is None
+        assert len(agent.summary_requests) == 1
+
+    def test_budget_from_context_window(self):
+        assert make_agent("gpt-4", history_max_tokens=None).history_budget == 4096
+        assert make_agent("gemini-2.5-flash", history_max_tokens=None).history_budget == Agent.HISTORY_BUDGET_MAX
+        assert make_agent("gpt-4", history_max_tokens=1000).history_budget == 1000
+
+    @pytest.mark.asyncio
+    async def test_token_budget_replaces_message_count(self):
+        agent = make_agent(history_max_tokens=None)
+        await fill(agent, 30)
+
+        assert agent.history_compaction is None
+
+    @pytest.mark.asyncio
+    async def test_history_over_limit_is_truncated(self):
+        agent = make_agent("gpt-4", msgs_keep_max=100, history_max_tokens=2000)
+        agent.chat_tokens = tokens.MessageTokenCounter(tokens.TokenCounter())  # 4 characters per token
+        await fill(agent, 6, "x" * 400)
+        assert agent.history_compaction is None
+        await agent.append_message("y" * 40_000, human=True)  # huge tool output, ~10k tokens
+        assert agent.history_compaction is not None
+
+        assert agent.truncate_history() is True
+
+        assert agent.chat_tokens.count_messages(agent.history) <= agent.history_limit
+        assert len(agent.history) == 7 and agent.history[-1].content.startswith("y" * 100)
+        assert agent.history_compaction is not None  # the summary still applies later
+        assert agent.truncate_history() is False
+
+    @pytest.mark.asyncio
+    async def test_reset_history_discards_summary(self):
+        agent = make_agent()
+        await fill(agent, 7)
+
+        agent.history = [HumanMessage(content="fresh start")]
+        await finish_summary(agent)
+
+        assert agent.apply_history_compaction() is False
+        assert [msg.content for msg in agent.history] == ["fresh start"]
+
+    @pytest.mark.asyncio
+    async def test_failed_summary_keeps_history(self):
+        agent = make_agent()
+
+        async def failing(middle_messages, interruptible=True):
+            raise RuntimeError("utility model down")
+
+        agent.replace_middle_messages = failing  # type: ignore
+        await fill(agent, 7)
+        await asyncio.gather(agent.history_compaction[0], return_exceptions=True)  # type: ignore
+
+        assert agent.apply_history_compaction() is False
+        assert len(agent.history) == 7
+        assert agent.history_compaction is None
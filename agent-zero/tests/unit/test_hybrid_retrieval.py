@@ -0,0 +1,225 @@
+"""
+Unit tests for hybrid keyword and vector retrieval
+
+Tests cover:
+- Reciprocal rank fusion of rankings
+- FTS5 keyword search of the vector memory, kept in sync and built for older databases
+- Vector search skipped when BM25 is confident, fused rankings otherwise
+- Only vector searches that never ran counted as skipped
+- Results cached per query until the memory changes
+"""
+
+import re
+import sqlite3
+import threading
+import zlib
+import numpy as np
+import pytest
+from python.helpers.hybrid_retrieval import HybridRetriever, bm25_confident, reciprocal_rank_fusion
+from python.helpers.vector_memory import VectorMemory
+
+DIM = 32
+
+
+class WordsModel:
+    """Sentence transformer stand-in, a text embeds to the sum of fixed vectors of its words"""
+
+    def __init__(self):
+        self.encoded: list = []
+
+    def encode(self, text, batch_size=32, convert_to_numpy=True):
+        if isinstance(text, list):
+            return np.stack([self._vector(t) for t in text])
+        self.encoded.append(text)
+        return self._vector(text)
+
+    def _vector(self, text):
+        vector = np.zeros(DIM, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector += np.random.default_rng(zlib.crc32(word.encode())).normal(size=DIM).astype(np.float32)
+        return vector
+
+
+MEMORIES = [
+    ("fix ssl certificate errors in termux with ca-certificates", "solution"),
+    ("python requests fails with certificate verify failed", "solution"),
+    ("error E4711 means the sensor cable is unplugged", "fact"),
+    ("the user prefers short answers in dutch", "instruction"),
+    ("deploy flask app on termux with gunicorn", "solution"),
+    ("restart the adb server when the phone is not detected", "solution"),
+]
+
+
+@pytest.fixture
+def memory(tmp_path):
+    vm = VectorMemory(db_path=str(tmp_path / "vector_memory.db"))
+    vm._embedding_model = WordsModel()
+    vm.add_memories([{"content": content, "memory_type": mem_type} for content, mem_type in MEMORIES])
+    return vm
+
+
+class TestFusion:
+    """Test reciprocal rank fusion."""
+
+    def test_scores(self):
+        fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+
+        assert [id for id, _ in fused] == [1, 3, 2]
+        assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+        assert fused[2][1] == pytest.approx(1 / 62)
+        assert reciprocal_rank_fusion([]) == []
+
+    def test_confidence(self):
+        hits = [{"content": "error E4711 sensor", "bm25": 9.0}, {"content": "sensor", "bm25": 2.0}]
+
+        assert bm25_confident("E4711", hits)
+        assert not bm25_confident("E4711 cable", hits)  # a query word missing from the top hit
+        assert not bm25_confident("sensor", [hits[0], {"content": "sensor", "bm25": 8.0}])
+        assert not bm25_confident("anything", [])
+
+
+class TestKeywordSearch:
+    """Test the FTS5 index of the vector memory."""
+
+    def test_ranked_and_filtered(self, memory):
+        hits = memory.keyword_search("termux certificate", top_k=10)
+
+        assert hits[0]["content"] == MEMORIES[0][0]  # both words
+        assert {h["content"] for h in hits} == {MEMORIES[0][0], MEMORIES[1][0], MEMORIES[4][0]}
+        assert all(h["bm25"] > 0 for h in hits)
+        assert [h["memory_type"] for h in memory.keyword_search("termux", memory_type="solution")] == ["solution"] * 2
+        assert memory.keyword_search('"AND" c++ (NEAR -- *') == []  # syntax characters are not operators
+        assert memory.keyword_search("...") == []
+
+    def test_kept_in_sync(self, memory):
+        ssl = memory.keyword_search("ssl")[0]["id"]
+        memory.delete_memory(ssl)
+        memory.add_memory("ssl pinning breaks the proxy")
+
+        assert [h["content"] for h in memory.keyword_search("ssl")] == ["ssl pinning breaks the proxy"]
+        memory.clear_all()
+        assert memory.keyword_search("ssl") == []
+
+    def test_older_database_indexed(self, memory):
+        for name in ("memories_ai", "memories_ad", "memories_au"):
+            memory._conn.execute(f"DROP TRIGGER {name}")
+        memory._conn.execute("DROP TABLE memories_fts")
+        memory._conn.commit()
+        memory.close()
+
+        reopened = VectorMemory(db_path=memory.db_path)
+
+        assert reopened.fts
+        assert reopened.keyword_search("gunicorn")[0]["content"] == MEMORIES[4][0]
+
+
+class TestHybridSearch:
+    """Test fused searches."""
+
+    def test_confident_bm25_skips_vector_search(self, memory):
+        retriever = HybridRetriever(memory, concurrent=False)
+        memory._embedding_model.encoded.clear()
+
+        results = retriever.search("E4711", top_k=3)
+
+        assert results[0]["content"] == MEMORIES[2][0]
+        assert results[0]["sources"] == ["keyword"] and results[0]["similarity"] is None
+        assert retriever.dense_skipped == 1
+        assert memory._embedding_model.encoded == []  # the query was never embedded
+
+    def test_fused_ranking(self, memory):
+        retriever = HybridRetriever(memory, concurrent=False)
+        query = "certificate problems on termux phone"
+        keyword = [h["id"] for h in memory.keyword_search(query, top_k=20)]
+        vector = [h["id"] for h in memory.search(query, top_k=20, similarity_threshold=-1)]
+
+        results = retriever.search(query, top_k=6, similarity_threshold=-1)
+
+        assert retriever.dense_skipped == 0
+        assert [(r["id"], r["score"]) for r in results] == reciprocal_rank_fusion([keyword, vector])[:6]
+        both = [r for r in results if r["id"] in keyword and r["id"] in vector]
+        assert both and all(r["sources"] == ["keyword", "vector"] and r["bm25"] > 0 for r in both)
+        vector_only = [r for r in results if r["id"] not in keyword]
+        assert vector_only and all(r["sources"] == ["vector"] and r["bm25"] is None for r in vector_only)
+
+    def test_concurrent_matches_sequential(self, memory):
+        concurrent = HybridRetriever(memory, concurrent=True)
+        sequential = HybridRetriever(memory)
+
+        for query in ("certificate problems on termux phone", "E4711", "answers", "nothing matches this"):
+            assert concurrent.search(query, similarity_threshold=-1) == sequential.search(query, similarity_threshold=-1)
+        concurrent.close()
+
+    def test_running_vector_search_is_not_counted_skipped(self, memory, monkeypatch):
+        retriever = HybridRetriever(memory, concurrent=True)
+        started, release = threading.Event(), threading.Event()
+        search, keyword_search = memory.search, memory.keyword_search
+
+        def slow_search(*args):
+            started.set()
+            release.wait(5)
+            return search(*args)
+
+        monkeypatch.setattr(memory, "search", slow_search)
+        monkeypatch.setattr(memory, "keyword_search", lambda *args: started.wait(5) and keyword_search(*args))
+
+        results = retriever.search("E4711", top_k=3)
+        release.set()
+        retriever.close()
+
+        assert results[0]["sources"] == ["keyword"]
+        assert retriever.dense_skipped == 0  # the vector search ran, unused
+
+    def test_queued_vector_search_is_skipped(self, memory):
+        retriever = HybridRetriever(memory, concurrent=True)
+        release = threading.Event()
+        retriever._executor.submit(release.wait, 5)  # the worker is busy
+        memory._embedding_model.encoded.clear()
+
+        retriever.search("E4711", top_k=3)
+        release.set()
+        retriever.close()
+
+        assert retriever.dense_skipped == 1
+        assert memory._embedding_model.encoded == []
+
+    def test_cached_until_memory_changes(self, memory, monkeypatch):
+        retriever = HybridRetriever(memory, concurrent=False)
+        calls = []
+        keyword_search = memory.keyword_search
+        monkeypatch.setattr(memory, "keyword_search", lambda *a, **kw: calls.append(a) or keyword_search(*a, **kw))
+
+        first = retriever.search("flask deploy")
+        first[0]["content"] = "changed by the caller"
+        second = retriever.search("flask deploy")
+        retriever.search("flask deploy", top_k=2)
+        memory.add_memory("deploy flask behind nginx")
+        third = retriever.search("flask deploy")
+
+        assert len(calls) == 3
+        assert second[0]["content"] == MEMORIES[4][0]
+        assert "deploy flask behind nginx" in [r["content"] for r in third]
+
+
+def test_fts_missing(tmp_path, monkeypatch):
+    """Without FTS5 in SQLite, keyword search finds nothing and hybrid search is vector search."""
+    real_connect = sqlite3.connect
+
+    class NoFtsCursor(sqlite3.Cursor):
+        def execute(self, sql, *params):
+            if "USING fts5" in sql:
+                raise sqlite3.OperationalError("no such module: fts5")
+            return super().execute(sql, *params)
+
+    class NoFts(sqlite3.Connection):
+        def cursor(self, factory=NoFtsCursor):
+            return super().cursor(factory)
+
+    monkeypatch.setattr(sqlite3, "connect", lambda *a, **kw: real_connect(*a, factory=NoFts, **kw))
+    vm = VectorMemory(db_path=str(tmp_path / "vector_memory.db"))
+    vm._embedding_model = WordsModel()
+    vm.add_memory("error E4711 means the sensor cable is unplugged")
+
+    assert not vm.fts and vm.keyword_search("E4711") == []
+    results = HybridRetriever(vm, concurrent=False).search("E4711", similarity_threshold=-1)
+    assert results[0]["sources"] == ["vector"]
@@ -0,0 +1,210 @@
+"""
+Unit tests for knowledge import
+
+Tests cover:
+- Chunked checksums
+- Scanning files into original, changed and removed states
+- Parsing in a thread or a process pool, failed files reported
+- Memory.preload_knowledge inserting, updating and removing file chunks in batches
+- Content addressed chunks: only changed chunks embedded, shared chunks stored once
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from unittest.mock import Mock, patch
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from python.helpers import knowledge_import
+from python.helpers.memory import Memory
+
+DIM = 16
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: int = 0
+    texts: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return super().embed_documents(texts)
+
+
+def paragraph(word: str) -> str:
+    return " ".join([word] * 600)  # ~3000 characters, one chunk each
+
+
+def preload_runs(tmp_path, embeddings, edits):
+    """Memory with all area databases, preloaded once and again after each edit"""
+
+    def abs_path(*paths):
+        return os.path.join(str(tmp_path), *paths)
+
+    with patch("python.helpers.files.get_abs_path", side_effect=abs_path):
+        dbs = {area.value: Memory._new_db(embeddings, DIM) for area in Memory.Area}
+        memory = Memory(agent=Mock(), db=dbs, memory_subdir="kn")
+        try:
+            for edit in [lambda: None, *edits]:
+                edit()
+                yield memory
+                asyncio.run(memory.preload_knowledge(None, ["default"], "kn"))
+        finally:
+            for area in Memory.Area:
+                Memory.wal.pop(Memory._wal_key("kn", area.value), None)
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+class TestScan:
+    """Test checksums and change detection."""
+
+    def test_chunked_checksum(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(knowledge_import, "CHECKSUM_CHUNK", 7)
+        data = os.urandom(1000)
+        (tmp_path / "file.bin").write_bytes(data)
+
+        assert knowledge_import.calculate_checksum(str(tmp_path / "file.bin")) == hashlib.md5(data).hexdigest()
+
+    def test_states(self, tmp_path):
+        write(str(tmp_path / "a.md"), "alpha")
+        write(str(tmp_path / "sub" / "b.txt"), "beta")
+        write(str(tmp_path / "ignored.bin"), "binary")
+        index, jobs = knowledge_import.scan_knowledge(None, str(tmp_path), {}, {"area": "main"})
+        for data in index.values():
+            del data["state"]
+        write(str(tmp_path / "a.md"), "alpha 2")
+        index[str(tmp_path / "gone.md")] = {"checksum": "x", "ids": ["1"]}  # type: ignore
+
+        index, jobs = knowledge_import.scan_knowledge(None, str(tmp_path), index, {"area": "main"})
+
+        assert {os.path.basename(file): data["state"] for file, data in index.items()} == {
+            "a.md": "changed", "b.txt": "original", "gone.md": "removed",
+        }
+        assert [(os.path.basename(job.file), job.ext, job.metadata) for job in jobs] == [("a.md", "md", {"area": "main"})]
+
+
+class TestParse:
+    """Test parallel parsing."""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("process_min_files", [100, 1])
+    async def test_parse_files(self, tmp_path, monkeypatch, process_min_files):
+        monkeypatch.setattr(knowledge_import, "PROCESS_MIN_FILES", process_min_files)
+        for i in range(4):
+            write(str(tmp_path / f"f{i}.txt"), f"file {i}")
+        _, jobs = knowledge_import.scan_knowledge(None, str(tmp_path), {}, {"area": "solutions"})
+        jobs.append(knowledge_import.ImportJob(str(tmp_path / "missing.txt"), "txt", 0, {}))
+
+        parsed = {
+            os.path.basename(job.file): documents
+            async for job, documents in knowledge_import.parse_files(jobs, workers=2)
+        }
+
+        assert parsed["missing.txt"] is None
+        assert [doc.page_content for doc in parsed["f2.txt"]] == ["file 2"]  # type: ignore
+        assert parsed["f2.txt"][0].metadata["area"] == "solutions"  # type: ignore
+        assert len(parsed) == 5
+
+
+class TestPreload:
+    """Test the knowledge preload of Memory."""
+
+    @pytest.mark.asyncio
+    async def test_insert_update_remove(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(Memory, "EMBED_BATCH", 2)
+        knowledge = tmp_path / "knowledge" / "default"
+        for i in range(5):
+            write(str(knowledge / "main" / f"m{i}.md"), f"main {i}")
+        write(str(knowledge / "solutions" / "s.md"), "solution")
+        embeddings = CountingEmbeddings(size=DIM)
+
+        def abs_path(*paths):
+            return os.path.join(str(tmp_path), *paths)
+
+        with patch("python.helpers.files.get_abs_path", side_effect=abs_path):
+            dbs = {area.value: Memory._new_db(embeddings, DIM) for area in Memory.Area}
+            memory = Memory(agent=Mock(), db=dbs, memory_subdir="kn")
+            try:
+                await memory.preload_knowledge(None, ["default"], "kn")
+                first_calls = embeddings.calls
+                await memory.preload_knowledge(None, ["default"], "kn")
+                unchanged_calls = embeddings.calls - first_calls
+
+                write(str(knowledge / "main" / "m0.md"), "main 0 changed")
+                os.remove(knowledge / "solutions" / "s.md")
+                await memory.preload_knowledge(None, ["default"], "kn")
+            finally:
+                for area in Memory.Area:
+                    Memory.wal.pop(Memory._wal_key("kn", area.value), None)
+
+        with open(tmp_path / "memory" / "kn" / "knowledge_import.json") as f:
+            index = json.load(f)
+        main = sorted(doc.page_content for doc in dbs["main"].docstore._dict.values())  # type: ignore
+
+        assert first_calls == 3  # 6 files in batches of 2 chunks
+        assert unchanged_calls == 0
+        assert main == ["main 0 changed", "main 1", "main 2", "main 3", "main 4"]
+        assert len(dbs["solutions"].index_to_docstore_id) == 0
+        assert sorted(os.path.basename(file) for file in index) == [f"m{i}.md" for i in range(5)]
+        assert all(len(data["ids"]) == 1 and "state" not in data for data in index.values())
+
+
+class TestChunkDedupe:
+    """Test content addressed knowledge chunks."""
+
+    def test_chunk_id(self):
+        doc = Document("text", metadata={"area": "main", "source": "a.md"})
+
+        assert knowledge_import.chunk_id(doc) == knowledge_import.chunk_id(
+            Document("text", metadata={"area": "main", "source": "b.md"})
+        )
+        assert knowledge_import.chunk_id(doc) != knowledge_import.chunk_id(
+            Document("text", metadata={"area": "solutions"})
+        )
+
+    def test_only_changed_chunks_are_embedded(self, tmp_path):
+        main = tmp_path / "knowledge" / "default" / "main"
+        original = "\n\n".join(paragraph(word) for word in ["alpha", "beta", "gamma", "delta"])
+        write(str(main / "big.md"), original)
+        write(str(main / "copy.md"), paragraph("beta"))
+        embeddings = CountingEmbeddings(size=DIM)
+        embedded = []
+
+        edits = [
+            lambda: embedded.append(embeddings.texts),
+            lambda: write(str(main / "big.md"), original.replace(paragraph("gamma"), paragraph("omega"))),
+            lambda: embedded.append(embeddings.texts),
+            lambda: os.remove(main / "big.md"),
+        ]
+        for memory in preload_runs(tmp_path, embeddings, edits):
+            pass
+
+        contents = sorted(doc.page_content.split()[0] for doc in memory.dbs["main"].docstore._dict.values())  # type: ignore
+        assert embedded[0] == 4  # beta shared by both files, embedded once
+        assert embedded[1] - embedded[0] == 1  # only the changed paragraph
+        assert contents == ["beta"]  # still referenced by copy.md
+
+    def test_shared_chunk_references_every_source(self, tmp_path):
+        main = tmp_path / "knowledge" / "default" / "main"
+        write(str(main / "a.md"), paragraph("alpha") + "\n\n" + paragraph("beta"))
+        write(str(main / "b.md"), paragraph("beta"))
+        beta = []
+
+        def sources():
+            db = memory.dbs["main"]
+            doc = next(d for d in db.docstore._dict.values() if d.page_content.startswith("beta"))  # type: ignore
+            beta.append((os.path.basename(doc.metadata["source"]), [os.path.basename(f) for f in doc.metadata["sources"]]))
+
+        edits = [sources, lambda: os.remove(main / "a.md"), sources]
+        for memory in preload_runs(tmp_path, CountingEmbeddings(size=DIM), edits):
+            pass
+
+        assert beta[0] == ("a.md", ["a.md", "b.md"])
+        assert beta[1] == ("b.md", ["b.md"])  # the removed file is no longer referenced
@@ -0,0 +1,213 @@
+"""
+Unit tests for live knowledge updates
+
+Tests cover:
+- Debouncing bursts of changes into one batch, bounded by the maximum delay
+- Polling fallback reporting created, modified and removed files
+- Rescanning only changed paths, removed folders, files outside knowledge roots ignored
+- Memory.refresh_knowledge embedding before applying, under the write locks
+"""
+
+import asyncio
+import os
+import threading
+import time
+from unittest.mock import Mock, patch
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from python.helpers import knowledge_import, knowledge_watcher
+from python.helpers.memory import Memory
+
+DIM = 16
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+class Batches:
+    """Collects the batches a watcher hands over"""
+
+    def __init__(self):
+        self.batches: list[set[str]] = []
+        self.event = threading.Event()
+
+    def __call__(self, paths):
+        self.batches.append(paths)
+        self.event.set()
+
+    def wait(self, timeout=5.0):
+        assert self.event.wait(timeout)
+        self.event.clear()
+
+
+class TestWatcher:
+    """Test debouncing and the polling fallback."""
+
+    def test_burst_is_one_batch(self, tmp_path):
+        batches = Batches()
+        watcher = knowledge_watcher.KnowledgeWatcher([str(tmp_path)], batches, debounce=0.2, inotify=False, poll=60)
+        watcher.start()
+        try:
+            for i in range(5):
+                watcher.notify([str(tmp_path / f"f{i}.md")])
+                time.sleep(0.02)
+            batches.wait()
+        finally:
+            watcher.stop()
+
+        assert batches.batches == [{str(tmp_path / f"f{i}.md") for i in range(5)}]
+
+    def test_max_delay(self, tmp_path):
+        batches = Batches()
+        watcher = knowledge_watcher.KnowledgeWatcher(
+            [str(tmp_path)], batches, debounce=0.2, max_delay=0.3, inotify=False, poll=60
+        )
+        watcher.start()
+        try:
+            started = time.monotonic()
+            while not batches.batches and time.monotonic() - started < 5:
+                watcher.notify([str(tmp_path / "busy.md")])  # never quiet
+                time.sleep(0.05)
+        finally:
+            watcher.stop()
+
+        assert batches.batches and time.monotonic() - started < 1.0
+
+    def test_polling(self, tmp_path):
+        write(str(tmp_path / "kept.md"), "kept")
+        write(str(tmp_path / "edited.md"), "before")
+        write(str(tmp_path / "gone.md"), "gone")
+        batches = Batches()
+        watcher = knowledge_watcher.KnowledgeWatcher([str(tmp_path)], batches, debounce=0.1, inotify=False, poll=0.05)
+        watcher.start()
+        try:
+            write(str(tmp_path / "sub" / "new.md"), "new")
+            write(str(tmp_path / "edited.md"), "after, longer")
+            os.remove(tmp_path / "gone.md")
+            batches.wait()
+        finally:
+            watcher.stop()
+
+        assert watcher.mode == "polling"
+        assert set.union(*batches.batches) == {
+            str(tmp_path / "sub" / "new.md"), str(tmp_path / "edited.md"), str(tmp_path / "gone.md"),
+        }
+
+
+class TestRescan:
+    """Test rescanning changed paths."""
+
+    def test_states(self, tmp_path):
+        root = knowledge_import.KnowledgeRoot(str(tmp_path / "main"), {"area": "main"})
+        for name in ["a.md", "b.md", "old/c.md", "old/d.md"]:
+            write(str(tmp_path / "main" / name), name)
+        index, _ = knowledge_import.scan_knowledge(None, root.dir, {}, root.metadata)
+        for data in index.values():
+            del data["state"]
+        write(str(tmp_path / "main" / "a.md"), "a changed")
+        write(str(tmp_path / "main" / "e.md"), "new")
+        write(str(tmp_path / "outside.md"), "not knowledge")
+        for name in ["c.md", "d.md"]:
+            os.remove(tmp_path / "main" / "old" / name)
+        os.rmdir(tmp_path / "main" / "old")
+
+        changed = {str(tmp_path / "main" / name) for name in ["a.md", "e.md", "old"]} | {str(tmp_path / "outside.md")}
+        index, jobs = knowledge_import.rescan_files(changed, index, [root])
+
+        assert {os.path.relpath(file, root.dir): data["state"] for file, data in index.items()} == {
+            "a.md": "changed", "b.md": "original", "e.md": "changed",
+            "old/c.md": "removed", "old/d.md": "removed",
+        }
+        assert sorted(os.path.basename(job.file) for job in jobs) == ["a.md", "e.md"]
+        assert all(job.metadata == {"area": "main"} for job in jobs)
+
+    def test_root_pattern(self, tmp_path):
+        root = knowledge_import.KnowledgeRoot(str(tmp_path), {"area": "instruments"}, "**/*.md")
+
+        assert root.contains(str(tmp_path / "tool" / "tool.md"))
+        assert not root.contains(str(tmp_path / "tool" / "tool.txt"))
+        assert not root.contains(str(tmp_path) + "-other/tool.md")
+
+
+class TestRefresh:
+    """Test live refreshes of Memory."""
+
+    def test_refresh_is_applied_after_embedding(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(Memory, "EMBED_BATCH", 1)
+        main = tmp_path / "knowledge" / "default" / "main"
+        for name in ["a", "b", "c"]:
+            write(str(main / f"{name}.md"), f"{name} text")
+        events = []
+
+        class Recording(DeterministicFakeEmbedding):
+            def embed_documents(self, texts):
+                events.append("embed")
+                return super().embed_documents(texts)
+
+        def abs_path(*paths):
+            return os.path.join(str(tmp_path), *paths)
+
+        with patch("python.helpers.files.get_abs_path", side_effect=abs_path):
+            dbs = {area.value: Memory._new_db(Recording(size=DIM), DIM) for area in Memory.Area}
+            memory = Memory(agent=Mock(), db=dbs, memory_subdir="watch")
+            try:
+                asyncio.run(memory.preload_knowledge(None, ["default"], "watch"))
+                write(str(main / "a.md"), "a changed")
+                write(str(main / "d.md"), "d text")
+                write(str(main / "e.md"), "e text")
+                os.remove(main / "b.md")
+                events.clear()
+                original_add = memory._add_embedded
+
+                def add(*args):
+                    events.append("add")
+                    assert all(wal.lock._is_owned() for wal in map(memory._wal, dbs))  # type: ignore
+                    original_add(*args)
+
+                memory._add_embedded = add  # type: ignore
+                paths = {str(main / name) for name in ["a.md", "b.md", "d.md", "e.md"]}
+                asyncio.run(memory.refresh_knowledge(paths, ["default"], "watch"))
+                index = Memory._load_knowledge_index("watch")
+            finally:
+                for area in Memory.Area:
+                    Memory.wal.pop(Memory._wal_key("watch", area.value), None)
+
+        texts = sorted(doc.page_content for doc in dbs["main"].docstore._dict.values())  # type: ignore
+        assert events == ["embed"] * 3 + ["add"] * 3
+        assert texts == ["a changed", "c text", "d text", "e text"]
+        assert sorted(os.path.basename(file) for file in index) == ["a.md", "c.md", "d.md", "e.md"]
+
+    def test_watch_knowledge(self, tmp_path):
+        main = tmp_path / "knowledge" / "default" / "main"
+        write(str(main / "a.md"), "a text")
+
+        def abs_path(*paths):
+            return os.path.join(str(tmp_path), *paths)
+
+        with patch("python.helpers.files.get_abs_path", side_effect=abs_path):
+            dbs = {area.value: Memory._new_db(DeterministicFakeEmbedding(size=DIM), DIM) for area in Memory.Area}
+            memory = Memory(agent=Mock(), db=dbs, memory_subdir="watch")
+            refreshed = threading.Event()
+            original = memory.refresh_knowledge
+
+            async def refresh(*args):
+                await original(*args)
+                refreshed.set()
+
+            memory.refresh_knowledge = refresh  # type: ignore
+            try:
+                asyncio.run(memory.preload_knowledge(None, ["default"], "watch"))
+                watcher = memory.watch_knowledge(["default"], "watch")
+                watcher.notify([str(main / "b.md")])  # as inotify or polling would report it
+                write(str(main / "b.md"), "b text")
+                assert refreshed.wait(5)
+            finally:
+                Memory.stop_watching("watch")
+                for area in Memory.Area:
+                    Memory.wal.pop(Memory._wal_key("watch", area.value), None)
+
+        texts = sorted(doc.page_content for doc in dbs["main"].docstore._dict.values())  # type: ignore
+        assert texts == ["a text", "b text"]
+        assert "watch" not in Memory.watchers
@@ -0,0 +1,177 @@
+"""
+Unit tests for per-area memory databases
+
+Tests cover:
+- Areas a filter can match
+- Writes routed to the database of their area, unknown areas kept with main
+- Searches touching only the filtered areas, federated results merged by score
+- Splitting a database shared by all areas
+"""
+
+import os
+from unittest.mock import Mock, patch
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from python.helpers import memory_filter, memory_index
+from python.helpers.memory import Memory, MyFaiss
+from conftest import MEMORY_DIM as DIM
+
+
+class UnitEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic normalized vectors, as cosine scores expect"""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        vector = np.array(super().embed_query(text))
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+embeddings = UnitEmbeddings(size=DIM)
+
+
+@pytest.fixture
+def memory(tmp_path, make_db):
+    with patch("python.helpers.files.get_abs_path", return_value=str(tmp_path)):
+        dbs = {area.value: make_db(embeddings=embeddings) for area in Memory.Area}
+        yield Memory(agent=Mock(), db=dbs, memory_subdir="areas-test")
+    for area in Memory.Area:
+        Memory.wal.pop(Memory._wal_key("areas-test", area.value), None)
+
+
+def stored_texts(db: MyFaiss) -> list[str]:
+    return sorted(doc.page_content for doc in db.docstore._dict.values())  # type: ignore
+
+
+class TestFilterAreas:
+    """Test the areas a filter is limited to."""
+
+    @pytest.mark.parametrize("condition,areas", [
+        ("area == 'main'", {"main"}),
+        ("area == 'main' or area == 'fragments'", {"main", "fragments"}),
+        ("'solutions' == area and timestamp > '2024'", {"solutions"}),
+        ("area in ['main', 'instruments']", {"main", "instruments"}),
+        ("area == 'main' and area == 'fragments'", set()),
+        ("area != 'main'", None),
+        ("timestamp > '2024'", None),
+        ("area == 'main' or timestamp > '2024'", None),
+    ])
+    def test_values(self, condition, areas):
+        assert memory_filter.compile(condition).values("area") == areas
+
+    def test_unknown_areas_search_main(self, memory):
+        assert memory._areas_for("area == 'custom' or area == 'solutions'") == ["main", "solutions"]
+        assert memory._areas_for("") == [area.value for area in Memory.Area]
+
+
+class TestRouting:
+    """Test writes and deletes across area databases."""
+
+    def test_insert_by_area(self, memory):
+        memory.insert_text("a fact")
+        memory.insert_text("a fragment", {"area": "fragments"})
+        memory.insert_text("a custom one", {"area": "custom"})
+        memory.insert_documents([
+            Document("a solution", metadata={"area": "solutions"}),
+            Document("a tool", metadata={"area": "instruments"}),
+        ])
+
+        assert stored_texts(memory.dbs["main"]) == ["a custom one", "a fact"]
+        assert stored_texts(memory.dbs["fragments"]) == ["a fragment"]
+        assert stored_texts(memory.dbs["solutions"]) == ["a solution"]
+        assert stored_texts(memory.dbs["instruments"]) == ["a tool"]
+        assert memory.db is memory.dbs["main"]
+
+    @pytest.mark.asyncio
+    async def test_delete_by_ids_across_areas(self, memory):
+        kept = memory.insert_text("kept")
+        ids = [memory.insert_text("gone", {"area": area.value}) for area in Memory.Area]
+
+        removed = await memory.delete_documents_by_ids(ids + ["missing"])
+
+        assert sorted(doc.metadata["id"] for doc in removed) == sorted(ids)
+        assert [len(db.index_to_docstore_id) for db in memory.dbs.values()] == [1, 0, 0, 0]
+        assert memory.dbs["main"].get_by_ids([kept])
+
+
+class TestSearch:
+    """Test federated searches."""
+
+    @pytest.mark.asyncio
+    async def test_search_only_touches_filtered_areas(self, memory):
+        memory.insert_text("deploy with docker", {"area": "solutions"})
+        memory.insert_text("deploy with docker", {"area": "main"})
+        searched = []
+        for area, db in memory.dbs.items():
+            original = db.asimilarity_search_with_score_by_vector
+
+            async def spy(*args, area=area, original=original, **kwargs):
+                searched.append(area)
+                return await original(*args, **kwargs)
+
+            db.asimilarity_search_with_score_by_vector = spy  # type: ignore
+
+        docs = await memory.search_similarity_threshold(
+            "deploy with docker", limit=5, threshold=0.5, filter="area == 'solutions'"
+        )
+
+        assert searched == ["solutions"]
+        assert [doc.metadata["area"] for doc in docs] == ["solutions"]
+
+    @pytest.mark.asyncio
+    async def test_federated_results_merged_by_score(self, memory):
+        for area in Memory.Area:
+            memory.insert_text(f"notes about {area.value}", {"area": area.value})
+        vector = memory.db.embedding_function.embed_query("notes about fragments")  # type: ignore
+
+        results = await memory.search_federated(vector, ["main", "fragments", "solutions"], limit=2)
+
+        assert [doc.metadata["area"] for doc, _ in results][0] == "fragments"
+        assert len(results) == 2
+        assert results[0][1] >= results[1][1]
+        assert all(doc.metadata["area"] != "instruments" for doc, _ in results)
+
+    @pytest.mark.asyncio
+    async def test_single_database(self, tmp_path, make_db):
+        with patch.object(Memory, "_abs_db_dir", return_value=str(tmp_path)):
+            memory = Memory(agent=Mock(), db=make_db(embeddings=embeddings), memory_subdir="single-test")
+            try:
+                memory.insert_text("one", {"area": "solutions"})
+                memory.insert_text("two")
+                docs = await memory.search_similarity_threshold("one", 5, 0.0, "area == 'solutions'")
+            finally:
+                Memory.wal.pop("single-test", None)
+
+        assert [doc.page_content for doc in docs] == ["one"]
+
+
+class TestSplit:
+    """Test migrating a database shared by all areas."""
+
+    def test_split_shared_db(self, tmp_path, make_db):
+        shared = make_db(embeddings=embeddings)
+        shared.add_texts(
+            ["a fact", "a fragment", "a solution", "no area"],
+            metadatas=[{"id": "1", "area": "main"}, {"id": "2", "area": "fragments"},
+                       {"id": "3", "area": "solutions"}, {"id": "4"}],
+            ids=["1", "2", "3", "4"],
+        )
+        shared.save_local(str(tmp_path))
+
+        with patch("python.helpers.files.get_abs_path", return_value=str(tmp_path)):
+            Memory._split_shared_db(None, shared.embedding_function, "split-test")
+            dbs = {
+                area.value: Memory._load_db(None, shared.embedding_function, Memory._abs_db_dir("split-test", area.value))
+                for area in Memory.Area
+            }
+
+        assert not os.path.exists(tmp_path / "index.faiss")
+        assert stored_texts(dbs["main"]) == ["a fact", "no area"]
+        assert stored_texts(dbs["fragments"]) == ["a fragment"]
+        assert stored_texts(dbs["instruments"]) == []
+        vector = shared.embedding_function.embed_query("a solution")  # type: ignore
+        assert dbs["solutions"].similarity_search_with_score_by_vector(vector, k=1)[0][0].metadata["id"] == "3"
+        assert memory_index.kind_of(dbs["solutions"].index) == "flat"
@@ -0,0 +1,126 @@
+"""
+Unit tests for bulk memory dedupe
+
+Tests cover:
+- Range search over a batch of vectors on each index kind, with filters
+- Delete by query in a single pass, beyond the old batch size
+- Inserting texts replacing similar memories with one embedding batch
+"""
+
+from unittest.mock import Mock, patch
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+from python.helpers import memory_index
+from python.helpers.memory import Memory
+
+DIM = 16
+TOPICS = ["cats", "dogs", "birds"]
+
+
+class TopicEmbeddings(Embeddings):
+    """Texts "<topic> <n>" embed close to their topic, different topics are orthogonal"""
+
+    def __init__(self):
+        self.batches: list[list[str]] = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        topic, _, n = text.partition(" ")
+        vector = np.zeros(DIM)
+        vector[TOPICS.index(topic)] = 1.0
+        vector[DIM - 1] = (int(n) if n.isdigit() else 0) % 10 / 100  # small per-text difference
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+def make_vectors(count, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, DIM))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+@pytest.fixture
+def memory(tmp_path):
+    with patch("python.helpers.files.get_abs_path", return_value=str(tmp_path)):
+        dbs = {area.value: Memory._new_db(TopicEmbeddings(), DIM) for area in Memory.Area}
+        yield Memory(agent=Mock(), db=dbs, memory_subdir="dedupe-test")
+    for area in Memory.Area:
+        Memory.wal.pop(Memory._wal_key("dedupe-test", area.value), None)
+
+
+def texts_of(memory: Memory, area: str) -> list[str]:
+    return sorted(doc.page_content for doc in memory.dbs[area].docstore._dict.values())  # type: ignore
+
+
+class TestRangeSearch:
+    """Test MyFaiss range searches."""
+
+    @pytest.mark.parametrize("kind", ["flat", "hnsw", "ivf"])
+    def test_matches_exact_scores(self, kind, monkeypatch):
+        monkeypatch.setattr(memory_index, "ANN_MIN_VECTORS", 500)
+        vectors = make_vectors(1000)
+        db = Memory._new_db(TopicEmbeddings(), DIM)
+        if kind != "flat":
+            db.index = memory_index.create(kind, DIM, make_vectors(1000, seed=1), np.arange(1000) + 10_000)
+            db.index.reset()
+            db.index_changed()
+        ids = [str(i) for i in range(1000)]
+        db.add_embeddings(
+            list(zip(ids, vectors.tolist())),
+            metadatas=[{"id": id, "area": "main" if i % 2 else "other"} for i, id in enumerate(ids)],
+            ids=ids,
+        )
+        db.delete(["1"])
+
+        results = db.range_search_with_score_by_vectors(
+            vectors[:3].tolist(), 0.8, filter=Memory._get_comparator("area == 'main'")
+        )
+
+        for row, found in enumerate(results):
+            expected = {
+                str(i) for i in np.nonzero(vectors @ vectors[row] > 0.8)[0] if i % 2 and i != 1
+            }
+            assert {doc.metadata["id"] for doc, _ in found} <= expected
+            assert len(found) >= 0.8 * len(expected)
+            assert [score for _, score in found] == sorted((score for _, score in found), reverse=True)
+
+
+class TestDedupe:
+    """Test bulk deletes and replacing inserts."""
+
+    @pytest.mark.asyncio
+    async def test_delete_by_query_single_pass(self, memory):
+        await memory.insert_texts_replacing(
+            [f"cats {i}" for i in range(150)] + ["dogs 1"], threshold=0, metadata={"area": "main"}
+        )
+
+        removed = await memory.delete_documents_by_query("cats 0", threshold=0.9, filter="area == 'main'")
+
+        assert len(removed) == 150
+        assert texts_of(memory, "main") == ["dogs 1"]
+
+    @pytest.mark.asyncio
+    async def test_insert_replacing_similar(self, memory):
+        await memory.insert_texts_replacing(
+            ["cats 1", "dogs 1", "birds 1"], threshold=0, metadata={"area": "fragments"}
+        )
+        await memory.insert_texts_replacing(["cats 1"], threshold=0, metadata={"area": "main"})
+        embedder = memory.db.embedding_function
+        embedder.batches.clear()  # type: ignore
+
+        ids, removed = await memory.insert_texts_replacing(
+            ["cats 2", "dogs 2"], threshold=0.9, filter="area == 'fragments'", metadata={"area": "fragments"}
+        )
+
+        assert embedder.batches == [["cats 2", "dogs 2"]]  # type: ignore
+        assert sorted(doc.page_content for doc in removed) == ["cats 1", "dogs 1"]
+        assert texts_of(memory, "fragments") == ["birds 1", "cats 2", "dogs 2"]
+        assert texts_of(memory, "main") == ["cats 1"]  # other areas untouched
+        assert all(doc.metadata["area"] == "fragments" for doc in memory.dbs["fragments"].get_by_ids(ids))
+
+    @pytest.mark.asyncio
+    async def test_nothing_to_insert(self, memory):
+        assert await memory.insert_texts_replacing([], threshold=0.9) == ([], [])
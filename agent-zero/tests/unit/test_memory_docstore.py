@@ -0,0 +1,141 @@
+"""
+Unit tests for the on-disk memory docstore
+
+Tests cover:
+- Segments written and read back, metadata read without texts
+- Rebasing on a new segment keeping changes made during the checkpoint
+- Checkpointed databases loading memory mapped, copied into RAM by the first write
+- Databases of older versions (pickled docstore) loading and converting
+"""
+
+import os
+import faiss
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores.utils import DistanceStrategy
+from python.helpers import memory_docstore, memory_index, memory_wal
+from python.helpers.memory import Memory, MyFaiss
+
+DIM = 8
+embeddings = DeterministicFakeEmbedding(size=DIM)
+
+
+def doc(id, text=None, **metadata) -> Document:
+    text = f"text {id} ünïcode" if text is None else text
+    return Document(id=id, page_content=text, metadata={"id": id, **metadata})
+
+
+def written(tmp_path, docs, name="index.docs") -> memory_docstore.Segment:
+    snapshot = memory_docstore.snapshot(memory_docstore.DiskDocstore(added={d.id: d for d in docs}))
+    path = str(tmp_path / name)
+    return memory_docstore.Segment(path, memory_docstore.write(path, snapshot))
+
+
+def load(db_dir) -> MyFaiss:
+    return MyFaiss.load_local(
+        str(db_dir), embeddings, allow_dangerous_deserialization=True,
+        distance_strategy=DistanceStrategy.COSINE, relevance_score_fn=Memory._cosine_normalizer,
+    )
+
+
+def add(wal, *ids):
+    texts = [f"text {id}" for id in ids]
+    wal.add(texts, embeddings.embed_documents(texts), [{"id": id, "area": "main"} for id in ids], list(ids))
+
+
+class TestSegment:
+    """Test segment files."""
+
+    def test_roundtrip(self, tmp_path):
+        segment = written(tmp_path, [doc("a", area="main"), doc("b", "", n=2)])
+        docstore = memory_docstore.DiskDocstore(segment)
+
+        assert docstore.search("a") == doc("a", area="main")
+        assert docstore.search("b").page_content == ""  # type: ignore
+        assert docstore.metadata("b") == {"id": "b", "n": 2}
+        assert docstore.search("c") == "ID c not found."
+        assert sorted(docstore._dict) == ["a", "b"] and "a" in docstore._dict and len(docstore._dict) == 2
+
+    def test_add_and_delete(self, tmp_path):
+        docstore = memory_docstore.DiskDocstore(written(tmp_path, [doc("a"), doc("b")]))
+
+        docstore.delete(["a"])
+        docstore.add({"c": doc("c")})
+        docstore.add({"a": doc("a", "again")})
+
+        assert docstore._dict["a"].page_content == "again"
+        assert sorted(docstore._dict) == ["a", "b", "c"]
+        with pytest.raises(ValueError):
+            docstore.add({"b": doc("b")})
+        with pytest.raises(ValueError):
+            docstore.delete(["missing"])
+
+    def test_rebase_keeps_changes_made_during_the_checkpoint(self, tmp_path):
+        live = memory_docstore.DiskDocstore(written(tmp_path, [doc("a"), doc("b"), doc("c")], "old.docs"))
+        live.delete(["c"])
+        live.add({"d": doc("d"), "e": doc("e")})
+        snapshot = memory_docstore.snapshot(live)
+        # while the segment is written
+        live.delete(["a", "d"])
+        live.delete(["e"])
+        live.add({"e": doc("e", "e changed"), "f": doc("f")})
+        path = str(tmp_path / "new.docs")
+        segment = memory_docstore.Segment(path, memory_docstore.write(path, snapshot))
+
+        rebased = memory_docstore.rebase(live, snapshot, segment)
+
+        assert sorted(segment.ids) == ["a", "b", "d", "e"]
+        assert {id: rebased._dict[id].page_content for id in rebased._dict} == {
+            id: live._dict[id].page_content for id in live._dict
+        }
+        assert sorted(rebased.added) == ["e", "f"]
+        assert sorted(rebased.deleted) == ["a", "d", "e"]
+
+
+class TestLoad:
+    """Test loading checkpointed databases."""
+
+    def test_mapped_until_first_write(self, tmp_path):
+        wal = memory_wal.MemoryWal(str(tmp_path), Memory._new_db(embeddings, DIM))
+        add(wal, "a", "b")
+        wal.close()
+
+        db = load(tmp_path)
+        vector = embeddings.embed_query("text b")
+        found = db.similarity_search_with_score_by_vector(vector, k=1)
+
+        assert isinstance(db.docstore, memory_docstore.DiskDocstore)
+        assert db.index_mapped == bool(memory_index.MMAP_FLAG)
+        assert found[0][0].page_content == "text b"
+        assert db.docstore.segment._map is not None and not db.docstore.added  # type: ignore
+
+        wal = memory_wal.MemoryWal(str(tmp_path), db)
+        add(wal, "c")
+        wal.delete(["a"])
+        assert not db.index_mapped
+        assert "text c" in [d.page_content for d, _ in db.similarity_search_with_score_by_vector(vector, k=3)]
+        wal.close()
+
+        reloaded = load(tmp_path)
+        assert sorted(reloaded.docstore._dict) == ["b", "c"]
+        assert sorted(reloaded.index_to_docstore_id.values()) == ["b", "c"]
+        assert reloaded.metadata_index.equal("area", "main") == set(reloaded.index_to_docstore_id)
+
+    def test_older_database(self, tmp_path):
+        ids = ["a", "b"]
+        old = FAISS(embeddings, faiss.IndexFlatIP(DIM), InMemoryDocstore(), {})  # positional, as saved before
+        old.add_texts([f"text {id}" for id in ids], metadatas=[{"id": id} for id in ids], ids=ids)
+        old.save_local(str(tmp_path))
+
+        db = load(tmp_path)
+        assert isinstance(db.docstore, InMemoryDocstore)
+        wal = memory_wal.MemoryWal(str(tmp_path), db)
+        add(wal, "c")
+        wal.close()
+
+        assert isinstance(db.docstore, memory_docstore.DiskDocstore)
+        assert sorted(load(tmp_path).docstore._dict) == ["a", "b", "c"]
+        assert os.path.getsize(tmp_path / memory_docstore.DOCS_FILE) > 0
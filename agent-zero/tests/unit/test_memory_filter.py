@@ -0,0 +1,199 @@
+"""
+Unit tests for compiled memory filters
+
+Tests cover:
+- Compiled filters matching eval semantics, invalid filters matching nothing
+- Values the index can't hold falling back to a scan
+- MetadataIndex equality, range and prefix lookups with adds and removes
+- Candidate planning and exactness
+- Prefiltered MyFaiss searches for selective filters on each index kind
+"""
+
+import numpy as np
+import pytest
+from python.helpers import memory_filter, memory_index
+from python.helpers.memory import Memory
+from conftest import MEMORY_DIM as DIM
+
+DOCS = [
+    {"area": "main", "timestamp": "2024-01-05", "score": 3},
+    {"area": "fragments", "timestamp": "2024-03-01", "score": 7},
+    {"area": "solutions", "timestamp": "2023-12-31", "score": 5.5},
+    {"area": "main", "timestamp": "2024-02-10"},
+    {"area": "instruments", "knowledge_source": True, "score": 1},
+]
+
+
+def index_of(docs=DOCS) -> memory_filter.MetadataIndex:
+    index = memory_filter.MetadataIndex()
+    for label, metadata in enumerate(docs):
+        index.add(label, metadata)
+    return index
+
+
+def evaluated(condition: str) -> list[int]:
+    matches = []
+    for label, metadata in enumerate(DOCS):
+        try:
+            if eval(condition, {}, metadata):
+                matches.append(label)
+        except Exception:
+            pass
+    return matches
+
+
+CONDITIONS = [
+    "area == 'main'",
+    "area != 'main'",
+    "area == 'main' or area == 'solutions'",
+    "area == 'main' and timestamp >= '2024-02'",
+    "area in ['main', 'instruments']",
+    "area not in ('main',)",
+    "not area == 'main'",
+    "score > 4",
+    "2 < score <= 7",
+    "5 >= score",
+    "timestamp.startswith('2024')",
+    "knowledge_source == True",
+    "len(area) > 4 and area.upper() == 'FRAGMENTS'",
+    "score > 2 or area == 'main'",
+]
+
+
+class TestCompile:
+    """Test filter compilation."""
+
+    @pytest.mark.parametrize("condition", CONDITIONS)
+    def test_same_as_eval(self, condition):
+        compiled = memory_filter.compile(condition)
+
+        assert [label for label, m in enumerate(DOCS) if compiled(m)] == evaluated(condition)
+
+    @pytest.mark.parametrize("condition", ["__import__('os').system('true')", "area ==", "area.__class__"])
+    def test_invalid_filters_match_nothing(self, condition):
+        compiled = memory_filter.compile(condition)
+
+        assert compiled.error
+        assert not any(compiled(m) for m in DOCS)
+        assert compiled.candidates(index_of()) == (set(), True)
+
+    def test_comparator_is_compiled(self):
+        comparator = Memory._get_comparator("area == 'main'")
+
+        assert isinstance(comparator, memory_filter.Filter)
+        assert comparator is Memory._get_comparator("area == 'main'")
+
+
+class TestMetadataIndex:
+    """Test the inverted metadata index."""
+
+    def test_lookups(self):
+        index = index_of()
+
+        assert index.equal("area", "main") == {0, 3}
+        assert index.range("timestamp", low="2024-01-01", high="2024-02-10", high_inclusive=False) == {0}
+        assert index.range("score", low=3, high=5.5) == {0, 2}
+        assert index.prefix("timestamp", "2024-0") == {0, 1, 3}
+        assert index.equal("area", ["main"]) == set()
+
+    def test_add_and_remove_keep_sorted_values(self):
+        index = index_of()
+        index.range("timestamp", low="2024")  # builds the sorted values
+
+        index.remove(0, DOCS[0])
+        index.add(9, {"timestamp": "2025-01-01", "area": "main"})
+
+        assert index.equal("area", "main") == {3, 9}
+        assert index.range("timestamp", low="2024") == {1, 3, 9}
+        assert index.prefix("timestamp", "2024-01") == set()
+
+
+class TestPlan:
+    """Test candidate planning."""
+
+    @pytest.mark.parametrize("condition,exact", [
+        ("area == 'main'", True),
+        ("area == 'main' and timestamp >= '2024-02'", True),
+        ("area in ['main', 'instruments']", True),
+        ("2 < score <= 7", True),
+        ("timestamp.startswith('2024')", True),
+        ("area == 'main' and len(timestamp) > 3", False),
+    ])
+    def test_candidates_cover_matches(self, condition, exact):
+        candidates, is_exact = memory_filter.compile(condition).candidates(index_of())
+
+        assert is_exact == exact
+        assert set(evaluated(condition)) <= candidates
+        if exact:
+            assert candidates == set(evaluated(condition))
+
+    @pytest.mark.parametrize("condition", [
+        "area != 'main'",
+        "not area == 'main'",
+        "score > 2 or len(area) > 4",
+        "score == None",
+        "area in ['main', None]",
+    ])
+    def test_unplanned(self, condition):
+        assert memory_filter.compile(condition).candidates(index_of()) == (None, False)
+
+
+class TestFilteredSearch:
+    """Test prefiltered MyFaiss searches."""
+
+    @pytest.mark.parametrize("kind", ["flat", "hnsw", "ivf"])
+    def test_selective_filter_finds_all_matches(self, kind, monkeypatch, make_db, make_vectors):
+        monkeypatch.setattr(memory_index, "ANN_MIN_VECTORS", 500)
+        vectors = make_vectors()
+        index = memory_index.create("flat", DIM)
+        if kind != "flat":
+            index = memory_index.create(kind, DIM, make_vectors(seed=1), np.arange(1000) + 10_000)
+            index.reset()
+        db = make_db(index)
+        ids = [f"doc{i}" for i in range(len(vectors))]
+        areas = ["rare" if i % 200 == 0 else "main" for i in range(len(vectors))]
+        db.add_embeddings(
+            list(zip(ids, vectors.tolist())),
+            metadatas=[{"id": id, "area": area} for id, area in zip(ids, areas)],
+            ids=ids,
+        )
+        db.delete(["doc200"])
+
+        results = db.similarity_search_with_score_by_vector(
+            vectors[1].tolist(), k=10, filter=Memory._get_comparator("area == 'rare'"), fetch_k=20
+        )
+
+        assert sorted(doc.metadata["id"] for doc, _ in results) == ["doc0", "doc400", "doc600", "doc800"]
+        assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+    def test_residual_predicate_is_applied(self, make_db, make_vectors):
+        vectors = make_vectors(100)
+        db = make_db()
+        ids = [f"doc{i}" for i in range(100)]
+        db.add_embeddings(
+            list(zip(ids, vectors.tolist())),
+            metadatas=[{"id": id, "area": "main", "n": i} for i, id in enumerate(ids)],
+            ids=ids,
+        )
+
+        results = db.similarity_search_with_score_by_vector(
+            vectors[0].tolist(), k=100, filter=Memory._get_comparator("area == 'main' and len(id) == 4"), fetch_k=100
+        )
+
+        assert sorted(doc.metadata["id"] for doc, _ in results) == [f"doc{i}" for i in range(10)]
+
+    def test_unindexed_value_scans(self, make_db, make_vectors):
+        vectors = make_vectors(20)
+        db = make_db()
+        ids = [f"doc{i}" for i in range(20)]
+        db.add_embeddings(
+            list(zip(ids, vectors.tolist())),
+            metadatas=[{"id": id, "parent": None if i % 2 else "doc0"} for i, id in enumerate(ids)],
+            ids=ids,
+        )
+
+        results = db.similarity_search_with_score_by_vector(
+            vectors[0].tolist(), k=20, filter=Memory._get_comparator("parent == None"), fetch_k=20
+        )
+
+        assert sorted(doc.metadata["id"] for doc, _ in results) == sorted(f"doc{i}" for i in range(1, 20, 2))
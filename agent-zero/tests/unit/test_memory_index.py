@@ -0,0 +1,173 @@
+"""
+Unit tests for memory index backends
+
+Tests cover:
+- Building and searching each index kind
+- Stable labels across deletes, deleted HNSW vectors skipped
+- Migration of legacy positional flat indexes
+- Rebuild thresholds and background rebuilds with concurrent writes
+"""
+
+import threading
+import faiss
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import FakeEmbeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from python.helpers import memory_index
+from python.helpers.memory import MyFaiss
+from conftest import MEMORY_DIM as DIM
+
+COUNT = 1000  # default count of make_vectors
+
+
+@pytest.fixture(autouse=True)
+def small_threshold(monkeypatch):
+    monkeypatch.setattr(memory_index, "ANN_MIN_VECTORS", 500)
+
+
+def fill(db, vectors, start=0):
+    ids = [f"doc{i}" for i in range(start, start + len(vectors))]
+    db.add_embeddings(list(zip(ids, vectors.tolist())), metadatas=[{"id": id} for id in ids], ids=ids)
+    return ids
+
+
+def small_hnsw(vectors):
+    return memory_index.create("hnsw", DIM, vectors)
+
+
+def top_id(db, vector):
+    return db.similarity_search_with_score_by_vector(vector.tolist(), k=1)[0][0].metadata["id"]
+
+
+class TestIndexKinds:
+    """Test building each index kind."""
+
+    @pytest.mark.parametrize("kind,min_recall", [
+        ("flat", 1.0), ("hnsw", 0.95), ("ivf", 0.9), ("ivf_sq8", 0.9), ("ivf_pq", 0.3),
+    ])
+    def test_self_recall(self, kind, min_recall, make_vectors):
+        vectors = make_vectors()
+        index = memory_index.create(kind, DIM, vectors)
+
+        _, labels = index.search(vectors[:100], 1)
+
+        assert memory_index.kind_of(index) == kind
+        assert np.mean(labels[:, 0] == np.arange(100)) >= min_recall
+
+    def test_ivf_needs_training_vectors(self, make_vectors):
+        with pytest.raises(ValueError):
+            memory_index.create("ivf", DIM, make_vectors(100))
+        with pytest.raises(ValueError):
+            memory_index.target_kind("annoy", 10)
+
+    def test_small_corpus_stays_flat(self):
+        assert memory_index.target_kind("hnsw", 499) == "flat"
+        assert memory_index.target_kind("hnsw", 500) == "hnsw"
+
+
+class TestLabels:
+    """Test MyFaiss with explicit labels."""
+
+    def test_legacy_flat_index_is_wrapped(self, tmp_path, make_vectors):
+        vectors = make_vectors(3)
+        legacy = faiss.IndexFlatIP(DIM)
+        legacy.add(vectors)
+        db = MyFaiss(
+            FakeEmbeddings(size=DIM), legacy, InMemoryDocstore(), {0: "a", 1: "b", 2: "c"},
+        )
+        db.docstore.add({id: Document(page_content=id, metadata={"id": id}) for id in "abc"})
+
+        db.save_local(str(tmp_path))
+        loaded = MyFaiss.load_local(str(tmp_path), FakeEmbeddings(size=DIM), allow_dangerous_deserialization=True)
+
+        assert isinstance(faiss.downcast_index(loaded.index), faiss.IndexIDMap2)
+        assert top_id(loaded, vectors[1]) == "b"
+
+    def test_ivf_delete_keeps_other_labels(self, make_db, make_vectors):
+        vectors = make_vectors()
+        db = make_db(memory_index.create("ivf", DIM, make_vectors(seed=1)[:600], np.arange(600) + 10_000))
+        db.index.reset()
+        ids = fill(db, vectors)
+
+        db.delete(ids[:10])
+        new_ids = fill(db, make_vectors(5, seed=2), start=COUNT)
+
+        assert db.index.ntotal == COUNT - 10 + 5
+        assert top_id(db, vectors[500]) == ids[500]
+        assert min(db.index_to_docstore_id) == 10
+        assert db.index_to_docstore_id[max(db.index_to_docstore_id)] == new_ids[-1]
+
+    def test_labels_by_id_follow_writes(self, tmp_path, make_db, make_vectors):
+        db = make_db()
+        ids = fill(db, make_vectors(20))
+        db.delete(ids[:5])
+        db.update_metadata([ids[5]], [{"id": ids[5], "area": "main"}])
+        db.save_local(str(tmp_path))
+
+        loaded = MyFaiss.load_local(str(tmp_path), FakeEmbeddings(size=DIM), allow_dangerous_deserialization=True)
+
+        for store in (db, loaded):
+            assert store._labels_by_id == {id: label for label, id in store.index_to_docstore_id.items()}
+        with pytest.raises(ValueError):
+            db.delete([ids[0]])
+
+    def test_hnsw_deleted_vectors_are_skipped(self, make_db, make_vectors):
+        vectors = make_vectors()
+        db = make_db(memory_index.create("hnsw", DIM))
+        ids = fill(db, vectors)
+
+        db.delete([ids[7]])
+        results = db.similarity_search_with_score_by_vector(vectors[7].tolist(), k=5)
+
+        assert db.index.ntotal == COUNT  # HNSW cannot remove
+        assert ids[7] not in [doc.metadata["id"] for doc, _ in results]
+        assert len(results) == 5
+
+
+class TestRebuild:
+    """Test automatic training and rebuilds."""
+
+    def test_needs_rebuild(self, make_vectors):
+        flat = memory_index.create("flat", DIM, make_vectors())
+        hnsw = memory_index.create("hnsw", DIM, make_vectors())
+
+        assert memory_index.needs_rebuild(flat, "hnsw", COUNT)
+        assert not memory_index.needs_rebuild(flat, "flat", COUNT)
+        assert not memory_index.needs_rebuild(small_hnsw(make_vectors(300)), "hnsw", 300)  # no flapping near the threshold
+        assert memory_index.needs_rebuild(small_hnsw(make_vectors(200)), "hnsw", 200)
+        assert memory_index.needs_rebuild(hnsw, "hnsw", int(COUNT * 0.7))  # many deleted vectors
+
+    def test_ivf_retrained_when_corpus_grows(self, make_vectors):
+        ivf = memory_index.create("ivf", DIM, make_vectors())
+
+        assert not memory_index.needs_rebuild(ivf, "ivf", COUNT)
+        assert memory_index.needs_rebuild(ivf, "ivf", COUNT * 5)
+
+    def test_background_migration_keeps_concurrent_writes(self, monkeypatch, make_db, make_vectors):
+        vectors = make_vectors()
+        db = make_db()
+        db.index_kind = "ivf_sq8"
+        ids = fill(db, vectors[:-1])
+        lock = threading.RLock()
+        done = threading.Event()
+
+        create = memory_index.create
+
+        def create_during_writes(*args, **kwargs):
+            index = create(*args, **kwargs)
+            with lock:  # writes made while the new index is built
+                fill(db, vectors[-1:], start=COUNT - 1)
+                db.delete([ids[0]])
+            return index
+
+        monkeypatch.setattr(memory_index, "create", create_during_writes)
+        thread = memory_index.rebuild_in_background(db, db.index_kind, lock, on_done=done.set)
+        thread.join(10)
+
+        assert done.is_set() and not db.rebuilding
+        assert memory_index.kind_of(db.index) == "ivf_sq8"
+        assert db.index.ntotal == COUNT - 1
+        assert top_id(db, vectors[-1]) == f"doc{COUNT - 1}"
+        assert memory_index.rebuild_in_background(db, db.index_kind, lock) is None
@@ -0,0 +1,175 @@
+"""
+Unit tests for memory query builders
+
+Tests cover:
+- Strategy selection
+- Keyword extraction with recency weights
+- Weighted embedding queries and vector search
+- Corpus recording and loading
+- A/B comparison of strategies on labelled and recorded cases
+"""
+
+import hashlib
+import faiss
+import numpy as np
+import pytest
+from unittest.mock import AsyncMock, Mock
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.utils import DistanceStrategy
+from python.helpers import memory_query
+from python.helpers.memory import Memory, MyFaiss
+
+
+class WordEmbeddings(Embeddings):
+    """Normalized bag of hashed words"""
+
+    DIM = 256
+
+    def embed_query(self, text):
+        vector = np.zeros(self.DIM, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.DIM] += 1
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+MEMORIES = {
+    "dog": "user has a dog named rex",
+    "car": "user drives a red car",
+    "python": "project uses python and pytest",
+}
+
+
+def make_memory() -> Memory:
+    db = MyFaiss(
+        embedding_function=WordEmbeddings(),
+        index=faiss.IndexFlatIP(WordEmbeddings.DIM),
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+        distance_strategy=DistanceStrategy.COSINE,
+        relevance_score_fn=Memory._cosine_normalizer,
+    )
+    db.add_texts(
+        list(MEMORIES.values()),
+        metadatas=[{"id": id, "area": "main"} for id in MEMORIES],
+        ids=list(MEMORIES),
+    )
+    return Memory(agent=Mock(), db=db, memory_subdir="test")
+
+
+def make_agent(query="dog rex"):
+    agent = Mock()
+    agent.read_prompt = Mock(return_value="system")
+    agent.concat_messages = Mock(return_value="history")
+    agent.call_utility_llm = AsyncMock(return_value=query)
+    return agent
+
+
+class TestBuilders:
+    """Test query strategies."""
+
+    def test_get_builder(self):
+        assert isinstance(memory_query.get_builder(""), memory_query.LlmQueryBuilder)
+        assert isinstance(memory_query.get_builder("keywords"), memory_query.KeywordQueryBuilder)
+        with pytest.raises(ValueError):
+            memory_query.get_builder("unknown")
+
+    @pytest.mark.asyncio
+    async def test_llm_builder_calls_utility_model(self):
+        agent = make_agent()
+
+        query = await memory_query.LlmQueryBuilder().build(agent, None, "msg", [], "memory.memories_query.sys.md")
+
+        assert query.text == "dog rex"
+        agent.call_utility_llm.assert_awaited_once()
+
+    def test_keywords_prefer_recent_messages(self):
+        builder = memory_query.KeywordQueryBuilder()
+        history = [HumanMessage(content="old topic gardening"), AIMessage(content='{"thoughts": ["the car"]}')]
+
+        words = builder.keywords(builder.window("fix the car engine", history))
+
+        assert words[0] == "car"
+        assert words.index("engine") < words.index("gardening")
+        assert "the" not in words and "thoughts" not in words
+
+    @pytest.mark.asyncio
+    async def test_keyword_builder_does_not_call_llm(self):
+        agent = make_agent()
+
+        query = await memory_query.KeywordQueryBuilder().build(agent, None, "tell me about rex", [], "")
+
+        assert query.text == "tell rex"
+        agent.call_utility_llm.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_embedding_query_finds_memory(self):
+        db = make_memory()
+        history = [HumanMessage(content="my dog named rex")]
+
+        query = await memory_query.EmbeddingQueryBuilder().build(make_agent(), db, "has a dog", history, "")
+        docs = await memory_query.search(db, query, limit=3, threshold=0.6)
+
+        assert query.vector is not None
+        assert abs(np.linalg.norm(query.vector) - 1) < 1e-5
+        assert docs[0].metadata["id"] == "dog"
+
+
+class TestVectorSearch:
+    """Test searching memory by vector."""
+
+    @pytest.mark.asyncio
+    async def test_threshold_and_filter(self):
+        db = make_memory()
+        vector = WordEmbeddings().embed_query("user drives a red car")
+
+        assert [d.metadata["id"] for d in await db.search_by_vector_threshold(vector, 3, 0.99)] == ["car"]
+        assert await db.search_by_vector_threshold(vector, 3, 0.5, "area == 'solutions'") == []
+
+
+class TestHarness:
+    """Test recording and comparing strategies."""
+
+    @pytest.mark.asyncio
+    async def test_record_and_compare(self, tmp_path):
+        db = make_memory()
+        path = str(tmp_path / "corpus.jsonl")
+        history = [HumanMessage(content="what car does the user drive")]
+        docs = await db.search_similarity_threshold("red car", 3, 0.6)
+        memory_query.record_case(path, "memory.memories_query.sys.md", "red car", history, docs, mode="llm")
+        memory_query.record_case(path, "memory.memories_query.sys.md", "weather", [], [], mode="llm")
+
+        cases = memory_query.load_corpus(path)
+        results = await memory_query.compare_modes(make_agent("weather today"), db, cases, limit=3, threshold=0.6)
+
+        assert cases[0].retrieved == ["car"] and cases[1].retrieved == []
+        assert cases[0].relevant is None and cases[0].mode == "llm"
+        assert isinstance(cases[0].history[0], HumanMessage)
+        assert results["llm"].agreement == 0.0  # mocked llm always asks about the weather
+        assert results["embedding"].agreement == 1.0
+        assert results["keywords"].agreement == 1.0
+        assert all(stats.cases == 2 and stats.recorded == 1 and stats.scored == 0 for stats in results.values())
+        assert all(len(stats.latencies) == 2 for stats in results.values())
+
+    @pytest.mark.asyncio
+    async def test_labelled_cases_give_hit_rate(self, tmp_path):
+        db = make_memory()
+        path = tmp_path / "corpus.jsonl"
+        # recorded in llm mode, which found the car; a reviewer labelled the dog as the relevant memory
+        path.write_text(
+            '{"message": "rex", "history": [], "retrieved": ["car"], "relevant": ["dog"], "mode": "llm"}\n'
+            '{"message": "red car", "history": [], "expected": ["car"]}\n'
+        )
+
+        cases = memory_query.load_corpus(str(path))
+        results = await memory_query.compare_modes(make_agent("red car"), db, cases, limit=1, threshold=0.6)
+
+        assert cases[1].retrieved == ["car"] and cases[1].relevant is None and cases[1].mode == "llm"
+        assert results["llm"].scored == 1 and results["llm"].hit_rate == 0.0
+        assert results["keywords"].hit_rate == 1.0
+        assert results["llm"].agreement == 1.0  # agrees with itself on the unlabelled case
@@ -0,0 +1,201 @@
+"""
+Unit tests for write-behind memory persistence
+
+Tests cover:
+- Logging mutations without rewriting the index
+- Crash recovery by replaying the log
+- Checkpoints and log truncation
+- Interrupted checkpoint swaps
+- Memory writes going through the log
+- Searches excluded while the index is written
+"""
+
+import os
+import threading
+import time
+import pytest
+from unittest.mock import Mock, patch
+from langchain_core.embeddings import FakeEmbeddings
+from python.helpers import memory_wal
+from python.helpers.memory import Memory, MyFaiss
+from conftest import MEMORY_DIM as DIM
+
+embeddings = FakeEmbeddings(size=DIM)
+
+
+@pytest.fixture
+def load_db(make_db):
+    """What Memory.initialize does on start"""
+
+    def load(db_dir) -> MyFaiss:
+        memory_wal.recover_checkpoint(db_dir)
+        if os.path.exists(os.path.join(db_dir, "index.faiss")):
+            db = MyFaiss.load_local(db_dir, embeddings, allow_dangerous_deserialization=True)
+        else:
+            db = make_db()
+        memory_wal.replay(db_dir, db)
+        return db
+
+    return load
+
+
+def add(wal, *ids):
+    texts = [f"text {id}" for id in ids]
+    wal.add(texts, embeddings.embed_documents(texts), [{"id": id} for id in ids], list(ids))
+
+
+def stored_ids(db):
+    return sorted(db.docstore._dict)
+
+
+class TestMemoryWal:
+    """Test logging, recovery and checkpoints."""
+
+    def test_writes_are_logged_not_saved(self, tmp_path, make_db):
+        wal = memory_wal.MemoryWal(str(tmp_path), make_db())
+
+        add(wal, "a", "b")
+        wal.delete(["a"])
+
+        assert stored_ids(wal.db) == ["b"]
+        assert not os.path.exists(tmp_path / "index.faiss")
+        assert len(open(tmp_path / memory_wal.WAL_FILE).readlines()) == 2
+
+    def test_search_waits_for_writes(self, tmp_path, make_db):
+        wal = memory_wal.MemoryWal(str(tmp_path), make_db())
+        add(wal, "a", "b")
+        found = []
+        search = threading.Thread(
+            target=lambda: found.extend(wal.db.similarity_search_with_score_by_vector([1.0] * DIM, k=2))
+        )
+
+        with wal.lock:  # a write, a rebuild swap or a knowledge refresh in progress
+            search.start()
+            search.join(0.2)
+            assert search.is_alive() and not found
+        search.join(1)
+
+        assert wal.lock is wal.db.lock
+        assert len(found) == 2
+
+    def test_metadata_update_is_replayed(self, tmp_path, make_db, load_db):
+        wal = memory_wal.MemoryWal(str(tmp_path), make_db())
+        add(wal, "a", "b")
+        wal.checkpoint()  # "a" is read from the segment on disk
+        wal.update(["a"], [{"id": "a", "source": "new.md"}])
+
+        db = load_db(str(tmp_path))
+
+        assert db.docstore.search("a").metadata == {"id": "a", "source": "new.md"}
+        assert db.docstore.search("a").page_content == "text a"
+        assert stored_ids(db) == ["a", "b"] and db.index.ntotal == 2
+        wal.checkpoint()
+        assert load_db(str(tmp_path)).docstore.search("a").metadata["source"] == "new.md"
+
+    def test_crash_recovery_replays_log(self, tmp_path, make_db, load_db):
+        wal = memory_wal.MemoryWal(str(tmp_path), make_db())
+        add(wal, "a", "b", "c")
+        wal.delete(["b"])
+        # crash, nothing checkpointed
+
+        db = load_db(str(tmp_path))
+
+        assert stored_ids(db) == ["a", "c"]
+        assert db.index.ntotal == 2
+
+    def test_checkpoint_truncates_log(self, tmp_path, make_db, load_db):
+        wal = memory_wal.MemoryWal(str(tmp_path), make_db())
+        add(wal, "a")
+        wal.checkpoint()
+        add(wal, "b")
+
+        assert os.path.exists(tmp_path / "index.faiss")
+        assert len(open(tmp_path / memory_wal.WAL_FILE).readlines()) == 1
+        assert stored_ids(load_db(str(tmp_path))) == ["a", "b"]
+
+    def test_replay_is_idempotent(self, tmp_path, make_db, load_db):
+        wal = memory_wal.MemoryWal(str(tmp_path), make_db())
+        add(wal, "a", "b")
+        log = open(tmp_path / memory_wal.WAL_FILE).read()
+        wal.checkpoint()
+        with open(tmp_path / memory_wal.WAL_FILE, "w") as f:
+            f.write(log)  # crash after the checkpoint, before the log was truncated
+
+        db = load_db(str(tmp_path))
+
+        assert stored_ids(db) == ["a", "b"]
+        assert db.index.ntotal == 2
+
+    def test_torn_record_is_ignored(self, tmp_path, make_db, load_db):
+        wal = memory_wal.MemoryWal(str(tmp_path), make_db())
+        add(wal, "a")
+        with open(tmp_path / memory_wal.WAL_FILE, "a") as f:
+            f.write('{"seq": 2, "op": "del')
+
+        assert stored_ids(load_db(str(tmp_path))) == ["a"]
+
+    def test_background_checkpoint_after_records(self, tmp_path, make_db, load_db):
+        wal = memory_wal.MemoryWal(str(tmp_path), make_db())
+        wal.CHECKPOINT_RECORDS = 3
+
+        for id in "abc":
+            add(wal, id)
+        deadline = time.monotonic() + 5
+        while not os.path.exists(tmp_path / "index.faiss") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        wal.checkpoint()  # waits for a running one
+
+        assert os.path.getsize(tmp_path / memory_wal.WAL_FILE) == 0
+        assert stored_ids(load_db(str(tmp_path))) == ["a", "b", "c"]
+
+    def test_flush_all_checkpoints_open_logs(self, tmp_path, make_db):
+        wal = memory_wal.MemoryWal(str(tmp_path), make_db())
+        add(wal, "a")
+
+        memory_wal.flush_all()
+
+        assert stored_ids(MyFaiss.load_local(str(tmp_path), embeddings, allow_dangerous_deserialization=True)) == ["a"]
+
+
+class TestCheckpointSwap:
+    """Test recovery of interrupted checkpoints."""
+
+    def test_complete_checkpoint_is_swapped_in(self, tmp_path):
+        for name in memory_wal.INDEX_FILES:
+            (tmp_path / name).write_text("old")
+            (tmp_path / (name + memory_wal.TMP_SUFFIX)).write_text("new")
+        (tmp_path / memory_wal.READY_MARKER).write_text("")
+
+        memory_wal.recover_checkpoint(str(tmp_path))
+
+        assert all((tmp_path / name).read_text() == "new" for name in memory_wal.INDEX_FILES)
+        assert not os.path.exists(tmp_path / memory_wal.READY_MARKER)
+
+    def test_incomplete_checkpoint_is_discarded(self, tmp_path):
+        (tmp_path / "index.faiss").write_text("old")
+        (tmp_path / ("index.faiss" + memory_wal.TMP_SUFFIX)).write_text("partial")
+
+        memory_wal.recover_checkpoint(str(tmp_path))
+
+        assert (tmp_path / "index.faiss").read_text() == "old"
+        assert not os.path.exists(tmp_path / ("index.faiss" + memory_wal.TMP_SUFFIX))
+
+
+class TestMemoryWrites:
+    """Test Memory mutations through the log."""
+
+    @pytest.mark.asyncio
+    async def test_insert_and_delete(self, tmp_path, make_db, load_db):
+        with patch.object(Memory, "_abs_db_dir", return_value=str(tmp_path)):
+            memory = Memory(agent=Mock(), db=make_db(), memory_subdir="wal-test")
+            try:
+                id = memory.insert_text("remember this")
+                ids = memory.insert_documents([])
+                await memory.delete_documents_by_ids([id, "missing"])
+                kept = memory.insert_text("keep this")
+            finally:
+                Memory.wal.pop("wal-test", None)
+
+        assert ids == []
+        assert stored_ids(load_db(str(tmp_path))) == [kept]
+        assert not os.path.exists(tmp_path / "index.faiss")
@@ -0,0 +1,126 @@
+"""
+Unit tests for compiled prompt templates
+
+Tests cover:
+- Placeholder rendering
+- Include resolution and backup directories
+- Code fence removal
+- Cache hits and mtime invalidation
+"""
+
+import os
+import pytest
+from python.helpers.templates import TemplateCache
+
+
+def write(path, text, bump=0):
+    path.write_text(text)
+    if bump:
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + bump * 1_000_000_000))
+
+
+class TestTemplateRendering:
+    """Test rendering of compiled templates."""
+
+    def test_placeholders(self, tmp_path):
+        write(tmp_path / "msg.md", "Tool {{tool_name}} said: {{tool_response}} ({{other}})")
+        cache = TemplateCache()
+
+        text = cache.render(str(tmp_path / "msg.md"), tool_name="code", tool_response=42)
+
+        assert text == "Tool code said: 42 ({{other}})"
+
+    def test_values_are_not_rendered_again(self, tmp_path):
+        write(tmp_path / "msg.md", "{{a}} {{b}}")
+        cache = TemplateCache()
+
+        assert cache.render(str(tmp_path / "msg.md"), a="{{b}}", b="x") == "{{b}} x"
+
+    def test_code_fences_removed(self, tmp_path):
+        write(tmp_path / "msg.md", "~~~json\n{\"a\": \"{{value}}\"}\n~~~")
+        cache = TemplateCache()
+
+        assert cache.render(str(tmp_path / "msg.md"), value=1) == "{\"a\": \"1\"}\n"
+
+    def test_includes_are_resolved(self, tmp_path):
+        write(tmp_path / "main.md", "start\n{{ include './part.md' }}\nend")
+        write(tmp_path / "part.md", "part {{name}} {{include \"./leaf.md\"}}")
+        write(tmp_path / "leaf.md", "leaf {{name}}")
+        cache = TemplateCache()
+
+        text = cache.render(str(tmp_path / "main.md"), name="x")
+
+        assert text == "start\npart x leaf x\nend"
+
+    def test_include_from_backup_dir(self, tmp_path):
+        custom, default = tmp_path / "custom", tmp_path / "default"
+        custom.mkdir()
+        default.mkdir()
+        write(custom / "main.md", "{{ include './part.md' }}")
+        write(default / "part.md", "default part")
+        cache = TemplateCache()
+
+        assert cache.render(str(custom / "main.md"), [str(default)]) == "default part"
+
+    def test_profile_overrides_included_file(self, tmp_path):
+        profile, default = tmp_path / "profile", tmp_path / "default"
+        profile.mkdir()
+        default.mkdir()
+        write(default / "main.md", "{{ include './part.md' }} {{ include './other.md' }}")
+        write(default / "part.md", "default part")
+        write(default / "other.md", "default other")
+        write(profile / "part.md", "profile part")
+        cache = TemplateCache()
+
+        # main.md comes from default, its includes are looked up in the profile first
+        assert cache.render(str(profile / "main.md"), [str(default)]) == "profile part default other"
+        assert cache.render(str(default / "main.md"), [str(default)]) == "default part default other"
+
+    def test_circular_include(self, tmp_path):
+        write(tmp_path / "a.md", "{{ include './b.md' }}")
+        write(tmp_path / "b.md", "{{ include './a.md' }}")
+        cache = TemplateCache()
+
+        with pytest.raises(ValueError):
+            cache.render(str(tmp_path / "a.md"))
+
+    def test_missing_file(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            TemplateCache().render(str(tmp_path / "missing.md"))
+
+
+class TestTemplateCaching:
+    """Test cache hits and invalidation."""
+
+    def test_compiled_once(self, tmp_path):
+        write(tmp_path / "msg.md", "{{a}}")
+        cache = TemplateCache()
+
+        for i in range(5):
+            assert cache.render(str(tmp_path / "msg.md"), a=i) == str(i)
+
+        stats = cache.get_stats()
+        assert stats["misses"] == 1
+        assert stats["hits"] == 4
+        assert stats["hit_rate"] == 0.8
+
+    def test_changed_file_is_recompiled(self, tmp_path):
+        write(tmp_path / "msg.md", "old")
+        cache = TemplateCache()
+        assert cache.render(str(tmp_path / "msg.md")) == "old"
+
+        write(tmp_path / "msg.md", "new", bump=1)
+
+        assert cache.render(str(tmp_path / "msg.md")) == "new"
+        assert cache.get_stats()["invalidations"] == 1
+
+    def test_changed_include_is_recompiled(self, tmp_path):
+        write(tmp_path / "main.md", "main {{ include './part.md' }}")
+        write(tmp_path / "part.md", "old")
+        cache = TemplateCache()
+        assert cache.render(str(tmp_path / "main.md")) == "main old"
+
+        write(tmp_path / "part.md", "new", bump=1)
+
+        assert cache.render(str(tmp_path / "main.md")) == "main new"
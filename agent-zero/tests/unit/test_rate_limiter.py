@@ -0,0 +1,192 @@
+"""
+Unit tests for the async rate limiter
+
+Tests cover:
+- Running call and token totals
+- Expiry of old records
+- Output tokens credited to their own call
+- Waiting without blocking the event loop
+- Rate limited embeddings wrapper
+- Utility limits of an agent defaulting to the chat limits, one limiter for one model
+"""
+
+import asyncio
+import time
+import pytest
+from unittest.mock import Mock
+from python.helpers.rate_limiter import RateLimiter, RateLimitedEmbeddings
+
+
+def make_limiter(**kwargs):
+    params = dict(max_calls=0, max_input_tokens=0, max_output_tokens=0, window_seconds=60)
+    params.update(kwargs)
+    return RateLimiter(Mock(), **params)
+
+
+class TestRateLimiterTotals:
+    """Test running totals of the window."""
+
+    @pytest.mark.asyncio
+    async def test_totals_follow_records(self):
+        limiter = make_limiter()
+
+        await limiter.limit_call_and_input(100)
+        limiter.set_output_tokens(10)
+        await limiter.limit_call_and_input(50)
+        limiter.set_output_tokens(5)
+
+        assert limiter._get_counts() == (2, 150, 15)
+
+    @pytest.mark.asyncio
+    async def test_expired_records_are_subtracted(self):
+        limiter = make_limiter(window_seconds=10)
+        await limiter.limit_call_and_input(100)
+        limiter.set_output_tokens(10)
+        limiter.call_records[0].timestamp -= 20  # pretend the call is old
+
+        await limiter.limit_call_and_input(30)
+
+        assert limiter._get_counts() == (1, 30, 0)
+
+    @pytest.mark.asyncio
+    async def test_output_credited_to_its_call(self):
+        limiter = make_limiter(window_seconds=10)
+        first = await limiter.limit_call_and_input(100)
+        second = await limiter.limit_call_and_input(50)
+
+        limiter.set_output_tokens(7, first)  # the first call finishes after the second started
+        limiter.set_output_tokens(3, second)
+
+        assert (first.output_tokens, second.output_tokens) == (7, 3)
+        first.timestamp -= 20
+        await limiter.limit_call_and_input(1)
+        assert limiter._get_counts() == (2, 51, 3)
+
+    @pytest.mark.asyncio
+    async def test_output_of_expired_call_not_counted(self):
+        limiter = make_limiter(window_seconds=10)
+        call = await limiter.limit_call_and_input(100)
+        call.timestamp -= 20
+        await limiter.limit_call_and_input(1)
+
+        limiter.set_output_tokens(10, call)
+
+        assert limiter._get_counts() == (1, 1, 0)
+
+    def test_record_call_does_not_wait(self):
+        limiter = make_limiter(max_calls=1)
+
+        limiter.record_call(10)
+        limiter.record_call(10)
+
+        assert limiter._get_counts() == (2, 20, 0)
+
+
+class TestRateLimiterWaiting:
+    """Test awaiting a free window."""
+
+    @pytest.mark.asyncio
+    async def test_waits_for_oldest_record(self):
+        limiter = make_limiter(max_calls=1, window_seconds=1)
+        await limiter.limit_call_and_input(1)
+        limiter.call_records[0].timestamp -= 0.8  # window frees in ~0.2s
+
+        start = time.monotonic()
+        await limiter.limit_call_and_input(1)
+
+        assert 0.1 < time.monotonic() - start < 1
+        limiter.logger.log.assert_called()
+
+    @pytest.mark.asyncio
+    async def test_waiting_does_not_block_event_loop(self):
+        limiter = make_limiter(max_calls=1, window_seconds=1)
+        await limiter.limit_call_and_input(1)
+        limiter.call_records[0].timestamp -= 0.7
+
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await limiter.limit_call_and_input(1)
+        task.cancel()
+
+        assert ticks > 5
+
+    @pytest.mark.asyncio
+    async def test_oversized_call_passes_empty_window(self):
+        limiter = make_limiter(max_input_tokens=10)
+
+        await asyncio.wait_for(limiter.limit_call_and_input(100), timeout=1)
+
+        assert limiter._get_counts() == (1, 100, 0)
+
+
+class TestRateLimitedEmbeddings:
+    """Test the embeddings wrapper."""
+
+    @pytest.mark.asyncio
+    async def test_calls_are_counted(self):
+        model = Mock(model="test-embed")
+        model.embed_query.return_value = [0.1]
+
+        async def aembed_documents(texts):
+            return [[0.2] for _ in texts]
+
+        model.aembed_documents = aembed_documents
+        limiter = make_limiter()
+        embeddings = RateLimitedEmbeddings(model, limiter)
+
+        assert embeddings.embed_query("abcd" * 10) == [0.1]
+        assert await embeddings.aembed_documents(["abcd", "efgh"]) == [[0.2], [0.2]]
+
+        assert limiter._get_counts() == (2, 12, 0)
+
+    def test_attributes_are_passed_through(self):
+        embeddings = RateLimitedEmbeddings(Mock(model="test-embed"), make_limiter())
+
+        assert embeddings.model == "test-embed"
+
+
+class TestAgentLimiters:
+    """Test the limiters of an agent."""
+
+    @staticmethod
+    def make_agent(chat_model=None, utility_model=None, **kwargs):
+        from agent import AgentConfig, AgentContext
+
+        config = AgentConfig(
+            chat_model=chat_model or Mock(model_name="test-chat"),
+            utility_model=utility_model or Mock(model_name="test-utility"),
+            embeddings_model=Mock(),
+            **kwargs,
+        )
+        context = AgentContext(config)
+        AgentContext.remove(context.id)
+        return context.agent0
+
+    def test_utility_limits_default_to_chat_limits(self):
+        agent = self.make_agent(rate_limit_requests=30, rate_limit_input_tokens=1000)
+
+        assert agent.utility_rate_limiter.max_calls == 30
+        assert agent.utility_rate_limiter.max_input_tokens == 1000
+        assert agent.utility_rate_limiter.max_output_tokens == 0
+
+    def test_utility_limits_can_be_set(self):
+        agent = self.make_agent(rate_limit_requests=30, utility_rate_limit_requests=0, utility_rate_limit_input_tokens=500)
+
+        assert agent.utility_rate_limiter.max_calls == 0
+        assert agent.utility_rate_limiter.max_input_tokens == 500
+
+    def test_same_model_shares_one_limiter(self):
+        model = Mock(model_name="test-chat")
+
+        shared = self.make_agent(model, model, rate_limit_requests=30)
+        limited = self.make_agent(model, model, rate_limit_requests=30, utility_rate_limit_requests=10)
+
+        assert shared.utility_rate_limiter is shared.rate_limiter
+        assert limited.utility_rate_limiter is not limited.rate_limiter
@@ -0,0 +1,184 @@
+"""
+Unit tests for speculative memory recall
+
+Tests cover:
+- Recall prepared one iteration ahead
+- Injection of a finished recall
+- Regular recall in place of late and stale recalls
+- Leftover recall dropped at monologue start
+- Solutions recalled ahead the same way
+- Regular recall when the mode is off
+"""
+
+import asyncio
+import pytest
+from unittest.mock import Mock
+from langchain_core.messages import AIMessage, HumanMessage
+from agent import AgentConfig, AgentContext, LoopData
+from python.extensions.message_loop_prompts._50_recall_memories import RecallMemories
+from python.extensions.message_loop_prompts._51_recall_solutions import RecallSolutions
+from python.extensions.monologue_start._10_drop_speculative_recall import DropSpeculativeRecall
+from python.helpers import speculative_recall
+
+
+@pytest.fixture
+def recall_calls(monkeypatch):
+    calls = []
+
+    async def fake_recall(self, message, log_item, interruptible=True):
+        calls.append({"history": len(self.agent.history), "interruptible": interruptible})
+        await asyncio.sleep(self.agent.recall_delay)
+        return f"memory from {len(calls)}"
+
+    monkeypatch.setattr(RecallMemories, "recall", fake_recall)
+    return calls
+
+
+@pytest.fixture
+def solution_calls(monkeypatch):
+    calls = []
+
+    async def fake_recall(self, message, log_item, interruptible=True):
+        calls.append({"history": len(self.agent.history), "interruptible": interruptible})
+        return "", f"solution from {len(calls)}"
+
+    monkeypatch.setattr(RecallSolutions, "recall", fake_recall)
+    return calls
+
+
+def make_agent(speculative=True, delay=0.0):
+    config = AgentConfig(
+        chat_model=Mock(model_name="test-chat"),
+        utility_model=Mock(model_name="test-utility"),
+        embeddings_model=Mock(),
+        recall_speculative=speculative,
+    )
+    context = AgentContext(config)
+    AgentContext.remove(context.id)
+    agent = context.agent0
+    agent.recall_delay = delay  # type: ignore
+    agent.history = [HumanMessage(content="task")]
+    return agent
+
+
+async def run_iteration(agent, iteration, message="task", extension=RecallMemories):
+    loop_data = LoopData()
+    loop_data.iteration = iteration
+    loop_data.message = message
+    await extension(agent=agent).execute(loop_data=loop_data)
+    return loop_data
+
+
+def prepared(agent, name=RecallMemories.SPECULATIVE_NAME):
+    return (agent.get_data(speculative_recall.DATA_KEY) or {}).get(name)
+
+
+def add_turn(agent):
+    agent.history += [AIMessage(content="tool request"), HumanMessage(content="tool result")]
+
+
+def has_memories(loop_data, text):
+    return any(text in part for part in loop_data.system)
+
+
+class TestSpeculativeRecall:
+    """Test recall prepared during the previous iteration."""
+
+    @pytest.mark.asyncio
+    async def test_first_iteration_recalls_directly(self, recall_calls):
+        agent = make_agent()
+
+        loop_data = await run_iteration(agent, 0)
+
+        assert has_memories(loop_data, "memory from 1")
+        assert recall_calls[0]["interruptible"] is True
+
+    @pytest.mark.asyncio
+    async def test_recall_prepared_ahead_is_injected(self, recall_calls):
+        agent = make_agent()
+        await run_iteration(agent, 2)
+        await asyncio.sleep(0.01)  # generation of iteration 2
+        assert len(recall_calls) == 1
+        assert recall_calls[0]["interruptible"] is False
+
+        add_turn(agent)
+        loop_data = await run_iteration(agent, 3)
+
+        assert has_memories(loop_data, "memory from 1")
+        assert len(recall_calls) == 1  # nothing recalled on the critical path
+
+    @pytest.mark.asyncio
+    async def test_late_recall_is_replaced(self, recall_calls):
+        agent = make_agent(delay=0.2)
+        await run_iteration(agent, 2)
+        speculative = prepared(agent)
+
+        add_turn(agent)
+        loop_data = await asyncio.wait_for(run_iteration(agent, 3), timeout=1)
+
+        assert speculative.task.cancelled()
+        assert has_memories(loop_data, "memory from 2")
+        assert recall_calls[1] == {"history": 3, "interruptible": True}
+
+    @pytest.mark.asyncio
+    async def test_stale_recall_falls_back_to_search(self, recall_calls):
+        agent = make_agent()
+        await run_iteration(agent, 2)
+        await asyncio.sleep(0.01)
+
+        add_turn(agent)
+        loop_data = await run_iteration(agent, 3, message="another task")
+
+        assert not has_memories(loop_data, "memory from 1")
+        assert has_memories(loop_data, "memory from 2")
+        assert recall_calls[1]["interruptible"] is True
+
+    @pytest.mark.asyncio
+    async def test_reset_history_makes_recall_stale(self, recall_calls):
+        agent = make_agent()
+        await run_iteration(agent, 2)
+        await asyncio.sleep(0.01)
+
+        agent.history = [HumanMessage(content="fresh")]
+        loop_data = await run_iteration(agent, 3)
+
+        assert not has_memories(loop_data, "memory from 1")
+        assert has_memories(loop_data, "memory from 2")
+
+    @pytest.mark.asyncio
+    async def test_leftover_recall_dropped_at_monologue_start(self, recall_calls):
+        agent = make_agent(delay=10)
+        await run_iteration(agent, 2)
+        speculative = prepared(agent)
+
+        await DropSpeculativeRecall(agent=agent).execute(loop_data=LoopData())
+        await asyncio.sleep(0)
+
+        assert prepared(agent) is None
+        assert speculative.task.cancelled()
+
+    @pytest.mark.asyncio
+    async def test_mode_off_recalls_in_iteration(self, recall_calls):
+        agent = make_agent(speculative=False)
+        await run_iteration(agent, 2)
+        assert recall_calls == []
+
+        add_turn(agent)
+        loop_data = await run_iteration(agent, 3)
+
+        assert has_memories(loop_data, "memory from 1")
+        assert recall_calls[0]["history"] == 3
+
+    @pytest.mark.asyncio
+    async def test_solutions_prepared_ahead_are_injected(self, solution_calls):
+        agent = make_agent()
+        await run_iteration(agent, 2, extension=RecallSolutions)
+        await asyncio.sleep(0.01)
+        assert solution_calls == [{"history": 1, "interruptible": False}]
+
+        add_turn(agent)
+        loop_data = await run_iteration(agent, 3, extension=RecallSolutions)
+
+        assert has_memories(loop_data, "solution from 1")
+        assert len(solution_calls) == 1
+        assert prepared(agent, RecallSolutions.SPECULATIVE_NAME) is None
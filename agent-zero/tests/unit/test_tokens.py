@@ -0,0 +1,170 @@
+"""
+Unit tests for token counting
+
+Tests cover:
+- Counter selection by model name
+- Registering custom counters
+- Tokenizers loaded in the background, approximate counts until then
+- Bundled encoding when tokenizer files can't be downloaded
+- Calibrated counters of non-OpenAI model families
+- Per-message count cache
+- Incremental counting of extended messages
+"""
+
+import sys
+import threading
+import types
+import pytest
+from unittest.mock import Mock
+from langchain_core.messages import AIMessage, HumanMessage
+from python.helpers import tokens
+from python.helpers.tokens import MessageTokenCounter, TokenCounter
+
+
+class CountingCounter(TokenCounter):
+    """One token per word, remembers what it was asked to count."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def encode_count(self, text):
+        self.calls.append(text)
+        return len(text.split())
+
+
+@pytest.fixture
+def restore_counters():
+    factories = list(tokens._factories)
+    yield
+    tokens._factories[:] = factories
+    tokens._counters.clear()
+
+
+class TestCounterSelection:
+    """Test picking counters for models."""
+
+    def test_model_name_from_attributes(self):
+        assert tokens.get_model_name(Mock(model_name="gpt-4o")) == "gpt-4o"
+        assert tokens.get_model_name(Mock(spec=["model"], model="llama3")) == "llama3"
+        assert tokens.get_model_name("mistral") == "mistral"
+
+    def test_unknown_model_is_approximated(self):
+        counter = tokens.get_counter("some-local-model")
+
+        assert type(counter) is TokenCounter
+        assert counter.count("x" * 40) == 10
+
+    def test_counter_is_reused(self):
+        assert tokens.get_counter("some-local-model") is tokens.get_counter("some-local-model")
+
+    def test_registered_counter(self, restore_counters):
+        tokens.register_counter("llama*", lambda name: CountingCounter())
+
+        assert isinstance(tokens.get_counter(Mock(model_name="llama3.1")).wait(), CountingCounter)
+        assert type(tokens.get_counter("some-local-model")) is TokenCounter
+
+    def test_failing_factory_falls_back(self, restore_counters):
+        def broken(name):
+            raise ImportError("no tokenizer")
+
+        tokens.register_counter("broken-*", broken)
+        counter = tokens.get_counter("broken-model")
+
+        assert counter.wait() is counter
+        assert counter.count("x" * 40) == 10
+
+    def test_loaded_in_background(self, restore_counters):
+        release = threading.Event()
+
+        def slow(name):
+            release.wait(5)
+            return CountingCounter()
+
+        tokens.register_counter("slow-*", slow)
+        counter = tokens.get_counter("slow-model")  # returns without waiting for the tokenizer
+        messages = MessageTokenCounter(counter)
+        history = [HumanMessage(content="x" * 40)]
+
+        assert counter.count("x" * 40) == 10
+        assert messages.count_messages(history) == 10 + counter.tokens_per_message
+
+        release.set()
+        counter.wait()
+
+        assert counter.count("one two three") == 3
+        assert messages.count_messages(history) == 1 + counter.tokens_per_message  # recounted
+
+    def test_offline_tiktoken_uses_bundled_encoding(self, restore_counters, monkeypatch):
+        import tiktoken
+
+        def download(model_name):
+            raise ConnectionError("openaipublic.blob.core.windows.net unreachable")
+
+        monkeypatch.setattr(tiktoken, "encoding_for_model", download)
+        tokens._counters.clear()
+
+        counter = tokens.get_counter("gpt-4o").wait()
+
+        assert counter.name == "tiktoken" and counter.encoding.name == tokens.BUNDLED_ENCODING  # type: ignore
+        assert counter.count("hello world") == 2
+
+    @pytest.mark.parametrize("model,factor", [
+        ("models/gemini-2.5-flash", 1.0),
+        ("claude-3-5-sonnet-20240620", 1.15),
+        ("llama3.2:3b-instruct-fp16", 1.0),
+        ("mistral-small-latest", 1.1),
+    ])
+    def test_model_families_are_calibrated(self, model, factor):
+        counter = tokens.get_counter(model).wait()
+
+        assert counter.name == "calibrated" and counter.factor == factor  # type: ignore
+        assert counter.count(" ".join(["hello world"] * 100)) == round(200 * factor)
+
+
+class TestMessageTokenCounter:
+    """Test counting message histories."""
+
+    def test_unchanged_messages_are_not_recounted(self):
+        counter = CountingCounter()
+        messages = MessageTokenCounter(counter)
+        history = [HumanMessage(content="one two three"), AIMessage(content="four five")]
+
+        first = messages.count_messages(history)
+        history.append(HumanMessage(content="six"))
+        second = messages.count_messages(history)
+
+        assert first == 5 + 2 * counter.tokens_per_message
+        assert second == first + 1 + counter.tokens_per_message
+        assert counter.calls == ["one two three", "four five", "six"]
+
+    def test_extended_message_counts_suffix(self):
+        counter = CountingCounter()
+        messages = MessageTokenCounter(counter)
+        history = [AIMessage(content="one two")]
+        messages.count_messages(history)
+
+        history[0].content += "\n\nthree four"
+        total = messages.count_messages(history)
+
+        assert total == 4 + counter.tokens_per_message
+        assert counter.calls[-1] == "\n\nthree four"
+
+    def test_removed_messages_are_dropped(self):
+        messages = MessageTokenCounter(CountingCounter())
+        history = [HumanMessage(content=str(i)) for i in range(10)]
+        messages.count_messages(history)
+
+        messages.count_messages(history[-2:])
+
+        assert len(messages._cache) == 2
+
+    def test_system_prompt_is_cached(self):
+        counter = CountingCounter()
+        messages = MessageTokenCounter(counter)
+
+        for _ in range(3):
+            total = messages.count_prompt(["system part", "more"], [])
+
+        assert total == 3 + counter.tokens_per_message
+        assert counter.calls == ["system part\n\nmore"]
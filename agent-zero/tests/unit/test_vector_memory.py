@@ -0,0 +1,346 @@
+"""
+Unit tests for the SQLite vector memory
+
+Tests cover:
+- Vectorized search matching a per-row cosine similarity scan
+- Type filter, threshold and top-k on the in-memory index
+- Index loaded once and kept in sync by add, delete and clear
+- Batch inserts in one encode call and one transaction, shared connection in WAL mode
+- float16 and int8 storage, exact re-rank and conversion of existing databases
+- Model name and dimension recorded, reads without the model, background warm-up
+"""
+
+import sqlite3
+import sys
+import threading
+import time
+import types
+import zlib
+import numpy as np
+import pytest
+from python.helpers.vector_memory import VectorMemory
+
+DIM = 16
+
+
+class FakeModel:
+    """Sentence transformer stand-in, texts map to fixed random vectors"""
+
+    def __init__(self):
+        self.vectors: dict[str, np.ndarray] = {}
+        self.calls = 0
+
+    def encode(self, text, batch_size=32, convert_to_numpy=True):
+        self.calls += 1
+        if isinstance(text, list):
+            return np.stack([self._vector(t) for t in text])
+        return self._vector(text)
+
+    def _vector(self, text):
+        if text not in self.vectors:
+            rng = np.random.default_rng(zlib.crc32(text.encode()))
+            self.vectors[text] = rng.normal(size=DIM).astype(np.float32)
+        return self.vectors[text]
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+
+def open_memory(path, model=None, storage=None) -> VectorMemory:
+    vm = VectorMemory(db_path=str(path), storage=storage)
+    vm._embedding_model = model or FakeModel()
+    vm._embedding_dim = DIM
+    return vm
+
+
+@pytest.fixture
+def memory(tmp_path):
+    return open_memory(tmp_path / "vector_memory.db")
+
+
+def scan(vm, query, top_k=5, memory_type=None, threshold=0.3):
+    """Reference search: every row read and compared one at a time"""
+    q = vm._text_to_embedding(query)
+    conn = sqlite3.connect(vm.db_path)
+    rows = conn.execute("SELECT id, embedding, memory_type FROM memories").fetchall()
+    conn.close()
+    found = []
+    for id, blob, mem_type in rows:
+        if memory_type and mem_type != memory_type:
+            continue
+        v = np.frombuffer(blob, dtype=np.float32)
+        similarity = float(np.dot(q, v) / (np.linalg.norm(q) * np.linalg.norm(v)))
+        if similarity >= threshold:
+            found.append((id, similarity))
+    found.sort(key=lambda x: x[1], reverse=True)
+    return found[:top_k]
+
+
+class TestSearch:
+    """Test the vectorized search."""
+
+    def test_matches_row_scan(self, memory):
+        for i in range(200):
+            memory.add_memory(f"memory {i}", memory_type=["general", "fact", "solution"][i % 3], metadata={"n": i})
+
+        for query, kwargs in [
+            ("memory 7", {}),
+            ("memory 7", {"top_k": 20, "threshold": -1.0}),
+            ("something else", {"memory_type": "fact", "threshold": 0.0}),
+            ("memory 12", {"memory_type": "missing"}),
+        ]:
+            results = memory.search(
+                query, top_k=kwargs.get("top_k", 5), memory_type=kwargs.get("memory_type"),
+                similarity_threshold=kwargs.get("threshold", 0.3),
+            )
+            expected = scan(memory, query, **kwargs)
+            assert [r["id"] for r in results] == [id for id, _ in expected]
+            assert [r["similarity"] for r in results] == pytest.approx([s for _, s in expected], abs=1e-5)
+
+        best = memory.search("memory 7", top_k=1)[0]
+        assert best["content"] == "memory 7" and best["metadata"] == {"n": 7} and best["memory_type"] == "fact"
+        assert best["similarity"] == pytest.approx(1.0)
+        assert memory.search("memory 7", top_k=0) == []
+
+    def test_zero_vectors(self, memory):
+        memory._embedding_model.vectors["empty"] = np.zeros(DIM, dtype=np.float32)
+        memory.add_memory("empty")
+        memory.add_memory("full")
+
+        assert [r["content"] for r in memory.search("empty", similarity_threshold=0.0)] == ["empty", "full"]
+        assert memory.search("full")[0]["content"] == "full"
+
+
+class TestIndexSync:
+    """Test the in-memory index following changes."""
+
+    def test_loaded_once(self, memory):
+        memory.add_memory("before load")
+        memory.search("before load")
+        index = memory._index
+
+        memory.add_memory("after load")
+        memory.search("after load")
+
+        assert memory._index is index
+        assert index["general"].count == 2  # type: ignore
+
+    def test_add_delete_clear(self, memory):
+        ids = [memory.add_memory(f"m{i}", memory_type="a" if i % 2 else "b") for i in range(100)]
+        memory.search("m0")
+
+        for id in ids[:60]:
+            memory.delete_memory(id)
+        memory.delete_memory(12345)  # unknown IDs are ignored
+        added = memory.add_memory("m0")
+
+        assert memory.search("m0", top_k=1)[0]["id"] == added
+        assert {r["id"] for r in memory.search("m70", top_k=100, similarity_threshold=-1)} == set(ids[60:]) | {added}
+        part = memory._index["a"]  # type: ignore
+        assert set(part.ids[: part.count].tolist()) == {id for i, id in enumerate(ids) if i >= 60 and i % 2}
+        assert part.rows == {int(id): row for row, id in enumerate(part.ids[: part.count])}
+
+        memory.clear_all("a")
+        assert {r["memory_type"] for r in memory.search("m71", top_k=100, similarity_threshold=-1)} == {"b", "general"}
+        memory.clear_all()
+        assert memory.search("m72", similarity_threshold=-1) == []
+        assert memory.get_memory_stats()["total_memories"] == 0
+
+    def test_top_k_ids_unchanged_by_delete(self, memory):
+        ids = [memory.add_memory(f"m{i}") for i in range(5)]
+        memory.search("m0")
+        part = memory._index["general"]  # type: ignore
+
+        found, scores = part.top_k(part.vectors[0].astype(np.float32), 10)
+        memory.delete_memory(ids[0])  # the last row moves into the first
+
+        assert found.tolist() == ids and len(scores) == 5
+
+    def test_fresh_instance_loads_stored_rows(self, memory):
+        memory.add_memory("stored", metadata={"k": "v"})
+        other = VectorMemory(db_path=memory.db_path)
+        other._embedding_model = memory._embedding_model
+
+        result = other.search("stored")[0]
+        assert result["content"] == "stored" and result["metadata"] == {"k": "v"}
+        assert result["similarity"] == pytest.approx(1.0)
+
+
+class TestBatchInsert:
+    """Test batch inserts and the shared connection."""
+
+    def test_add_memories(self, memory):
+        memory.add_memory("single")
+        memory.search("single")  # index loaded, batches are added to it
+        memory._embedding_model.calls = 0
+
+        ids = memory.add_memories(
+            [{"content": f"batch {i}", "memory_type": "fact" if i % 2 else "general", "metadata": {"i": i}} for i in range(50)]
+            + [{"content": "defaults"}]
+        )
+
+        assert memory._embedding_model.calls == 1
+        conn = sqlite3.connect(memory.db_path)
+        rows = conn.execute("SELECT id, content, memory_type, agent_name FROM memories WHERE id >= ?", (ids[0],)).fetchall()
+        conn.close()
+        assert [(row[0], row[1]) for row in rows] == list(zip(ids, [f"batch {i}" for i in range(50)] + ["defaults"]))
+        assert rows[-1][2:] == ("general", "Agent 0")
+        assert memory.search("batch 7", top_k=1)[0]["metadata"] == {"i": 7}
+        assert memory.search("batch 8", top_k=1, memory_type="general")[0]["id"] == ids[8]
+        assert memory.get_memory_stats()["by_type"] == {"fact": 25, "general": 27}
+        assert memory.add_memories([]) == []
+
+    def test_concurrent_threads(self, memory):
+        barrier = threading.Barrier(4)
+        ids = {}
+
+        def add(n):
+            barrier.wait()
+            ids[n] = memory.add_memories([{"content": f"t{n} {i}"} for i in range(25)])
+            memory.search(f"t{n} 0")
+
+        threads = [threading.Thread(target=add, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len({id for batch in ids.values() for id in batch}) == 100
+        assert memory.search("t2 5", top_k=1)[0]["id"] == ids[2][5]
+
+    def test_wal_mode(self, memory):
+        assert memory._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert memory._conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        memory.close()
+
+
+class TestQuantizedStorage:
+    """Test float16 and int8 embedding storage."""
+
+    @pytest.mark.parametrize("storage, tolerance", [("float16", 1e-3), ("int8", 2e-2)])
+    def test_search_close_to_float32(self, tmp_path, storage, tolerance):
+        model = FakeModel()
+        exact = open_memory(tmp_path / "exact.db", model)
+        quantized = open_memory(tmp_path / f"{storage}.db", model, storage)
+        batch = [{"content": f"memory {i}", "memory_type": "a" if i % 2 else "b"} for i in range(300)]
+        exact.add_memories(batch[:150])
+        quantized.add_memories(batch[:150])
+        quantized.search("memory 0")  # later adds go to the loaded index
+        exact.add_memories(batch[150:])
+        quantized.add_memories(batch[150:])
+
+        expected = exact.search("memory 42", top_k=10, similarity_threshold=-1)
+        found = quantized.search("memory 42", top_k=10, similarity_threshold=-1)
+        assert found[0]["id"] == expected[0]["id"]
+        by_id = {r["id"]: r["similarity"] for r in expected}
+        assert all(abs(r["similarity"] - by_id.get(r["id"], r["similarity"])) < tolerance for r in found)
+
+        reranked = quantized.search("memory 42", top_k=10, similarity_threshold=-1, rerank=50)
+        assert [r["id"] for r in reranked] == [r["id"] for r in expected]
+        assert [r["similarity"] for r in reranked] == pytest.approx([r["similarity"] for r in expected], abs=1e-5)
+
+        reloaded = open_memory(quantized.db_path, model)
+        assert reloaded.storage == storage
+        assert reloaded.search("memory 42", top_k=10, similarity_threshold=-1) == found
+
+    def test_blob_sizes(self, tmp_path):
+        for storage, size in [("float32", 4 * DIM), ("float16", 2 * DIM), ("int8", DIM + 4)]:
+            vm = open_memory(tmp_path / f"{storage}.db", storage=storage)
+            vm.add_memory("sized")
+            conn = sqlite3.connect(vm.db_path)
+            assert conn.execute("SELECT length(embedding) FROM memories").fetchone()[0] == size
+            conn.close()
+
+    def test_convert_existing_database(self, tmp_path):
+        path = tmp_path / "vector_memory.db"
+        old = open_memory(path)
+        old.add_memories([{"content": f"memory {i}", "metadata": {"i": i}} for i in range(500)])
+        old._conn.execute("DROP TABLE meta")  # as written before storage types were recorded
+        old.close()
+        size = path.stat().st_size
+
+        converted = open_memory(path, storage="int8")
+
+        assert converted.storage == "int8" and converted._get_meta("storage") == "int8"
+        assert converted.search("memory 3", top_k=1)[0]["metadata"] == {"i": 3}
+        assert path.stat().st_size < size
+        assert converted.convert_storage("int8") == 0
+        assert converted.convert_storage("float16") == 500
+        assert converted.search("memory 4", top_k=1)[0]["similarity"] == pytest.approx(1.0, abs=1e-3)
+        with pytest.raises(ValueError):
+            converted.convert_storage("float8")
+
+
+class LoadedModel(FakeModel):
+    """Loaded through the sentence_transformers module, counts and delays loads"""
+
+    loads: list = []
+    delay = 0.0
+    dimension = DIM
+
+    def __init__(self, name):
+        super().__init__()
+        time.sleep(self.delay)
+        self.loads.append(name)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+
+@pytest.fixture
+def sentence_transformers(monkeypatch):
+    monkeypatch.setattr(LoadedModel, "loads", [])
+    monkeypatch.setitem(sys.modules, "sentence_transformers", types.SimpleNamespace(SentenceTransformer=LoadedModel))
+    return LoadedModel
+
+
+class TestModelLoading:
+    """Test model metadata and warm-up."""
+
+    def test_reads_without_model(self, tmp_path, sentence_transformers):
+        path = str(tmp_path / "vector_memory.db")
+        writer = VectorMemory(db_path=path, embedding_model="mini", storage="int8")
+        memory_id = writer.add_memory("kept")
+        writer.close()
+        sentence_transformers.loads.clear()
+
+        reader = VectorMemory(db_path=path, embedding_model="mini")
+        stats = reader.get_memory_stats()
+        reader._get_index()
+        reader.delete_memory(memory_id)
+
+        assert stats["embedding_model"] == "mini" and stats["embedding_dimension"] == DIM and stats["storage"] == "int8"
+        assert reader._embedding_dim == DIM and list(reader._index) == ["general"]  # type: ignore
+        assert sentence_transformers.loads == []
+
+    def test_dimension_mismatch(self, tmp_path, sentence_transformers, monkeypatch):
+        path = str(tmp_path / "vector_memory.db")
+        VectorMemory(db_path=path, embedding_model="mini").add_memory("kept")
+        monkeypatch.setattr(LoadedModel, "dimension", DIM * 2)
+
+        with pytest.raises(ValueError, match="mini"):
+            VectorMemory(db_path=path, embedding_model="large").search("query")
+
+        emptied = VectorMemory(db_path=path, embedding_model="large")
+        emptied.clear_all()
+        emptied._get_embedding_model()
+        assert emptied.get_memory_stats()["embedding_model"] == "large"
+        assert emptied._embedding_dim == DIM * 2
+
+    def test_warm_up(self, tmp_path, sentence_transformers, monkeypatch):
+        monkeypatch.setattr(LoadedModel, "delay", 0.2)
+
+        memory = VectorMemory(db_path=str(tmp_path / "vector_memory.db"), embedding_model="mini", warm_up=True)
+        memory.add_memory("during warm-up")  # waits for the load in progress
+        memory.search("during warm-up")
+
+        assert sentence_transformers.loads == ["mini"]
+
+    def test_warm_up_failure_is_reported_later(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(sys.modules, "sentence_transformers", None)
+        memory = VectorMemory(db_path=str(tmp_path / "vector_memory.db"))
+
+        memory.warm_up().join()
+
+        with pytest.raises(ImportError):
+            memory.search("query")